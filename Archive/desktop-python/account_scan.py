@@ -0,0 +1,513 @@
+#!/usr/bin/env python3
+r"""
+Concurrent scans of several accounts and folders.
+
+withOutlookRulesYAML.py scanned one hard-coded account (EMAIL_ADDRESS) and its
+bulk folders (EMAIL_BULK_FOLDER_NAMES) one after another, and the IMAP, Gmail
+and local backends each scanned one store per command.  With several mailboxes
+the wall time was the sum of all of them.
+
+scan_accounts() runs one worker thread per store:
+
+  - an Outlook store gets its own COM apartment (pythoncom.CoInitialize) and its
+    own Outlook.Application / MAPI Namespace in the worker; COM objects are never
+    shared between threads.  OutlookBackend reads folders with Folder.GetTable
+    (outlook_table.py) and commits through an OutlookActionQueue;
+  - IMAP and Gmail stores get their own logged-in session from one SessionPool
+    (session_pool.py), sized so that no worker waits for another's connection;
+  - Maildir, mbox and .eml stores are read from disk.
+
+Every worker evaluates with the same CompiledRuleset (compiled once; evaluation
+does not change it) through mail_backends.scan_backend(), so each store gets the
+same safe-sender and rule actions.  The per-store outcomes are merged into one
+result list, summed stats and one ReportEngine report (no-match emails by From
+domain).  Workers spend most of their time waiting on COM, sockets or the disk,
+so the wall time approaches that of the slowest store.  Outlook serves calls
+from all apartments in one process, so several Outlook stores overlap less than
+network stores do.
+
+Stores file (YAML); entries for the same store are merged into one worker:
+
+    accounts:
+      - kind: outlook
+        account: me@aol.com
+        folders: [Bulk Mail, bulk]
+      - kind: imap
+        host: imap.example.com
+        port: 993
+        ssl: true
+        user: me@example.com
+        password_env: IMAP_PASSWORD
+        folders: [Junk]
+      - kind: gmail
+        account: me@gmail.com
+        token_env: GMAIL_TOKEN
+        folders: [Bulk Mail]
+      - kind: maildir          # also mbox, eml
+        path: D:/Mail/export
+        folders: [Bulk Mail]
+
+Usage:
+    python account_scan.py --accounts accounts.yaml --rules ../rules.yaml --safe-senders ../rules_safe_senders.yaml
+    python account_scan.py --accounts accounts.yaml --rules ../rules.yaml --safe-senders ../rules_safe_senders.yaml --dry-run --report scan.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import yaml
+
+from folder_cache import FolderCache
+from gmail_backend import GMAIL_API_URL, GmailApiClient, GmailBackend
+from imap_backend import ImapBackend
+from mail_backends import EmlDirectoryBackend, MailBackend, MaildirBackend, MboxBackend, scan_backend
+from outlook_actions import OutlookActionQueue
+from outlook_table import email_transport_headers, fetch_table_rows, new_fetch_stats
+from public_suffix import address_domain
+from report_engine import ReportEngine
+from rule_engine import CompiledRuleset, MessageView, combine_email_header_lines
+from session_pool import DEFAULT_POOL_SIZE, SessionPool
+
+# Handle the pywin32 imports gracefully (Linux, macOS, CI): only Outlook stores need them
+try:
+    import pythoncom
+    import win32com.client
+except ImportError:
+    pythoncom = None
+    win32com = None
+
+KIND_OUTLOOK = "outlook"
+KIND_IMAP = "imap"
+KIND_GMAIL = "gmail"
+KIND_MAILDIR = "maildir"
+KIND_MBOX = "mbox"
+KIND_EML = "eml"
+STORE_KINDS = (KIND_OUTLOOK, KIND_IMAP, KIND_GMAIL, KIND_MAILDIR, KIND_MBOX, KIND_EML)
+NETWORK_KINDS = frozenset((KIND_IMAP, KIND_GMAIL))
+LOCAL_BACKENDS = {KIND_MAILDIR: MaildirBackend, KIND_MBOX: MboxBackend, KIND_EML: EmlDirectoryBackend}
+WIN32_CLIENT_DISPATCH = "Outlook.Application"
+OUTLOOK_GETNAMESPACE = "MAPI"
+
+
+#------------------Stores------------------
+
+class StoreSpec:
+    r"""
+    One mail store to scan.
+
+    Attributes:
+        kind: one of STORE_KINDS
+        account: SMTP address (Outlook, Gmail) or user (IMAP); may be empty for local stores
+        folders: folder names to scan (empty: every folder but the trash folder)
+        options: the other settings of the entry (host, port, ssl, password_env, token_env, path, ...)
+    """
+    __slots__ = ("kind", "account", "folders", "options")
+
+    def __init__(self, kind, account="", folders=(), options=None):
+        if kind not in STORE_KINDS:
+            raise ValueError(f"Unknown store kind {kind!r} (expected one of {', '.join(STORE_KINDS)})")
+        self.kind = kind
+        self.account = account or ""
+        self.folders = list(folders or [])
+        self.options = dict(options or {})
+
+    @property
+    def key(self):
+        r"""Identity of the store: entries with the same key share one worker"""
+        if self.kind == KIND_IMAP:
+            options = self.options
+            return (self.kind, options.get("host"), options.get("port"), options.get("user") or self.account)
+        if self.kind in LOCAL_BACKENDS:
+            return (self.kind, os.path.abspath(self.options.get("path", "")))
+        return (self.kind, self.account.lower())
+
+    @property
+    def label(self):
+        r"""Name used in the log and the merged results"""
+        if self.kind in LOCAL_BACKENDS:
+            return f"{self.kind}:{self.options.get('path', '')}"
+        if self.kind == KIND_IMAP:
+            port = f":{self.options['port']}" if self.options.get("port") else ""
+            return f"imap:{self.options.get('user') or self.account}@{self.options.get('host')}{port}"
+        return f"{self.kind}:{self.account}"
+
+    def __repr__(self):
+        return f"StoreSpec({self.label!r}, folders={self.folders!r})"
+
+
+def stores_from_config(entries):
+    r"""
+    StoreSpec per store from a list of dicts (see the module docstring).
+
+    Entries for the same store are merged (their folders are combined, first
+    occurrence first), so one store never gets two workers.
+
+    Returns:
+        list: StoreSpec, in order of first appearance
+    """
+    stores = {}
+    for entry in entries or []:
+        entry = dict(entry)
+        kind = entry.pop("kind", KIND_OUTLOOK)
+        account = entry.pop("account", "")
+        folders = entry.pop("folders", [])
+        if isinstance(folders, str):
+            folders = [folders]
+        store = StoreSpec(kind, account, folders, entry)
+        existing = stores.get(store.key)
+        if existing is None:
+            stores[store.key] = store
+        else:
+            existing.folders.extend(f for f in store.folders if f not in existing.folders)
+    return list(stores.values())
+
+
+def load_stores(path):
+    r"""StoreSpec list from a YAML file with an 'accounts' list"""
+    with open(path, 'r', encoding='utf-8') as f:
+        doc = yaml.safe_load(f) or {}
+    return stores_from_config(doc.get("accounts", []) if isinstance(doc, dict) else doc)
+
+
+#------------------Outlook------------------
+
+@contextlib.contextmanager
+def com_apartment(enabled=True):
+    r"""Initialize COM on the current thread for the duration of the block (no-op without pywin32)"""
+    if not enabled or pythoncom is None:
+        yield
+        return
+    pythoncom.CoInitialize()
+    try:
+        yield
+    finally:
+        pythoncom.CoUninitialize()
+
+
+class OutlookBackend(MailBackend):
+    r"""
+    MailBackend over one Outlook account, for use inside one COM apartment.
+
+    Folders are read with Folder.GetTable; a message's body is fetched only when a
+    rule reached before the verdict is final needs it.  Changes go through an
+    OutlookActionQueue (one Save per message, then one Move or Delete) and are
+    committed per chunk and by flush().  Delete() goes to Deleted Items by itself.
+
+    Args:
+        account: SMTP address of the account
+        namespace: Outlook MAPI Namespace created on this thread (None: dispatch Outlook here)
+        log: callable(message, level="INFO")
+        folder_cache_path: JSON file of folder EntryIDs (None: resolve folders once per run)
+    """
+    name = KIND_OUTLOOK
+
+    def __init__(self, account, namespace=None, log=None, folder_cache_path=None):
+        super().__init__(trash_folder=None)
+        if namespace is None:
+            if win32com is None:
+                raise RuntimeError("win32com.client is not available: Outlook stores cannot be scanned")
+            namespace = win32com.client.Dispatch(WIN32_CLIENT_DISPATCH).GetNamespace(OUTLOOK_GETNAMESPACE)
+        self.account = account
+        self.root = account
+        self.namespace = namespace
+        self.log = log or (lambda message, level="INFO": None)
+        self.fetch_stats = new_fetch_stats()
+        self.queue = OutlookActionQueue(self.log)
+        self.folder_cache = FolderCache(namespace, folder_cache_path, self.log)
+
+    def _account_root(self):
+        for account in self.namespace.Accounts:
+            if account.SmtpAddress.lower() == self.account.lower():
+                return self.namespace.Folders(account.DeliveryStore.DisplayName)
+        return None
+
+    def _resolve(self, folder_name):
+        root = self._account_root()
+        if root is None:
+            self.log(f"Account not found: {self.account}")
+            return None
+        try:
+            return root.Folders[folder_name]
+        except Exception:
+            return _find_folder(root, folder_name)
+
+    def folder(self, folder_name):
+        r"""MAPIFolder for a folder name of this account, or None"""
+        return self.folder_cache.get(self.account, folder_name, lambda: self._resolve(folder_name))
+
+    def list_folders(self):
+        root = self._account_root()
+        return [] if root is None else [folder.Name for folder in root.Folders]
+
+    def evaluate_folder(self, folder, ruleset, cutoff=None, select=None):
+        target = self.folder(folder)
+        if target is None:
+            self.log(f"Could not find folder '{folder}' in account '{self.account}'")
+            return
+        restriction = f"[ReceivedTime] >= '{cutoff.strftime('%m/%d/%Y')}'" if cutoff is not None else ""
+        self.queue.folder = folder     # circuit breaker key
+        for message in fetch_table_rows(target, restriction, self.namespace, self.fetch_stats):
+            if select is not None and not select(message.EntryID):
+                continue
+            try:
+                header = combine_email_header_lines(email_transport_headers(message))
+            except Exception:
+                header = ""
+            view = MessageView(message.SenderEmailAddress, message.Subject, "", header)
+            verdict = ruleset.evaluate_headers(view)
+            if verdict is None:
+                view.body = message.Body or ""
+                verdict = ruleset.evaluate(view)
+            self.queue.maybe_flush()
+            yield message, verdict
+
+    def iter_messages(self, folder):
+        target = self.folder(folder)
+        return iter(()) if target is None else iter(fetch_table_rows(target, "", self.namespace, self.fetch_stats))
+
+    def _target(self, folder_name):
+        target = self.folder(folder_name)
+        if target is None:
+            raise LookupError(f"Could not find folder '{folder_name}' in account '{self.account}'")
+        return target
+
+    def move(self, message, folder):
+        self.queue.move(message, self._target(folder))
+
+    def copy(self, message, folder):
+        message.Copy().Move(self._target(folder))
+
+    def delete(self, message):
+        self.queue.delete(message)
+
+    def remove(self, message):
+        self.queue.delete(message)
+
+    def mark_read(self, message):
+        self.queue.mark_read(message)
+
+    def assign_category(self, message, category):
+        self.queue.assign_category(message, category)
+        return True
+
+    def flush(self):
+        self.queue.flush()
+
+
+def _find_folder(root_folder, folder_name):
+    r"""Depth-first search of a folder tree by name"""
+    try:
+        for folder in root_folder.Folders:
+            if folder.Name == folder_name:
+                return folder
+            found = _find_folder(folder, folder_name)
+            if found is not None:
+                return found
+    except Exception:
+        pass
+    return None
+
+
+#------------------Workers------------------
+
+def open_backend(store, pool=None, log=None):
+    r"""
+    MailBackend for a store, created on the calling (worker) thread.
+
+    Args:
+        store: StoreSpec
+        pool: SessionPool for the IMAP and Gmail sessions
+        log: callable(message, level="INFO")
+    """
+    options = store.options
+    if store.kind == KIND_OUTLOOK:
+        return OutlookBackend(store.account, log=log)
+    if store.kind == KIND_IMAP:
+        password = os.environ.get(options["password_env"]) if options.get("password_env") else options.get("password")
+        return ImapBackend(options.get("host", "127.0.0.1"), options.get("port"), options.get("user") or store.account,
+                           password, use_ssl=options.get("ssl", False), pool=pool)
+    if store.kind == KIND_GMAIL:
+        token = os.environ.get(options["token_env"]) if options.get("token_env") else options.get("token")
+        return GmailBackend(GmailApiClient(options.get("api_url", GMAIL_API_URL), token, pool=pool))
+    return LOCAL_BACKENDS[store.kind](options["path"])
+
+
+def new_scan_stats():
+    return {"processed": 0, "safe_senders": 0, "matched": 0, "deleted": 0, "moved": 0, "errors": 0}
+
+
+def scan_store(store, ruleset, days_back=None, dry_run=False, log=None, pool=None, opener=open_backend):
+    r"""
+    Scan one store (runs on its worker thread).
+
+    Returns:
+        dict: {"store", "kind", "results", "stats", "elapsed", "error"}; error is None unless the store
+              could not be opened or read (the other stores are not affected)
+    """
+    log = log or (lambda message, level="INFO": None)
+    outcome = {"store": store.label, "kind": store.kind, "results": [], "stats": new_scan_stats(), "elapsed": 0.0,
+               "error": None}
+    start = time.perf_counter()
+    try:
+        with com_apartment(store.kind == KIND_OUTLOOK):
+            backend = opener(store, pool, log)
+            try:
+                scanned = scan_backend(backend, ruleset, store.folders or None, days_back=days_back, dry_run=dry_run,
+                                       log=log)
+            finally:
+                backend.close()
+                del backend     # release the COM objects inside the apartment
+        outcome["results"], outcome["stats"] = scanned["results"], scanned["stats"]
+    except Exception as e:
+        outcome["error"] = str(e)
+        log(f"Error scanning {store.label}: {str(e)}")
+    outcome["elapsed"] = time.perf_counter() - start
+    return outcome
+
+
+def scan_accounts(stores, ruleset, days_back=None, dry_run=False, log=None, pool=None, opener=open_backend):
+    r"""
+    Scan every store concurrently, one worker thread per store, and merge the outcomes.
+
+    Args:
+        stores: StoreSpec list (see stores_from_config)
+        ruleset: CompiledRuleset shared by all workers
+        days_back: skip messages older than this many days (None scans everything)
+        dry_run: evaluate and plan only, change nothing
+        log: callable(message, level="INFO"); lines are prefixed with the store label
+        pool: SessionPool for the network stores (default: one sized for them, closed at the end)
+        opener: callable(store, pool, log) -> MailBackend (open_backend)
+
+    Returns:
+        dict: {"results": [record per message, with "store"], "stats": summed stats,
+               "stores": [per-store {"store", "kind", "stats", "elapsed", "error"}],
+               "elapsed": wall seconds, "store_seconds": sum of the per-store seconds}
+    """
+    log = log or (lambda message, level="INFO": None)
+    own_pool = pool is None
+    if own_pool:
+        pool = SessionPool(max(DEFAULT_POOL_SIZE, sum(store.kind in NETWORK_KINDS for store in stores)))
+
+    def store_log(store):
+        return lambda message, level="INFO": log(f"[{store.label}] {message}", level)
+
+    outcomes = [None] * len(stores)
+    ruleset.plan()  # rebuild it here if an edit dropped it, not in the first workers to evaluate
+
+    def work(index, store):
+        outcomes[index] = scan_store(store, ruleset, days_back, dry_run, store_log(store), pool, opener)
+
+    start = time.perf_counter()
+    try:
+        workers = [threading.Thread(target=work, args=(index, store), name=f"scan-{store.label}", daemon=True)
+                   for index, store in enumerate(stores)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        if own_pool:
+            pool.close()
+    return merge_outcomes(outcomes, time.perf_counter() - start)
+
+
+def merge_outcomes(outcomes, elapsed):
+    r"""One result list and summed stats from the per-store outcomes of scan_store()"""
+    results = []
+    stats = new_scan_stats()
+    stores = []
+    for outcome in outcomes:
+        for record in outcome["results"]:
+            record["store"] = outcome["store"]
+            results.append(record)
+        for name, value in outcome["stats"].items():
+            stats[name] = stats.get(name, 0) + value
+        stats["errors"] += outcome["error"] is not None
+        stores.append({name: outcome[name] for name in ("store", "kind", "stats", "elapsed", "error")})
+    return {"results": results, "stats": stats, "stores": stores, "elapsed": elapsed,
+            "store_seconds": sum(store["elapsed"] for store in stores)}
+
+
+def merged_report(outcome, top_n=None):
+    r"""
+    ReportEngine over the merged results: emails that matched no rule (and no safe sender), by From domain.
+
+    Email numbers are positions in outcome["results"] (1-based).
+    """
+    engine = ReportEngine() if top_n is None else ReportEngine(top_n)
+    for number, record in enumerate(outcome["results"], 1):
+        if record.get("safe_sender") is not None or record.get("error") or record.get("match") is not False:
+            continue
+        domain = address_domain(record.get("sender") or "")
+        received = record.get("received")
+        try:
+            received = datetime.fromisoformat(received) if received else None
+        except (TypeError, ValueError):
+            received = None
+        engine.add(number, f"@{domain}" if domain else "", received, None, False)
+    return engine
+
+
+def store_summary_lines(outcome):
+    r"""One line per store and a total line"""
+    lines = []
+    for store in outcome["stores"]:
+        stats = store["stats"]
+        status = f"error: {store['error']}" if store["error"] else (
+            f"{stats['processed']} processed, {stats['safe_senders']} safe, {stats['matched']} matched, "
+            f"{stats['deleted']} deleted, {stats['moved']} moved, {stats['errors']} errors")
+        lines.append(f"{store['store']}: {status} ({store['elapsed']:.1f}s)")
+    stats = outcome["stats"]
+    lines.append(f"All stores: {stats['processed']} processed, {stats['deleted']} deleted, {stats['moved']} moved, "
+                 f"{stats['errors']} errors in {outcome['elapsed']:.1f}s wall time "
+                 f"({outcome['store_seconds']:.1f}s if scanned one after another)")
+    return lines
+
+
+#------------------CLI------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scan several accounts and folders concurrently with one ruleset')
+    parser.add_argument('--accounts', required=True, help="YAML file with an 'accounts' list (see account_scan.py)")
+    parser.add_argument('--rules', required=True, help='rules.yaml')
+    parser.add_argument('--safe-senders', required=True, help='rules_safe_senders.yaml')
+    parser.add_argument('--days-back', type=int, help='Only messages received in the last N days')
+    parser.add_argument('--dry-run', action='store_true', help='Evaluate only; do not move or delete anything')
+    parser.add_argument('--report', help='Write the merged per-message results as JSON to this file')
+    parser.add_argument('--report-prefix', help='Write the merged From-domain report to <prefix>.csv/.json/.txt')
+    args = parser.parse_args(argv)
+
+    stores = load_stores(args.accounts)
+    with open(args.rules, 'r', encoding='utf-8') as f:
+        rules_json = yaml.safe_load(f) or {"rules": []}
+    with open(args.safe_senders, 'r', encoding='utf-8') as f:
+        safe_senders = yaml.safe_load(f) or {"safe_senders": []}
+    ruleset = CompiledRuleset(rules_json, safe_senders)
+    print(f"[INFO] Scanning {len(stores)} store(s) concurrently{' (dry run)' if args.dry_run else ''}")
+    print_lock = threading.Lock()
+
+    def log(message, level="INFO"):
+        with print_lock:
+            print(f"[{level}] {message}")
+
+    outcome = scan_accounts(stores, ruleset, args.days_back, args.dry_run, log)
+    for line in store_summary_lines(outcome):
+        print(f"[OK] {line}")
+    if args.report_prefix:
+        merged_report(outcome).write(args.report_prefix)
+        print(f"[OK] Wrote report to {args.report_prefix}.csv/.json/.txt")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(outcome, f, indent=2, default=str)
+        print(f"[OK] Wrote results to {args.report}")
+    return 1 if outcome["stats"]["errors"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
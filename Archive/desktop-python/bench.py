@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+r"""
+Benchmark suite and regression gate for the desktop spam filter.
+
+Each scenario runs in its own Python process so its peak RSS is its own, and
+reports up to three metrics:
+    emails_per_sec  (higher is better)
+    load_seconds    (lower is better)  time to read the YAML and compile the ruleset
+    rss_mb          (lower is better)  peak resident set size of the scenario process
+
+Usage:
+    python bench.py run                              # run all scenarios, print a table
+    python bench.py run --scenario archive_rules_compiled --json -
+    python bench.py compare                          # run, compare to bench_baseline.json, exit 1 on regression
+    python bench.py compare --threshold 0.10         # allow at most 10% regression per metric
+    python bench.py update                           # re-measure and rewrite bench_baseline.json
+
+Baselines are machine specific: after moving to a new machine run `python bench.py update`
+once and commit the result.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+import yaml
+
+try:
+    import psutil
+except ImportError:
+    # Optional: psutil gives RSS on Windows; elsewhere the resource module is enough
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from rule_engine import CompiledRuleset, reference_evaluate
+import differential_harness
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BENCH_DIR, "bench_baseline.json")
+ARCHIVE_RULES_FILE = os.path.join(os.path.dirname(BENCH_DIR), "rules.yaml")
+BUNDLED_RULES_DIR = os.path.join(os.path.dirname(os.path.dirname(BENCH_DIR)), "mobile-app", "assets", "rules")
+BUNDLED_SAFE_SENDERS_FILE = os.path.join(BUNDLED_RULES_DIR, "rules_safe_senders.yaml")
+
+DEFAULT_THRESHOLD = 0.20
+CORPUS_SEED = 20251118
+REPEATS = 5
+
+# metric -> (higher_is_better, noise floor). A change smaller than the noise floor in absolute
+# terms is never a regression, so a 15 ms load time growing to 25 ms does not fail the gate.
+METRICS = {
+    "emails_per_sec": (True, 0),
+    "load_seconds": (False, 0.05),
+    "rss_mb": (False, 5.0),
+}
+
+
+def peak_rss_mb():
+    r"""Peak RSS of this process in MB, or None when it cannot be measured"""
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KB on Linux, bytes on macOS
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    return None
+
+
+def _load_yaml(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f)
+
+
+def _throughput(evaluate, messages):
+    r"""Best-of-REPEATS emails per second for evaluate(message) over messages"""
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for message in messages:
+            evaluate(message)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return round(len(messages) / best, 1) if best else None
+
+
+def _corpus(rules_json, safe_senders, count):
+    rng = random.Random(CORPUS_SEED)
+    return differential_harness.generate_corpus(rng, count, differential_harness.addresses_for_rules(rules_json, safe_senders))
+
+
+def _random_ruleset(rule_count):
+    return differential_harness.generate_ruleset(random.Random(CORPUS_SEED), rule_count)
+
+
+#------------------Scenarios------------------
+# Each scenario returns a dict of metrics (see METRICS). Return None when its inputs are missing.
+
+def scenario_archive_rules_compiled():
+    if not os.path.exists(ARCHIVE_RULES_FILE):
+        return None
+    start = time.perf_counter()
+    rules_json = _load_yaml(ARCHIVE_RULES_FILE)
+    ruleset = CompiledRuleset(rules_json, {"safe_senders": []})
+    load_seconds = time.perf_counter() - start
+    messages = _corpus(rules_json, {"safe_senders": []}, 2000)
+    return {"emails_per_sec": _throughput(ruleset.evaluate, messages), "load_seconds": round(load_seconds, 4)}
+
+
+def scenario_random_rules_reference():
+    rules_json, safe_senders = _random_ruleset(40)
+    messages = _corpus(rules_json, safe_senders, 300)
+    return {"emails_per_sec": _throughput(lambda m: reference_evaluate(rules_json, safe_senders, m), messages)}
+
+
+def scenario_random_rules_compiled():
+    rules_json, safe_senders = _random_ruleset(40)
+    start = time.perf_counter()
+    ruleset = CompiledRuleset(rules_json, safe_senders)
+    load_seconds = time.perf_counter() - start
+    messages = _corpus(rules_json, safe_senders, 3000)
+    return {"emails_per_sec": _throughput(ruleset.evaluate, messages), "load_seconds": round(load_seconds, 4)}
+
+
+def scenario_bundled_safe_senders():
+    if not os.path.exists(BUNDLED_SAFE_SENDERS_FILE):
+        return None
+    start = time.perf_counter()
+    safe_senders = _load_yaml(BUNDLED_SAFE_SENDERS_FILE)
+    ruleset = CompiledRuleset({"rules": []}, safe_senders)
+    load_seconds = time.perf_counter() - start
+    messages = _corpus({"rules": []}, safe_senders, 3000)
+    return {"emails_per_sec": _throughput(ruleset.evaluate, messages), "load_seconds": round(load_seconds, 4)}
+
+
+def scenario_imap_standin_scan():
+    from imap_backend import ImapBackend
+    from imap_standin import ImapStandinServer
+    from mail_backends import scan_backend
+
+    rules_json, safe_senders = _random_ruleset(40)
+    ruleset = CompiledRuleset(rules_json, safe_senders)
+    server = ImapStandinServer()
+    for message in _corpus(rules_json, safe_senders, 2000):
+        raw = f"From: <{message.sender.strip()}>\nSubject: {message.subject}\n\n{message.body}\n"
+        server.add_message("INBOX", raw.encode('utf-8'))
+    host, port = server.start()
+    try:
+        backend = ImapBackend(host, port, "user", "password")
+        start = time.perf_counter()
+        outcome = scan_backend(backend, ruleset, ["Inbox"], dry_run=True)
+        elapsed = time.perf_counter() - start
+        backend.close()
+    finally:
+        server.stop()
+    return {"emails_per_sec": round(outcome["stats"]["processed"] / elapsed, 1)}
+
+
+def scenario_gmail_standin_scan():
+    from gmail_backend import GmailApiClient, GmailBackend, TokenBucket
+    from gmail_standin import GmailStandinServer
+    from mail_backends import scan_backend
+
+    rules_json, safe_senders = _random_ruleset(40)
+    ruleset = CompiledRuleset(rules_json, safe_senders)
+    server = GmailStandinServer()
+    for message in _corpus(rules_json, safe_senders, 2000):
+        raw = f"From: <{message.sender.strip()}>\r\nSubject: {message.subject}\r\n\r\n{message.body}\r\n"
+        server.add_message(raw.encode('utf-8'), ("INBOX",))
+    base_url = server.start()
+    try:
+        # Quota is not the subject here: measure client and batching overhead only
+        backend = GmailBackend(GmailApiClient(base_url, bucket=TokenBucket(1e9)))
+        start = time.perf_counter()
+        outcome = scan_backend(backend, ruleset, ["Inbox"], dry_run=True)
+        elapsed = time.perf_counter() - start
+        backend.close()
+    finally:
+        server.stop()
+    return {"emails_per_sec": round(outcome["stats"]["processed"] / elapsed, 1)}
+
+
+def scenario_packed_corpus_scan():
+    import tempfile
+    from mail_backends import scan_backend
+    from packed_corpus import PackedCorpusBackend, PackedCorpusWriter
+
+    rules_json, safe_senders = _random_ruleset(40)
+    ruleset = CompiledRuleset(rules_json, safe_senders)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.sfpc")
+        with PackedCorpusWriter(path) as writer:
+            for message in _corpus(rules_json, safe_senders, 2000):
+                raw = f"From: <{message.sender.strip()}>\nSubject: {message.subject}\n\n{message.body}\n"
+                writer.add(raw.encode('utf-8'), "Bulk Mail")
+        backend = PackedCorpusBackend(path)
+        start = time.perf_counter()
+        outcome = scan_backend(backend, ruleset, dry_run=True)
+        elapsed = time.perf_counter() - start
+        backend.close()
+    return {"emails_per_sec": round(outcome["stats"]["processed"] / elapsed, 1)}
+
+
+SCENARIOS = {
+    "archive_rules_compiled": scenario_archive_rules_compiled,
+    "random_rules_reference": scenario_random_rules_reference,
+    "random_rules_compiled": scenario_random_rules_compiled,
+    "bundled_safe_senders": scenario_bundled_safe_senders,
+    "imap_standin_scan": scenario_imap_standin_scan,
+    "gmail_standin_scan": scenario_gmail_standin_scan,
+    "packed_corpus_scan": scenario_packed_corpus_scan,
+}
+
+
+#------------------Runner------------------
+
+def run_scenario_in_process(name):
+    metrics = SCENARIOS[name]()
+    if metrics is None:
+        return None
+    rss = peak_rss_mb()
+    if rss is not None:
+        metrics["rss_mb"] = rss
+    return metrics
+
+
+def run_scenario_isolated(name):
+    r"""Run one scenario in a fresh interpreter and return its metrics (None if skipped)"""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "run", "--scenario", name, "--in-process", "--json", "-"],
+        capture_output=True, text=True, cwd=BENCH_DIR,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Scenario {name} failed:\n{proc.stderr}")
+    return json.loads(proc.stdout).get(name)
+
+
+def run_suite(names=None, in_process=False):
+    results = {}
+    for name in names or SCENARIOS:
+        metrics = run_scenario_in_process(name) if in_process else run_scenario_isolated(name)
+        if metrics is not None:
+            results[name] = metrics
+    return results
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    r"""
+    Compare current results with the baseline.
+
+    Args:
+        baseline: {scenario: {metric: value}} from bench_baseline.json
+        current: {scenario: {metric: value}} from run_suite()
+        threshold: allowed relative regression per metric (0.20 = 20%)
+
+    Returns:
+        list: one row dict per (scenario, metric) with baseline, current, delta and regressed
+    """
+    rows = []
+    for scenario, base_metrics in sorted(baseline.items()):
+        cur_metrics = current.get(scenario)
+        for metric, (higher_is_better, noise_floor) in METRICS.items():
+            base = base_metrics.get(metric)
+            if base is None:
+                continue
+            cur = None if cur_metrics is None else cur_metrics.get(metric)
+            if cur is None or not base:
+                rows.append({"scenario": scenario, "metric": metric, "baseline": base, "current": cur,
+                             "delta": None, "regressed": False})
+                continue
+            delta = (cur - base) / base
+            regressed = delta < -threshold if higher_is_better else delta > threshold
+            regressed = regressed and abs(cur - base) > noise_floor
+            rows.append({"scenario": scenario, "metric": metric, "baseline": base, "current": cur,
+                         "delta": delta, "regressed": regressed})
+    return rows
+
+
+def format_results(results):
+    lines = [f"{'scenario':<28} {'metric':<16} {'value':>12}"]
+    for scenario, metrics in sorted(results.items()):
+        for metric, value in metrics.items():
+            lines.append(f"{scenario:<28} {metric:<16} {value:>12}")
+    return "\n".join(lines)
+
+
+def format_delta_table(rows):
+    lines = [f"{'scenario':<28} {'metric':<16} {'baseline':>12} {'current':>12} {'delta':>9}"]
+    for row in rows:
+        current = "skipped" if row["current"] is None else row["current"]
+        delta = "" if row["delta"] is None else f"{row['delta'] * 100:+.1f}%"
+        flag = "  REGRESSION" if row["regressed"] else ""
+        lines.append(f"{row['scenario']:<28} {row['metric']:<16} {row['baseline']:>12} {current:>12} {delta:>9}{flag}")
+    return "\n".join(lines)
+
+
+def load_baseline(path=BASELINE_FILE):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("scenarios", {})
+
+
+def write_baseline(results, path=BASELINE_FILE):
+    doc = {
+        "generated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "scenarios": results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(doc, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark suite and regression gate')
+    parser.add_argument('mode', choices=['run', 'compare', 'update'])
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='Limit to these scenarios')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline JSON (compare/update)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed relative regression per metric, e.g. 0.2 for 20%% (compare)')
+    parser.add_argument('--json', help="Write results as JSON to this file ('-' for stdout)")
+    parser.add_argument('--in-process', action='store_true', help='Run scenarios in this process (RSS is then shared)')
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.scenario, in_process=args.in_process)
+
+    if args.json:
+        payload = json.dumps(results, indent=2, sort_keys=True)
+        if args.json == '-':
+            print(payload)
+        else:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                f.write(payload + "\n")
+    elif args.mode == 'run':
+        print(format_results(results))
+
+    if args.mode == 'update':
+        write_baseline(results, args.baseline)
+        print(f"[OK] Wrote baseline for {len(results)} scenarios to {args.baseline}")
+        return 0
+
+    if args.mode == 'compare':
+        baseline = load_baseline(args.baseline)
+        if args.scenario:
+            baseline = {k: v for k, v in baseline.items() if k in args.scenario}
+        rows = compare_results(baseline, results, args.threshold)
+        print(format_delta_table(rows))
+        regressions = [r for r in rows if r["regressed"]]
+        if regressions:
+            print(f"[FAIL] {len(regressions)} metrics regressed more than {args.threshold * 100:.0f}%")
+            return 1
+        print(f"[OK] No metric regressed more than {args.threshold * 100:.0f}%")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
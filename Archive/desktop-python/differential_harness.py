@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+r"""
+Differential test harness: CompiledRuleset (fast path) vs reference_evaluate() (process_emails semantics)
+
+Generates corpora and randomized rulesets, evaluates every message with both
+evaluators and reports any divergence in safe-sender outcome, matched rule,
+matched pattern or exception outcome.
+
+Usage:
+    python differential_harness.py                          # randomized rounds, seed 1
+    python differential_harness.py --seed 7 --rounds 200
+    python differential_harness.py --rules rules.yaml --safe-senders rules_safe_senders.yaml --messages 5000
+
+Exit code is 1 when any divergence is found, or when at least MAX_ERROR_SHARE of the
+reference verdicts are errors (the original loop raises, e.g. on a rule without an
+'exceptions' mapping): both evaluators then agree on nothing but the error, and a
+comparison without divergences means nothing.  The run also reports how many
+messages a rule actually matched.
+"""
+
+import argparse
+import random
+import re
+import sys
+from collections import Counter
+
+import yaml
+
+from rule_engine import (
+    MATCHER_EXACT, MATCHER_LABEL, MATCHER_REGEX, MATCHER_TAIL,
+    CompiledRuleset, MessageView, classify_pattern, combine_email_header_lines,
+    reference_evaluate, rule_sort_key, rules_list_from, safe_senders_list_from,
+)
+
+LABELS = ["acme", "widgets", "ygllc", "0za12o", "shop-now", "mail", "google", "spam", "x1", "kelvin", "sso"]
+TLDS = ["com", "net", "org", "co.uk", "ru", "xyz", "info"]
+LOCAL_PARTS = ["john", "j.doe", "noreply", "billing", "s", "k", "info"]
+KEYWORDS = ["free", "casino", "invoice", "urgent", "password", "meeting", "winner", "dating site"]
+
+MAX_ERROR_SHARE = 0.5
+
+OUTCOME_SAFE_SENDER = "safe_sender"
+OUTCOME_MATCHED = "matched"
+OUTCOME_NO_MATCH = "no_match"
+OUTCOME_ERROR = "error"
+
+# Text fragments that exercise the fast path's fallbacks (case, whitespace, case-folding non-ASCII)
+ODD_SENDER_SUFFIXES = ["", "", "", "", " ", "\n", "ſ", "K", "é"]
+
+
+def _domain(rng):
+    parts = [rng.choice(LABELS)]
+    if rng.random() < 0.4:
+        parts.insert(0, rng.choice(LABELS))
+    return ".".join(parts) + "." + rng.choice(TLDS)
+
+
+def _address(rng):
+    return f"{rng.choice(LOCAL_PARTS)}@{_domain(rng)}"
+
+
+def random_pattern(rng, field):
+    r"""Return one pattern in one of the shapes the bundled rules use (plus a few broken ones)"""
+    label = rng.choice(LABELS)
+    if rng.random() < 0.1:
+        label = label.upper()
+    escaped_domain = re.escape(_domain(rng))
+    if field in ("subject", "body"):
+        kw = re.escape(rng.choice(KEYWORDS))
+        return rng.choice([f"(?i).*{kw}.*", kw, f"\\b{kw}\\b", f"^{kw}", "(+invalid"])
+    return rng.choice([
+        f"@(?:[a-z0-9-]+\\.)*{re.escape(label)}\\.[a-z0-9.-]+$",
+        f"@{re.escape(label)}\\.[a-z0-9.-]+$",
+        f"@.*\\.{rng.choice(TLDS).split('.')[-1]}$",
+        f"^[^@\\s]+@(?:[a-z0-9-]+\\.)*{escaped_domain}$",
+        f"^[^@\\s]+@(?:[a-z0-9-]+\\.)*@{escaped_domain}$",
+        f"^{re.escape(_address(rng))}$",
+        f"@{escaped_domain}$",
+        f"^\\S+@{escaped_domain}$",
+        label,
+        f".*{label}.*",
+        "(+invalid",
+    ])
+
+
+def _pattern_lists(rng, max_keys, max_patterns):
+    out = {}
+    for key in rng.sample(["from", "subject", "body", "header"], rng.randint(0, max_keys)):
+        out[key] = [random_pattern(rng, key) for _ in range(rng.randint(0, max_patterns))]
+    return out
+
+
+def generate_ruleset(rng, rule_count=8):
+    r"""
+    Build a random rules document and safe_senders document.
+
+    Returns:
+        tuple: (rules_json, safe_senders)
+    """
+    # One type for the delete flag per ruleset: the process_emails() sort key cannot compare bool with str
+    delete_values = [True, False] if rng.random() < 0.5 else ['True', '']
+    rules = []
+    for i in range(rule_count):
+        rule = {
+            "name": f"rule_{i}",
+            "conditions": _pattern_lists(rng, 3, 6),
+            "exceptions": _pattern_lists(rng, 2, 2) if rng.random() < 0.5 else {},
+            "actions": {"delete": rng.choice(delete_values)},
+        }
+        if rng.random() < 0.02:
+            del rule["exceptions"]
+        rules.append(rule)
+    safe = [random_pattern(rng, "header") for _ in range(rng.randint(0, 6))]
+    return {"rules": rules}, {"safe_senders": safe}
+
+
+def generate_message(rng, addresses=None):
+    r"""Build one MessageView whose sender/From domain is drawn from the rule vocabulary"""
+    sender = rng.choice(addresses) if addresses and rng.random() < 0.7 else _address(rng)
+    if rng.random() < 0.1:
+        sender = sender.upper()
+    sender += rng.choice(ODD_SENDER_SUFFIXES)
+    if rng.random() < 0.03:
+        sender = ""
+    header_sender = sender.strip() if rng.random() < 0.7 else _address(rng)
+    header_lines = [f"Received: from mx.{_domain(rng)}"]
+    if rng.random() < 0.9:
+        header_lines.append(f"From: \"Sender\" <{header_sender}>")
+    header_lines.append(f"Subject: {rng.choice(KEYWORDS)}")
+    subject = " ".join(rng.sample(KEYWORDS, rng.randint(0, 2)))
+    body = " ".join(rng.sample(KEYWORDS, rng.randint(0, 3))) + f"\nhttps://www.{_domain(rng)}/x"
+    return MessageView(sender, subject, body, combine_email_header_lines("\n".join(header_lines)))
+
+
+def generate_corpus(rng, count, addresses=None):
+    return [generate_message(rng, addresses) for _ in range(count)]
+
+
+def addresses_for_rules(rules_json, safe_senders, limit=2000):
+    r"""Derive sender addresses that hit the indexed patterns of a real ruleset"""
+    addresses = []
+    patterns = list(safe_senders_list_from(safe_senders))
+    for rule in rules_list_from(rules_json):
+        if isinstance(rule, dict):
+            for key in ("from", "header"):
+                patterns.extend((rule.get("conditions") or {}).get(key) or [])
+    for pattern in patterns:
+        kind, key = classify_pattern(pattern) if isinstance(pattern, str) else (MATCHER_REGEX, None)
+        if kind == MATCHER_EXACT:
+            addresses.append(key)
+        elif kind == MATCHER_TAIL:
+            addresses.append(f"user@{key}" if '@' not in key else f"user@{key.lstrip('@')}")
+        elif kind == MATCHER_LABEL:
+            addresses.append(f"user@mail.{key}.com")
+        if len(addresses) >= limit:
+            break
+    return addresses
+
+
+def diff_fields(reference, optimized):
+    r"""Name the verdict fields that differ"""
+    return sorted(k for k in set(reference) | set(optimized) if reference.get(k) != optimized.get(k))
+
+
+def verdict_outcome(verdict):
+    r"""OUTCOME_ERROR, OUTCOME_SAFE_SENDER, OUTCOME_MATCHED (a rule fired) or OUTCOME_NO_MATCH"""
+    if verdict.get("error"):
+        return OUTCOME_ERROR
+    if verdict["safe_sender"] is not None:
+        return OUTCOME_SAFE_SENDER
+    return OUTCOME_MATCHED if verdict["fired"] else OUTCOME_NO_MATCH
+
+
+def run_differential(rules_json, safe_senders, messages, sort_key=rule_sort_key, outcomes=None):
+    r"""
+    Evaluate every message with both evaluators.  When the headers-only evaluation
+    of the compiled ruleset commits to a verdict it must match too.
+
+    Args:
+        sort_key: rule order passed to both evaluators
+        outcomes: optional Counter, incremented with verdict_outcome() of every reference verdict
+
+    Returns:
+        list: one dict per divergence with index, message, evaluator, reference, optimized and fields
+    """
+    compiled = CompiledRuleset(rules_json, safe_senders, sort_key=sort_key)
+    divergences = []
+    for index, message in enumerate(messages):
+        reference = reference_evaluate(rules_json, safe_senders, message, sort_key=sort_key)
+        if outcomes is not None:
+            outcomes[verdict_outcome(reference)] += 1
+        candidates = [("compiled", compiled.evaluate(message))]
+        header_only = compiled.evaluate_headers(message)
+        if header_only is not None:
+            candidates.append(("headers_only", header_only))
+        for evaluator, optimized in candidates:
+            if reference != optimized:
+                divergences.append({
+                    "index": index,
+                    "message": message,
+                    "evaluator": evaluator,
+                    "reference": reference,
+                    "optimized": optimized,
+                    "fields": diff_fields(reference, optimized),
+                })
+                break
+    return divergences
+
+
+def run_randomized(seed=1, rounds=50, rule_count=8, message_count=200):
+    r"""
+    Randomized rulesets x generated corpora.
+
+    Returns:
+        dict: rounds, messages, outcomes (Counter of verdict_outcome()), divergences (each
+              tagged with its round and the ruleset used)
+    """
+    rng = random.Random(seed)
+    result = {"rounds": rounds, "messages": 0, "outcomes": Counter(), "divergences": []}
+    for round_no in range(rounds):
+        rules_json, safe_senders = generate_ruleset(rng, rule_count)
+        addresses = addresses_for_rules(rules_json, safe_senders)
+        messages = generate_corpus(rng, message_count, addresses)
+        result["messages"] += len(messages)
+        for div in run_differential(rules_json, safe_senders, messages, outcomes=result["outcomes"]):
+            div["round"] = round_no
+            div["rules_json"] = rules_json
+            div["safe_senders"] = safe_senders
+            result["divergences"].append(div)
+    return result
+
+
+def print_divergences(divergences, limit=10):
+    for div in divergences[:limit]:
+        print(f"[DIVERGENCE] round={div.get('round', '-')} message={div['index']} evaluator={div['evaluator']} fields={div['fields']}")
+        print(f"  message:   {div['message']!r} header_from={div['message'].header.splitlines()[:3]}")
+        print(f"  reference: {div['reference']}")
+        print(f"  optimized: {div['optimized']}")
+    if len(divergences) > limit:
+        print(f"  ... {len(divergences) - limit} more")
+
+
+def outcome_line(outcomes):
+    total = sum(outcomes.values())
+    return (f"[INFO] Reference verdicts: {outcomes[OUTCOME_MATCHED]} matched a rule, "
+            f"{outcomes[OUTCOME_SAFE_SENDER]} safe sender, {outcomes[OUTCOME_NO_MATCH]} no match, "
+            f"{outcomes[OUTCOME_ERROR]} errors (of {total})")
+
+
+def vacuous_reason(outcomes):
+    r"""Why a run without divergences proves nothing, or None"""
+    total = sum(outcomes.values())
+    if not total:
+        return "no messages were compared"
+    if outcomes[OUTCOME_ERROR] >= MAX_ERROR_SHARE * total:
+        return (f"{outcomes[OUTCOME_ERROR]} of {total} verdicts are errors (the original loop raises, "
+                f"e.g. on a rule without an 'exceptions' mapping), so almost nothing was compared")
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the compiled rule engine against the reference evaluator')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=50, help='Randomized rulesets to try')
+    parser.add_argument('--rule-count', type=int, default=8, help='Rules per randomized ruleset')
+    parser.add_argument('--messages', type=int, default=200, help='Messages per round (or per file-based run)')
+    parser.add_argument('--rules', help='rules.yaml to use instead of randomized rulesets')
+    parser.add_argument('--safe-senders', help='rules_safe_senders.yaml to use with --rules')
+    args = parser.parse_args(argv)
+
+    if args.rules:
+        with open(args.rules, 'r', encoding='utf-8') as f:
+            rules_json = yaml.safe_load(f) or {"rules": []}
+        safe_senders = {"safe_senders": []}
+        if args.safe_senders:
+            with open(args.safe_senders, 'r', encoding='utf-8') as f:
+                safe_senders = yaml.safe_load(f) or {"safe_senders": []}
+        rng = random.Random(args.seed)
+        messages = generate_corpus(rng, args.messages, addresses_for_rules(rules_json, safe_senders))
+        outcomes = Counter()
+        divergences = run_differential(rules_json, safe_senders, messages, outcomes=outcomes)
+        print(f"[INFO] Compared {len(messages)} messages against {args.rules}")
+    else:
+        result = run_randomized(args.seed, args.rounds, args.rule_count, args.messages)
+        divergences, outcomes = result["divergences"], result["outcomes"]
+        print(f"[INFO] Compared {result['messages']} messages over {result['rounds']} randomized rulesets (seed {args.seed})")
+    print(outcome_line(outcomes))
+
+    if divergences:
+        print(f"[FAIL] {len(divergences)} divergences")
+        print_divergences(divergences)
+        return 1
+    vacuous = vacuous_reason(outcomes)
+    if vacuous:
+        print(f"[FAIL] No divergences, but {vacuous}")
+        return 1
+    if not outcomes[OUTCOME_MATCHED]:
+        print("[WARN] No message matched a rule: only the no-match path was compared")
+    print("[OK] No divergences")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+r"""
+Folder resolution cache for withOutlookRulesYAML.py.
+
+OutlookSecurityAgent._get_account_folder walks Session.Accounts and, when the
+folder is not a direct child of the account root, searches the whole folder
+tree.  It runs at startup for every bulk folder and the Inbox, again in the
+second pass, and for every move_to_folder/copy_to_folder action, so once per
+matched email.
+
+FolderCache keeps what a resolution found:
+
+  - in memory: (account, folder name) -> MAPIFolder, for the rest of the run;
+  - on disk: (account, folder name) -> EntryID and StoreID, as JSON.  A later run
+    opens the folder with one Namespace.GetFolderFromID call.  The walk runs
+    again only when there is no entry, or when the stored ID no longer opens a
+    folder with that name (deleted, renamed, or a store that was re-created).
+
+Failed lookups are not cached: the agent retries them.
+
+Usage:
+    cache = FolderCache(namespace, "folder_cache.json", log_print)
+    folder = cache.get(email_address, "Bulk Mail", lambda: walk_accounts(email_address, "Bulk Mail"))
+"""
+
+import json
+import os
+
+FOLDER_CACHE_VERSION = 1
+
+
+def new_folder_cache_stats():
+    return {"memory_hits": 0, "id_hits": 0, "resolved": 0, "stale_ids": 0, "saves": 0}
+
+
+def folder_cache_key(account, folder_name):
+    return f"{account.lower()}|{folder_name}"
+
+
+class FolderCache:
+    r"""
+    (account, folder name) -> folder, backed by a JSON file of EntryIDs.
+
+    Args:
+        namespace: Outlook MAPI Namespace (None disables the EntryID lookups)
+        path: JSON file with the persisted EntryIDs (None keeps them in memory only)
+        log: callable(message, level="INFO"), e.g. OutlookSecurityAgent.log_print
+    """
+
+    def __init__(self, namespace, path=None, log=None):
+        self.namespace = namespace
+        self.path = path
+        self.log = log or (lambda message, level="INFO": None)
+        self.stats = new_folder_cache_stats()
+        self._folders = {}
+        self._ids = self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                doc = json.load(f)
+        except (OSError, ValueError) as e:
+            self.log(f"Ignoring unreadable folder cache {self.path}: {e}")
+            return {}
+        if not isinstance(doc, dict) or doc.get("version") != FOLDER_CACHE_VERSION:
+            return {}
+        return dict(doc.get("folders", {}))
+
+    def save(self):
+        r"""Write the EntryIDs (temporary file + rename, so a crash never leaves half a file)"""
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp = self.path + ".tmp"
+            with open(temp, 'w', encoding='utf-8') as f:
+                json.dump({"version": FOLDER_CACHE_VERSION, "folders": self._ids}, f, indent=2, sort_keys=True)
+            os.replace(temp, self.path)
+            self.stats["saves"] += 1
+        except OSError as e:
+            self.log(f"Could not save folder cache {self.path}: {e}")
+
+    def get(self, account, folder_name, resolve):
+        r"""
+        Folder for (account, folder_name): from memory, by stored EntryID, or via resolve().
+
+        Args:
+            account: SMTP address of the account
+            folder_name: folder name as configured
+            resolve: callable returning the folder (or None) the slow way
+
+        Returns:
+            MAPIFolder or None
+        """
+        key = folder_cache_key(account, folder_name)
+        folder = self._folders.get(key)
+        if folder is not None:
+            self.stats["memory_hits"] += 1
+            return folder
+        folder = self._open_by_id(key, folder_name)
+        if folder is not None:
+            self.stats["id_hits"] += 1
+            self._folders[key] = folder
+            return folder
+        folder = resolve()
+        if folder is None:
+            return None
+        self.stats["resolved"] += 1
+        self._folders[key] = folder
+        self._remember(key, folder)
+        return folder
+
+    def invalidate(self, account, folder_name):
+        r"""Forget a folder (e.g. after it was deleted); the next get() resolves it again"""
+        key = folder_cache_key(account, folder_name)
+        self._folders.pop(key, None)
+        if self._ids.pop(key, None) is not None:
+            self.save()
+
+    def _open_by_id(self, key, folder_name):
+        entry = self._ids.get(key)
+        if entry is None or self.namespace is None:
+            return None
+        try:
+            folder = self.namespace.GetFolderFromID(entry["entry_id"], entry.get("store_id"))
+            if folder.Name == folder_name:
+                return folder
+        except Exception as e:
+            self.log(f"Stored folder ID for {key} no longer opens: {e}", "DEBUG")
+        self.stats["stale_ids"] += 1
+        del self._ids[key]
+        return None
+
+    def _remember(self, key, folder):
+        try:
+            entry = {"entry_id": folder.EntryID, "store_id": folder.StoreID}
+        except Exception as e:
+            self.log(f"Folder {key} has no EntryID to cache: {e}", "DEBUG")
+            return
+        if self._ids.get(key) != entry:
+            self._ids[key] = entry
+            self.save()
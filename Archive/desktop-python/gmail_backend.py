@@ -0,0 +1,637 @@
+#!/usr/bin/env python3
+r"""
+Gmail backend for scan_backend() (see mail_backends.py), modeled on the Gmail REST API v1.
+
+Throughput is bounded by the per-user quota rather than by per-message HTTP latency:
+  - messages.list is paged at 500 ids per call;
+  - messages.get?format=metadata is sent through the batch endpoint (batch_size calls
+    per HTTP request) for header-only evaluation; format=raw is fetched, the same way,
+    only for messages a body rule still has to decide;
+  - actions are coalesced per message (mark read + move becomes one label change) and
+    applied with messages.batchModify / batchDelete, 1000 ids per call;
+  - every call is charged to a TokenBucket in Gmail quota units, so the client waits
+    instead of collecting 429s;
+  - identical in-flight requests are coalesced: duplicate ids in a get are fetched once
+    and answered from a small LRU resource cache.  Pages are evicted from it once they
+    are evaluated (actions only need the ids), so memory does not grow with the mailbox.
+
+Folders are labels: Inbox -> INBOX, Deleted Items -> TRASH, Bulk Mail/Spam/Junk -> SPAM,
+anything else is a user label of that name (created when a rule first moves mail to it).
+Deleting moves to TRASH (batchModify); purge uses batchDelete.
+
+Tests and bench.py run this backend against gmail_standin.py over a keep-alive http.client
+connection, so no extra HTTP package is needed.  With a session_pool.SessionPool the
+connection (and the label map) outlives the client: the next client for the same
+account and token reuses it instead of opening a new TLS connection.
+
+Usage:
+    GMAIL_TOKEN=... python gmail_backend.py --rules ../rules.yaml --safe-senders ../rules_safe_senders.yaml \
+        --folders "Bulk Mail" --days-back 30 --dry-run
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+import yaml
+
+from mail_backends import (
+    DEFAULT_TRASH_FOLDER, INBOX_FOLDER, MailBackend, parse_lines, scan_backend,
+)
+from query_planner import QueryPlan
+from rule_engine import CompiledRuleset, combine_email_header_lines
+from session_pool import DEFAULT_POOL_SIZE, SessionPool, http_alive, http_session_key
+
+GMAIL_API_URL = "https://gmail.googleapis.com"
+API_PREFIX = "/gmail/v1/users/me/"
+BATCH_PATH = "/batch/gmail/v1"
+
+# Per-user quota (units per second) and the cost of each call we make
+DEFAULT_QUOTA_PER_SEC = 250
+QUOTA_UNITS = {
+    "labels.list": 1,
+    "labels.create": 5,
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.batchModify": 50,
+    "messages.batchDelete": 50,
+}
+DEFAULT_BATCH_SIZE = 50          # calls per batch request (Gmail allows 100, recommends 50)
+MAX_MODIFY_IDS = 1000
+LIST_PAGE_SIZE = 500
+RESOURCE_CACHE_SIZE = 2 * LIST_PAGE_SIZE    # resources kept for coalescing (LRU)
+MAX_RETRIES = 5
+
+SYSTEM_FOLDERS = {
+    INBOX_FOLDER.lower(): "INBOX",
+    DEFAULT_TRASH_FOLDER.lower(): "TRASH",
+    "bulk mail": "SPAM",        # AOL's bulk folder is Gmail's Spam label
+    "bulk": "SPAM",
+    "spam": "SPAM",
+    "junk": "SPAM",
+}
+
+
+class GmailApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+
+class TokenBucket:
+    r"""
+    Token bucket in quota units.
+
+    Args:
+        rate: units added per second
+        capacity: maximum burst (defaults to one second of rate)
+        clock, sleep: injectable for tests
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.waited = 0.0
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, cost):
+        r"""Block until cost units are available; a cost above capacity runs the bucket into debt. Returns seconds waited"""
+        self._refill()
+        needed = min(cost, self.capacity)
+        waited = 0.0
+        if self.tokens < needed:
+            waited = (needed - self.tokens) / self.rate
+            self.sleep(waited)
+            self._refill()
+        self.tokens -= cost
+        self.waited += waited
+        return waited
+
+
+def _b64url_decode(data):
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _split_multipart(data, boundary):
+    delimiter = b"--" + boundary.encode()
+    parts = []
+    for chunk in data.split(delimiter)[1:]:
+        if chunk.startswith(b"--"):
+            break
+        parts.append(chunk.strip(b"\r\n"))
+    return parts
+
+
+def _split_head(block):
+    parts = re.split(rb'\r?\n\r?\n', block, maxsplit=1)
+    return parts[0], (parts[1] if len(parts) > 1 else b"")
+
+
+def _close_http(conn):
+    conn.close()
+
+
+class GmailApiClient:
+    r"""
+    Minimal Gmail API client over one keep-alive connection.
+
+    Args:
+        base_url: API root (GMAIL_API_URL, or a stand-in's URL)
+        token: OAuth access token sent as a Bearer token
+        bucket: TokenBucket charged in quota units (default: DEFAULT_QUOTA_PER_SEC)
+        batch_size: calls per batch HTTP request
+        pool: SessionPool to take the connection from and return it to on close()
+    """
+
+    def __init__(self, base_url=GMAIL_API_URL, token=None, bucket=None, batch_size=DEFAULT_BATCH_SIZE, timeout=60,
+                 pool=None):
+        url = urlsplit(base_url)
+        self.scheme = url.scheme
+        self.netloc = url.netloc
+        self.token = token
+        self.bucket = bucket or TokenBucket(DEFAULT_QUOTA_PER_SEC)
+        self.batch_size = max(1, min(batch_size, 100))
+        self.timeout = timeout
+        self._conn = None
+        self.pool = pool
+        self.session = None
+        self._state = {}
+        self._cache = OrderedDict()     # (id, format) -> resource, least recently used first
+        self.stats = {"http_requests": 0, "api_calls": 0, "quota_units": 0, "coalesced": 0, "throttled": 0}
+
+    # --- transport
+
+    def _new_connection(self):
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return cls(self.netloc, timeout=self.timeout)
+
+    def _open_connection(self):
+        r"""New connection with the TCP/TLS handshake already done (for prewarm)"""
+        conn = self._new_connection()
+        conn.connect()
+        return conn
+
+    @property
+    def session_key(self):
+        return http_session_key(self.scheme, self.netloc, self.token)
+
+    def prewarm(self, count=1):
+        r"""Connect on a background thread so the first call finds a session waiting in the pool"""
+        return self.pool.prewarm(self.session_key, self._open_connection, http_alive, _close_http, count)
+
+    def _connection(self):
+        if self._conn is None:
+            if self.pool is None:
+                self._conn = self._new_connection()
+            else:
+                self.session = self.pool.acquire(self.session_key, self._new_connection, http_alive, _close_http)
+                self._conn = self.session.conn
+        return self._conn
+
+    @property
+    def state(self):
+        r"""Cache dict that lives as long as the connection (the pooled session's state when pooled)"""
+        if self.pool is not None:
+            self._connection()
+            return self.session.state
+        return self._state
+
+    def close(self, discard=False):
+        if self.session is not None:
+            self.pool.release(self.session, discard=discard)
+            self.session = None
+        elif self._conn is not None:
+            self._conn.close()
+        self._conn = None
+
+    def _http(self, method, path, body=b"", headers=None):
+        headers = dict(headers or {})
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                self.stats["http_requests"] += 1
+                return response.status, response.headers, data
+            except (http.client.HTTPException, ConnectionError):
+                # Server closed the keep-alive connection: reconnect once
+                self.close(discard=True)
+                if attempt:
+                    raise
+
+    def _charge(self, method_name, calls=1):
+        units = QUOTA_UNITS[method_name] * calls
+        self.bucket.acquire(units)
+        self.stats["api_calls"] += calls
+        self.stats["quota_units"] += units
+
+    def call(self, method_name, http_method, path, params=None, body=None):
+        r"""One API call, retried on 429/5xx after waiting Retry-After (or the bucket refill)"""
+        url = API_PREFIX + path + ("?" + urlencode(params, doseq=True) if params else "")
+        payload = json.dumps(body).encode('utf-8') if body is not None else b""
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(MAX_RETRIES):
+            self._charge(method_name)
+            status, response_headers, data = self._http(http_method, url, payload, headers)
+            if status in (429, 500, 502, 503) and attempt + 1 < MAX_RETRIES:
+                self.stats["throttled"] += 1
+                self.bucket.sleep(float(response_headers.get("Retry-After") or 2 ** attempt))
+                continue
+            if status >= 400:
+                raise GmailApiError(status, data.decode('utf-8', 'replace'))
+            return json.loads(data) if data else None
+
+    # --- API
+
+    def list_labels(self):
+        return self.call("labels.list", "GET", "labels")["labels"]
+
+    def create_label(self, name):
+        return self.call("labels.create", "POST", "labels", body={"name": name})
+
+    def list_message_ids(self, label_ids=None, q=None, include_spam_trash=False):
+        r"""Page through messages.list; yields message ids"""
+        params = {"maxResults": LIST_PAGE_SIZE}
+        if label_ids:
+            params["labelIds"] = list(label_ids)
+        if q:
+            params["q"] = q
+        if include_spam_trash:
+            params["includeSpamTrash"] = "true"
+        while True:
+            page = self.call("messages.list", "GET", "messages", params)
+            for item in page.get("messages", []):
+                yield item["id"]
+            token = page.get("nextPageToken")
+            if not token:
+                return
+            params["pageToken"] = token
+
+    def get_messages(self, ids, fmt="metadata", metadata_headers=None):
+        r"""
+        messages.get for many ids through the batch endpoint.
+
+        Duplicate ids and ids still in the cache in this format are answered without a new get.
+
+        Returns:
+            dict: id -> message resource (missing ids are left out)
+        """
+        found = {}
+        wanted = []
+        for message_id in ids:
+            key = (message_id, fmt)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                found[message_id] = self._cache[key]
+                self.stats["coalesced"] += 1
+            elif message_id in found or message_id in wanted:
+                self.stats["coalesced"] += 1
+            else:
+                wanted.append(message_id)
+        params = {"format": fmt}
+        if metadata_headers:
+            params["metadataHeaders"] = list(metadata_headers)
+        query = urlencode(params, doseq=True)
+        pending = wanted
+        for attempt in range(MAX_RETRIES):
+            retry = []
+            for i in range(0, len(pending), self.batch_size):
+                chunk = pending[i:i + self.batch_size]
+                for message_id, status, resource in self._batch_get(chunk, query):
+                    if status == 200:
+                        found[message_id] = resource
+                        self._remember((message_id, fmt), resource)
+                    elif status in (429, 500, 503):
+                        retry.append(message_id)
+            if not retry:
+                break
+            self.stats["throttled"] += len(retry)
+            self.bucket.sleep(2 ** attempt * 0.5)
+            pending = retry
+        return {message_id: found[message_id] for message_id in ids if message_id in found}
+
+    def _remember(self, key, resource):
+        self._cache[key] = resource
+        self._cache.move_to_end(key)
+        while len(self._cache) > RESOURCE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+    def _batch_get(self, ids, query):
+        self._charge("messages.get", len(ids))
+        boundary = f"batch_{uuid.uuid4().hex}"
+        body = b"".join(
+            f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <item{n}>\r\n\r\n"
+            f"GET {API_PREFIX}messages/{message_id}?{query}\r\n\r\n".encode()
+            for n, message_id in enumerate(ids)
+        ) + f"--{boundary}--\r\n".encode()
+        status, headers, data = self._http("POST", BATCH_PATH, body, {"Content-Type": f"multipart/mixed; boundary={boundary}"})
+        if status >= 400:
+            raise GmailApiError(status, data.decode('utf-8', 'replace'))
+        found = re.search(r'boundary="?([^";]+)"?', headers.get("Content-Type", ""))
+        if not found:
+            raise GmailApiError(status, "batch response has no multipart boundary")
+        # Parts come back in any order: match them to ids by Content-ID <response-itemN>
+        results = {}
+        for part in _split_multipart(data, found.group(1)):
+            part_headers, inner = _split_head(part)
+            content_id = re.search(rb'(?im)^Content-ID:\s*<response-item(\d+)>', part_headers)
+            n = int(content_id.group(1)) if content_id else -1
+            if not 0 <= n < len(ids):
+                raise GmailApiError(status, f"batch response part with unknown Content-ID: {part_headers[:200]!r}")
+            status_line = inner.split(b"\n", 1)[0].decode()
+            inner_status = int(status_line.split()[1])
+            _inner_headers, inner_body = _split_head(inner)
+            results[ids[n]] = (ids[n], inner_status, json.loads(inner_body) if inner_status == 200 else None)
+        missing = [message_id for message_id in ids if message_id not in results]
+        if missing:
+            raise GmailApiError(status, f"batch response is missing {len(missing)} of {len(ids)} parts")
+        return [results[message_id] for message_id in ids]
+
+    def batch_modify(self, ids, add_label_ids=(), remove_label_ids=()):
+        ids = list(ids)
+        for i in range(0, len(ids), MAX_MODIFY_IDS):
+            self.call("messages.batchModify", "POST", "messages/batchModify", body={
+                "ids": ids[i:i + MAX_MODIFY_IDS],
+                "addLabelIds": sorted(add_label_ids),
+                "removeLabelIds": sorted(remove_label_ids),
+            })
+
+    def batch_delete(self, ids):
+        ids = list(ids)
+        for i in range(0, len(ids), MAX_MODIFY_IDS):
+            self.call("messages.batchDelete", "POST", "messages/batchDelete", body={"ids": ids[i:i + MAX_MODIFY_IDS]})
+
+    def forget(self, message_id):
+        for fmt in ("metadata", "raw", "minimal", "full"):
+            self._cache.pop((message_id, fmt), None)
+
+    def forget_page(self, ids, fmt):
+        r"""Evict a page of resources once it is evaluated"""
+        for message_id in ids:
+            self._cache.pop((message_id, fmt), None)
+
+
+def message_from_metadata(resource, folder):
+    r"""LocalMailMessage from a format=metadata resource (no body)"""
+    headers = resource.get("payload", {}).get("headers", [])
+    raw_header = "\n".join(f"{h['name']}: {h['value']}" for h in headers)
+    block = raw_header.encode('utf-8') + b"\n\n"
+    message = parse_lines(block.splitlines(keepends=True), resource["id"], folder, location=resource["id"],
+                          unread="UNREAD" in resource.get("labelIds", []))
+    try:
+        message.header = combine_email_header_lines(raw_header)
+    except IndexError:
+        message.header = ""
+    if message.ReceivedTime is None and resource.get("internalDate"):
+        message.ReceivedTime = datetime.fromtimestamp(int(resource["internalDate"]) / 1000)
+    message.label_ids = set(resource.get("labelIds", []))
+    return message
+
+
+def message_from_raw(resource, folder):
+    r"""LocalMailMessage from a format=raw resource"""
+    raw = _b64url_decode(resource["raw"])
+    message = parse_lines(raw.splitlines(keepends=True), resource["id"], folder, location=resource["id"],
+                          unread="UNREAD" in resource.get("labelIds", []))
+    if message.ReceivedTime is None and resource.get("internalDate"):
+        message.ReceivedTime = datetime.fromtimestamp(int(resource["internalDate"]) / 1000)
+    message.label_ids = set(resource.get("labelIds", []))
+    return message
+
+
+class GmailBackend(MailBackend):
+    r"""
+    MailBackend over the Gmail API.
+
+    Args:
+        client: GmailApiClient
+        trash_folder, purge: see MailBackend (purge uses batchDelete)
+    """
+    name = "gmail"
+    query_dialect = "gmail"
+
+    def __init__(self, client, trash_folder=DEFAULT_TRASH_FOLDER, purge=False):
+        super().__init__(trash_folder, purge)
+        self.client = client
+        self.root = client.netloc
+        self._labels = None             # name -> id
+        self._changes = {}              # message id -> (set add, set remove)
+        self._purge_ids = set()
+        self.stats = {"headers_fetched": 0, "bodies_fetched": 0}
+
+    # --- labels
+
+    def _load_labels(self):
+        if self._labels is None:
+            state = self.client.state
+            if "labels" not in state:
+                state["labels"] = {label["name"]: label["id"] for label in self.client.list_labels()}
+            self._labels = state["labels"]
+        return self._labels
+
+    def label_id(self, folder, create=False):
+        system = SYSTEM_FOLDERS.get(folder.lower())
+        if system:
+            return system
+        labels = self._load_labels()
+        if folder not in labels and create:
+            labels[folder] = self.client.create_label(folder)["id"]
+        return labels.get(folder)
+
+    def list_folders(self):
+        folders = [INBOX_FOLDER, DEFAULT_TRASH_FOLDER, "Bulk Mail"]
+        # System labels are named by their id; user labels have their own ids
+        folders += sorted(name for name, label_id in self._load_labels().items() if name != label_id)
+        return folders
+
+    # --- fetching
+
+    def search_query(self, cutoff=None):
+        return f"after:{cutoff.strftime('%Y/%m/%d')}" if cutoff is not None else None
+
+    def _ids(self, folder, cutoff, query=None):
+        label_id = self.label_id(folder)
+        if label_id is None:
+            return []
+        q = " ".join(part for part in (self.search_query(cutoff), query) if part) or None
+        return list(self.client.list_message_ids([label_id], q, include_spam_trash=label_id in ("SPAM", "TRASH")))
+
+    def search_candidates(self, folder, queries, cutoff=None):
+        r"""Union of messages.list results, one listing per q (queries from query_planner.gmail_query)"""
+        ids = set()
+        for query in queries:
+            ids.update(self._ids(folder, cutoff, query))
+        return ids
+
+    def evaluate_folder(self, folder, ruleset, cutoff=None, select=None):
+        r"""Header-first evaluation: format=raw is fetched only for messages a body rule still has to decide"""
+        ids = self._ids(folder, cutoff)
+        if select is not None:
+            ids = [message_id for message_id in ids if select(message_id)]
+        undecided = []
+        for i in range(0, len(ids), LIST_PAGE_SIZE):
+            chunk = ids[i:i + LIST_PAGE_SIZE]
+            resources = self.client.get_messages(chunk, "metadata")
+            for message_id in chunk:
+                resource = resources.get(message_id)
+                if resource is None:
+                    continue
+                self.stats["headers_fetched"] += 1
+                message = message_from_metadata(resource, folder)
+                verdict = ruleset.evaluate_headers(message.view())
+                if verdict is None:
+                    undecided.append(message_id)
+                else:
+                    yield message, verdict
+            self.client.forget_page(chunk, "metadata")
+        for i in range(0, len(undecided), LIST_PAGE_SIZE):
+            chunk = undecided[i:i + LIST_PAGE_SIZE]
+            resources = self.client.get_messages(chunk, "raw")
+            for message_id in chunk:
+                resource = resources.get(message_id)
+                if resource is None:
+                    continue
+                self.stats["bodies_fetched"] += 1
+                message = message_from_raw(resource, folder)
+                yield message, ruleset.evaluate(message.view())
+            self.client.forget_page(chunk, "raw")
+
+    def iter_messages(self, folder):
+        ids = self._ids(folder, None)
+        for i in range(0, len(ids), LIST_PAGE_SIZE):
+            chunk = ids[i:i + LIST_PAGE_SIZE]
+            resources = self.client.get_messages(chunk, "raw")
+            for message_id in chunk:
+                if message_id in resources:
+                    yield message_from_raw(resources[message_id], folder)
+            self.client.forget_page(chunk, "raw")
+
+    # --- actions (coalesced per message, applied by flush())
+
+    def _change(self, message):
+        return self._changes.setdefault(message.location, (set(), set()))
+
+    def move(self, message, folder):
+        add, remove = self._change(message)
+        source = self.label_id(message.folder)
+        target = self.label_id(folder, create=True)
+        add.add(target)
+        add.discard(source)
+        if source and source != target:
+            remove.add(source)
+        remove.discard(target)
+        message.folder = folder
+
+    def copy(self, message, folder):
+        add, remove = self._change(message)
+        target = self.label_id(folder, create=True)
+        add.add(target)
+        remove.discard(target)
+
+    def remove(self, message):
+        self._purge_ids.add(message.location)
+
+    def mark_read(self, message):
+        add, remove = self._change(message)
+        remove.add("UNREAD")
+        add.discard("UNREAD")
+        message.UnRead = False
+
+    def assign_category(self, message, category):
+        self.copy(message, category)
+        return True
+
+    def flush(self):
+        r"""One batchModify per distinct label change (1000 ids per call), then one batchDelete"""
+        changes, self._changes = self._changes, {}
+        purge_ids, self._purge_ids = self._purge_ids, set()
+        groups = {}
+        for message_id, (add, remove) in changes.items():
+            if message_id in purge_ids or not (add or remove):
+                continue
+            groups.setdefault((frozenset(add), frozenset(remove)), []).append(message_id)
+        for (add, remove), ids in sorted(groups.items(), key=lambda g: (sorted(g[0][0]), sorted(g[0][1]))):
+            self.client.batch_modify(ids, add, remove)
+        if purge_ids:
+            self.client.batch_delete(sorted(purge_ids))
+        for message_id in list(changes) + list(purge_ids):
+            self.client.forget(message_id)
+
+    def close(self):
+        self.flush()
+        self.client.close()
+
+
+#------------------CLI------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply rules.yaml / rules_safe_senders.yaml to a Gmail account')
+    parser.add_argument('--api-url', default=GMAIL_API_URL, help='API root (for a stand-in server)')
+    parser.add_argument('--token-env', default='GMAIL_TOKEN', help='Environment variable holding the OAuth access token')
+    parser.add_argument('--rules', required=True, help='rules.yaml')
+    parser.add_argument('--safe-senders', required=True, help='rules_safe_senders.yaml')
+    parser.add_argument('--folders', nargs='+', default=["Bulk Mail"], help='Folders (labels) to scan')
+    parser.add_argument('--days-back', type=int, help='Only messages received in the last N days')
+    parser.add_argument('--quota', type=float, default=DEFAULT_QUOTA_PER_SEC, help='Quota units per second to stay under')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Calls per batch request (max 100)')
+    parser.add_argument('--purge', action='store_true', help='batchDelete instead of moving to Trash')
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--push-down', action='store_true',
+                        help='Let the server search for sender candidates (see query_planner.py)')
+    parser.add_argument('--report', help='Write per-message results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    # Connect while the rules load and compile
+    pool = SessionPool(DEFAULT_POOL_SIZE)
+    client = GmailApiClient(args.api_url, os.environ.get(args.token_env), TokenBucket(args.quota), args.batch_size,
+                            pool=pool)
+    client.prewarm()
+    with open(args.rules, 'r', encoding='utf-8') as f:
+        rules_json = yaml.safe_load(f) or {"rules": []}
+    with open(args.safe_senders, 'r', encoding='utf-8') as f:
+        safe_senders = yaml.safe_load(f) or {"safe_senders": []}
+    backend = GmailBackend(client, purge=args.purge)
+    plan = QueryPlan(rules_json, safe_senders, backend.query_dialect) if args.push_down else None
+    if plan is not None:
+        print(f"[INFO] Push-down plan: {plan.summary()}")
+    start = time.perf_counter()
+    outcome = scan_backend(backend, plan.ruleset if plan else CompiledRuleset(rules_json, safe_senders), args.folders,
+                           days_back=args.days_back, dry_run=args.dry_run, log=lambda m: print(f"[INFO] {m}"), plan=plan)
+    backend.close()
+    pool.close()
+    elapsed = time.perf_counter() - start
+    stats = outcome["stats"]
+    print(f"[OK] Processed {stats['processed']} messages in {elapsed:.1f}s with {client.stats['http_requests']} HTTP requests "
+          f"({client.stats['quota_units']} quota units, {client.bucket.waited:.1f}s throttled): "
+          f"{stats['deleted']} deleted, {stats['moved']} moved, {stats['errors']} errors")
+    if plan is not None:
+        print(f"[INFO] Push-down: {plan.stats['candidates']} candidates from the server, "
+              f"{plan.stats['residual_evaluated']} other messages checked against the residual rules")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(outcome, f, indent=2, default=str)
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
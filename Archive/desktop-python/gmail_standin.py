@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+r"""
+In-process stand-in for the Gmail REST API (v1) for testing and benchmarking gmail_backend.py.
+
+Implements the calls the backend uses, with Gmail's request and response shapes:
+    GET  /gmail/v1/users/me/labels
+    POST /gmail/v1/users/me/labels
+    GET  /gmail/v1/users/me/messages                 (labelIds, q, maxResults, pageToken, includeSpamTrash)
+    GET  /gmail/v1/users/me/messages/{id}            (format=minimal|metadata|raw, metadataHeaders)
+    POST /gmail/v1/users/me/messages/batchModify     (at most 1000 ids)
+    POST /gmail/v1/users/me/messages/batchDelete     (at most 1000 ids)
+    POST /batch/gmail/v1                             (multipart/mixed, at most 100 calls)
+
+Quota is charged in Gmail's per-user units (see QUOTA_UNITS).  When quota_per_sec is
+set, a call that would exceed it within the current one-second window gets HTTP 429
+rateLimitExceeded, like the real service.  Every HTTP request is recorded in request_log.
+
+Search (q) supports from:, to:, subject:, after:YYYY/MM/DD, before:YYYY/MM/DD, bare words and {...} OR groups.
+
+Usage:
+    server = GmailStandinServer()
+    server.add_message(raw_bytes, label_ids=("INBOX", "UNREAD"))
+    base_url = server.start()
+    ...
+    server.stop()
+"""
+
+import base64
+import json
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from email.parser import BytesHeaderParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+SYSTEM_LABELS = ["INBOX", "SPAM", "TRASH", "UNREAD", "STARRED", "IMPORTANT", "SENT", "DRAFT"]
+
+QUOTA_UNITS = {
+    "labels.list": 1,
+    "labels.create": 5,
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.batchModify": 50,
+    "messages.batchDelete": 50,
+}
+
+MAX_BATCH_CALLS = 100
+MAX_BATCH_IDS = 1000
+API_PREFIX = "/gmail/v1/users/me/"
+
+
+class _ApiError(Exception):
+    def __init__(self, status, reason, message):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+class StandinGmailMessage:
+    def __init__(self, message_id, raw, label_ids, internal_date):
+        self.id = message_id
+        self.thread_id = message_id
+        self.raw = raw
+        self.label_ids = set(label_ids)
+        self.internal_date = internal_date
+        head = re.split(rb'\r?\n\r?\n', raw, maxsplit=1)[0]
+        self.headers = BytesHeaderParser().parsebytes(head + b"\n\n")
+
+    def resource(self, fmt, metadata_headers=None):
+        out = {"id": self.id, "threadId": self.thread_id, "labelIds": sorted(self.label_ids),
+               "internalDate": str(int(self.internal_date.timestamp() * 1000)), "sizeEstimate": len(self.raw)}
+        if fmt == "raw":
+            out["raw"] = b64url(self.raw)
+        elif fmt in ("metadata", "full"):
+            wanted = {h.lower() for h in metadata_headers or []}
+            out["payload"] = {
+                "mimeType": self.headers.get_content_type(),
+                "headers": [{"name": k, "value": str(v)} for k, v in self.headers.items()
+                            if not wanted or k.lower() in wanted],
+            }
+        return out
+
+
+class GmailStandinServer(ThreadingHTTPServer):
+    r"""
+    Threaded Gmail API stand-in bound to 127.0.0.1 on a free port.
+
+    Attributes:
+        messages: id -> StandinGmailMessage
+        labels: id -> name (system labels use their id as name)
+        request_log: [(method, path, number of calls in the request)]
+        units_used: quota units charged so far
+        throttled: number of 429 responses sent
+    """
+    daemon_threads = True
+
+    def __init__(self, token=None, quota_per_sec=None, latency=0.0):
+        super().__init__(("127.0.0.1", 0), _GmailHandler)
+        self.token = token
+        self.quota_per_sec = quota_per_sec
+        self.latency = latency
+        self.reverse_batch_responses = False   # Gmail does not promise batch response order
+        self.messages = {}
+        self.labels = {name: name for name in SYSTEM_LABELS}
+        self.request_log = []
+        self.units_used = 0
+        self.throttled = 0
+        self.lock = threading.RLock()
+        self._next_id = 0x18c0000000000000
+        self._next_label = 1
+        self._window = (0, 0)           # (second, units used in that second)
+
+    def add_message(self, raw, label_ids=("INBOX", "UNREAD"), internal_date=None):
+        with self.lock:
+            self._next_id += 1
+            message_id = f"{self._next_id:x}"
+            self.messages[message_id] = StandinGmailMessage(
+                message_id, raw, label_ids, internal_date or datetime.now(timezone.utc))
+            return message_id
+
+    def label_id(self, name):
+        with self.lock:
+            for label_id, label_name in self.labels.items():
+                if label_name == name:
+                    return label_id
+            return None
+
+    def messages_with_label(self, label_id):
+        return [m for m in self.messages.values() if label_id in m.label_ids]
+
+    def requests(self, path_suffix=None):
+        return [r for r in self.request_log if path_suffix is None or r[1].endswith(path_suffix)]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    # --- quota
+
+    def charge(self, method_name):
+        units = QUOTA_UNITS[method_name]
+        with self.lock:
+            if self.quota_per_sec is not None:
+                second = int(time.monotonic())
+                window_second, used = self._window
+                if window_second != second:
+                    used = 0
+                if used + units > self.quota_per_sec:
+                    self.throttled += 1
+                    raise _ApiError(429, "rateLimitExceeded", "User-rate limit exceeded")
+                self._window = (second, used + units)
+            self.units_used += units
+
+    # --- API calls: each returns (status, json-able body or None)
+
+    def call(self, method, path, query, body):
+        if not path.startswith(API_PREFIX):
+            raise _ApiError(404, "notFound", f"Unknown path {path}")
+        parts = path[len(API_PREFIX):].split('/')
+        with self.lock:
+            if parts == ["labels"] and method == "GET":
+                self.charge("labels.list")
+                return 200, {"labels": [{"id": i, "name": n, "type": "system" if i in SYSTEM_LABELS else "user"}
+                                        for i, n in self.labels.items()]}
+            if parts == ["labels"] and method == "POST":
+                self.charge("labels.create")
+                name = body["name"]
+                if self.label_id(name) is not None:
+                    raise _ApiError(409, "duplicate", "Label name exists or conflicts")
+                label_id = f"Label_{self._next_label}"
+                self._next_label += 1
+                self.labels[label_id] = name
+                return 200, {"id": label_id, "name": name, "type": "user"}
+            if parts == ["messages"] and method == "GET":
+                self.charge("messages.list")
+                return 200, self._list(query)
+            if parts == ["messages", "batchModify"] and method == "POST":
+                self.charge("messages.batchModify")
+                ids = self._batch_ids(body)
+                for message_id in ids:
+                    message = self.messages.get(message_id)
+                    if message is not None:
+                        message.label_ids |= set(body.get("addLabelIds", []))
+                        message.label_ids -= set(body.get("removeLabelIds", []))
+                return 204, None
+            if parts == ["messages", "batchDelete"] and method == "POST":
+                self.charge("messages.batchDelete")
+                for message_id in self._batch_ids(body):
+                    self.messages.pop(message_id, None)
+                return 204, None
+            if len(parts) == 2 and parts[0] == "messages" and method == "GET":
+                self.charge("messages.get")
+                message = self.messages.get(parts[1])
+                if message is None:
+                    raise _ApiError(404, "notFound", "Requested entity was not found.")
+                fmt = query.get("format", ["full"])[0]
+                return 200, message.resource(fmt, query.get("metadataHeaders"))
+        raise _ApiError(404, "notFound", f"Unknown call {method} {path}")
+
+    @staticmethod
+    def _batch_ids(body):
+        ids = body.get("ids", [])
+        if len(ids) > MAX_BATCH_IDS:
+            raise _ApiError(400, "invalidArgument", f"Too many ids: {len(ids)} > {MAX_BATCH_IDS}")
+        return ids
+
+    def _list(self, query):
+        label_ids = query.get("labelIds", [])
+        include_spam_trash = query.get("includeSpamTrash", ["false"])[0] == "true"
+        q = query.get("q", [""])[0]
+        matches = []
+        for message in sorted(self.messages.values(), key=lambda m: (m.internal_date, m.id), reverse=True):
+            if not all(label in message.label_ids for label in label_ids):
+                continue
+            if not include_spam_trash and not label_ids and message.label_ids & {"SPAM", "TRASH"}:
+                continue
+            if q and not _matches_query(message, q):
+                continue
+            matches.append(message)
+        page_size = min(int(query.get("maxResults", ["100"])[0]), 500)
+        start = int(query.get("pageToken", ["0"])[0])
+        page = matches[start:start + page_size]
+        out = {"resultSizeEstimate": len(matches)}
+        if page:
+            out["messages"] = [{"id": m.id, "threadId": m.thread_id} for m in page]
+        if start + page_size < len(matches):
+            out["nextPageToken"] = str(start + page_size)
+        return out
+
+
+def _matches_query(message, q):
+    for term in re.findall(r'\{[^}]*\}|\S+:"[^"]*"|\S+:\S+|"[^"]*"|\S+', q):
+        if term.startswith('{'):
+            # {a b c} is an OR group
+            if not any(_matches_query(message, inner) for inner in re.findall(r'\S+:"[^"]*"|\S+:\S+|"[^"]*"|\S+', term[1:-1])):
+                return False
+            continue
+        key, sep, value = term.partition(':')
+        if not sep:
+            key, value = "", term
+        value = value.strip('"').lower()
+        key = key.lower()
+        if key in ("from", "to", "subject"):
+            if value not in str(message.headers.get(key, "")).lower():
+                return False
+        elif key in ("after", "before"):
+            day = datetime.strptime(value, "%Y/%m/%d").replace(tzinfo=timezone.utc)
+            if (key == "after" and message.internal_date < day) or (key == "before" and message.internal_date >= day):
+                return False
+        elif key == "":
+            if value not in message.raw.decode('utf-8', 'replace').lower():
+                return False
+        else:
+            return False
+    return True
+
+
+def _error_body(error):
+    return {"error": {"code": error.status, "message": str(error),
+                      "errors": [{"reason": error.reason, "message": str(error)}]}}
+
+
+class _GmailHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="application/json; charset=UTF-8"):
+        data = b"" if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode('utf-8'))
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "1")
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        token = self.server.token
+        return token is None or self.headers.get("Authorization") == f"Bearer {token}"
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _dispatch(self, method):
+        raw_body = self._body()
+        url = urlsplit(self.path)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if not self._authorized():
+            self.server.request_log.append((method, url.path, 1))
+            return self._send(401, _error_body(_ApiError(401, "authError", "Invalid Credentials")))
+        if url.path == "/batch/gmail/v1" and method == "POST":
+            return self._batch(raw_body)
+        self.server.request_log.append((method, url.path, 1))
+        try:
+            body = json.loads(raw_body) if raw_body else {}
+            status, payload = self.server.call(method, url.path, parse_qs(url.query), body)
+        except _ApiError as e:
+            status, payload = e.status, _error_body(e)
+        self._send(status, payload)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _batch(self, raw_body):
+        found = re.search(r'boundary="?([^";]+)"?', self.headers.get("Content-Type", ""))
+        if not found:
+            self.server.request_log.append(("POST", "/batch/gmail/v1", 0))
+            return self._send(400, _error_body(_ApiError(400, "invalidArgument", "Missing boundary")))
+        parts = split_multipart(raw_body, found.group(1))
+        self.server.request_log.append(("POST", "/batch/gmail/v1", len(parts)))
+        if len(parts) > MAX_BATCH_CALLS:
+            return self._send(400, _error_body(_ApiError(400, "invalidArgument", "Too many requests in batch")))
+        boundary = "batch_standin_response"
+        out = []
+        for index, part in enumerate(parts, start=1):
+            part_headers, inner = _split_head(part)
+            content_id = re.search(rb'(?im)^Content-ID:\s*<([^>]*)>', part_headers)
+            response_id = f"response-{content_id.group(1).decode() if content_id else index}"
+            request_line, _inner_headers_body = (inner.split(b"\n", 1) + [b""])[:2]
+            method, target = request_line.decode().split()[:2]
+            url = urlsplit(target)
+            try:
+                status, payload = self.server.call(method, url.path, parse_qs(url.query), {})
+            except _ApiError as e:
+                status, payload = e.status, _error_body(e)
+            body = json.dumps(payload).encode('utf-8') if payload is not None else b""
+            out.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <{response_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status < 400 else 'Error'}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+                + body + b"\r\n")
+        if self.server.reverse_batch_responses:
+            out.reverse()
+        out.append(f"--{boundary}--\r\n".encode())
+        self._send(200, b"".join(out), f"multipart/mixed; boundary={boundary}")
+
+
+def _split_head(block):
+    r"""Split a header block from its body at the first blank line"""
+    parts = re.split(rb'\r?\n\r?\n', block, maxsplit=1)
+    return parts[0], (parts[1] if len(parts) > 1 else b"")
+
+
+def split_multipart(data, boundary):
+    r"""Split a multipart/mixed body into its raw parts (part headers included)"""
+    delimiter = b"--" + boundary.encode()
+    parts = []
+    for chunk in data.split(delimiter)[1:]:
+        if chunk.startswith(b"--"):
+            break
+        parts.append(chunk.strip(b"\r\n"))
+    return parts
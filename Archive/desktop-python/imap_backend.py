@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+r"""
+IMAP backend for scan_backend() (see mail_backends.py).
+
+Round trips are what make IMAP scans slow, so the backend:
+  - fetches headers only, with UID FETCH (UID FLAGS INTERNALDATE BODY.PEEK[HEADER])
+    over UID sets of batch_size messages, keeping up to pipeline_depth commands in
+    flight before reading the replies;
+  - evaluates the header-only verdict (CompiledRuleset.evaluate_headers) and fetches
+    BODY.PEEK[TEXT] only for messages a body rule still has to decide, in the same
+    pipelined batches;
+  - queues every action and applies it per folder as one UID STORE / UID COPY /
+    UID MOVE command per target over compressed UID ranges ('3:9,12');
+  - with a session_pool.SessionPool, takes a logged-in connection from the pool and
+    gives it back on close(), together with the selected folder and folder list, so
+    the next backend for the same account skips LOGIN (and SELECT when it stays in
+    the same folder).
+
+The mobile app's generic_imap_adapter.dart is the Dart counterpart.  Tests and
+bench.py run this backend against imap_standin.py.
+
+Usage:
+    python imap_backend.py --host imap.example.com --user me@example.com --password-env IMAP_PASSWORD \
+        --rules ../rules.yaml --safe-senders ../rules_safe_senders.yaml --folders "Bulk Mail" --dry-run
+"""
+
+import argparse
+import imaplib
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from datetime import datetime
+
+import yaml
+
+from mail_backends import (
+    DEFAULT_TRASH_FOLDER, INBOX_FOLDER, MailBackend, parse_lines, scan_backend,
+)
+from query_planner import QueryPlan
+from rule_engine import CompiledRuleset
+from session_pool import DEFAULT_POOL_SIZE, SessionPool, imap_logout, imap_noop, imap_session_key
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_PIPELINE_DEPTH = 4
+HEADER_FETCH_ITEMS = "(UID FLAGS INTERNALDATE BODY.PEEK[HEADER])"
+BODY_FETCH_ITEMS = "(UID BODY.PEEK[TEXT])"
+
+_UID_RE = re.compile(rb'UID (\d+)')
+_FLAGS_RE = re.compile(rb'FLAGS \(([^)]*)\)')
+_LIST_RE = re.compile(rb'\((?P<flags>[^)]*)\) (?P<delim>"[^"]*"|NIL) (?P<name>.+)')
+
+
+def compress_uids(uids):
+    r"""Render UIDs as an IMAP set of ranges: [1, 2, 3, 7, 9, 10] -> '1:3,7,9:10'"""
+    uids = sorted(set(int(u) for u in uids))
+    parts = []
+    start = prev = None
+    for uid in uids:
+        if start is None:
+            start = prev = uid
+        elif uid == prev + 1:
+            prev = uid
+        else:
+            parts.append(f"{start}:{prev}" if prev != start else str(start))
+            start = prev = uid
+    if start is not None:
+        parts.append(f"{start}:{prev}" if prev != start else str(start))
+    return ",".join(parts)
+
+
+def quote_mailbox(name):
+    return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def imap_keyword(category):
+    r"""IMAP keywords are atoms: map a category name onto one"""
+    return re.sub(r'[^A-Za-z0-9_$.-]', '_', category)
+
+
+def parse_fetch_response(data):
+    r"""
+    Split imaplib FETCH data into per-message records.
+
+    Returns:
+        list: (uid, flags tuple, internaldate datetime or None, literal bytes) per message
+    """
+    records = []
+    for item in data:
+        if not isinstance(item, tuple):
+            if records and records[-1][0] is None and item:
+                # Some servers send UID after the literal: b' UID 12)'
+                found = _UID_RE.search(item)
+                if found:
+                    records[-1] = (int(found.group(1)),) + records[-1][1:]
+            continue
+        prefix, literal = item
+        found = _UID_RE.search(prefix)
+        flags = _FLAGS_RE.search(prefix)
+        received = imaplib.Internaldate2tuple(prefix)
+        records.append((
+            int(found.group(1)) if found else None,
+            tuple(flags.group(1).decode().split()) if flags else (),
+            datetime.fromtimestamp(time.mktime(received)) if received else None,
+            literal,
+        ))
+    return records
+
+
+class ImapBackend(MailBackend):
+    r"""
+    MailBackend over one IMAP connection.
+
+    Args:
+        host, port, user, password: account
+        use_ssl: IMAP4_SSL instead of plain IMAP4
+        batch_size: UIDs per FETCH command
+        pipeline_depth: FETCH commands sent before the first reply is read (1 = no pipelining)
+        trash_folder, purge: see MailBackend
+        connection: an already logged-in imaplib connection (host/user/password are then unused)
+        pool: SessionPool to take the connection from and return it to on close()
+    """
+    name = "imap"
+    query_dialect = "imap"
+
+    def __init__(self, host="127.0.0.1", port=None, user=None, password=None, use_ssl=False,
+                 batch_size=DEFAULT_BATCH_SIZE, pipeline_depth=DEFAULT_PIPELINE_DEPTH,
+                 trash_folder=DEFAULT_TRASH_FOLDER, purge=False, connection=None, pool=None):
+        super().__init__(trash_folder, purge)
+        self.root = f"{user}@{host}" if user else host
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+        self.batch_size = max(1, batch_size)
+        self.pipeline_depth = max(1, pipeline_depth)
+        self.conn = connection
+        self.pool = pool
+        self.session = None
+        self.selected = None
+        self._pending = {}              # (op, argument) -> set of UIDs in the selected folder
+        self._known_folders = None
+        self.stats = {"header_fetch_commands": 0, "body_fetch_commands": 0, "headers_fetched": 0,
+                      "bodies_fetched": 0, "action_commands": 0}
+
+    # --- connection
+
+    def _login(self):
+        cls = imaplib.IMAP4_SSL if self.use_ssl else imaplib.IMAP4
+        conn = cls(self.host, self.port or (993 if self.use_ssl else 143))
+        conn.login(self.user, self.password)
+        return conn
+
+    @property
+    def session_key(self):
+        return imap_session_key(self.host, self.port, self.user, self.use_ssl)
+
+    def prewarm(self, count=1):
+        r"""Log in on a background thread so connect() finds a session waiting in the pool"""
+        return self.pool.prewarm(self.session_key, self._login, imap_noop, imap_logout, count)
+
+    def connect(self):
+        if self.conn is None:
+            if self.pool is None:
+                self.conn = self._login()
+            else:
+                self.session = self.pool.acquire(self.session_key, self._login, imap_noop, imap_logout)
+                self.conn = self.session.conn
+                # Folder state belongs to the connection, not to this backend
+                self.selected = self.session.state.get("selected")
+                self._known_folders = self.session.state.get("folders")
+        return self.conn
+
+    def close(self, discard=False):
+        r"""Apply queued actions, then log out (or hand the connection back to the pool)"""
+        try:
+            self.flush()
+        except Exception:
+            discard = True
+            raise
+        finally:
+            if self.session is not None:
+                self.session.state["selected"] = self.selected
+                self.session.state["folders"] = self._known_folders
+                self.pool.release(self.session, discard=discard)
+                self.session = None
+            elif self.conn is not None:
+                try:
+                    self.conn.logout()
+                except Exception:
+                    pass
+            self.conn = None
+            self.selected = None
+
+    def _check(self, typ, data, what):
+        if typ != 'OK':
+            raise imaplib.IMAP4.error(f"{what} failed: {data}")
+        return data
+
+    # --- folders
+
+    @staticmethod
+    def server_name(folder):
+        return "INBOX" if folder.lower() == INBOX_FOLDER.lower() else folder
+
+    def list_folders(self):
+        data = self._check(*self.connect().list(), "LIST")
+        folders = []
+        for line in data:
+            found = _LIST_RE.match(line or b"")
+            if not found or b"\\Noselect" in found.group('flags'):
+                continue
+            name = found.group('name').decode('utf-8')
+            if name.startswith('"'):
+                name = name[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+            folders.append(INBOX_FOLDER if name.upper() == "INBOX" else name)
+        self._known_folders = set(folders)
+        return folders
+
+    def select(self, folder):
+        conn = self.connect()          # a pooled connection may already have the folder selected
+        if self.selected != folder:
+            self.flush()
+            self._check(*conn.select(quote_mailbox(self.server_name(folder))), f"SELECT {folder}")
+            self.selected = folder
+        return conn
+
+    def _ensure_folder(self, folder):
+        if self._known_folders is None:
+            self.list_folders()
+        if folder not in self._known_folders:
+            typ, data = self.conn.create(quote_mailbox(self.server_name(folder)))
+            if typ != 'OK' and b"ALREADYEXISTS" not in b" ".join(d for d in data if d):
+                raise imaplib.IMAP4.error(f"CREATE {folder} failed: {data}")
+            self._known_folders.add(folder)
+
+    # --- fetching
+
+    def search_uids(self, folder, criteria="ALL"):
+        conn = self.select(folder)
+        data = self._check(*conn.uid('SEARCH', None, criteria), "UID SEARCH")
+        return [int(u) for u in (data[0] or b"").split()]
+
+    def _batches(self, uids):
+        for i in range(0, len(uids), self.batch_size):
+            yield compress_uids(uids[i:i + self.batch_size])
+
+    def pipelined_fetch(self, uids, items):
+        r"""
+        UID FETCH in batches with up to pipeline_depth commands outstanding.
+
+        Yields:
+            tuple: (uid, flags, internaldate, literal) per message, batch by batch
+        """
+        conn = self.conn
+        if self.pipeline_depth == 1:
+            for uid_set in self._batches(uids):
+                yield from parse_fetch_response(self._check(*conn.uid('FETCH', uid_set, items), "UID FETCH"))
+            return
+        in_flight = deque()
+        for uid_set in self._batches(uids):
+            # imaplib keeps every outstanding tag in tagged_commands, so several commands
+            # can be sent before the first completion is read
+            in_flight.append(conn._command('UID', 'FETCH', uid_set, items))
+            if len(in_flight) >= self.pipeline_depth:
+                yield from self._complete_fetch(in_flight.popleft())
+        while in_flight:
+            yield from self._complete_fetch(in_flight.popleft())
+
+    def _complete_fetch(self, tag):
+        typ, data = self.conn._command_complete('FETCH', tag)
+        typ, data = self.conn._untagged_response(typ, data, 'FETCH')
+        return parse_fetch_response(self._check(typ, data, "UID FETCH"))
+
+    def search_criteria(self, cutoff=None):
+        if cutoff is None:
+            return "ALL"
+        return f"SINCE {cutoff.strftime('%d-%b-%Y')}"
+
+    def search_candidates(self, folder, queries, cutoff=None):
+        r"""Union of UID SEARCH results, one command per query (queries from query_planner.imap_search_criteria)"""
+        since = self.search_criteria(cutoff)
+        uids = set()
+        for query in queries:
+            uids.update(self.search_uids(folder, f"{since} {query}"))
+        return uids
+
+    def evaluate_folder(self, folder, ruleset, cutoff=None, select=None):
+        r"""Header-first evaluation: bodies are fetched only for messages a body rule still has to decide"""
+        uids = self.search_uids(folder, self.search_criteria(cutoff))
+        if select is not None:
+            uids = [uid for uid in uids if select(uid)]
+        decided = []
+        undecided = {}
+        for uid, flags, received, header_bytes in self.pipelined_fetch(uids, HEADER_FETCH_ITEMS):
+            self.stats["headers_fetched"] += 1
+            message = parse_lines(header_bytes.splitlines(keepends=True), uid, folder,
+                                  location=uid, unread='\\Seen' not in flags)
+            message.ReceivedTime = message.ReceivedTime or received
+            message.header_bytes = header_bytes
+            verdict = ruleset.evaluate_headers(message.view())
+            if verdict is None:
+                undecided[uid] = message
+            else:
+                decided.append((message, verdict))
+        self.stats["header_fetch_commands"] += -(-len(uids) // self.batch_size)
+        for message, verdict in decided:
+            yield message, verdict
+        if not undecided:
+            return
+        body_uids = sorted(undecided)
+        self.stats["body_fetch_commands"] += -(-len(body_uids) // self.batch_size)
+        for uid, _flags, _received, text_bytes in self.pipelined_fetch(body_uids, BODY_FETCH_ITEMS):
+            headers_only = undecided.pop(uid, None)
+            if headers_only is None:
+                continue
+            self.stats["bodies_fetched"] += 1
+            raw = headers_only.header_bytes + (text_bytes or b"")
+            message = parse_lines(raw.splitlines(keepends=True), uid, folder, location=uid, unread=headers_only.UnRead)
+            message.ReceivedTime = headers_only.ReceivedTime
+            yield message, ruleset.evaluate(message.view())
+        # Messages expunged between the two fetches are simply gone
+
+    def iter_messages(self, folder):
+        uids = self.search_uids(folder)
+        for uid, flags, received, raw in self.pipelined_fetch(uids, "(UID FLAGS INTERNALDATE BODY.PEEK[])"):
+            message = parse_lines(raw.splitlines(keepends=True), uid, folder, location=uid, unread='\\Seen' not in flags)
+            message.ReceivedTime = message.ReceivedTime or received
+            yield message
+
+    # --- actions (queued per folder, applied by flush())
+
+    def _queue(self, op, arg, message):
+        self._pending.setdefault((op, arg), set()).add(message.location)
+
+    def move(self, message, folder):
+        self._queue("move", folder, message)
+        message.folder = folder
+
+    def copy(self, message, folder):
+        self._queue("copy", folder, message)
+
+    def remove(self, message):
+        self._queue("expunge", None, message)
+
+    def mark_read(self, message):
+        self._queue("flag", "\\Seen", message)
+        message.UnRead = False
+
+    def assign_category(self, message, category):
+        self._queue("flag", imap_keyword(category), message)
+        return True
+
+    def flush(self):
+        r"""Apply queued actions for the selected folder: one command per (action, target) over UID ranges"""
+        if not self._pending or self.selected is None:
+            self._pending = {}
+            return
+        pending, self._pending = self._pending, {}
+        by_op = lambda op: sorted((arg, uids) for (o, arg), uids in pending.items() if o == op)
+        flags = {}
+        for arg, uids in by_op("flag"):
+            flags.setdefault(frozenset(uids), []).append(arg)
+        for uids, flag_list in flags.items():
+            self._uid_command('STORE', uids, '+FLAGS.SILENT', f"({' '.join(sorted(flag_list))})")
+        for folder, uids in by_op("copy"):
+            self._ensure_folder(folder)
+            self._uid_command('COPY', uids, quote_mailbox(self.server_name(folder)))
+        moved = set()
+        for folder, uids in by_op("move"):
+            self._ensure_folder(folder)
+            self._move(uids, folder)
+            moved |= uids
+        for _arg, uids in by_op("expunge"):
+            uids = uids - moved
+            if uids:
+                self._expunge(uids)
+
+    def _uid_command(self, command, uids, *args):
+        self.stats["action_commands"] += 1
+        return self._check(*self.conn.uid(command, compress_uids(uids), *args), f"UID {command}")
+
+    def _move(self, uids, folder):
+        target = quote_mailbox(self.server_name(folder))
+        if 'MOVE' in self.conn.capabilities:
+            self._uid_command('MOVE', uids, target)
+            return
+        self._uid_command('COPY', uids, target)
+        self._expunge(uids)
+
+    def _expunge(self, uids):
+        r"""Flag uids \Deleted and expunge them: only those with UIDPLUS, the whole folder's \Deleted without it"""
+        self._uid_command('STORE', uids, '+FLAGS.SILENT', r"(\Deleted)")
+        if 'UIDPLUS' in self.conn.capabilities:
+            self._uid_command('EXPUNGE', uids)
+        else:
+            self._check(*self.conn.expunge(), "EXPUNGE")
+            self.stats["action_commands"] += 1
+
+
+#------------------CLI------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply rules.yaml / rules_safe_senders.yaml to an IMAP account')
+    parser.add_argument('--host', required=True)
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--ssl', action='store_true', help='Use IMAP over TLS (port 993)')
+    parser.add_argument('--user', required=True)
+    parser.add_argument('--password-env', default='IMAP_PASSWORD', help='Environment variable holding the password')
+    parser.add_argument('--rules', required=True, help='rules.yaml')
+    parser.add_argument('--safe-senders', required=True, help='rules_safe_senders.yaml')
+    parser.add_argument('--folders', nargs='+', help='Folders to scan (default: all but the trash folder)')
+    parser.add_argument('--days-back', type=int, help='Only messages received in the last N days')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--pipeline-depth', type=int, default=DEFAULT_PIPELINE_DEPTH)
+    parser.add_argument('--trash-folder', default=DEFAULT_TRASH_FOLDER)
+    parser.add_argument('--purge', action='store_true', help='Expunge instead of moving to the trash folder')
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--push-down', action='store_true',
+                        help='Let the server search for sender/subject candidates (see query_planner.py)')
+    parser.add_argument('--report', help='Write per-message results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    # Log in while the rules load and compile
+    pool = SessionPool(DEFAULT_POOL_SIZE)
+    backend = ImapBackend(args.host, args.port, args.user, os.environ.get(args.password_env, ""), args.ssl,
+                          args.batch_size, args.pipeline_depth, args.trash_folder, args.purge, pool=pool)
+    backend.prewarm()
+    with open(args.rules, 'r', encoding='utf-8') as f:
+        rules_json = yaml.safe_load(f) or {"rules": []}
+    with open(args.safe_senders, 'r', encoding='utf-8') as f:
+        safe_senders = yaml.safe_load(f) or {"safe_senders": []}
+    plan = QueryPlan(rules_json, safe_senders, backend.query_dialect) if args.push_down else None
+    if plan is not None:
+        print(f"[INFO] Push-down plan: {plan.summary()}")
+    start = time.perf_counter()
+    outcome = scan_backend(backend, plan.ruleset if plan else CompiledRuleset(rules_json, safe_senders), args.folders,
+                           days_back=args.days_back, dry_run=args.dry_run, log=lambda m: print(f"[INFO] {m}"), plan=plan)
+    backend.close()
+    pool.close()
+    elapsed = time.perf_counter() - start
+    stats = outcome["stats"]
+    print(f"[OK] Processed {stats['processed']} messages in {elapsed:.1f}s: {stats['deleted']} deleted, "
+          f"{stats['moved']} moved, {stats['errors']} errors; bodies fetched for "
+          f"{backend.stats['bodies_fetched']} of {backend.stats['headers_fetched']}")
+    if plan is not None:
+        print(f"[INFO] Push-down: {plan.stats['candidates']} candidates from the server, "
+              f"{plan.stats['residual_evaluated']} other messages checked against the residual rules")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(outcome, f, indent=2, default=str)
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+r"""
+In-process IMAP4rev1 stand-in server for testing and benchmarking imap_backend.py.
+
+Implements the subset of IMAP the backend uses: CAPABILITY, LOGIN, LOGOUT, NOOP,
+LIST, CREATE, SELECT/EXAMINE, CLOSE, EXPUNGE and the UID forms of SEARCH, FETCH,
+STORE, COPY, MOVE and EXPUNGE.  Every command is recorded in command_log so tests
+can count round trips.  Commands are answered strictly in order, so clients may
+pipeline several tagged commands before reading the replies.
+
+Usage:
+    server = ImapStandinServer()
+    server.add_message("INBOX", raw_bytes, flags=("\\Seen",))
+    host, port = server.start()
+    ...
+    server.stop()
+
+Not implemented: literals sent by the client (APPEND), partial fetches, IDLE, TLS.
+"""
+
+import re
+import socketserver
+import threading
+from datetime import datetime, timezone
+from email.parser import BytesHeaderParser
+
+CAPABILITIES = "IMAP4rev1 MOVE UIDPLUS LITERAL+"
+# Commands that only exist with a capability; a server without it answers BAD, as a real one would
+COMMAND_CAPABILITY = {"UID MOVE": "MOVE", "UID EXPUNGE": "UIDPLUS"}
+
+_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|\(|\)|[^\s()]+')
+_MONTHS = {m: i for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+
+
+def _tokens(data):
+    r"""Parse command arguments into nested lists of str (quoted strings are unquoted)"""
+    stack = [[]]
+    for match in _TOKEN.finditer(data):
+        tok = match.group(0)
+        if tok == b"(":
+            stack.append([])
+        elif tok == b")":
+            inner = stack.pop()
+            stack[-1].append(inner)
+        elif tok.startswith(b'"'):
+            stack[-1].append(re.sub(rb'\\(.)', rb'\1', tok[1:-1]).decode('utf-8'))
+        else:
+            stack[-1].append(tok.decode('utf-8'))
+    return stack[0]
+
+
+def _quote(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _parse_date(value):
+    day, month, year = value.split('-')
+    return datetime(int(year), _MONTHS[month.lower()], int(day), tzinfo=timezone.utc)
+
+
+def _parse_set(spec, maximum):
+    r"""Expand an IMAP sequence set ('1:4,7,9:*') into a set of ints"""
+    out = set()
+    for part in spec.split(','):
+        if ':' in part:
+            lo, hi = part.split(':', 1)
+            lo = maximum if lo == '*' else int(lo)
+            hi = maximum if hi == '*' else int(hi)
+            out.update(range(min(lo, hi), max(lo, hi) + 1))
+        else:
+            out.add(maximum if part == '*' else int(part))
+    return out
+
+
+def _crlf(raw):
+    return re.sub(rb'\r?\n', b'\r\n', raw)
+
+
+class StandinMessage:
+    def __init__(self, uid, raw, flags=(), internaldate=None):
+        self.uid = uid
+        self.raw = _crlf(raw)
+        self.flags = set(flags)
+        self.internaldate = internaldate or datetime.now(timezone.utc)
+        head, sep, _text = self.raw.partition(b"\r\n\r\n")
+        self.header_bytes = head + sep
+        self.text_bytes = self.raw[len(self.header_bytes):]
+        self.headers = BytesHeaderParser().parsebytes(self.header_bytes)
+
+
+class StandinFolder:
+    def __init__(self, name, uidvalidity=1):
+        self.name = name
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.messages = []      # ordered by uid; sequence number = index + 1
+
+    def add(self, raw, flags=(), internaldate=None):
+        message = StandinMessage(self.uidnext, raw, flags, internaldate)
+        self.uidnext += 1
+        self.messages.append(message)
+        return message.uid
+
+    def by_uid_set(self, spec):
+        top = self.messages[-1].uid if self.messages else 0
+        uids = _parse_set(spec, top)
+        return [(seq, m) for seq, m in enumerate(self.messages, start=1) if m.uid in uids]
+
+
+class ImapStandinServer(socketserver.ThreadingTCPServer):
+    r"""
+    Threaded IMAP stand-in bound to 127.0.0.1 on a free port.
+
+    Attributes:
+        folders: name -> StandinFolder ("INBOX" always exists)
+        command_log: [(connection id, command name, argument text)] in arrival order
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, user="user", password="password", capabilities=CAPABILITIES):
+        super().__init__(("127.0.0.1", 0), _ImapHandler)
+        self.user = user
+        self.password = password
+        self.capabilities = capabilities
+        self.folders = {"INBOX": StandinFolder("INBOX")}
+        self.command_log = []
+        self.lock = threading.RLock()
+        self._connection_ids = 0
+        self._thread = None
+
+    def add_folder(self, name):
+        with self.lock:
+            return self.folders.setdefault(name, StandinFolder(name))
+
+    def add_message(self, folder, raw, flags=(), internaldate=None):
+        with self.lock:
+            return self.add_folder(folder).add(raw, flags, internaldate)
+
+    def commands(self, name=None):
+        r"""Logged commands, optionally only those named e.g. 'UID FETCH'"""
+        return [c for c in self.command_log if name is None or c[1] == name]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self._thread.start()
+        return self.server_address
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def next_connection_id(self):
+        with self.lock:
+            self._connection_ids += 1
+            return self._connection_ids
+
+
+class _ImapHandler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        self.conn_id = self.server.next_connection_id()
+        self.selected = None
+        self.read_only = False
+        self.authenticated = False
+
+    # --- output helpers
+
+    def send(self, line):
+        self.wfile.write(line if isinstance(line, bytes) else line.encode('utf-8'))
+
+    def untagged(self, text):
+        self.send(f"* {text}\r\n")
+
+    # --- main loop
+
+    def handle(self):
+        self.untagged("OK IMAP4rev1 stand-in ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            line = line.rstrip(b"\r\n")
+            if not line:
+                continue
+            tag, _, rest = line.partition(b" ")
+            tag = tag.decode('utf-8')
+            command, _, args = rest.partition(b" ")
+            command = command.decode('utf-8').upper()
+            if command == "UID":
+                sub, _, args = args.partition(b" ")
+                command = "UID " + sub.decode('utf-8').upper()
+            with self.server.lock:
+                self.server.command_log.append((self.conn_id, command, args.decode('utf-8', 'replace')))
+                handler = getattr(self, "cmd_" + command.replace(" ", "_"), None)
+                try:
+                    if handler is None or \
+                            COMMAND_CAPABILITY.get(command, "IMAP4rev1") not in self.server.capabilities.split():
+                        self.send(f"{tag} BAD unknown command {command}\r\n")
+                        continue
+                    if command not in ("CAPABILITY", "LOGIN", "LOGOUT", "NOOP") and not self.authenticated:
+                        self.send(f"{tag} NO not authenticated\r\n")
+                        continue
+                    if command.startswith("UID") or command in ("CLOSE", "EXPUNGE"):
+                        if self.selected is None:
+                            self.send(f"{tag} BAD no mailbox selected\r\n")
+                            continue
+                    result = handler(_tokens(args))
+                except Exception as e:
+                    self.send(f"{tag} BAD {type(e).__name__}: {e}\r\n")
+                    continue
+            if result is None:
+                self.send(f"{tag} OK {command} completed\r\n")
+            elif result == "BYE":
+                self.send(f"{tag} OK LOGOUT completed\r\n")
+                return
+            else:
+                self.send(f"{tag} {result}\r\n")
+
+    # --- commands (each returns None for OK, or the full status text)
+
+    def cmd_CAPABILITY(self, args):
+        self.untagged(f"CAPABILITY {self.server.capabilities}")
+
+    def cmd_NOOP(self, args):
+        return None
+
+    def cmd_LOGIN(self, args):
+        if args[:2] != [self.server.user, self.server.password]:
+            return "NO [AUTHENTICATIONFAILED] invalid credentials"
+        self.authenticated = True
+
+    def cmd_LOGOUT(self, args):
+        self.untagged("BYE logging out")
+        return "BYE"
+
+    def cmd_LIST(self, args):
+        for name in sorted(self.server.folders):
+            self.untagged(f'LIST (\\HasNoChildren) "/" {_quote(name)}')
+
+    def cmd_CREATE(self, args):
+        if args[0] in self.server.folders:
+            return "NO [ALREADYEXISTS] mailbox exists"
+        self.server.add_folder(args[0])
+
+    def _folder(self, name):
+        if name.upper() == "INBOX":
+            name = "INBOX"
+        return self.server.folders.get(name)
+
+    def cmd_SELECT(self, args, read_only=False):
+        folder = self._folder(args[0])
+        if folder is None:
+            self.selected = None
+            return "NO [NONEXISTENT] no such mailbox"
+        self.selected = folder
+        self.read_only = read_only
+        self.untagged(f"{len(folder.messages)} EXISTS")
+        self.untagged("0 RECENT")
+        self.untagged(f"OK [UIDVALIDITY {folder.uidvalidity}] UIDs valid")
+        self.untagged(f"OK [UIDNEXT {folder.uidnext}] predicted next UID")
+        self.untagged("FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)")
+        return f"OK [{'READ-ONLY' if read_only else 'READ-WRITE'}] SELECT completed"
+
+    def cmd_EXAMINE(self, args):
+        return self.cmd_SELECT(args, read_only=True)
+
+    def cmd_CLOSE(self, args):
+        if not self.read_only:
+            self._expunge(lambda m: "\\Deleted" in m.flags, announce=False)
+        self.selected = None
+
+    def cmd_EXPUNGE(self, args):
+        self._expunge(lambda m: "\\Deleted" in m.flags)
+
+    def cmd_UID_EXPUNGE(self, args):
+        uids = {m.uid for _seq, m in self.selected.by_uid_set(args[0])}
+        self._expunge(lambda m: "\\Deleted" in m.flags and m.uid in uids)
+
+    def _expunge(self, predicate, announce=True):
+        folder = self.selected
+        seq = 1
+        kept = []
+        for message in folder.messages:
+            if predicate(message):
+                if announce:
+                    # Sequence numbers shift down as each message goes, so 'seq' stays put
+                    self.untagged(f"{seq} EXPUNGE")
+            else:
+                kept.append(message)
+                seq += 1
+        folder.messages = kept
+
+    # --- UID commands
+
+    def _match(self, message, keys):
+        r"""Evaluate a list of SEARCH keys (implicit AND)"""
+        i = 0
+        ok = True
+        while i < len(keys):
+            key = keys[i]
+            if isinstance(key, list):
+                sub_ok = self._match(message, key)
+                ok = ok and sub_ok
+                i += 1
+                continue
+            matched, used = self._match_one(message, keys, i)
+            ok = ok and matched
+            i += used
+        return ok
+
+    def _match_one(self, message, keys, i):
+        key = keys[i].upper()
+        flags = message.flags
+        if key == "ALL":
+            return True, 1
+        if key in ("SEEN", "DELETED", "FLAGGED", "ANSWERED"):
+            return "\\" + key.capitalize() in flags, 1
+        if key in ("UNSEEN", "UNDELETED", "UNFLAGGED", "UNANSWERED"):
+            return "\\" + key[2:].capitalize() not in flags, 1
+        if key == "NOT":
+            matched, used = self._match_one_or_group(message, keys, i + 1)
+            return not matched, used + 1
+        if key == "OR":
+            left, lused = self._match_one_or_group(message, keys, i + 1)
+            right, rused = self._match_one_or_group(message, keys, i + 1 + lused)
+            return left or right, 1 + lused + rused
+        if key in ("SINCE", "BEFORE", "ON"):
+            day = _parse_date(keys[i + 1]).date()
+            received = message.internaldate.date()
+            return {"SINCE": received >= day, "BEFORE": received < day, "ON": received == day}[key], 2
+        if key in ("FROM", "TO", "CC", "SUBJECT"):
+            return keys[i + 1].lower() in str(message.headers.get(key, "")).lower(), 2
+        if key == "HEADER":
+            return keys[i + 2].lower() in str(message.headers.get(keys[i + 1], "")).lower(), 3
+        if key == "UID":
+            return message.uid in _parse_set(keys[i + 1], message.uid), 2
+        if key == "KEYWORD":
+            return keys[i + 1] in flags, 2
+        raise ValueError(f"unsupported search key {key}")
+
+    def _match_one_or_group(self, message, keys, i):
+        if isinstance(keys[i], list):
+            return self._match(message, keys[i]), 1
+        return self._match_one(message, keys, i)
+
+    def cmd_UID_SEARCH(self, args):
+        uids = [m.uid for m in self.selected.messages if self._match(m, args or ["ALL"])]
+        self.untagged("SEARCH" + "".join(f" {u}" for u in uids))
+
+    def cmd_UID_FETCH(self, args):
+        spec, items = args[0], args[1]
+        items = [i.upper() for i in (items if isinstance(items, list) else [items])]
+        for seq, message in self.selected.by_uid_set(spec):
+            parts = [f"UID {message.uid}".encode()]
+            for item in items:
+                if item == "UID":
+                    continue
+                if item == "FLAGS":
+                    parts.append(f"FLAGS ({' '.join(sorted(message.flags))})".encode())
+                elif item == "RFC822.SIZE":
+                    parts.append(f"RFC822.SIZE {len(message.raw)}".encode())
+                elif item == "INTERNALDATE":
+                    parts.append(f'INTERNALDATE "{message.internaldate.strftime("%d-%b-%Y %H:%M:%S %z")}"'.encode())
+                elif item in ("BODY.PEEK[HEADER]", "BODY[HEADER]", "RFC822.HEADER"):
+                    parts.append(self._literal("BODY[HEADER]" if item != "RFC822.HEADER" else item, message.header_bytes))
+                elif item in ("BODY.PEEK[TEXT]", "BODY[TEXT]"):
+                    parts.append(self._literal("BODY[TEXT]", message.text_bytes))
+                elif item in ("BODY.PEEK[]", "BODY[]", "RFC822"):
+                    parts.append(self._literal("BODY[]" if item != "RFC822" else item, message.raw))
+                else:
+                    raise ValueError(f"unsupported fetch item {item}")
+                if not item.startswith("BODY.PEEK") and item.startswith(("BODY[", "RFC822")) and item != "RFC822.HEADER" and not self.read_only:
+                    message.flags.add("\\Seen")
+            self.send(f"* {seq} FETCH (".encode() + b" ".join(parts) + b")\r\n")
+
+    @staticmethod
+    def _literal(name, data):
+        return f"{name} {{{len(data)}}}\r\n".encode() + data
+
+    def cmd_UID_STORE(self, args):
+        spec, mode, flags = args[0], args[1].upper(), args[2]
+        flags = set(flags if isinstance(flags, list) else [flags])
+        silent = mode.endswith(".SILENT")
+        for seq, message in self.selected.by_uid_set(spec):
+            if mode.startswith("+"):
+                message.flags |= flags
+            elif mode.startswith("-"):
+                message.flags -= flags
+            else:
+                message.flags = set(flags)
+            if not silent:
+                self.untagged(f"{seq} FETCH (UID {message.uid} FLAGS ({' '.join(sorted(message.flags))}))")
+
+    def _copy_to(self, spec, target_name):
+        target = self._folder(target_name)
+        if target is None:
+            return None, "NO [TRYCREATE] no such mailbox"
+        moved = self.selected.by_uid_set(spec)
+        source_uids, target_uids = [], []
+        for _seq, message in moved:
+            source_uids.append(message.uid)
+            target_uids.append(target.add(message.raw, message.flags - {"\\Deleted"}, message.internaldate))
+        code = ""
+        if source_uids:
+            code = f"[COPYUID {target.uidvalidity} {','.join(map(str, source_uids))} {','.join(map(str, target_uids))}] "
+        return set(source_uids), code
+
+    def cmd_UID_COPY(self, args):
+        uids, code = self._copy_to(args[0], args[1])
+        if uids is None:
+            return code
+        return f"OK {code}COPY completed"
+
+    def cmd_UID_MOVE(self, args):
+        uids, code = self._copy_to(args[0], args[1])
+        if uids is None:
+            return code
+        self.untagged(f"OK {code}moved")
+        self._expunge(lambda m: m.uid in uids)
+        return "OK MOVE completed"
@@ -0,0 +1,826 @@
+#!/usr/bin/env python3
+r"""
+Mailbox backends for scanning mail outside of Outlook.
+
+A backend lists folders, yields LocalMailMessage objects (same attribute names as
+an Outlook MailItem: SenderEmailAddress, Subject, Body, HTMLBody, ReceivedTime,
+UnRead, EntryID) and carries out the mailbox operations the rules ask for.
+scan_backend() runs the shared CompiledRuleset over a backend and applies the
+same safe-sender / rule actions as OutlookSecurityAgent.process_emails().
+
+Local backends (offline re-filtering of exported mail):
+    MaildirBackend        Maildir / Maildir++ tree (root = Inbox)
+    MboxBackend           directory of .mbox files, or a single mbox file (= Inbox)
+    EmlDirectoryBackend   directory of .eml files, subdirectories are folders (root = Inbox)
+
+Messages are parsed with email.parser.BytesFeedParser (the incremental parser behind
+BytesParser), fed one line at a time straight from the file, so an mbox of any
+size is read one message at a time.
+
+Usage:
+    python mail_backends.py --maildir ~/Mail --rules ../rules.yaml --safe-senders ../rules_safe_senders.yaml
+    python mail_backends.py --mbox export/ --rules ../rules.yaml --safe-senders ../rules_safe_senders.yaml --dry-run
+    python mail_backends.py --eml saved/ --rules ../rules.yaml --safe-senders ../rules_safe_senders.yaml --folders "Bulk Mail" --purge
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+from email import policy
+from email.parser import BytesFeedParser
+from email.utils import parseaddr, parsedate_to_datetime
+
+import yaml
+
+from rule_engine import CompiledRuleset, MessageView, combine_email_header_lines
+
+INBOX_FOLDER = "Inbox"
+DEFAULT_TRASH_FOLDER = "Deleted Items"
+
+# Operations produced by plan_actions(), applied in this order
+OP_CATEGORY = "category"
+OP_MARK_READ = "mark_read"
+OP_COPY = "copy"
+OP_MOVE = "move"
+OP_DELETE = "delete"
+
+
+#------------------Messages------------------
+
+class LocalMailMessage:
+    r"""
+    A message from a non-Outlook store, exposing the MailItem attributes the agent reads.
+
+    Attributes:
+        EntryID: backend-specific id (file path, UID, message id)
+        folder: name of the folder the message was read from
+        header: combined header block (see combine_email_header_lines)
+        location: backend-specific handle used by the action methods
+    """
+
+    def __init__(self, entry_id, folder, sender="", sender_name="", subject="", body="", html_body="",
+                 header="", received_time=None, unread=True, location=None):
+        self.EntryID = entry_id
+        self.SenderEmailAddress = sender or ""
+        self.SenderName = sender_name or ""
+        self.Subject = subject or ""
+        self.Body = body or ""
+        self.HTMLBody = html_body or ""
+        self.ReceivedTime = received_time
+        self.UnRead = unread
+        self.folder = folder
+        self.header = header or ""
+        self.location = location
+
+    def view(self):
+        return MessageView(self.SenderEmailAddress, self.Subject, self.Body, self.header)
+
+    def __repr__(self):
+        return f"LocalMailMessage({self.EntryID!r}, folder={self.folder!r}, sender={self.SenderEmailAddress!r})"
+
+
+def _html_to_text(html):
+    r"""Rough stand-in for the plain-text Body Outlook derives from an HTML-only message"""
+    text = re.sub(r'(?is)<(script|style)\b.*?</\1>', ' ', html)
+    text = re.sub(r'<[^>]+>', ' ', text)
+    return re.sub(r'[ \t]+', ' ', text)
+
+
+def _part_text(msg, subtype):
+    try:
+        part = msg.get_body(preferencelist=(subtype,))
+        return part.get_content() if part is not None else ""
+    except Exception:
+        # Unknown charsets and broken MIME structure: treat as no text, like an unreadable Body
+        return ""
+
+
+def _received_time(msg):
+    try:
+        received = parsedate_to_datetime(str(msg.get('Date', '')))
+    except Exception:
+        return None
+    if received is not None and received.tzinfo is not None:
+        received = received.astimezone().replace(tzinfo=None)
+    return received
+
+
+class StreamParser:
+    r"""
+    Incremental parser for one message: feed() raw lines, close() returns the parts the rules need.
+
+    The raw header block is captured as it streams past so the header text matches
+    what Outlook exposes as PR_TRANSPORT_MESSAGE_HEADERS.
+    """
+
+    def __init__(self):
+        self._parser = BytesFeedParser(policy=policy.default)
+        self._header_lines = []
+        self._in_header = True
+
+    def feed(self, line):
+        if self._in_header:
+            if line in (b"\n", b"\r\n"):
+                self._in_header = False
+            else:
+                self._header_lines.append(line)
+        self._parser.feed(line)
+
+    def close(self):
+        r"""
+        Returns:
+            tuple: (EmailMessage, raw header text)
+        """
+        raw_header = b"".join(self._header_lines).decode('utf-8', 'replace')
+        return self._parser.close(), raw_header
+
+
+def message_from_parsed(msg, raw_header, entry_id, folder, location=None, unread=None):
+    r"""
+    Build a LocalMailMessage from a parsed EmailMessage.
+
+    Args:
+        msg: EmailMessage (policy.default)
+        raw_header: raw header block text
+        entry_id: id to store on the message
+        folder: folder name the message was read from
+        location: backend handle for the action methods
+        unread: read state from the store; None to derive it from the Status header
+    """
+    try:
+        sender_name, sender = parseaddr(str(msg.get('From', '')))
+    except Exception:
+        sender_name, sender = "", ""
+    try:
+        subject = str(msg.get('Subject', ''))
+    except Exception:
+        subject = ""
+    body = _part_text(msg, 'plain')
+    html_body = _part_text(msg, 'html')
+    if not body and html_body:
+        body = _html_to_text(html_body)
+    if unread is None:
+        unread = 'R' not in str(msg.get('Status', ''))
+    try:
+        header = combine_email_header_lines(raw_header)
+    except IndexError:
+        header = ""
+    return LocalMailMessage(
+        entry_id, folder, sender=sender, sender_name=sender_name, subject=subject, body=body,
+        html_body=html_body, header=header, received_time=_received_time(msg), unread=unread, location=location,
+    )
+
+
+def parse_lines(lines, entry_id, folder, location=None, unread=None):
+    r"""Stream an iterable of raw bytes lines (an open binary file works) into a LocalMailMessage"""
+    stream = StreamParser()
+    for line in lines:
+        stream.feed(line)
+    msg, raw_header = stream.close()
+    return message_from_parsed(msg, raw_header, entry_id, folder, location, unread)
+
+
+#------------------Actions------------------
+
+def _action_arg(actions, key, field):
+    value = actions.get(key)
+    return value.get(field) if isinstance(value, dict) else None
+
+
+def rule_actions_by_name(ruleset):
+    r"""Map rule name -> actions dict for the rules of a CompiledRuleset (first rule wins on duplicate names)"""
+    by_name = {}
+    for crule in ruleset.rules:
+        by_name.setdefault(crule.name, crule.rule.get('actions') or {})
+    return by_name
+
+
+def plan_actions(verdict, rule_actions, source_folder, inbox_folder=INBOX_FOLDER):
+    r"""
+    Turn a verdict into the mailbox operations process_emails() performs for it.
+
+    Safe senders are moved back to the inbox.  For every fired rule: a category
+    assignment (which also marks the message read), copy_to_folder and
+    move_to_folder; a delete action ends the list.  Only one move can happen to
+    a file, so the last move wins and a delete overrides any move.
+
+    Returns:
+        list: (op, argument) tuples, see the OP_* constants
+    """
+    if verdict.get("error"):
+        return []
+    if verdict.get("safe_sender") is not None:
+        return [] if source_folder == inbox_folder else [(OP_MOVE, inbox_folder)]
+    ops = []
+    final = None
+    for name, _keyword in verdict["fired"]:
+        actions = rule_actions.get(name) or {}
+        category = _action_arg(actions, 'assign_to_category', 'category_name')
+        if category:
+            ops.append((OP_CATEGORY, category))
+            if (OP_MARK_READ, None) not in ops:
+                ops.append((OP_MARK_READ, None))
+        copy_to = _action_arg(actions, 'copy_to_folder', 'folder_name')
+        if copy_to:
+            ops.append((OP_COPY, copy_to))
+        move_to = _action_arg(actions, 'move_to_folder', 'folder_name')
+        if move_to:
+            final = (OP_MOVE, move_to)
+        if 'delete' in actions and actions['delete']:
+            final = (OP_DELETE, None)
+            break
+    if final is not None and final != (OP_MOVE, source_folder):
+        ops.append(final)
+    return ops
+
+
+def apply_actions(backend, message, ops):
+    for op, arg in ops:
+        if op == OP_CATEGORY:
+            backend.assign_category(message, arg)
+        elif op == OP_MARK_READ:
+            backend.mark_read(message)
+        elif op == OP_COPY:
+            backend.copy(message, arg)
+        elif op == OP_MOVE:
+            backend.move(message, arg)
+        elif op == OP_DELETE:
+            backend.delete(message)
+
+
+#------------------Backend base class------------------
+
+class MailBackend:
+    r"""
+    Base class for mailbox backends.
+
+    Subclasses implement list_folders(), iter_messages() and the action methods.
+    Deletes go to trash_folder (like Outlook's Deleted Items) unless purge is set.
+    """
+    name = "base"
+    query_dialect = None    # query_planner dialect for search_candidates()
+
+    def __init__(self, trash_folder=DEFAULT_TRASH_FOLDER, purge=False):
+        self.trash_folder = trash_folder
+        self.purge = purge
+
+    def list_folders(self):
+        raise NotImplementedError
+
+    def iter_messages(self, folder):
+        raise NotImplementedError
+
+    def evaluate_folder(self, folder, ruleset, cutoff=None, select=None):
+        r"""
+        Yield (message, verdict) for every message in the folder received after cutoff.
+        Remote backends override this to fetch headers first and bodies only when needed.
+
+        Args:
+            select: optional predicate on the message id (EntryID); other messages are skipped
+        """
+        for message in self.iter_messages(folder):
+            if cutoff is not None and message.ReceivedTime is not None and message.ReceivedTime < cutoff:
+                continue
+            if select is not None and not select(message.EntryID):
+                continue
+            yield message, ruleset.evaluate(message.view())
+
+    def search_candidates(self, folder, queries, cutoff=None):
+        r"""
+        Run store-side queries (see query_planner) and return the union of matching ids,
+        or None when the store cannot search.
+        """
+        return None
+
+    def move(self, message, folder):
+        raise NotImplementedError
+
+    def copy(self, message, folder):
+        raise NotImplementedError
+
+    def delete(self, message):
+        if self.purge or not self.trash_folder:
+            self.remove(message)
+        else:
+            self.move(message, self.trash_folder)
+
+    def remove(self, message):
+        raise NotImplementedError
+
+    def mark_read(self, message):
+        message.UnRead = False
+
+    def assign_category(self, message, category):
+        r"""Categories have no local equivalent; backends with labels/keywords override this"""
+        return False
+
+    def flush(self):
+        r"""Commit deferred changes (called after each folder)"""
+
+    def close(self):
+        self.flush()
+
+
+def scan_backend(backend, ruleset, folders=None, inbox_folder=INBOX_FOLDER, days_back=None, dry_run=False, log=None,
+                 plan=None):
+    r"""
+    Evaluate every message in the given folders and apply the resulting actions.
+
+    Args:
+        backend: MailBackend instance
+        ruleset: CompiledRuleset shared with the Outlook path
+        folders: folder names to scan (default: every folder except the trash folder)
+        inbox_folder: where safe senders are moved back to
+        days_back: skip messages older than this many days (None scans everything)
+        dry_run: evaluate and plan only, change nothing
+        log: optional callable taking one string
+        plan: optional query_planner.QueryPlan for the same rules; the store finds candidates
+              and other messages are evaluated with the residual rules only
+
+    Returns:
+        dict: {"results": [record per message], "stats": {...}}
+    """
+    rule_actions = rule_actions_by_name(ruleset)
+    cutoff = datetime.now() - timedelta(days=days_back) if days_back else None
+    if folders is None:
+        folders = [f for f in backend.list_folders() if f != backend.trash_folder]
+    stats = {"processed": 0, "safe_senders": 0, "matched": 0, "deleted": 0, "moved": 0, "errors": 0}
+    results = []
+    for folder in folders:
+        if log:
+            log(f"Processing folder: {folder}")
+        if plan is not None:
+            evaluations = plan.evaluate_folder(backend, folder, cutoff)
+        else:
+            evaluations = backend.evaluate_folder(folder, ruleset, cutoff)
+        for message, verdict in evaluations:
+            stats["processed"] += 1
+            ops = plan_actions(verdict, rule_actions, folder, inbox_folder)
+            record = {
+                "id": message.EntryID,
+                "source_folder": folder,
+                "sender": message.SenderEmailAddress,
+                "subject": message.Subject,
+                "received": message.ReceivedTime.isoformat() if message.ReceivedTime else None,
+                "safe_sender": verdict["safe_sender"],
+                "match": verdict["match"],
+                "rule": verdict["rule_name"],
+                "matched_keyword": verdict["matched_keyword"],
+                "actions": ops,
+            }
+            if verdict.get("error"):
+                record["error"] = "rule evaluation error"
+                stats["errors"] += 1
+            if verdict["safe_sender"] is not None:
+                stats["safe_senders"] += 1
+            elif verdict["fired"]:
+                stats["matched"] += 1
+            if ops and not dry_run:
+                try:
+                    apply_actions(backend, message, ops)
+                except Exception as e:
+                    record["error"] = f"Error applying actions: {str(e)}"
+                    stats["errors"] += 1
+                    if log:
+                        log(f"Error applying actions to {message.EntryID}: {str(e)}")
+            stats["deleted"] += any(op == OP_DELETE for op, _ in ops)
+            stats["moved"] += any(op == OP_MOVE for op, _ in ops)
+            results.append(record)
+        if not dry_run:
+            backend.flush()
+    return {"results": results, "stats": stats}
+
+
+#------------------Filesystem helpers------------------
+
+def _unique_path(directory, filename):
+    target = os.path.join(directory, filename)
+    stem, ext = os.path.splitext(filename)
+    n = 1
+    while os.path.exists(target):
+        target = os.path.join(directory, f"{stem}.{n}{ext}")
+        n += 1
+    return target
+
+
+def _is_maildir(path):
+    return all(os.path.isdir(os.path.join(path, sub)) for sub in ("cur", "new"))
+
+
+#------------------Maildir------------------
+
+class MaildirBackend(MailBackend):
+    r"""
+    Maildir tree.  The root is the Inbox when it is itself a Maildir (Maildir++
+    layout, subfolders are '.Name' / '.Parent.Child'); otherwise every nested
+    directory holding cur/new is a folder named by its relative path.
+    """
+    name = "maildir"
+
+    def __init__(self, root, trash_folder=DEFAULT_TRASH_FOLDER, purge=False):
+        super().__init__(trash_folder, purge)
+        self.root = os.path.abspath(root)
+        self.maildir_plus = _is_maildir(self.root)
+
+    def list_folders(self):
+        folders = []
+        if self.maildir_plus:
+            folders.append(INBOX_FOLDER)
+            for entry in sorted(os.listdir(self.root)):
+                if entry.startswith('.') and _is_maildir(os.path.join(self.root, entry)):
+                    folders.append(entry[1:].replace('.', '/'))
+            return folders
+        for dirpath, dirnames, _files in os.walk(self.root):
+            dirnames.sort()
+            if _is_maildir(dirpath):
+                folders.append(os.path.relpath(dirpath, self.root).replace(os.sep, '/'))
+                dirnames[:] = [d for d in dirnames if d not in ("cur", "new", "tmp")]
+        return folders
+
+    def folder_path(self, folder, create=False):
+        if self.maildir_plus:
+            path = self.root if folder == INBOX_FOLDER else os.path.join(self.root, '.' + folder.replace('/', '.'))
+        else:
+            path = os.path.join(self.root, *folder.split('/'))
+        if create:
+            for sub in ("cur", "new", "tmp"):
+                os.makedirs(os.path.join(path, sub), exist_ok=True)
+        return path
+
+    def _listing(self, folder):
+        r"""(file path, unread) of every message, new/ first"""
+        path = self.folder_path(folder)
+        if not _is_maildir(path):
+            return []
+        # A snapshot of both listings: mark_read() moves files from new/ into cur/
+        listing = []
+        for sub in ("new", "cur"):
+            for filename in sorted(os.listdir(os.path.join(path, sub))):
+                if not filename.startswith('.'):
+                    flags = filename.split(":2,", 1)[1] if ":2," in filename else ""
+                    listing.append((os.path.join(path, sub, filename), 'S' not in flags))
+        return listing
+
+    def iter_messages(self, folder):
+        for file_path, unread in self._listing(folder):
+            with open(file_path, 'rb') as f:
+                yield parse_lines(f, file_path, folder, location=file_path, unread=unread)
+
+    def iter_raw(self, folder):
+        r"""(raw bytes, unread) of every message, without parsing"""
+        for file_path, unread in self._listing(folder):
+            with open(file_path, 'rb') as f:
+                yield f.read(), unread
+
+    def _place(self, message, folder, keep_source):
+        source = message.location
+        sub = os.path.basename(os.path.dirname(source))
+        target = _unique_path(os.path.join(self.folder_path(folder, create=True), sub), os.path.basename(source))
+        if keep_source:
+            shutil.copy2(source, target)
+        else:
+            os.replace(source, target)
+            message.location = target
+            message.folder = folder
+        return target
+
+    def move(self, message, folder):
+        self._place(message, folder, keep_source=False)
+
+    def copy(self, message, folder):
+        self._place(message, folder, keep_source=True)
+
+    def remove(self, message):
+        os.unlink(message.location)
+        message.location = None
+
+    def mark_read(self, message):
+        source = message.location
+        filename = os.path.basename(source)
+        base, _, flags = filename.partition(":2,")
+        if 'S' not in flags:
+            flags = "".join(sorted(set(flags) | {'S'}))
+            target = os.path.join(os.path.dirname(os.path.dirname(source)), "cur", f"{base}:2,{flags}")
+            os.replace(source, target)
+            message.location = target
+        message.UnRead = False
+
+
+#------------------EML directory------------------
+
+class EmlDirectoryBackend(MailBackend):
+    r"""Directory of .eml files; the root is the Inbox and each subdirectory is a folder"""
+    name = "eml"
+
+    def __init__(self, root, trash_folder=DEFAULT_TRASH_FOLDER, purge=False):
+        super().__init__(trash_folder, purge)
+        self.root = os.path.abspath(root)
+
+    def list_folders(self):
+        folders = []
+        for dirpath, dirnames, _files in os.walk(self.root):
+            dirnames.sort()
+            rel = os.path.relpath(dirpath, self.root)
+            folders.append(INBOX_FOLDER if rel == '.' else rel.replace(os.sep, '/'))
+        return folders
+
+    def folder_path(self, folder, create=False):
+        path = self.root if folder == INBOX_FOLDER else os.path.join(self.root, *folder.split('/'))
+        if create:
+            os.makedirs(path, exist_ok=True)
+        return path
+
+    def _listing(self, folder):
+        path = self.folder_path(folder)
+        if not os.path.isdir(path):
+            return []
+        return [os.path.join(path, filename) for filename in sorted(os.listdir(path))
+                if filename.lower().endswith('.eml')]
+
+    def iter_messages(self, folder):
+        for file_path in self._listing(folder):
+            with open(file_path, 'rb') as f:
+                yield parse_lines(f, file_path, folder, location=file_path, unread=True)
+
+    def iter_raw(self, folder):
+        r"""(raw bytes, unread) of every message, without parsing"""
+        for file_path in self._listing(folder):
+            with open(file_path, 'rb') as f:
+                yield f.read(), True
+
+    def move(self, message, folder):
+        target = _unique_path(self.folder_path(folder, create=True), os.path.basename(message.location))
+        os.replace(message.location, target)
+        message.location = target
+        message.folder = folder
+
+    def copy(self, message, folder):
+        shutil.copy2(message.location, _unique_path(self.folder_path(folder, create=True), os.path.basename(message.location)))
+
+    def remove(self, message):
+        os.unlink(message.location)
+        message.location = None
+
+
+#------------------mbox------------------
+
+def _mbox_lines(f):
+    r"""
+    Lines of an open mbox file.
+
+    Yields:
+        tuple: (offset, line, True when the line is a From_ line that starts an entry)
+    """
+    offset = 0
+    prev_blank = True
+    for line in f:
+        yield offset, line, prev_blank and line.startswith(b"From ")
+        offset += len(line)
+        prev_blank = line in (b"\n", b"\r\n")
+
+
+def iter_mbox_offsets(path):
+    r"""
+    Entry boundaries of an mbox file, without parsing the messages (for rewrites).
+
+    Yields:
+        tuple: (start offset, end offset) of each entry, From_ line included
+    """
+    with open(path, 'rb') as f:
+        start = None
+        end = 0
+        for offset, line, starts_entry in _mbox_lines(f):
+            if starts_entry:
+                if start is not None:
+                    yield start, offset
+                start = offset
+            end = offset + len(line)
+        if start is not None:
+            yield start, end
+
+
+def iter_mbox_spans(path):
+    r"""
+    Stream an mbox file.
+
+    Yields:
+        tuple: (start offset, end offset, StreamParser fed with the message lines)
+    """
+    with open(path, 'rb') as f:
+        start = None
+        stream = None
+        end = 0
+        for offset, line, starts_entry in _mbox_lines(f):
+            if starts_entry:
+                if stream is not None:
+                    yield start, offset, stream
+                start, stream = offset, StreamParser()
+            elif stream is not None:
+                stream.feed(line)
+            end = offset + len(line)
+        if stream is not None:
+            yield start, end, stream
+
+
+class MboxBackend(MailBackend):
+    r"""
+    mbox mail.  The root is either a single mbox file (scanned as the Inbox) or a
+    directory where every '<name>.mbox' file is a folder.  Moves and deletes are
+    appended to the target file immediately and removed from the source file when
+    the folder is flushed (one rewrite per source file).  Entries appended during
+    the run are not scanned again when their folder comes up later.
+    """
+    name = "mbox"
+    EXTENSION = ".mbox"
+
+    def __init__(self, root, trash_folder=DEFAULT_TRASH_FOLDER, purge=False):
+        super().__init__(trash_folder, purge)
+        self.root = os.path.abspath(root)
+        self.single_file = os.path.isfile(self.root)
+        self.base_dir = os.path.dirname(self.root) if self.single_file else self.root
+        self._removed = {}      # source path -> set of start offsets
+        self._mark_read = {}    # source path -> set of start offsets
+        self._appended = {}     # target path -> offset of the first entry appended this run
+
+    def list_folders(self):
+        if self.single_file:
+            return [INBOX_FOLDER]
+        folders = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(self.EXTENSION):
+                    rel = os.path.relpath(os.path.join(dirpath, filename), self.root)
+                    folders.append(rel[:-len(self.EXTENSION)].replace(os.sep, '/'))
+        return folders
+
+    def folder_path(self, folder):
+        if self.single_file and folder == INBOX_FOLDER:
+            return self.root
+        return os.path.join(self.base_dir, *folder.split('/')) + self.EXTENSION
+
+    def iter_messages(self, folder):
+        path = self.folder_path(folder)
+        if not os.path.isfile(path):
+            return
+        limit = self._appended.get(path)
+        for start, end, stream in iter_mbox_spans(path):
+            if limit is not None and start >= limit:
+                break
+            msg, raw_header = stream.close()
+            yield message_from_parsed(msg, raw_header, f"{path}#{start}", folder, location=(path, start, end))
+
+    def iter_raw(self, folder):
+        r"""(raw bytes without the From_ line, unread) of every entry, without parsing"""
+        path = self.folder_path(folder)
+        if not os.path.isfile(path):
+            return
+        limit = self._appended.get(path)
+        with open(path, 'rb') as f:
+            for start, end in iter_mbox_offsets(path):
+                if limit is not None and start >= limit:
+                    break
+                f.seek(start)
+                raw = f.read(end - start)
+                raw = raw[raw.find(b"\n") + 1:]
+                yield raw, _unread_from_status(raw)
+
+    def _raw(self, message):
+        r"""The message's entry, with the read state it has now (mark_read() only rewrites the source at flush)"""
+        path, start, end = message.location
+        with open(path, 'rb') as f:
+            f.seek(start)
+            raw = f.read(end - start)
+        return raw if message.UnRead else _with_read_status(raw)
+
+    def _append(self, folder, raw):
+        target = self.folder_path(folder)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'ab+') as f:
+            f.seek(0, os.SEEK_END)
+            self._appended.setdefault(target, f.tell())
+            if f.tell() > 0:
+                f.seek(-2, os.SEEK_END)
+                if f.read(2) != b"\n\n":
+                    f.write(b"\n")
+            f.write(raw if raw.endswith(b"\n") else raw + b"\n")
+
+    def copy(self, message, folder):
+        if self.folder_path(folder) == message.location[0]:
+            return  # already there; appending would only add a duplicate
+        self._append(folder, self._raw(message))
+
+    def move(self, message, folder):
+        if self.folder_path(folder) == message.location[0]:
+            return
+        self._append(folder, self._raw(message))
+        self.remove(message)
+        message.folder = folder
+
+    def remove(self, message):
+        path, start, _end = message.location
+        self._removed.setdefault(path, set()).add(start)
+
+    def mark_read(self, message):
+        path, start, _end = message.location
+        self._mark_read.setdefault(path, set()).add(start)
+        message.UnRead = False
+
+    def flush(self):
+        for path in set(self._removed) | set(self._mark_read):
+            removed = self._removed.get(path, set())
+            mark_read = self._mark_read.get(path, set())
+            limit = self._appended.get(path)
+            new_limit = None
+            tmp_path = path + ".tmp"
+            with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                for start, end in iter_mbox_offsets(path):
+                    if limit is not None and new_limit is None and start >= limit:
+                        new_limit = dst.tell()
+                    if start in removed:
+                        continue
+                    src.seek(start)
+                    raw = src.read(end - start)
+                    dst.write(_with_read_status(raw) if start in mark_read else raw)
+                if limit is not None:
+                    self._appended[path] = dst.tell() if new_limit is None else new_limit
+            os.replace(tmp_path, path)
+        self._removed = {}
+        self._mark_read = {}
+
+
+def _unread_from_status(raw):
+    r"""Read state from the Status header of a raw message, scanning only its header block"""
+    head = re.split(rb'\r?\n\r?\n', raw, maxsplit=1)[0]
+    status = re.search(rb'(?im)^status:(.*)$', head)
+    return not (status and b"R" in status.group(1))
+
+
+def _with_read_status(raw):
+    r"""Set 'Status: RO' in the header block of one raw mbox entry (From_ line included)"""
+    head, sep, rest = raw.partition(b"\n\n")
+    lines = head.split(b"\n")
+    for i, line in enumerate(lines[1:], start=1):
+        if line.lower().startswith(b"status:"):
+            if b"R" not in line[7:]:
+                lines[i] = line.rstrip() + b"R"
+            return b"\n".join(lines) + sep + rest
+    lines.insert(1, b"Status: RO")
+    return b"\n".join(lines) + sep + rest
+
+
+#------------------CLI------------------
+
+def _load_yaml(path, default):
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or default
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply rules.yaml / rules_safe_senders.yaml to local mail')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--maildir', help='Maildir root')
+    source.add_argument('--mbox', help='mbox file or directory of .mbox files')
+    source.add_argument('--eml', help='Directory of .eml files')
+    parser.add_argument('--rules', required=True, help='rules.yaml')
+    parser.add_argument('--safe-senders', required=True, help='rules_safe_senders.yaml')
+    parser.add_argument('--folders', nargs='+', help='Folders to scan (default: all but the trash folder)')
+    parser.add_argument('--days-back', type=int, help='Only messages received in the last N days')
+    parser.add_argument('--trash-folder', default=DEFAULT_TRASH_FOLDER, help='Folder deletes are moved to')
+    parser.add_argument('--purge', action='store_true', help='Delete files instead of moving them to the trash folder')
+    parser.add_argument('--dry-run', action='store_true', help='Evaluate only; do not move or delete anything')
+    parser.add_argument('--report', help='Write per-message results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    if args.maildir:
+        backend = MaildirBackend(args.maildir, args.trash_folder, args.purge)
+    elif args.mbox:
+        backend = MboxBackend(args.mbox, args.trash_folder, args.purge)
+    else:
+        backend = EmlDirectoryBackend(args.eml, args.trash_folder, args.purge)
+
+    ruleset = CompiledRuleset(_load_yaml(args.rules, {"rules": []}), _load_yaml(args.safe_senders, {"safe_senders": []}))
+    print(f"[INFO] {backend.name} backend at {backend.root}{' (dry run)' if args.dry_run else ''}")
+    start = time.perf_counter()
+    outcome = scan_backend(backend, ruleset, args.folders, days_back=args.days_back, dry_run=args.dry_run, log=lambda m: print(f"[INFO] {m}"))
+    backend.close()
+    elapsed = time.perf_counter() - start
+    stats = outcome["stats"]
+    rate = stats["processed"] / elapsed if elapsed else 0
+    print(f"[OK] Processed {stats['processed']} messages in {elapsed:.1f}s ({rate:.0f}/s): "
+          f"{stats['safe_senders']} safe, {stats['matched']} matched, {stats['deleted']} deleted, "
+          f"{stats['moved']} moved, {stats['errors']} errors")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(outcome, f, indent=2, default=str)
+        print(f"[OK] Wrote report to {args.report}")
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
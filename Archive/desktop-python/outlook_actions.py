@@ -0,0 +1,236 @@
+r"""
+Deferred, coalesced mailbox changes for withOutlookRulesYAML.py.
+
+The *_with_retry helpers this replaces (removed from OutlookSecurityAgent)
+changed one property at a time and Save()d after each change.  Every failure
+slept for a second and tried again, up to 10 times.  Deleting an unread,
+flagged email cost three commits, and a safe-sender rescue also did Copy, Move
+and Delete.
+
+OutlookActionQueue records what each email should end up as during evaluation,
+then commits it in one go, once per chunk of emails:
+
+  - every property change (UnRead, Categories, Importance, Sensitivity,
+    TaskDueDate) and the flag clear are applied together, followed by one
+    Save() per email;
+  - then one Move() (safe senders back to the Inbox, move_to_folder) or one
+    Delete().  A delete replaces any move queued for the same email;
+  - a failed email is parked in a retry_scheduler.RetryScheduler with
+    exponential backoff and jitter, and is retried by a later maybe_flush()
+    while evaluation goes on.  Only the flush() at the end of a pass waits, for
+    what is still parked.  A circuit breaker per source folder (set .folder
+    before queueing) stops commits to a folder that keeps failing;
+  - with a scan_journal.ScanJournal attached (.journal), each chunk is written
+    to the journal before it is committed and marked done after, so an
+    interrupted scan can be resumed.
+
+The Outlook object model has no call that moves or deletes many items at once,
+so Move/Delete stay per item.  The IMAP and Gmail backends already queue their
+actions and commit them with bulk commands (see MailBackend.flush()).
+"""
+
+import time
+
+from retry_scheduler import RetryScheduler
+
+DEFAULT_CHUNK_SIZE = 100
+
+
+def new_action_stats():
+    return {"queued": 0, "coalesced": 0, "committed": 0, "saves": 0, "moves": 0, "deletes": 0, "flushes": 0,
+            "failed": 0}
+
+
+class PendingChange:
+    r"""
+    What one email should end up as.
+
+    Attributes:
+        email: MailItem or TableMailItem
+        properties: name -> value to set before the single Save()
+        clear_flag: call Flag.Clear() before saving (when the item has a Flag)
+        move_to: target MAPIFolder, or None
+        delete: Delete() after saving (replaces move_to)
+        folder: source folder name (circuit breaker key)
+        attempts: commit attempts so far
+    """
+    __slots__ = ("email", "properties", "clear_flag", "move_to", "delete", "folder", "attempts", "error")
+
+    def __init__(self, email, folder=None):
+        self.email = email
+        self.properties = {}
+        self.clear_flag = False
+        self.move_to = None
+        self.delete = False
+        self.folder = folder
+        self.attempts = 0
+        self.error = None
+
+
+class OutlookActionQueue:
+    r"""
+    Collects mailbox changes per email and commits them in batches.
+
+    Args:
+        log: callable(message, level="INFO"), e.g. OutlookSecurityAgent.log_print
+        chunk_size: maybe_flush() commits once this many emails have changes queued
+        retries: RetryScheduler for failed commits (backoff, jitter, circuit breakers)
+        clock, sleep: for the default RetryScheduler, injectable for tests
+
+    Attributes:
+        folder: source folder name of the emails being queued (set per email by the caller)
+        journal: scan_journal.ScanJournal checkpointing the commits, or None
+    """
+
+    def __init__(self, log=None, chunk_size=DEFAULT_CHUNK_SIZE, retries=None, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.log = log or (lambda message, level="INFO": None)
+        self.chunk_size = max(1, chunk_size)
+        self.retries = retries if retries is not None else RetryScheduler(clock=clock, sleep=sleep)
+        self.stats = new_action_stats()
+        self.folder = None
+        self.journal = None
+        self._pending = {}              # id(email) -> PendingChange, in queue order
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _change(self, email):
+        self.stats["queued"] += 1
+        change = self._pending.get(id(email))
+        if change is None:
+            change = self._pending[id(email)] = PendingChange(email, self.folder)
+        else:
+            self.stats["coalesced"] += 1
+        return change
+
+    # --- queueing (no COM calls)
+
+    def mark_read(self, email):
+        self._change(email).properties["UnRead"] = False
+
+    def clear_flag(self, email):
+        self._change(email).clear_flag = True
+
+    def assign_category(self, email, category_name):
+        self._change(email).properties["Categories"] = category_name
+
+    def set_property(self, email, name, value):
+        self._change(email).properties[name] = value
+
+    def move(self, email, target_folder):
+        self._change(email).move_to = target_folder
+
+    def delete(self, email):
+        r"""Delete implies marked read and flag cleared, as the old delete_email_with_retry() did"""
+        change = self._change(email)
+        change.properties["UnRead"] = False
+        change.clear_flag = True
+        change.delete = True
+
+    # --- committing
+
+    @property
+    def parked(self):
+        r"""Number of emails waiting for a retry"""
+        return len(self.retries)
+
+    def maybe_flush(self):
+        r"""
+        Commit if a full chunk of emails has changes queued (or the journal holds a chunk of processed emails),
+        and retry parked emails that are due (never waits)
+        """
+        journal_full = self.journal is not None and self.journal.buffered >= self.chunk_size
+        if len(self._pending) >= self.chunk_size or journal_full:
+            return self.flush(wait=False)
+        if self.retries:
+            return self._attempt(self.retries.pop_due())
+        return 0
+
+    def flush(self, wait=True):
+        r"""
+        Commit every queued change and retry the parked emails that are due.
+
+        Args:
+            wait: keep going (sleeping until the next retry is due) until nothing is parked
+
+        Returns:
+            int: number of emails given up on during this call
+        """
+        failed = 0
+        changes, self._pending = list(self._pending.values()), {}
+        if self.journal is not None:
+            self.journal.checkpoint(changes)
+        if changes:
+            self.stats["flushes"] += 1
+            failed += self._attempt(changes)
+        failed += self._attempt(self.retries.pop_due())
+        while wait and self.retries:
+            self.retries.wait_next()
+            failed += self._attempt(self.retries.pop_due())
+        return failed
+
+    def _attempt(self, changes):
+        r"""Try each change once; park the failures.  Returns the number given up on"""
+        failed = 0
+        finished = []
+        for change in changes:
+            folder = change.folder
+            if self.retries.given_up(folder):
+                change.error = change.error or f"circuit breaker for folder {folder!r} kept opening"
+            elif not self.retries.allow(folder):
+                self.retries.defer(change, folder)
+                continue
+            else:
+                change.attempts += 1
+                ok = self._commit(change)
+                self.retries.record(folder, ok)
+                if ok:
+                    finished.append(change)
+                    continue
+                if self.retries.park(change, folder, change.attempts):
+                    continue
+            self.log(f"Error applying queued changes to email (after {change.attempts} attempt(s)): {change.error}")
+            self.stats["failed"] += 1
+            failed += 1
+            finished.append(change)
+        if self.journal is not None and finished:
+            self.journal.committed(finished)
+        return failed
+
+    def _commit(self, change):
+        r"""Apply one email's changes; returns False (and keeps the finished steps) on error"""
+        email = change.email
+        try:
+            if change.properties or change.clear_flag:
+                dirty = False
+                for name, value in change.properties.items():
+                    if name == "UnRead":
+                        if email.UnRead:
+                            email.UnRead = False
+                            dirty = True
+                    else:
+                        setattr(email, name, value)
+                        dirty = True
+                if change.clear_flag and hasattr(email, 'Flag'):
+                    email.Flag.Clear()
+                    dirty = True
+                if dirty:
+                    email.Save()
+                    self.stats["saves"] += 1
+                # Only a saved change is done: a retry sets everything again
+                change.properties = {}
+                change.clear_flag = False
+            if change.delete:
+                email.Delete()
+                change.delete = False
+                self.stats["deletes"] += 1
+            elif change.move_to is not None:
+                email.Move(change.move_to)
+                change.move_to = None
+                self.stats["moves"] += 1
+        except Exception as e:
+            change.error = str(e)
+            return False
+        self.stats["committed"] += 1
+        return True
@@ -0,0 +1,150 @@
+r"""
+Bulk column fetch from Outlook folders via Folder.GetTable.
+
+Items.Restrict hands back COM MailItems, and every property read on them
+(Subject, SenderEmailAddress, ReceivedTime, the transport headers) is a separate
+COM round trip per message.  A Table returns the same columns for hundreds of
+rows per GetArray call.  fetch_table_rows wraps each row in a TableMailItem that
+answers the column properties from the row and opens the real MailItem (through
+Namespace.GetItemFromID) only when something else is touched: Body, HTMLBody,
+Move, Delete, Categories, ...
+
+Body and HTMLBody are read from the item at most once each and kept on the
+row; "bodies_fetched" counts the messages whose body was ever read, so rows
+minus bodies_fetched is the number of body downloads a header-only decision
+saved.
+
+MAPI contents tables truncate long string columns.  A transport header that
+comes back at TABLE_STRING_LIMIT characters or more is treated as truncated
+and re-read from the item.
+"""
+
+PR_TRANSPORT_MESSAGE_HEADERS = "http://schemas.microsoft.com/mapi/proptag/0x007D001E"
+
+# Built-in names return ReceivedTime in local time, matching MailItem.ReceivedTime
+TABLE_COLUMNS = ("EntryID", "Subject", "SenderEmailAddress", "SenderName", "ReceivedTime", "UnRead",
+                 PR_TRANSPORT_MESSAGE_HEADERS)
+ROW_ATTRIBUTES = frozenset(TABLE_COLUMNS[:-1])
+BODY_ATTRIBUTES = frozenset(("Body", "HTMLBody"))
+TABLE_STRING_LIMIT = 255
+ROW_BATCH = 500
+OL_USER_ITEMS = 0   # OlTableContents.olUserItems
+
+
+def new_fetch_stats():
+    return {"rows": 0, "table_batches": 0, "items_opened": 0, "header_rereads": 0, "bodies_fetched": 0}
+
+
+class TableMailItem:
+    r"""
+    MailItem stand-in backed by one Table row.
+
+    Column properties are served from the row.  Any other attribute read, any
+    attribute write and any method call opens the underlying MailItem once and is
+    forwarded to it; writes to column properties also update the row copy.
+    Body and HTMLBody are cached after the first read.
+    """
+
+    def __init__(self, namespace, store_id, row, stats=None):
+        object.__setattr__(self, "_namespace", namespace)
+        object.__setattr__(self, "_store_id", store_id)
+        object.__setattr__(self, "_row", dict(row))
+        object.__setattr__(self, "_item", None)
+        object.__setattr__(self, "_headers_complete", False)
+        object.__setattr__(self, "_bodies", {})
+        object.__setattr__(self, "_stats", stats if stats is not None else new_fetch_stats())
+
+    @property
+    def opened(self):
+        return self._item is not None
+
+    @property
+    def body_fetched(self):
+        return bool(self._bodies)
+
+    @property
+    def item(self):
+        r"""The full MailItem, opened on first use"""
+        if self._item is None:
+            object.__setattr__(self, "_item", self._namespace.GetItemFromID(self._row["EntryID"], self._store_id))
+            self._stats["items_opened"] += 1
+        return self._item
+
+    def transport_headers(self):
+        r"""
+        PR_TRANSPORT_MESSAGE_HEADERS, from the row when it was not truncated.
+
+        Returns:
+            str: raw header block ("" when the message has none)
+        """
+        value = self._row.get(PR_TRANSPORT_MESSAGE_HEADERS)
+        if self._headers_complete or (isinstance(value, str) and len(value) < TABLE_STRING_LIMIT):
+            return value
+        self._stats["header_rereads"] += 1
+        value = self.item.PropertyAccessor.GetProperty(PR_TRANSPORT_MESSAGE_HEADERS)
+        self._row[PR_TRANSPORT_MESSAGE_HEADERS] = value
+        object.__setattr__(self, "_headers_complete", True)
+        return value
+
+    def __getattr__(self, name):
+        # Only reached for names not found on the instance or class
+        if name.startswith('_'):
+            raise AttributeError(name)
+        row = self.__dict__["_row"]
+        if name in ROW_ATTRIBUTES:
+            return row[name]
+        if name in BODY_ATTRIBUTES:
+            bodies = self.__dict__["_bodies"]
+            if name not in bodies:
+                if not bodies:
+                    self._stats["bodies_fetched"] += 1
+                bodies[name] = getattr(self.item, name)
+            return bodies[name]
+        return getattr(self.item, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.item, name, value)
+        if name in ROW_ATTRIBUTES:
+            self._row[name] = value
+        elif name in BODY_ATTRIBUTES:
+            self._bodies[name] = value
+
+
+def fetch_table_rows(folder, restriction, namespace, stats=None, batch_size=ROW_BATCH):
+    r"""
+    Read a folder's matching items as TableMailItem rows, newest first.
+
+    Args:
+        folder: Outlook MAPIFolder
+        restriction: Jet filter, the same string Items.Restrict takes (e.g. "[ReceivedTime] >= '11/01/2025'")
+        namespace: Outlook Namespace (used to open items on demand)
+        stats: dict from new_fetch_stats() to accumulate counters into
+        batch_size: rows per GetArray call
+
+    Returns:
+        list: TableMailItem per row
+    """
+    stats = stats if stats is not None else new_fetch_stats()
+    table = folder.GetTable(restriction, OL_USER_ITEMS)
+    table.Columns.RemoveAll()
+    for column in TABLE_COLUMNS:
+        table.Columns.Add(column)
+    table.Sort("[ReceivedTime]", True)
+    store_id = folder.StoreID
+    rows = []
+    while not table.EndOfTable:
+        batch = table.GetArray(batch_size)
+        stats["table_batches"] += 1
+        if not batch:
+            break
+        for values in batch:
+            rows.append(TableMailItem(namespace, store_id, zip(TABLE_COLUMNS, values), stats))
+    stats["rows"] += len(rows)
+    return rows
+
+
+def email_transport_headers(email):
+    r"""Transport headers of a MailItem or TableMailItem"""
+    if isinstance(email, TableMailItem):
+        return email.transport_headers()
+    return email.PropertyAccessor.GetProperty(PR_TRANSPORT_MESSAGE_HEADERS)
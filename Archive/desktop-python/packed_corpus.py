@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+r"""
+Packed mail corpus: many raw messages in one memory-mapped file.
+
+Layout (little-endian):
+    header   32 bytes   magic b"SFPCORP1", count u64, index offset u64, folders offset u64
+    data     raw RFC 822 messages, back to back
+    index    count x 24 bytes: offset u64, length u32, folder id u16, flags u16, received i64 (epoch seconds, 0 = unknown)
+    folders  UTF-8 JSON list of folder names (folder id = position)
+
+Message i is located with one fixed-width index read, so any message is readable
+in O(1) without touching the others.  Readers map the file with ACCESS_READ:
+worker processes that open the same corpus share the page cache and nothing is
+copied until a message is actually parsed.
+
+Usage:
+    python packed_corpus.py pack --maildir ~/Mail --folders "Bulk Mail" -o bulk-2025.sfpc
+    python packed_corpus.py pack --mbox export/ -o export.sfpc
+    python packed_corpus.py info bulk-2025.sfpc
+    python packed_corpus.py scan bulk-2025.sfpc --rules ../rules.yaml --safe-senders ../rules_safe_senders.yaml --workers 4
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from datetime import datetime
+from email.parser import BytesHeaderParser
+from email.utils import parsedate_to_datetime
+from multiprocessing import Pool
+
+import yaml
+
+from mail_backends import (
+    DEFAULT_TRASH_FOLDER, INBOX_FOLDER, EmlDirectoryBackend, MailBackend, MaildirBackend, MboxBackend,
+    parse_lines, scan_backend,
+)
+from rule_engine import CompiledRuleset
+
+MAGIC = b"SFPCORP1"
+HEADER = struct.Struct("<8sQQQ")
+ENTRY = struct.Struct("<QIHHq")
+FLAG_UNREAD = 0x1
+
+
+def _received_epoch(raw):
+    r"""Date header as epoch seconds (0 if missing or unparsable), reading only the header block"""
+    end = raw.find(b"\n\n")
+    end2 = raw.find(b"\r\n\r\n")
+    cut = min(e for e in (end, end2, len(raw)) if e >= 0)
+    try:
+        date = BytesHeaderParser().parsebytes(raw[:cut] + b"\n\n").get('Date')
+        return int(parsedate_to_datetime(str(date)).timestamp()) if date else 0
+    except Exception:
+        return 0
+
+
+class PackedCorpusWriter:
+    r"""
+    Stream messages into a packed corpus.  Data is written as it arrives; the index
+    and folder table are appended on close() and the file is renamed into place.
+
+    Usage:
+        with PackedCorpusWriter("out.sfpc") as writer:
+            writer.add(raw_bytes, folder="Bulk Mail")
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = path + ".tmp"
+        self._file = open(self._tmp_path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, 0, 0, 0))
+        self._entries = []
+        self._folders = {}
+
+    def add(self, raw, folder=INBOX_FOLDER, unread=True, received=None):
+        r"""
+        Append one raw message.
+
+        Args:
+            raw: message bytes
+            folder: folder name recorded with the message
+            unread: read state
+            received: datetime; None to take it from the Date header
+        """
+        folder_id = self._folders.setdefault(folder, len(self._folders))
+        offset = self._file.tell()
+        self._file.write(raw)
+        epoch = int(received.timestamp()) if received is not None else _received_epoch(raw)
+        self._entries.append(ENTRY.pack(offset, len(raw), folder_id, FLAG_UNREAD if unread else 0, epoch))
+        return len(self._entries) - 1
+
+    def close(self):
+        if self._file is None:
+            return
+        index_offset = self._file.tell()
+        self._file.write(b"".join(self._entries))
+        folders_offset = self._file.tell()
+        names = sorted(self._folders, key=self._folders.get)
+        self._file.write(json.dumps(names).encode('utf-8'))
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, len(self._entries), index_offset, folders_offset))
+        self._file.close()
+        self._file = None
+        os.replace(self._tmp_path, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._file.close()
+            self._file = None
+            os.unlink(self._tmp_path)
+
+
+class PackedCorpus:
+    r"""
+    Read-only, memory-mapped view of a packed corpus.
+
+    Attributes:
+        folders: folder names (folder id = position)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER.size:
+            raise ValueError(f"{path}: not a packed corpus (too short)")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.index_offset, folders_offset = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a packed corpus (bad magic {magic!r})")
+        if self.index_offset + self.count * ENTRY.size != folders_offset or folders_offset > size:
+            raise ValueError(f"{path}: corrupt index")
+        self.folders = json.loads(self._mm[folders_offset:size].decode('utf-8'))
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, i):
+        r"""
+        Returns:
+            tuple: (offset, length, folder name, unread, received datetime or None)
+        """
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        offset, length, folder_id, flags, epoch = ENTRY.unpack_from(self._mm, self.index_offset + i * ENTRY.size)
+        return offset, length, self.folders[folder_id], bool(flags & FLAG_UNREAD), datetime.fromtimestamp(epoch) if epoch else None
+
+    def raw_view(self, i):
+        r"""Zero-copy memoryview of message i (valid until close())"""
+        offset, length = self.entry(i)[:2]
+        return memoryview(self._mm)[offset:offset + length]
+
+    def raw(self, i):
+        offset, length = self.entry(i)[:2]
+        return self._mm[offset:offset + length]
+
+    def message(self, i):
+        r"""Parse message i into a LocalMailMessage (EntryID = index)"""
+        offset, length, folder, unread, received = self.entry(i)
+        message = parse_lines(self._mm[offset:offset + length].splitlines(keepends=True), i, folder, location=i, unread=unread)
+        if message.ReceivedTime is None:
+            message.ReceivedTime = received
+        return message
+
+    def indices(self, folder=None):
+        if folder is None:
+            return range(self.count)
+        return [i for i in range(self.count) if self.entry(i)[2] == folder]
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PackedCorpusBackend(MailBackend):
+    r"""Read-only MailBackend over a packed corpus (use scan_backend(..., dry_run=True))"""
+    name = "packed"
+
+    def __init__(self, path):
+        super().__init__(DEFAULT_TRASH_FOLDER, False)
+        self.root = path
+        self.corpus = PackedCorpus(path)
+
+    def list_folders(self):
+        return list(self.corpus.folders)
+
+    def iter_messages(self, folder):
+        for i in self.corpus.indices(folder):
+            yield self.corpus.message(i)
+
+    def _read_only(self, *args):
+        raise NotImplementedError("packed corpora are read-only; scan them with dry_run=True")
+
+    move = copy = remove = mark_read = _read_only
+
+    def close(self):
+        self.corpus.close()
+
+
+#------------------Packing------------------
+
+def iter_raw_messages(backend, folders=None):
+    r"""
+    Raw bytes straight from a local backend (its iter_raw()), without parsing.
+
+    Yields:
+        tuple: (raw bytes, folder, unread)
+    """
+    for folder in folders or backend.list_folders():
+        for raw, unread in backend.iter_raw(folder):
+            yield raw, folder, unread
+
+
+def pack_backend(backend, out_path, folders=None):
+    r"""Pack every message of a local backend; returns the message count"""
+    with PackedCorpusWriter(out_path) as writer:
+        count = 0
+        for raw, folder, unread in iter_raw_messages(backend, folders):
+            writer.add(raw, folder, unread)
+            count += 1
+    return count
+
+
+#------------------Parallel scan------------------
+
+_worker_state = {}
+
+
+def _worker_init(path, rules_json, safe_senders):
+    # Each worker maps the corpus itself: pages are shared through the OS page cache
+    _worker_state["corpus"] = PackedCorpus(path)
+    _worker_state["ruleset"] = CompiledRuleset(rules_json, safe_senders)
+
+
+def _worker_scan(bounds):
+    corpus, ruleset = _worker_state["corpus"], _worker_state["ruleset"]
+    start, stop = bounds
+    return [(i, ruleset.evaluate(corpus.message(i).view())) for i in range(start, stop)]
+
+
+def evaluate_corpus(path, rules_json, safe_senders, workers=1, chunk=2000):
+    r"""
+    Evaluate every message of a packed corpus.
+
+    Args:
+        path: corpus file
+        rules_json, safe_senders: rules documents
+        workers: processes (1 evaluates in this process)
+        chunk: messages per task
+
+    Returns:
+        list: verdict per message, in index order
+    """
+    with PackedCorpus(path) as corpus:
+        count = len(corpus)
+    ranges = [(i, min(i + chunk, count)) for i in range(0, count, chunk)]
+    verdicts = [None] * count
+    if workers <= 1:
+        _worker_init(path, rules_json, safe_senders)
+        try:
+            for part in map(_worker_scan, ranges):
+                for i, verdict in part:
+                    verdicts[i] = verdict
+        finally:
+            _worker_state.pop("corpus").close()
+        return verdicts
+    with Pool(workers, initializer=_worker_init, initargs=(path, rules_json, safe_senders)) as pool:
+        for part in pool.imap_unordered(_worker_scan, ranges):
+            for i, verdict in part:
+                verdicts[i] = verdict
+    return verdicts
+
+
+#------------------CLI------------------
+
+def _load_yaml(path, default):
+    with open(path, 'r', encoding='utf-8') as f:
+        return yaml.safe_load(f) or default
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Packed, memory-mapped mail corpus')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    pack = sub.add_parser('pack', help='Pack a Maildir, mbox or EML directory into one corpus file')
+    source = pack.add_mutually_exclusive_group(required=True)
+    source.add_argument('--maildir')
+    source.add_argument('--mbox')
+    source.add_argument('--eml')
+    pack.add_argument('--folders', nargs='+', help='Folders to pack (default: all)')
+    pack.add_argument('-o', '--output', required=True)
+
+    info = sub.add_parser('info', help='Show message and folder counts')
+    info.add_argument('corpus')
+
+    scan = sub.add_parser('scan', help='Evaluate rules over a corpus (read-only)')
+    scan.add_argument('corpus')
+    scan.add_argument('--rules', required=True)
+    scan.add_argument('--safe-senders', required=True)
+    scan.add_argument('--workers', type=int, default=1)
+    scan.add_argument('--report', help='Write per-message verdicts as JSON to this file')
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        if args.maildir:
+            backend = MaildirBackend(args.maildir)
+        elif args.mbox:
+            backend = MboxBackend(args.mbox)
+        else:
+            backend = EmlDirectoryBackend(args.eml)
+        start = time.perf_counter()
+        count = pack_backend(backend, args.output, args.folders)
+        print(f"[OK] Packed {count} messages into {args.output} in {time.perf_counter() - start:.1f}s")
+        return 0
+
+    if args.command == 'info':
+        with PackedCorpus(args.corpus) as corpus:
+            counts = {}
+            for i in range(len(corpus)):
+                folder = corpus.entry(i)[2]
+                counts[folder] = counts.get(folder, 0) + 1
+            print(f"[INFO] {args.corpus}: {len(corpus)} messages, {os.path.getsize(args.corpus)} bytes")
+            for folder, n in sorted(counts.items()):
+                print(f"  {folder:<30} {n:>8}")
+        return 0
+
+    rules_json = _load_yaml(args.rules, {"rules": []})
+    safe_senders = _load_yaml(args.safe_senders, {"safe_senders": []})
+    start = time.perf_counter()
+    if args.workers > 1:
+        verdicts = evaluate_corpus(args.corpus, rules_json, safe_senders, args.workers)
+        outcome = {"verdicts": verdicts}
+        processed = len(verdicts)
+        matched = sum(1 for v in verdicts if v["fired"])
+    else:
+        backend = PackedCorpusBackend(args.corpus)
+        outcome = scan_backend(backend, CompiledRuleset(rules_json, safe_senders), dry_run=True)
+        backend.close()
+        processed = outcome["stats"]["processed"]
+        matched = outcome["stats"]["matched"]
+    elapsed = time.perf_counter() - start
+    print(f"[OK] Evaluated {processed} messages in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.0f}/s), {matched} matched a rule")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(outcome, f, indent=2, default=str)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
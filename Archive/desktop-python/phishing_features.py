@@ -0,0 +1,301 @@
+r"""
+Single-pass phishing feature extraction.
+
+OutlookSecurityAgent.check_phishing_indicators lowercased Subject, Body and
+HTMLBody separately for every check, and inside its href loop lowercased the
+whole HTMLBody again for every URL (urls x body).  That check compared each
+href with the HTML it was taken from, so it could never report a mismatch.
+
+extract_email_features reads each property once and builds a PhishingFeatures
+record:
+
+  - the HTML is tokenized once (html.parser) into links: (href, display text)
+    pairs.  A link is mismatched when its display text is itself a URL or
+    domain that names a different host than the href;
+  - keyword hits (URGENT_WORDS in the subject, SENSITIVE_WORDS in the body) come
+    from a KeywordAutomaton built once at import: an Aho-Corasick automaton that
+    finds every keyword in one left-to-right scan of the text;
+  - the sender/display-name mismatch.
+
+The record also carries the body's URL stubs ("/<domain>.<>" and ".<domain>.<>",
+see url_stubs()) and the link domains.  It is kept with the email's scan info, and
+a FeatureStore keeps it per EntryID for the run, so the phishing rules, the URL
+report, the interactive triage and the second pass over the same messages read it
+instead of going back to the item.
+"""
+
+import re
+from collections import deque
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+URGENT_WORDS = ('urgent', 'immediate', 'action required', 'account suspended')
+SENSITIVE_WORDS = ('password', 'login', 'credential', 'verify account')
+
+_URL_STUB = re.compile(r'(\.[\w-]+\.[\w-]+)|(/[\w-]+\.[\w-]+)')
+
+# Display text that is itself a URL or a bare domain ("www.bank.com", "https://bank.com/login")
+_DISPLAY_URL = re.compile(r'^(?:[a-z][a-z0-9+.-]*://)?([a-z0-9-]+(?:\.[a-z0-9-]+)+)(?::\d+)?(?:[/?#]\S*)?$', re.I)
+
+
+class KeywordAutomaton:
+    r"""
+    Aho-Corasick automaton over lowercase keywords.
+
+    Args:
+        keywords: iterable of keywords (matched case-insensitively, overlaps included)
+    """
+
+    def __init__(self, keywords):
+        self.keywords = tuple(dict.fromkeys(keyword.lower() for keyword in keywords))
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for keyword in self.keywords:
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = next_state
+            self._out[state] += (keyword,)
+        # Breadth-first: failure links point at the longest proper suffix that is also a prefix
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] += self._out[self._fail[next_state]]
+
+    def find(self, text):
+        r"""
+        Keywords occurring in text.
+
+        Returns:
+            list: keywords found, in self.keywords order
+        """
+        if not text:
+            return []
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+                if len(found) == len(self.keywords):
+                    break
+        return [keyword for keyword in self.keywords if keyword in found]
+
+
+URGENT_AUTOMATON = KeywordAutomaton(URGENT_WORDS)
+SENSITIVE_AUTOMATON = KeywordAutomaton(SENSITIVE_WORDS)
+
+
+class _LinkParser(HTMLParser):
+    r"""Collects (href, display text) for every <a href> in one pass over the HTML"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+        self._href = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'a':
+            return
+        self._close()
+        href = dict(attrs).get('href')
+        if href:
+            self._href = href.strip()
+            self._text = []
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._close()
+
+    def handle_data(self, data):
+        if self._href is not None:
+            self._text.append(data)
+
+    def _close(self):
+        if self._href is not None:
+            self.links.append((self._href, " ".join("".join(self._text).split())))
+            self._href = None
+
+    def close(self):
+        super().close()
+        self._close()
+
+
+def url_host(url):
+    r"""Lowercase host of an http(s) URL, or None"""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return None
+    if parts.scheme.lower() not in ('http', 'https'):
+        return None
+    return (parts.hostname or '').lower() or None
+
+
+def display_host(text):
+    r"""Host named by link text that looks like a URL or domain, or None"""
+    match = _DISPLAY_URL.match(text.strip()) if text else None
+    return match.group(1).lower() if match else None
+
+
+def url_stubs(text):
+    r"""
+    Unique URL stubs "/<domain>.<>" and ".<domain>.<>" in text, first-seen order.
+
+    Same output as OutlookSecurityAgent.get_unique_URL_stubs (the pattern never spans
+    a line, so the text is scanned in one go instead of line by line).
+    """
+    stubs = {}
+    for match in _URL_STUB.finditer(text or ""):
+        cleaned = (match.group(1) or match.group(2)).lstrip('/.')
+        stubs.setdefault('/' + cleaned)
+        stubs.setdefault('.' + cleaned)
+    return list(stubs)
+
+
+def _same_site(a, b):
+    return a == b or a.endswith('.' + b) or b.endswith('.' + a)
+
+
+class PhishingFeatures:
+    r"""
+    Compact per-email feature record.
+
+    Attributes:
+        sender, display_name: lowercased SenderEmailAddress / SenderName
+        sender_mismatch: display name contains an address other than the sender
+        urgent_words: URGENT_WORDS found in the subject
+        sensitive_words: SENSITIVE_WORDS found in the body
+        links: (href, display text) per <a href> in the HTML body
+        link_domains: hosts of the http(s) links, first-seen order
+        mismatched_links: links whose display text names another host than the href
+        url_stubs: url_stubs() of the plain-text body
+    """
+    __slots__ = ("sender", "display_name", "sender_mismatch", "urgent_words", "sensitive_words", "links",
+                 "link_domains", "mismatched_links", "url_stubs")
+
+    def __init__(self, sender="", display_name="", urgent_words=(), sensitive_words=(), links=(), url_stubs=()):
+        self.sender = sender
+        self.display_name = display_name
+        self.sender_mismatch = '@' in display_name and display_name != sender
+        self.urgent_words = list(urgent_words)
+        self.sensitive_words = list(sensitive_words)
+        self.links = list(links)
+        self.link_domains = []
+        self.mismatched_links = []
+        for href, text in self.links:
+            host = url_host(href)
+            if host is None:
+                continue
+            if host not in self.link_domains:
+                self.link_domains.append(host)
+            shown = display_host(text)
+            if shown and not _same_site(shown, host):
+                self.mismatched_links.append((href, text))
+        self.url_stubs = list(url_stubs)
+
+    def indicators(self):
+        r"""
+        Indicator strings, as check_phishing_indicators reports them.
+
+        Returns:
+            list: (indicator, detail) pairs
+        """
+        found = []
+        if self.sender_mismatch:
+            found.append(("Phishing indicator: Sender name/email mismatch", f"{self.display_name} vs {self.sender}"))
+        if self.urgent_words:
+            found.append(("Phishing indicator: Found urgent language in subject", self.urgent_words))
+        if self.mismatched_links:
+            found.append(("Phishing indicator: Found Mismatched URL display text", self.mismatched_links[0]))
+        if self.sensitive_words:
+            found.append(("Phishing indicator: Found requests for sensitive information", self.sensitive_words))
+        return found
+
+
+def extract_links(html):
+    r"""(href, display text) for every <a href>, in document order"""
+    if not html:
+        return []
+    parser = _LinkParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass            # keep what was parsed before the broken markup
+    return parser.links
+
+
+def extract_features(subject="", sender="", display_name="", body="", html_body=""):
+    r"""Build a PhishingFeatures record from already-read properties"""
+    return PhishingFeatures(
+        sender=(sender or "").lower(),
+        display_name=(display_name or "").lower(),
+        urgent_words=URGENT_AUTOMATON.find(subject),
+        sensitive_words=SENSITIVE_AUTOMATON.find(body),
+        links=extract_links(html_body),
+        url_stubs=url_stubs(body),
+    )
+
+
+def extract_email_features(email):
+    r"""Read Subject, sender, Body and HTMLBody once each from a MailItem (or TableMailItem) and extract"""
+    def read(name):
+        try:
+            return getattr(email, name) or ""
+        except Exception:
+            return ""
+    return extract_features(read("Subject"), read("SenderEmailAddress"), read("SenderName"), read("Body"),
+                            read("HTMLBody"))
+
+
+class FeatureStore:
+    r"""
+    PhishingFeatures per message (EntryID) for one run.
+
+    The second pass, the URL report and the interactive triage look at the same
+    messages as the first pass; their bodies do not change in between, so the
+    record extracted once is handed out again.  Items without an EntryID are
+    extracted every time.
+    """
+
+    def __init__(self):
+        self.stats = {"extracted": 0, "reused": 0}
+        self._features = {}
+
+    def __len__(self):
+        return len(self._features)
+
+    def get(self, email):
+        r"""PhishingFeatures for email, extracted on first use"""
+        try:
+            key = email.EntryID
+        except Exception:
+            key = None
+        if key:
+            features = self._features.get(key)
+            if features is not None:
+                self.stats["reused"] += 1
+                return features
+        features = extract_email_features(email)
+        self.stats["extracted"] += 1
+        if key:
+            self._features[key] = features
+        return features
@@ -0,0 +1,175 @@
+r"""
+Registrable domains from the Public Suffix List.
+
+build_sender_domain_safe_regex and triage.registrable_domain reduced a domain
+to its last two labels, or three under a hard-coded set of ten multi-part
+suffixes (co.uk, com.au, ...).  Every other multi-part suffix (ltd.uk, com.mx,
+github.io, ...) gave the suffix itself as the "domain", so one rule or one
+triage cluster covered unrelated senders.
+build_domain_regex_from_address guessed the anchor label by skipping a list of
+infrastructure and TLD-like labels (SKIP_LABELS).
+
+public_suffix_list.dat is an offline snapshot of https://publicsuffix.org/list/
+(ICANN and private sections; refresh it by downloading the same file again).
+It is compiled once, on first use, into a trie keyed by reversed labels:
+
+    uk -> co -> (rule)          co.uk
+    jp -> kawasaki -> *         *.kawasaki.jp
+                   -> city      !city.kawasaki.jp (exception)
+
+lookup() walks the trie once per domain: exception rules win, otherwise the
+longest matching rule gives the public suffix, and the registrable domain is
+that suffix plus one label.  Results are memoized per domain, so millions of
+senders from a few thousand domains cost a few thousand walks.
+
+Usage:
+    registrable_domain("a@mail.news.example.co.uk")   # 'example.co.uk'
+    lookup("shop.example.com.mx")                      # DomainParts('com.mx', 'example.com.mx', True)
+"""
+
+import functools
+import os
+from collections import namedtuple
+
+PSL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "public_suffix_list.dat")
+LOOKUP_CACHE_SIZE = 1 << 16
+
+_END = ""           # trie key of the rule marker (labels are never empty)
+_WILDCARD = "*"
+_RULE = 1
+_EXCEPTION = 2
+
+DomainParts = namedtuple("DomainParts", ("suffix", "registrable", "listed"))
+DomainParts.__doc__ = r"""
+Public suffix and registrable domain of one domain.
+
+Attributes:
+    suffix: public suffix ('co.uk'); the last label when no rule matches
+    registrable: suffix plus one label ('example.co.uk'); the domain itself if it is a public suffix
+    listed: True if a list rule gave the suffix (False for unknown TLDs, where the implicit '*' rule applies)
+"""
+
+
+def address_domain(addr_or_domain):
+    r"""Domain part of "user@host", "@host" or "host", lowercased"""
+    s = (addr_or_domain or '').strip().lower()
+    if '@' in s:
+        s = s.rsplit('@', 1)[1]
+    return s.strip('.')
+
+
+def _ascii_label(label):
+    try:
+        return label.encode('idna').decode('ascii')
+    except UnicodeError:
+        return label
+
+
+class PublicSuffixTrie:
+    r"""
+    Public Suffix List rules compiled into a reversed-label trie.
+
+    Args:
+        lines: lines of a public_suffix_list.dat file
+        include_private: also load the PRIVATE DOMAINS section (github.io, blogspot.com, ...)
+    """
+
+    def __init__(self, lines, include_private=True):
+        self.root = {}
+        self.rules = 0
+        private = False
+        for line in lines:
+            line = line.strip()
+            if line.startswith("//"):
+                if "===BEGIN PRIVATE DOMAINS===" in line:
+                    private = True
+                continue
+            if not line or (private and not include_private):
+                continue
+            rule = line.split()[0].lower()
+            self._add(rule)
+            ascii_rule = '.'.join(_ascii_label(label) for label in rule.split('.'))
+            if ascii_rule != rule:
+                self._add(ascii_rule)       # senders carry IDNs in punycode (xn--...)
+
+    @classmethod
+    def from_file(cls, path=PSL_FILE, include_private=True):
+        with open(path, encoding='utf-8') as f:
+            return cls(f, include_private)
+
+    def _add(self, rule):
+        kind = _RULE
+        if rule.startswith('!'):
+            kind, rule = _EXCEPTION, rule[1:]
+        node = self.root
+        for label in reversed(rule.split('.')):
+            node = node.setdefault(label, {})
+        node[_END] = kind
+        self.rules += 1
+
+    def suffix_length(self, labels):
+        r"""
+        Args:
+            labels: domain labels, left to right
+
+        Returns:
+            tuple: (number of labels in the public suffix, True if a list rule matched)
+        """
+        length, listed = 1, False       # the implicit '*' rule
+        node = self.root
+        for depth, label in enumerate(reversed(labels), 1):
+            exact = node.get(label)
+            if exact is not None and exact.get(_END) == _EXCEPTION:
+                return depth - 1, True
+            wildcard = node.get(_WILDCARD)
+            if wildcard is not None and wildcard.get(_END) == _RULE:
+                length, listed = depth, True
+            if exact is None:
+                break
+            if exact.get(_END) == _RULE:
+                length, listed = depth, True
+            node = exact
+        return length, listed
+
+    def lookup(self, domain):
+        r"""
+        Args:
+            domain: lowercase domain without '@'
+
+        Returns:
+            DomainParts, or None for an empty domain
+        """
+        labels = [label for label in domain.split('.') if label]
+        if not labels:
+            return None
+        length, listed = self.suffix_length(labels)
+        suffix = '.'.join(labels[-length:])
+        registrable = '.'.join(labels[-(length + 1):]) if len(labels) > length else suffix
+        return DomainParts(suffix, registrable, listed)
+
+
+_default_trie = None
+
+
+def default_trie():
+    r"""The bundled snapshot, compiled on first use"""
+    global _default_trie
+    if _default_trie is None:
+        _default_trie = PublicSuffixTrie.from_file()
+    return _default_trie
+
+
+@functools.lru_cache(maxsize=LOOKUP_CACHE_SIZE)
+def _lookup_domain(domain):
+    return default_trie().lookup(domain)
+
+
+def lookup(addr_or_domain):
+    r"""DomainParts of an address or domain (memoized), or None when there is no domain"""
+    return _lookup_domain(address_domain(addr_or_domain))
+
+
+def registrable_domain(addr_or_domain):
+    r"""Registrable domain ('example.co.uk' for a@mail.example.co.uk); '' when there is no domain"""
+    parts = lookup(addr_or_domain)
+    return parts.registrable if parts else ''
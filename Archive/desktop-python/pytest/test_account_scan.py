@@ -0,0 +1,315 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+import account_scan
+from account_scan import (
+    KIND_EML, OutlookBackend, StoreSpec, merged_report, scan_accounts, store_summary_lines, stores_from_config,
+)
+from imap_standin import ImapStandinServer
+from mail_backends import LocalMailMessage, MailBackend, scan_backend
+from outlook_table import TABLE_COLUMNS
+from rule_engine import CompiledRuleset
+
+RULES = {"rules": [
+    {"name": "SpamHeader", "conditions": {"header": [r"@(?:[a-z0-9-]+\.)*spammy\.[a-z0-9.-]+$"]}, "exceptions": {},
+     "actions": {"delete": True}},
+    {"name": "Body", "conditions": {"body": [r"(?i).*casino.*"]}, "exceptions": {}, "actions": {"delete": True}},
+]}
+SAFE = {"safe_senders": [r"^[^@\s]+@(?:[a-z0-9-]+\.)*friend\.org$"]}
+
+
+def _raw(sender, subject, body):
+    return f"From: <{sender}>\nSubject: {subject}\nDate: Mon, 10 Nov 2025 10:00:00 +0000\n\n{body}\n".encode()
+
+
+def _kinds(prefix, count):
+    r"""count messages per kind: spam header, safe sender, casino body, clean"""
+    for i in range(count):
+        yield _raw(f"{prefix}{i}@mail.spammy.com", "hi", "buy")
+        yield _raw(f"{prefix}pal{i}@friend.org", "lunch", "casino night")
+        yield _raw(f"{prefix}s{i}@else.net", "offer", "visit the casino")
+        yield _raw(f"{prefix}c{i}@clean-{prefix}.net", "notes", "plain")
+
+
+def test_entries_for_the_same_store_share_one_worker():
+    stores = stores_from_config([
+        {"kind": "outlook", "account": "Me@AOL.com", "folders": ["Bulk Mail"]},
+        {"kind": "imap", "host": "imap.example.com", "user": "me", "folders": "Junk"},
+        {"kind": "outlook", "account": "me@aol.com", "folders": ["bulk", "Bulk Mail"]},
+    ])
+    assert [store.label for store in stores] == ["outlook:Me@AOL.com", "imap:me@imap.example.com"]
+    assert stores[0].folders == ["Bulk Mail", "bulk"] and stores[1].folders == ["Junk"]
+    assert stores[1].options == {"host": "imap.example.com", "user": "me"}
+    with pytest.raises(ValueError):
+        StoreSpec("pop3", "me@example.com")
+
+
+def test_concurrent_scan_of_imap_and_local_stores_matches_scanning_each_alone(tmp_path):
+    servers = []
+    for name in ("a", "b"):
+        server = ImapStandinServer()
+        server.add_folder("Bulk Mail")
+        for raw in _kinds(name, 10):
+            server.add_message("Bulk Mail", raw)
+        server.start()
+        servers.append(server)
+    bulk = tmp_path / "eml" / "Bulk Mail"
+    bulk.mkdir(parents=True)
+    for n, raw in enumerate(_kinds("e", 5)):
+        (bulk / f"{n:03}.eml").write_bytes(raw)
+    entries = [{"kind": "imap", "host": server.server_address[0], "port": server.server_address[1], "user": "user",
+                "password": "password", "folders": ["Bulk Mail"]} for server in servers]
+    entries.append({"kind": KIND_EML, "path": str(tmp_path / "eml"), "folders": ["Bulk Mail"]})
+    stores = stores_from_config(entries)
+    ruleset = CompiledRuleset(RULES, SAFE)
+    try:
+        outcome = scan_accounts(stores, ruleset, dry_run=True)
+        alone = [scan_backend(account_scan.open_backend(store), ruleset, store.folders, dry_run=True)
+                 for store in stores]
+    finally:
+        for server in servers:
+            server.stop()
+
+    assert outcome["stats"] == {"processed": 100, "safe_senders": 25, "matched": 50, "deleted": 50, "moved": 25,
+                                "errors": 0}
+    assert [store["stats"] for store in outcome["stores"]] == [scanned["stats"] for scanned in alone]
+    by_store = {}
+    for record in outcome["results"]:
+        by_store.setdefault(record.pop("store"), []).append(record)
+    assert list(by_store) == [store.label for store in stores]
+    assert list(by_store.values()) == [scanned["results"] for scanned in alone]
+    assert ruleset.hits == {"SpamHeader": 50, "Body": 50}  # both scans, counted from every worker
+
+    report = merged_report(outcome)
+    assert report.no_match == 25
+    assert {group.key: group.count for group in report.top("from_domain")} == {
+        "@clean-a.net": 10, "@clean-b.net": 10, "@clean-e.net": 5}
+
+
+class SlowBackend(MailBackend):
+    r"""Local store whose every message costs a fixed wait (a slow network or COM round trip)"""
+    name = "slow"
+
+    def __init__(self, label, count, delay):
+        super().__init__()
+        self.root = label
+        self.count = count
+        self.delay = delay
+        self.threads = set()
+
+    def iter_messages(self, folder):
+        for i in range(self.count):
+            self.threads.add(threading.current_thread().name)
+            time.sleep(self.delay)
+            yield LocalMailMessage(f"{self.root}-{i}", folder, f"x{i}@mail.spammy.com", subject="hi",
+                                   received_time=datetime(2025, 11, 10))
+
+    def remove(self, message):
+        pass
+
+    def move(self, message, folder):
+        pass
+
+
+def test_a_dropped_plan_is_rebuilt_once_and_not_by_the_workers(monkeypatch):
+    ruleset = CompiledRuleset(RULES, SAFE)
+    builds = []
+    build_plan = CompiledRuleset._build_plan
+
+    def counting_build_plan(self):
+        builds.append(threading.current_thread().name)
+        time.sleep(0.01)  # leaves room for a second thread to start its own rebuild
+        return build_plan(self)
+
+    monkeypatch.setattr(CompiledRuleset, "_build_plan", counting_build_plan)
+    planned = []
+
+    def opener(store, pool, log):
+        planned.append(ruleset._plan is not None)
+        return SlowBackend(store.account, 5, 0)
+
+    ruleset._plan = None  # as after an edit that changes the rule order
+    stores = stores_from_config([{"kind": "gmail", "account": f"user{n}@example.com", "folders": ["Junk"]}
+                                 for n in range(4)])
+    outcome = scan_accounts(stores, ruleset, opener=opener)
+    assert outcome["stats"]["deleted"] == 20
+    assert builds == [threading.current_thread().name] and planned == [True] * 4
+
+    ruleset._plan = None
+    barrier = threading.Barrier(8)
+    plans = []
+
+    def evaluate():
+        barrier.wait()
+        plans.append(ruleset.plan())
+
+    threads = [threading.Thread(target=evaluate) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(builds) == 2 and all(plan is plans[0] for plan in plans)
+
+
+def test_wall_time_follows_the_slowest_store_and_failures_stay_per_store():
+    backends = {}
+
+    def opener(store, pool, log):
+        if store.account == "broken@example.com":
+            raise ConnectionError("login failed")
+        backend = backends[store.account] = SlowBackend(store.account, store.options["count"], 0.02)
+        return backend
+
+    stores = stores_from_config([{"kind": "gmail", "account": f"user{n}@example.com", "count": 10, "folders": ["Junk"]}
+                                 for n in range(4)] + [{"kind": "gmail", "account": "broken@example.com"}])
+    outcome = scan_accounts(stores, CompiledRuleset(RULES, SAFE), opener=opener)
+
+    assert outcome["stats"]["processed"] == 40 and outcome["stats"]["deleted"] == 40
+    assert outcome["stats"]["errors"] == 1 and outcome["stores"][-1]["error"] == "login failed"
+    assert len({thread for backend in backends.values() for thread in backend.threads}) == 4
+    assert outcome["store_seconds"] >= 0.8 and outcome["elapsed"] < 0.5 * outcome["store_seconds"]
+    assert store_summary_lines(outcome)[-2] == "gmail:broken@example.com: error: login failed (0.0s)"
+
+
+class FakeTable:
+    def __init__(self, rows):
+        self.rows = rows
+        self.position = 0
+        self.Columns = self
+        self.columns = []
+
+    def RemoveAll(self):
+        self.columns = []
+
+    def Add(self, name):
+        self.columns.append(name)
+
+    def Sort(self, column, descending):
+        pass
+
+    @property
+    def EndOfTable(self):
+        return self.position >= len(self.rows)
+
+    def GetArray(self, max_rows):
+        batch = self.rows[self.position:self.position + max_rows]
+        self.position += len(batch)
+        return tuple(tuple(row[c] for c in self.columns) for row in batch)
+
+
+class FakeFolder:
+    StoreID = "store-1"
+
+    def __init__(self, name, rows=(), subfolders=()):
+        self.Name = name
+        self.EntryID = f"id-{name}"
+        self.rows = list(rows)
+        self.Folders = FakeFolders(subfolders)
+        self.restrictions = []
+
+    def GetTable(self, restriction, contents):
+        self.restrictions.append(restriction)
+        return FakeTable(self.rows)
+
+    def __repr__(self):
+        return self.Name
+
+
+class FakeFolders(list):
+    def __getitem__(self, name):
+        if isinstance(name, int):
+            return list.__getitem__(self, name)
+        for folder in self:
+            if folder.Name == name:
+                return folder
+        raise KeyError(name)
+
+
+class FakeMailItem:
+    def __init__(self, entry_id, body):
+        self.EntryID = entry_id
+        self.Body = body
+        self.UnRead = True
+        self.calls = []
+
+    def Save(self):
+        self.calls.append("Save")
+
+    def Move(self, folder):
+        self.calls.append(f"Move {folder}")
+
+    def Delete(self):
+        self.calls.append("Delete")
+
+
+class FakeAccount:
+    def __init__(self, address):
+        self.SmtpAddress = address
+        self.DeliveryStore = self
+        self.DisplayName = address
+
+
+class FakeNamespace:
+    def __init__(self, address, root, items):
+        self.Accounts = [FakeAccount("other@example.com"), FakeAccount(address)]
+        self.roots = {address: root}
+        self.items = items
+
+    def Folders(self, name):
+        return self.roots[name]
+
+    def GetItemFromID(self, entry_id, store_id):
+        return self.items[entry_id]
+
+
+def _outlook_store(address, senders):
+    rows, items = [], {}
+    for n, (sender, body) in enumerate(senders):
+        entry_id = f"{address}-{n}"
+        rows.append(dict(zip(TABLE_COLUMNS, (entry_id, "hi", sender, "", datetime(2025, 11, 10), True,
+                                             f"From: <{sender}>\n"))))
+        items[entry_id] = FakeMailItem(entry_id, body)
+    inbox = FakeFolder("Inbox")
+    bulk = FakeFolder("Bulk Mail", rows)
+    root = FakeFolder(address, subfolders=[inbox, FakeFolder("Archive", subfolders=[bulk])])
+    return FakeNamespace(address, root, items), items
+
+
+def test_outlook_workers_each_get_their_own_com_apartment(monkeypatch):
+    apartments = []
+
+    class FakePythoncom:
+        @staticmethod
+        def CoInitialize():
+            apartments.append(("init", threading.current_thread().name))
+
+        @staticmethod
+        def CoUninitialize():
+            apartments.append(("uninit", threading.current_thread().name))
+
+    monkeypatch.setattr(account_scan, "pythoncom", FakePythoncom)
+    senders = [("x@mail.spammy.com", "buy"), ("pal@friend.org", "hello"), ("s@else.net", "casino"),
+               ("c@else.net", "plain")]
+    mailboxes = {address: _outlook_store(address, senders) for address in ("a@aol.com", "b@outlook.com")}
+    opened_on = {}
+
+    def opener(store, pool, log):
+        opened_on[store.account] = threading.current_thread().name
+        assert ("init", threading.current_thread().name) in apartments
+        return OutlookBackend(store.account, mailboxes[store.account][0], log)
+
+    stores = stores_from_config([{"account": address, "folders": ["Bulk Mail"]} for address in mailboxes])
+    outcome = scan_accounts(stores, CompiledRuleset(RULES, SAFE), days_back=30, opener=opener)
+
+    assert outcome["stats"]["processed"] == 8 and outcome["stats"]["errors"] == 0
+    assert sorted(apartments) == sorted([("init", ident) for ident in opened_on.values()] +
+                                        [("uninit", ident) for ident in opened_on.values()])
+    assert len(set(opened_on.values())) == 2
+    for address, (namespace, items) in mailboxes.items():
+        calls = [items[f"{address}-{n}"].calls for n in range(4)]
+        assert calls == [["Save", "Delete"], ["Move Inbox"], ["Save", "Delete"], []]
+        bulk = namespace.roots[address].Folders["Archive"].Folders["Bulk Mail"]
+        assert bulk.restrictions[0].startswith("[ReceivedTime] >= '")
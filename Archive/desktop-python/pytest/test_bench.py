@@ -0,0 +1,38 @@
+import bench
+
+
+def test_compare_flags_throughput_drop_beyond_threshold():
+    baseline = {"s": {"emails_per_sec": 1000.0}}
+    rows = bench.compare_results(baseline, {"s": {"emails_per_sec": 750.0}}, threshold=0.20)
+    assert rows[0]["regressed"] is True
+    rows = bench.compare_results(baseline, {"s": {"emails_per_sec": 850.0}}, threshold=0.20)
+    assert rows[0]["regressed"] is False
+
+
+def test_compare_lower_is_better_metrics_respect_noise_floor():
+    baseline = {"s": {"load_seconds": 0.015, "rss_mb": 100.0}}
+    # +70% load time but only 10 ms: noise; +30% RSS (30 MB): regression
+    rows = bench.compare_results(baseline, {"s": {"load_seconds": 0.025, "rss_mb": 130.0}}, threshold=0.20)
+    by_metric = {r["metric"]: r for r in rows}
+    assert by_metric["load_seconds"]["regressed"] is False
+    assert by_metric["rss_mb"]["regressed"] is True
+
+
+def test_compare_missing_scenario_is_reported_not_failed():
+    rows = bench.compare_results({"gone": {"emails_per_sec": 10.0}}, {}, threshold=0.20)
+    assert rows == [{"scenario": "gone", "metric": "emails_per_sec", "baseline": 10.0, "current": None,
+                     "delta": None, "regressed": False}]
+    assert "skipped" in bench.format_delta_table(rows)
+
+
+def test_compare_mode_exits_nonzero_on_regression(tmp_path, monkeypatch, capsys):
+    baseline_file = tmp_path / "baseline.json"
+    bench.write_baseline({"random_rules_compiled": {"emails_per_sec": 1e12}}, str(baseline_file))
+    monkeypatch.setattr(bench, "run_suite", lambda names=None, in_process=False: {"random_rules_compiled": {"emails_per_sec": 100.0}})
+    assert bench.main(["compare", "--baseline", str(baseline_file)]) == 1
+    assert "REGRESSION" in capsys.readouterr().out
+    assert bench.main(["compare", "--baseline", str(baseline_file), "--threshold", "1.0"]) == 0
+
+
+def test_checked_in_baseline_covers_every_scenario():
+    assert set(bench.load_baseline()) == set(bench.SCENARIOS)
@@ -0,0 +1,440 @@
+import os
+import random
+
+import pytest
+import yaml
+
+import differential_harness
+import rule_engine
+from rule_engine import (
+    MATCHER_EXACT, MATCHER_LABEL, MATCHER_REGEX, MATCHER_TAIL,
+    CompiledRuleset, MessageView, PatternMatcher, VerdictCache, classify_pattern, combine_email_header_lines,
+    header_first_sort_key, reference_evaluate,
+)
+
+ARCHIVE_RULES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "rules.yaml")
+BUNDLED_RULES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+                                  "mobile-app", "assets", "rules", "rules.yaml")
+
+
+def _msg(sender, subject="", body="", from_line=None):
+    header = combine_email_header_lines(f"From: <{from_line or sender.strip()}>\nSubject: {subject}")
+    return MessageView(sender, subject, body, header)
+
+
+def _rule(name, conditions, exceptions=None, delete=True):
+    return {"name": name, "conditions": conditions, "exceptions": exceptions or {}, "actions": {"delete": delete}}
+
+
+def _both(rules, safe, message):
+    reference = reference_evaluate(rules, safe, message)
+    optimized = CompiledRuleset(rules, safe).evaluate(message)
+    assert reference == optimized
+    return reference
+
+
+@pytest.mark.parametrize(
+    "pattern, expected",
+    [
+        (r"@(?:[a-z0-9-]+\.)*acme\.[a-z0-9.-]+$", (MATCHER_LABEL, "acme")),
+        (r"@acme\.[a-z0-9.-]+$", (MATCHER_LABEL, "acme")),
+        (r"@.*\.ru$", (MATCHER_TAIL, "ru")),
+        (r"^[^@\s]+@(?:[a-z0-9-]+\.)*lifeway\.com$", (MATCHER_TAIL, "lifeway.com")),
+        (r"^[^@\s]+@(?:[a-z0-9-]+\.)*@id\.apple\.com$", (MATCHER_TAIL, "@id.apple.com")),
+        (r"^john@example\.com$", (MATCHER_EXACT, "john@example.com")),
+        (r"(?i).*casino.*", (MATCHER_REGEX, None)),
+        (r"@insightfinancialassociates.com", (MATCHER_REGEX, None)),
+    ],
+)
+def test_classify_pattern(pattern, expected):
+    assert classify_pattern(pattern) == expected
+
+
+def test_randomized_rulesets_have_no_divergence():
+    result = differential_harness.run_randomized(seed=3, rounds=25, rule_count=6, message_count=80)
+    assert result["messages"] == 25 * 80
+    assert result["divergences"] == []
+
+
+def test_main_fails_when_most_verdicts_are_errors(tmp_path, capsys):
+    rules_file = tmp_path / "rules.yaml"
+    rule = _rule("entire_acme", {"header": [r"@(?:[a-z0-9-]+\.)*acme\.[a-z0-9.-]+$"]})
+    rules_file.write_text(yaml.safe_dump({"rules": [rule]}))
+    assert differential_harness.main(["--rules", str(rules_file), "--messages", "40"]) == 0
+    out = capsys.readouterr().out
+    assert "[OK] No divergences" in out and " 0 errors (of 40)" in out and "0 matched a rule" not in out
+
+    del rule["exceptions"]          # the split format before rebuild_rules_yaml.py emitted 'exceptions: {}'
+    rules_file.write_text(yaml.safe_dump({"rules": [rule]}))
+    assert differential_harness.main(["--rules", str(rules_file), "--messages", "40"]) == 1
+    out = capsys.readouterr().out
+    assert "40 errors (of 40)" in out and "[FAIL] No divergences, but 40 of 40 verdicts are errors" in out
+
+
+def test_first_pattern_in_list_order_wins_over_index_hits():
+    # The label index hits position 1, but the unindexable regex at position 0 also matches
+    rules = {"rules": [_rule("r", {"header": [r".*acme.*", r"@(?:[a-z0-9-]+\.)*acme\.[a-z0-9.-]+$"]})]}
+    verdict = _both(rules, {"safe_senders": []}, _msg("bob@mail.acme.com"))
+    assert verdict["matched_keyword"] == r".*acme.*"
+
+
+def test_last_matching_condition_sets_keyword():
+    rules = {"rules": [_rule("r", {"from": [r"acme"], "subject": [r"free"]})]}
+    verdict = _both(rules, {"safe_senders": []}, _msg("bob@acme.com", subject="free stuff"))
+    assert verdict["fired"] == [("r", "free")]
+
+
+def test_later_rule_overwrites_record_of_non_delete_match():
+    rules = {"rules": [_rule("tag", {"from": [r"acme"]}, delete=False), _rule("del", {"from": [r"nomatch"]}, delete=True)]}
+    verdict = _both(rules, {"safe_senders": []}, _msg("bob@acme.com"))
+    assert verdict["fired"] == [("tag", "acme")]
+    assert verdict["match"] is False and verdict["rule_name"] is None
+
+
+def test_from_exception_patterns_are_lowercased_before_compile():
+    # '\S' becomes '\s' in the original loop, so this exception never fires
+    rules = {"rules": [_rule("r", {"from": [r"acme"]}, exceptions={"from": [r"^\S+@acme\.com$"]})]}
+    verdict = _both(rules, {"safe_senders": []}, _msg("bob@acme.com"))
+    assert verdict["delete"] is True and verdict["suppressed"] == []
+
+
+def test_case_folding_sender_falls_back_to_full_regex():
+    # U+017F LATIN SMALL LETTER LONG S matches 's' under re.IGNORECASE; the index must not be trusted for it
+    rules = {"rules": [_rule("r", {"from": [r"^bob@sso\.com$"]})]}
+    verdict = _both(rules, {"safe_senders": []}, _msg("bob@\u017fso.com"))
+    assert verdict["delete"] is True
+
+
+def test_safe_sender_short_circuits_rules():
+    rules = {"rules": [_rule("r", {"header": [r"@(?:[a-z0-9-]+\.)*acme\.[a-z0-9.-]+$"]})]}
+    safe = {"safe_senders": [r"^[^@\s]+@(?:[a-z0-9-]+\.)*acme\.com$"]}
+    verdict = _both(rules, safe, _msg("bob@mail.acme.com"))
+    assert verdict["safe_sender"] == safe["safe_senders"][0]
+    assert verdict["fired"] == []
+
+
+def test_missing_exceptions_key_is_an_email_error_in_both():
+    rules = {"rules": [{"name": "r", "conditions": {"from": ["acme"]}, "actions": {"delete": True}}]}
+    assert _both(rules, {"safe_senders": []}, _msg("bob@acme.com")).get("error") is True
+
+
+def test_harness_reports_divergence(monkeypatch):
+    rules = {"rules": [_rule("r", {"from": [r"acme"]})]}
+    original = CompiledRuleset.evaluate
+
+    def broken(self, message):
+        verdict = original(self, message)
+        verdict["matched_keyword"] = "wrong"
+        return verdict
+
+    monkeypatch.setattr(CompiledRuleset, "evaluate", broken)
+    divergences = differential_harness.run_differential(rules, {"safe_senders": []}, [_msg("bob@acme.com")])
+    assert len(divergences) == 1
+    assert divergences[0]["fields"] == ["matched_keyword"]
+
+
+@pytest.mark.skipif(not os.path.exists(ARCHIVE_RULES_FILE), reason="archived rules.yaml not available")
+def test_archived_rules_sample_has_no_divergence():
+    with open(ARCHIVE_RULES_FILE, 'r', encoding='utf-8') as f:
+        rules = yaml.safe_load(f)
+    safe = {"safe_senders": []}
+    rng = random.Random(5)
+    messages = differential_harness.generate_corpus(rng, 3, differential_harness.addresses_for_rules(rules, safe))
+    assert differential_harness.run_differential(rules, safe, messages) == []
+
+
+def test_headers_only_evaluation_defers_only_when_a_body_list_is_reached():
+    rules = {"rules": [
+        _rule("hdr", {"header": [r"@(?:[a-z0-9-]+\.)*spammy\.[a-z0-9.-]+$"]}),
+        _rule("exc", {"from": [r"work\.com"]}, exceptions={"body": [r"keep"]}, delete=True),
+        _rule("body", {"body": [r"(?i).*casino.*"]}),
+    ]}
+    ruleset = CompiledRuleset(rules, {"safe_senders": []})
+    # Deleted by the header rule before any body list is reached
+    assert ruleset.evaluate_headers(_msg("x@mail.spammy.com"))["delete"] is True
+    # 'exc' matched, so its body exception has to be checked
+    assert ruleset.evaluate_headers(_msg("boss@work.com")) is None
+    # Neither header rule matched, so the body rule is reached
+    assert ruleset.evaluate_headers(_msg("pal@friend.org")) is None
+    rules["rules"].pop()
+    ruleset = CompiledRuleset(rules, {"safe_senders": []})
+    # 'exc' did not match: its body exception is never consulted
+    verdict = ruleset.evaluate_headers(_msg("pal@friend.org", body="keep"))
+    assert verdict == reference_evaluate(rules, {"safe_senders": []}, _msg("pal@friend.org", body="keep"))
+
+
+def test_empty_body_lists_do_not_need_the_body():
+    # rules.yaml carries "body: []" on every rule
+    rules = {"rules": [
+        _rule("hdr", {"header": [r"@(?:[a-z0-9-]+\.)*spammy\.[a-z0-9.-]+$"], "body": []}, exceptions={"body": []}),
+        _rule("from", {"from": [r"@junkco\.net$"], "body": []}),
+    ]}
+    ruleset = CompiledRuleset(rules, {"safe_senders": []})
+    assert ruleset.evaluate_headers(_msg("x@mail.spammy.com"))["rule_name"] == "hdr"
+    assert ruleset.evaluate_headers(_msg("pal@friend.org")) == reference_evaluate(rules, {"safe_senders": []},
+                                                                                  _msg("pal@friend.org"))
+
+
+def test_header_first_order_decides_from_rules_before_body_rules():
+    rules = {"rules": [
+        _rule("tag", {"subject": [r"(?i)news"]}, delete=False),
+        _rule("body", {"body": [r"(?i).*casino.*"], "from": []}),
+        _rule("from", {"from": [r"@junkco\.net$"], "body": []}),
+    ]}
+    safe = {"safe_senders": []}
+    file_order = CompiledRuleset(rules, safe)
+    header_first = CompiledRuleset(rules, safe, sort_key=header_first_sort_key)
+    assert [r.name for r in header_first.rules] == ["tag", "from", "body"]
+    message = _msg("y@junkco.net", subject="news", body="casino")
+    assert file_order.evaluate_headers(message) is None
+    verdict = header_first.evaluate_headers(message)
+    assert verdict["fired"] == [("tag", "(?i)news"), ("from", r"@junkco\.net$")] and verdict["delete"] is True
+    # Both orders delete; only the credited delete rule differs
+    assert file_order.evaluate(message)["fired"][-1][0] == "body"
+    assert verdict == reference_evaluate(rules, safe, message, sort_key=header_first_sort_key)
+
+
+@pytest.mark.skipif(not os.path.exists(ARCHIVE_RULES_FILE), reason="archived rules.yaml not available")
+def test_archived_rules_sample_has_no_divergence_in_header_first_order():
+    with open(ARCHIVE_RULES_FILE, "r", encoding="utf-8") as f:
+        rules = yaml.safe_load(f)
+    safe = {"safe_senders": []}
+    rng = random.Random(7)
+    messages = differential_harness.generate_corpus(rng, 3, differential_harness.addresses_for_rules(rules, safe))
+    assert differential_harness.run_differential(rules, safe, messages, sort_key=header_first_sort_key) == []
+    ruleset = CompiledRuleset(rules, safe, sort_key=header_first_sort_key)
+    # Header, from and subject rules come before the body rules
+    assert [r.name for r in ruleset.rules][-2:] == ["SpamAutoDeleteBody", "SpamAutoDeleteBody-imgur.com"]
+
+
+def test_pattern_matcher_add_and_remove_keep_list_order():
+    matcher = PatternMatcher([r".*acme.*", r"@(?:[a-z0-9-]+\.)*acme\.[a-z0-9.-]+$"])
+    assert matcher.first_match("@mail.acme.com") == r".*acme.*"
+    assert matcher.remove(r".*acme.*") and not matcher.remove(r".*acme.*")
+    assert matcher.first_match("@mail.acme.com") == r"@(?:[a-z0-9-]+\.)*acme\.[a-z0-9.-]+$"
+    matcher.add(r".*acme.*")       # appended: now last in list order
+    assert matcher.first_match("@mail.acme.com") == r"@(?:[a-z0-9-]+\.)*acme\.[a-z0-9.-]+$"
+    assert matcher.pattern_list()[-1] == r".*acme.*" and matcher.version == 2
+
+
+def test_pattern_matcher_compacts_removed_ids():
+    patterns = [rf"(?i)word{i}" for i in range(200)]
+    matcher = PatternMatcher(patterns)
+    for pattern in patterns[:150]:
+        assert matcher.remove(pattern)
+    assert len(matcher) == 50 and len(matcher.ordered) < 150
+    assert matcher.first_match("x WORD199 word160") == patterns[160]
+    assert matcher.pattern_list() == patterns[150:]
+
+
+def _random_edit(rng, rules_json, safe_senders, ruleset):
+    r"""Apply one random add/remove to the documents and mirror it on the compiled ruleset"""
+    if rng.random() < 0.25:
+        safe = safe_senders["safe_senders"]
+        if safe and rng.random() < 0.4:
+            pattern = rng.choice(safe)
+            safe.remove(pattern)
+            assert ruleset.remove_safe_sender(pattern)
+        else:
+            pattern = differential_harness.random_pattern(rng, "header")
+            safe.append(pattern)
+            ruleset.add_safe_sender(pattern)
+        return
+    rule = rng.choice([rule for rule in rules_json["rules"] if "exceptions" in rule])
+    exception = rng.random() < 0.3
+    key = rng.choice(["from", "subject", "body", "header"])
+    lists = rule["exceptions" if exception else "conditions"]
+    if lists.get(key) and rng.random() < 0.4:
+        pattern = rng.choice(lists[key])
+        lists[key].remove(pattern)
+        assert ruleset.remove_rule_pattern(rule["name"], key, pattern, exception)
+    else:
+        pattern = differential_harness.random_pattern(rng, key)
+        lists.setdefault(key, []).append(pattern)
+        ruleset.add_rule_pattern(rule["name"], key, pattern, exception)
+
+
+@pytest.mark.parametrize("sort_key", [None, header_first_sort_key])
+def test_incremental_edits_match_a_rebuilt_ruleset(sort_key):
+    rng = random.Random(11)
+    kwargs = {"sort_key": sort_key} if sort_key else {}
+    revalidated = 0
+    for _ in range(6):
+        rules_json, safe_senders = differential_harness.generate_ruleset(rng, rule_count=6)
+        messages = differential_harness.generate_corpus(rng, 60)
+        ruleset = CompiledRuleset(rules_json, safe_senders, **kwargs)
+        cache = VerdictCache(ruleset)
+        for _ in range(15):
+            _random_edit(rng, rules_json, safe_senders, ruleset)
+            for number, message in enumerate(messages):
+                assert cache.evaluate(number, message) == reference_evaluate(rules_json, safe_senders, message, **kwargs)
+        assert ruleset.version == len(ruleset.changes) >= 15
+        revalidated += cache.stats["revalidated"]
+    # Most edits touch few messages: those verdicts are re-stamped, not re-evaluated
+    assert revalidated > 0
+
+
+def test_verdict_cache_only_re_evaluates_messages_a_change_can_affect():
+    rules = {"rules": [_rule("SpamAutoDeleteHeader", {"header": [r"@(?:[a-z0-9-]+\.)*spam\.[a-z0-9.-]+$"]})]}
+    safe = {"safe_senders": []}
+    ruleset = CompiledRuleset(rules, safe)
+    cache = VerdictCache(ruleset)
+    spam, other = _msg("a@spam.com"), _msg("b@other.org")
+    assert cache.evaluate(1, spam)["match"] and not cache.evaluate(2, other)["match"]
+
+    pattern = r"@(?:[a-z0-9-]+\.)*other\.[a-z0-9.-]+$"
+    rules["rules"][0]["conditions"]["header"].append(pattern)
+    ruleset.add_rule_pattern("SpamAutoDeleteHeader", "header", pattern)
+    assert cache.evaluate(1, spam)["match"] and cache.evaluate(2, other)["match"]
+    assert cache.stats == {"hits": 0, "misses": 2, "revalidated": 1, "invalidated": 1}
+    assert cache.evaluate(1, spam)["match"] and cache.stats["hits"] == 1
+
+
+def _split_ruleset(rng, count):
+    r"""Split-format rules (one pattern each) with a few rules that must not coalesce"""
+    rules = []
+    for i in range(count):
+        key = "header" if rng.random() < 0.85 else rng.choice(["from", "subject", "body"])
+        rule = {"name": f"r{i}", "executionOrder": 20, "conditions": {"type": "OR", "header": [], "from": [],
+                "subject": [], "body": []}, "exceptions": {}, "actions": {"delete": True}}
+        rule["conditions"][key] = [differential_harness.random_pattern(rng, key)]
+        roll = rng.random()
+        if roll < 0.05:
+            rule["exceptions"]["from"] = [differential_harness.random_pattern(rng, "from")]
+        elif roll < 0.1:
+            rule["actions"] = {"delete": False, "assign_to_category": {"category_name": "Spam"}}
+        elif roll < 0.15:
+            rule["executionOrder"] = 10
+        rules.append(rule)
+    return {"rules": rules}
+
+
+@pytest.mark.parametrize("sort_key", [None, header_first_sort_key])
+def test_coalesced_rule_groups_match_the_reference(sort_key):
+    rng = random.Random(5)
+    kwargs = {"sort_key": sort_key} if sort_key else {}
+    for _ in range(8):
+        rules_json = _split_ruleset(rng, 60)
+        safe = {"safe_senders": [differential_harness.random_pattern(rng, "header")]}
+        ruleset = CompiledRuleset(rules_json, safe, **kwargs)
+        stats = ruleset.coalesce_stats()
+        assert stats["groups"] > 0 and stats["steps"] < stats["rules"]
+        messages = differential_harness.generate_corpus(rng, 150, differential_harness.addresses_for_rules(rules_json, safe))
+        for message in messages:
+            expected = reference_evaluate(rules_json, safe, message, **kwargs)
+            assert ruleset.evaluate(message) == expected
+            headers_only = ruleset.evaluate_headers(message)
+            assert headers_only is None or headers_only == expected
+
+
+def test_coalescing_keeps_per_rule_attribution_and_follows_edits():
+    rules = {"rules": [_rule(f"entire_{label}", {"header": [rf"@(?:[a-z0-9-]+\.)*{label}\.[a-z0-9.-]+$"]})
+                       for label in ("acme", "spam", "widgets")]}
+    ruleset = CompiledRuleset(rules, [])
+    assert ruleset.coalesce_stats() == {"rules": 3, "steps": 1, "groups": 1, "grouped_rules": 3}
+    # The From-line domain matches the later rule, the sender the earlier one: the earlier rule wins
+    verdict = ruleset.evaluate(_msg("a@acme.com", from_line="b@spam.com"))
+    assert verdict["rule_name"] == "entire_acme" and verdict["fired"] == [("entire_acme", r"@(?:[a-z0-9-]+\.)*acme\.[a-z0-9.-]+$")]
+    ruleset.evaluate(_msg("x@mail.spam.org"))
+    assert ruleset.hits == {"entire_acme": 1, "entire_spam": 1}
+
+    # An exception takes its rule out of the group; the others stay coalesced
+    rules["rules"][1]["exceptions"]["from"] = ["x@mail.spam.org"]
+    ruleset.add_rule_pattern("entire_spam", "from", "x@mail.spam.org", exception=True)
+    assert ruleset.coalesce_stats()["steps"] == 3
+    assert ruleset.evaluate(_msg("x@mail.spam.org")) == reference_evaluate(rules, [], _msg("x@mail.spam.org"))
+
+
+def test_bundled_split_rules_coalesce_and_evaluate_without_errors():
+    with open(BUNDLED_RULES_FILE, "r", encoding="utf-8") as f:
+        rules = yaml.safe_load(f)
+    safe = {"safe_senders": []}
+    ruleset = CompiledRuleset(rules, safe)
+    stats = ruleset.coalesce_stats()
+    assert stats["groups"] > 0 and stats["grouped_rules"] > stats["rules"] // 2
+    messages = differential_harness.generate_corpus(random.Random(3), 100, differential_harness.addresses_for_rules(rules, safe))
+    verdicts = [ruleset.evaluate(message) for message in messages]
+    assert not any(verdict.get("error") for verdict in verdicts)
+    assert any(verdict["delete"] for verdict in verdicts)
+
+
+def test_single_edits_reuse_the_plan_and_update_the_group_in_place():
+    rules = {"rules": [_rule(f"entire_{label}", {"header": [rf"@(?:[a-z0-9-]+\.)*{label}\.[a-z0-9.-]+$"]})
+                       for label in ("acme", "spam", "widgets")]}
+    ruleset = CompiledRuleset(rules, [])
+    plan = ruleset.plan()
+    group = plan[0]
+
+    ruleset.add_safe_sender(r"@(?:[a-z0-9-]+\.)*friend\.[a-z0-9.-]+$")
+    assert ruleset.plan() is plan
+
+    # A pattern appended to the middle rule is ordered before the last rule's patterns
+    pattern = r"@(?:[a-z0-9-]+\.)*gadgets\.[a-z0-9.-]+$"
+    rules["rules"][1]["conditions"]["header"].append(pattern)
+    ruleset.add_rule_pattern("entire_spam", "header", pattern)
+    assert ruleset.plan() is plan and ruleset.plan()[0] is group
+    message = _msg("a@gadgets.com", from_line="b@widgets.com")
+    assert ruleset.evaluate(message) == reference_evaluate(rules, [], message)
+    assert ruleset.evaluate(message)["rule_name"] == "entire_spam"
+
+    rules["rules"][1]["conditions"]["header"].remove(pattern)
+    assert ruleset.remove_rule_pattern("entire_spam", "header", pattern)
+    assert ruleset.plan() is plan and ruleset.plan()[0] is group
+    assert ruleset.evaluate(message)["rule_name"] == "entire_widgets"
+
+
+@pytest.mark.parametrize("sort_key", [None, header_first_sort_key])
+def test_edits_to_coalesced_rules_match_the_reference(sort_key):
+    rng = random.Random(9)
+    kwargs = {"sort_key": sort_key} if sort_key else {}
+    for _ in range(4):
+        rules_json = _split_ruleset(rng, 40)
+        safe = {"safe_senders": []}
+        ruleset = CompiledRuleset(rules_json, safe, **kwargs)
+        messages = differential_harness.generate_corpus(rng, 60, differential_harness.addresses_for_rules(rules_json, safe))
+        for _ in range(25):
+            _random_edit(rng, rules_json, safe, ruleset)
+            for message in messages:
+                assert ruleset.evaluate(message) == reference_evaluate(rules_json, safe, message, **kwargs)
+        assert ruleset.coalesce_stats()["groups"] > 0
+
+
+def test_change_log_is_bounded(monkeypatch):
+    monkeypatch.setattr(rule_engine, "MAX_CHANGE_LOG", 8)
+    ruleset = CompiledRuleset({"rules": []}, [])
+    cache = VerdictCache(ruleset)
+    message = _msg("a@b.com")
+    cache.evaluate(1, message)
+    for i in range(20):
+        ruleset.add_safe_sender(rf"^x{i}@nowhere\.org$")
+    assert ruleset.version == 20 and len(ruleset.changes) <= 8
+    assert ruleset.changes_since(0) is None and len(ruleset.changes_since(19)) == 1
+    # Older than the log: re-evaluated rather than trusted
+    cache.evaluate(1, message)
+    assert cache.stats["invalidated"] == 1
+
+
+def test_coalesced_evaluation_does_not_grow_with_the_rule_count(monkeypatch):
+    labels = [f"sender{i}" for i in range(3000)]
+    rules = {"rules": [_rule(f"entire_{i}", {"header": [rf"@(?:[a-z0-9-]+\.)*{label}\.[a-z0-9.-]+$"]})
+                       for i, label in enumerate(labels)]}
+    coalesced, separate = CompiledRuleset(rules, []), CompiledRuleset(rules, [], coalesce=False)
+    messages = [_msg(f"a@mail.{labels[i]}.com") for i in range(2999, 0, -100)] + [_msg("a@unknown.org")] * 10
+    # Count matcher lookups instead of timing them: one group is a fixed number per message
+    lookups = []
+    first_id = PatternMatcher.first_id
+
+    def counting_first_id(self, text):
+        lookups[-1] += 1
+        return first_id(self, text)
+    monkeypatch.setattr(PatternMatcher, "first_id", counting_first_id)
+    results = []
+    for ruleset in (coalesced, separate):
+        lookups.append(0)
+        results.append([ruleset.evaluate(message) for message in messages])
+    assert results[0] == results[1]
+    assert [v["rule_name"] for v in results[0][:3]] == ["entire_2999", "entire_2899", "entire_2799"]
+    assert coalesced.coalesce_stats() == {"rules": 3000, "steps": 1, "groups": 1, "grouped_rules": 3000}
+    # Safe senders plus From-line and sender token against the one group
+    assert lookups[0] <= 4 * len(messages)
+    assert lookups[1] > 1000 * len(messages)
@@ -0,0 +1,85 @@
+import json
+
+from folder_cache import FolderCache
+
+
+class FakeFolder:
+    def __init__(self, name, entry_id, store_id="store-1"):
+        self.Name = name
+        self.EntryID = entry_id
+        self.StoreID = store_id
+
+
+class FakeNamespace:
+    def __init__(self, folders):
+        self.folders = {folder.EntryID: folder for folder in folders}
+        self.lookups = []
+
+    def GetFolderFromID(self, entry_id, store_id=None):
+        self.lookups.append(entry_id)
+        if entry_id not in self.folders:
+            raise RuntimeError("The operation failed. An object could not be found.")
+        return self.folders[entry_id]
+
+
+class Resolver:
+    r"""Stands in for the account walk; counts how often it runs"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.folder
+
+
+def test_folder_is_resolved_once_per_run(tmp_path):
+    bulk = FakeFolder("Bulk Mail", "id-bulk")
+    cache = FolderCache(FakeNamespace([bulk]), str(tmp_path / "folders.json"))
+    resolve = Resolver(bulk)
+    folders = [cache.get("Me@Example.com", "Bulk Mail", resolve) for _ in range(5)]
+    assert folders == [bulk] * 5 and resolve.calls == 1
+    assert cache.stats["memory_hits"] == 4 and cache.stats["saves"] == 1
+
+
+def test_next_run_opens_the_folder_by_entry_id(tmp_path):
+    path = str(tmp_path / "folders.json")
+    bulk = FakeFolder("Bulk Mail", "id-bulk")
+    FolderCache(FakeNamespace([bulk]), path).get("me@example.com", "Bulk Mail", Resolver(bulk))
+    assert json.load(open(path))["folders"]["me@example.com|Bulk Mail"]["entry_id"] == "id-bulk"
+
+    namespace = FakeNamespace([bulk])
+    cache = FolderCache(namespace, path)
+    resolve = Resolver(None)
+    assert cache.get("me@example.com", "Bulk Mail", resolve) is bulk
+    assert resolve.calls == 0 and namespace.lookups == ["id-bulk"] and cache.stats["id_hits"] == 1
+
+
+def test_stale_or_renamed_entry_ids_fall_back_to_the_search(tmp_path):
+    path = str(tmp_path / "folders.json")
+    old = FakeFolder("Bulk Mail", "id-old")
+    FolderCache(FakeNamespace([old]), path).get("me@example.com", "Bulk Mail", Resolver(old))
+
+    # The folder was deleted and re-created: the old EntryID no longer opens
+    new = FakeFolder("Bulk Mail", "id-new")
+    cache = FolderCache(FakeNamespace([new]), path)
+    assert cache.get("me@example.com", "Bulk Mail", Resolver(new)) is new
+    assert cache.stats["stale_ids"] == 1
+    assert json.load(open(path))["folders"]["me@example.com|Bulk Mail"]["entry_id"] == "id-new"
+
+    # The ID opens a folder that has been renamed since
+    renamed = FakeFolder("Old Bulk", "id-new")
+    cache = FolderCache(FakeNamespace([renamed]), path)
+    resolve = Resolver(FakeFolder("Bulk Mail", "id-other"))
+    assert cache.get("me@example.com", "Bulk Mail", resolve).EntryID == "id-other" and resolve.calls == 1
+
+
+def test_failed_lookups_are_not_cached_and_bad_files_are_ignored(tmp_path):
+    path = tmp_path / "folders.json"
+    path.write_text("{not json")
+    cache = FolderCache(FakeNamespace([]), str(path))
+    resolve = Resolver(None)
+    assert cache.get("me@example.com", "Missing", resolve) is None
+    assert cache.get("me@example.com", "Missing", resolve) is None
+    assert resolve.calls == 2 and cache.stats["saves"] == 0
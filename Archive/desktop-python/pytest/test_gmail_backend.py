@@ -0,0 +1,162 @@
+import pytest
+
+import gmail_backend
+from gmail_backend import GmailApiClient, GmailApiError, GmailBackend, TokenBucket
+from gmail_standin import GmailStandinServer
+from mail_backends import scan_backend
+from rule_engine import CompiledRuleset
+
+RULES = {"rules": [
+    {"name": "SpamHeader", "conditions": {"header": [r"@(?:[a-z0-9-]+\.)*spammy\.[a-z0-9.-]+$"]}, "exceptions": {},
+     "actions": {"delete": True}},
+    {"name": "Tag", "conditions": {"subject": ["newsletter"]}, "exceptions": {},
+     "actions": {"assign_to_category": {"category_name": "News"}, "move_to_folder": {"folder_name": "Reading"}}},
+    {"name": "Body", "conditions": {"body": [r"(?i).*casino.*"]}, "exceptions": {}, "actions": {"delete": True}},
+]}
+SAFE = {"safe_senders": [r"^[^@\s]+@(?:[a-z0-9-]+\.)*friend\.org$"]}
+
+
+def _raw(sender, subject, body):
+    return f"From: <{sender}>\r\nSubject: {subject}\r\n\r\n{body}\r\n".encode()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def server():
+    server = GmailStandinServer(token="tok")
+    server.base_url = server.start()
+    yield server
+    server.stop()
+
+
+def _client(server, **kwargs):
+    return GmailApiClient(server.base_url, "tok", TokenBucket(1e9), **kwargs)
+
+
+def _fill(server, count):
+    for i in range(count):
+        server.add_message(_raw(f"x{i}@mail.spammy.com", "hi", "buy"), ("SPAM", "UNREAD"))
+        server.add_message(_raw(f"pal{i}@friend.org", "lunch", "casino night"), ("SPAM", "UNREAD"))
+        server.add_message(_raw(f"news{i}@paper.com", "weekly newsletter", "stories"), ("SPAM", "UNREAD"))
+        server.add_message(_raw(f"s{i}@else.net", "offer", "visit the casino"), ("SPAM", "UNREAD"))
+        server.add_message(_raw(f"c{i}@else.net", "notes", "plain"), ("SPAM", "UNREAD"))
+
+
+def test_token_bucket_waits_for_refill():
+    fake = FakeClock()
+    bucket = TokenBucket(rate=100, capacity=100, clock=fake.clock, sleep=fake.sleep)
+    assert bucket.acquire(100) == 0
+    assert bucket.acquire(50) == pytest.approx(0.5)
+    # Above capacity: waits for a full bucket, then runs into debt
+    assert bucket.acquire(250) == pytest.approx(1.0)
+    assert bucket.acquire(10) == pytest.approx(1.6)
+    assert bucket.waited == pytest.approx(3.1)
+
+
+def test_scan_uses_batched_calls_and_header_first_fetch(server):
+    _fill(server, 120)      # 600 messages, two list pages
+    client = _client(server)
+    backend = GmailBackend(client)
+    outcome = scan_backend(backend, CompiledRuleset(RULES, SAFE), ["Bulk Mail"])
+    backend.close()
+
+    assert outcome["stats"]["processed"] == 600
+    assert backend.stats == {"headers_fetched": 600, "bodies_fetched": 360}
+    batches = server.requests("/batch/gmail/v1")
+    assert len(batches) == -(-600 // 50) + -(-360 // 50)
+    assert all(calls <= 50 for _method, _path, calls in batches)
+    assert len(server.requests("/messages")) == 2
+    # One batchModify per distinct label change: rescue, trash, newsletter; nothing per message
+    modifies = server.requests("/messages/batchModify")
+    assert len(modifies) == 3
+
+    spam = server.messages_with_label("SPAM")
+    assert len(spam) == 120 and all("notes" in str(m.headers["Subject"]) for m in spam)
+    assert len(server.messages_with_label("INBOX")) == 120
+    assert len(server.messages_with_label("TRASH")) == 240
+    reading = server.messages_with_label(server.label_id("Reading"))
+    assert len(reading) == 120
+    assert all(server.label_id("News") in m.label_ids and "UNREAD" not in m.label_ids for m in reading)
+    assert not client._cache  # clean mail that matched nothing is not kept either
+
+
+def test_batch_modify_and_delete_split_at_1000_ids(server):
+    ids = [server.add_message(_raw(f"x{i}@mail.spammy.com", "hi", "buy"), ("SPAM",)) for i in range(1500)]
+    client = _client(server)
+    backend = GmailBackend(client, purge=True)
+    scan_backend(backend, CompiledRuleset(RULES, SAFE), ["Bulk Mail"])
+    backend.close()
+    assert [calls for _m, _p, calls in server.requests("/messages/batchDelete")] == [1, 1]
+    assert not any(i in server.messages for i in ids)
+
+
+def test_duplicate_gets_are_coalesced(server):
+    ids = [server.add_message(_raw(f"a{i}@b.com", "s", "b")) for i in range(5)]
+    client = _client(server)
+    first = client.get_messages(ids + ids[:2], "metadata")
+    again = client.get_messages(ids[:3], "metadata")
+    assert set(first) == set(ids) and set(again) == set(ids[:3])
+    assert client.stats["coalesced"] == 5
+    assert len(server.requests("/batch/gmail/v1")) == 1
+
+
+def test_resource_cache_is_bounded_and_pages_are_evicted(server, monkeypatch):
+    monkeypatch.setattr(gmail_backend, "RESOURCE_CACHE_SIZE", 8)
+    ids = [server.add_message(_raw(f"a{i}@b.com", "s", "b"), ("SPAM",)) for i in range(20)]
+    client = _client(server)
+    assert set(client.get_messages(ids, "metadata")) == set(ids)  # larger than the cache
+    assert list(client._cache) == [(message_id, "metadata") for message_id in ids[-8:]]
+
+    sizes = []
+    backend = GmailBackend(client)
+    for _message in backend.evaluate_folder("Bulk Mail", CompiledRuleset(RULES, SAFE)):
+        sizes.append(len(client._cache))
+    assert max(sizes) <= 8 and not client._cache
+
+
+def test_throttled_batch_parts_are_retried(server):
+    ids = [server.add_message(_raw(f"a{i}@b.com", "s", "b")) for i in range(30)]
+    # The server allows 20 gets per second; the client bucket is not limiting, so part of the batch gets 429
+    server.quota_per_sec = 100
+    client = _client(server)
+    resources = client.get_messages(ids, "metadata")
+    assert set(resources) == set(ids)
+    assert server.throttled >= 1 and client.stats["throttled"] >= 1
+
+
+def test_bad_token_raises(server):
+    client = GmailApiClient(server.base_url, "wrong", TokenBucket(1e9))
+    with pytest.raises(GmailApiError):
+        client.list_labels()
+
+
+def test_batch_parts_are_matched_by_content_id(server):
+    ids = [server.add_message(_raw(f"a{i}@b{i}.com", "s", "b")) for i in range(5)]
+    server.reverse_batch_responses = True
+    resources = _client(server).get_messages(ids, "metadata")
+    assert [resources[message_id]["id"] for message_id in ids] == ids
+
+
+def test_malformed_batch_responses_raise(server, monkeypatch):
+    client = _client(server)
+    monkeypatch.setattr(client, "_http", lambda *args: (200, {"Content-Type": "multipart/mixed"}, b""))
+    with pytest.raises(GmailApiError, match="boundary"):
+        client.get_messages(["a", "b"], "metadata")
+
+    part = (b"--x\r\nContent-Type: application/http\r\nContent-ID: <response-item1>\r\n\r\n"
+            b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n{\"id\": \"b\"}\r\n--x--\r\n")
+    monkeypatch.setattr(client, "_http", lambda *args: (200, {"Content-Type": "multipart/mixed; boundary=x"}, part))
+    with pytest.raises(GmailApiError, match="missing 1 of 2"):
+        client.get_messages(["a", "b"], "metadata")
@@ -0,0 +1,142 @@
+import imaplib
+
+import pytest
+
+from imap_backend import ImapBackend, compress_uids
+from imap_standin import ImapStandinServer
+from mail_backends import INBOX_FOLDER, scan_backend
+from rule_engine import CompiledRuleset
+
+RULES = {"rules": [
+    {"name": "SpamHeader", "conditions": {"header": [r"@(?:[a-z0-9-]+\.)*spammy\.[a-z0-9.-]+$"]}, "exceptions": {},
+     "actions": {"delete": True}},
+    {"name": "Tag", "conditions": {"subject": ["newsletter"]}, "exceptions": {},
+     "actions": {"assign_to_category": {"category_name": "News Letters"}, "move_to_folder": {"folder_name": "Reading"}}},
+    {"name": "Body", "conditions": {"body": [r"(?i).*casino.*"]}, "exceptions": {}, "actions": {"delete": True}},
+]}
+SAFE = {"safe_senders": [r"^[^@\s]+@(?:[a-z0-9-]+\.)*friend\.org$"]}
+
+
+def _raw(sender, subject, body):
+    return f"From: <{sender}>\nSubject: {subject}\nDate: Mon, 10 Nov 2025 10:00:00 +0000\n\n{body}\n".encode()
+
+
+@pytest.fixture
+def server():
+    server = ImapStandinServer()
+    server.add_folder("Bulk Mail")
+    server.start()
+    yield server
+    server.stop()
+
+
+def _backend(server, **kwargs):
+    host, port = server.server_address
+    return ImapBackend(host, port, "user", "password", **kwargs)
+
+
+def _fill(server, count):
+    r"""count messages per kind: spam header, safe sender, newsletter, casino body, clean"""
+    for i in range(count):
+        server.add_message("Bulk Mail", _raw(f"x{i}@mail.spammy.com", "hi", "buy"))
+        server.add_message("Bulk Mail", _raw(f"pal{i}@friend.org", "lunch", "casino night"))
+        server.add_message("Bulk Mail", _raw(f"news{i}@paper.com", "weekly newsletter", "stories"))
+        server.add_message("Bulk Mail", _raw(f"s{i}@else.net", "offer", "visit the casino"))
+        server.add_message("Bulk Mail", _raw(f"c{i}@else.net", "notes", "plain"))
+
+
+def test_compress_uids():
+    assert compress_uids([9, 1, 2, 3, 7, 10]) == "1:3,7,9:10"
+    assert compress_uids([]) == ""
+
+
+def test_header_first_scan_fetches_bodies_only_for_undecided(server):
+    _fill(server, 40)
+    backend = _backend(server, batch_size=64, pipeline_depth=3)
+    outcome = scan_backend(backend, CompiledRuleset(RULES, SAFE), ["Bulk Mail"])
+    backend.close()
+
+    assert outcome["stats"]["processed"] == 200
+    # Spam headers are deleted and safe senders rescued from headers alone;
+    # newsletters, casino bodies and clean mail reach the Body rule
+    assert backend.stats["headers_fetched"] == 200
+    assert backend.stats["bodies_fetched"] == 120
+    assert len(server.commands("UID FETCH")) == -(-200 // 64) + -(-120 // 64)
+
+    folders = server.folders
+    assert [str(m.headers["Subject"]) for m in folders["Bulk Mail"].messages] == ["notes"] * 40
+    assert len(folders["INBOX"].messages) == 40
+    assert len(folders["Deleted Items"].messages) == 80
+    reading = folders["Reading"].messages
+    assert len(reading) == 40 and all({"\\Seen", "News_Letters"} <= m.flags for m in reading)
+
+
+def test_actions_are_one_command_per_target_over_uid_ranges(server):
+    _fill(server, 25)
+    backend = _backend(server)
+    scan_backend(backend, CompiledRuleset(RULES, SAFE), ["Bulk Mail"])
+    backend.close()
+    moves = server.commands("UID MOVE")
+    assert sorted(args.split(" ", 1)[1] for _conn, _cmd, args in moves) == ['"Deleted Items"', '"INBOX"', '"Reading"']
+    assert len(server.commands("UID STORE")) == 1
+    assert len(server.commands("CREATE")) == 2
+
+
+def test_pipelined_and_sequential_fetch_agree(server):
+    _fill(server, 30)
+    results = []
+    for depth in (1, 4):
+        backend = _backend(server, batch_size=16, pipeline_depth=depth)
+        uids = backend.search_uids("Bulk Mail")
+        results.append([(uid, literal) for uid, _flags, _received, literal in backend.pipelined_fetch(uids, "(UID BODY.PEEK[HEADER])")])
+        backend.close()
+    assert results[0] == results[1]
+    assert len(results[0]) == 150
+
+
+def test_dry_run_and_purge(server):
+    _fill(server, 2)
+    backend = _backend(server)
+    outcome = scan_backend(backend, CompiledRuleset(RULES, SAFE), ["Bulk Mail"], dry_run=True)
+    assert outcome["stats"]["deleted"] == 4
+    assert len(server.folders["Bulk Mail"].messages) == 10
+    assert server.commands("UID MOVE") == [] and server.commands("UID STORE") == []
+
+    backend = _backend(server, purge=True)
+    scan_backend(backend, CompiledRuleset(RULES, SAFE), ["Bulk Mail"])
+    backend.close()
+    assert "Deleted Items" not in server.folders
+    assert len(server.commands("UID EXPUNGE")) == 1
+    assert len(server.folders["Bulk Mail"].messages) == 2
+
+
+def test_list_folders_maps_inbox(server):
+    backend = _backend(server)
+    assert backend.list_folders() == ["Bulk Mail", INBOX_FOLDER]
+    backend.close()
+
+
+def test_bad_login_raises(server):
+    with pytest.raises(imaplib.IMAP4.error):
+        ImapBackend(*server.server_address, "user", "wrong").list_folders()
+
+
+def test_moves_without_move_or_uidplus_fall_back_to_copy_and_expunge():
+    server = ImapStandinServer(capabilities="IMAP4rev1 LITERAL+")
+    server.add_folder("Bulk Mail")
+    _fill(server, 3)
+    server.start()
+    try:
+        backend = _backend(server)
+        outcome = scan_backend(backend, CompiledRuleset(RULES, SAFE), ["Bulk Mail"])
+        backend.close()
+    finally:
+        server.stop()
+
+    assert outcome["stats"]["errors"] == 0
+    assert server.commands("UID MOVE") == [] and server.commands("UID EXPUNGE") == []
+    assert len(server.commands("UID COPY")) == 3 and len(server.commands("EXPUNGE")) == 3
+    folders = server.folders
+    assert [str(m.headers["Subject"]) for m in folders["Bulk Mail"].messages] == ["notes"] * 3
+    assert len(folders["INBOX"].messages) == 3 and len(folders["Deleted Items"].messages) == 6
+    assert len(folders["Reading"].messages) == 3
@@ -0,0 +1,212 @@
+import os
+
+import pytest
+
+import mail_backends
+
+from mail_backends import (
+    INBOX_FOLDER, OP_CATEGORY, OP_COPY, OP_DELETE, OP_MARK_READ, OP_MOVE,
+    EmlDirectoryBackend, MaildirBackend, MboxBackend, iter_mbox_offsets, iter_mbox_spans, plan_actions, scan_backend,
+)
+from rule_engine import CompiledRuleset
+
+RULES = {"rules": [
+    {"name": "Tag", "conditions": {"subject": ["newsletter"]}, "exceptions": {},
+     "actions": {"assign_to_category": {"category_name": "News"}, "copy_to_folder": {"folder_name": "Copies"}}},
+    {"name": "SpamFrom", "conditions": {"header": [r"@(?:[a-z0-9-]+\.)*spammy\.[a-z0-9.-]+$"]}, "exceptions": {},
+     "actions": {"delete": True}},
+    {"name": "Body", "conditions": {"body": [r"(?i).*casino.*"]}, "exceptions": {"from": [r"^boss@work\.com$"]},
+     "actions": {"delete": True}},
+]}
+SAFE = {"safe_senders": [r"^[^@\s]+@(?:[a-z0-9-]+\.)*friend\.org$"]}
+
+
+def _eml(sender, subject, body):
+    return (f"From: Someone <{sender}>\nTo: me@home.com\nSubject: {subject}\n"
+            f"Date: Mon, 10 Nov 2025 10:00:00 +0000\n\n{body}\n").encode()
+
+
+MESSAGES = [
+    ("a", _eml("x@mail.spammy.com", "hello", "hi")),
+    ("b", _eml("pal@friend.org", "lunch", "casino night?")),
+    ("c", _eml("boss@work.com", "quarterly", "casino budget")),
+    ("d", _eml("news@paper.com", "weekly newsletter", "stories")),
+    ("e", _eml("stranger@else.net", "casino", "visit the casino")),
+]
+
+
+def _ruleset():
+    return CompiledRuleset(RULES, SAFE)
+
+
+def _by_subject(outcome):
+    return {r["subject"]: r for r in outcome["results"]}
+
+
+def _check_outcome(outcome):
+    records = _by_subject(outcome)
+    assert records["hello"]["actions"] == [(OP_DELETE, None)]
+    assert records["lunch"]["safe_sender"] is not None
+    assert records["quarterly"]["actions"] == []
+    assert records["weekly newsletter"]["actions"] == [(OP_CATEGORY, "News"), (OP_MARK_READ, None), (OP_COPY, "Copies")]
+    assert records["casino"]["rule"] == "Body"
+    assert outcome["stats"]["deleted"] == 2
+
+
+def test_plan_actions_safe_sender_moves_to_inbox_only_from_other_folders():
+    verdict = {"safe_sender": "p", "fired": [], "error": None}
+    assert plan_actions(verdict, {}, "Bulk Mail") == [(OP_MOVE, INBOX_FOLDER)]
+    assert plan_actions(verdict, {}, INBOX_FOLDER) == []
+
+
+def test_plan_actions_delete_overrides_move():
+    actions = {"mover": {"move_to_folder": {"folder_name": "Later"}}, "killer": {"delete": True}}
+    verdict = {"safe_sender": None, "fired": [("mover", "x"), ("killer", "y")]}
+    assert plan_actions(verdict, actions, INBOX_FOLDER) == [(OP_DELETE, None)]
+
+
+def test_maildir_scan_moves_and_deletes(tmp_path):
+    root = tmp_path / "Mail"
+    for sub in ("cur", "new", "tmp"):
+        os.makedirs(root / ".Bulk Mail" / sub)
+        os.makedirs(root / sub)
+    for name, raw in MESSAGES:
+        (root / ".Bulk Mail" / "new" / f"{name}.host").write_bytes(raw)
+    backend = MaildirBackend(str(root))
+    assert backend.list_folders() == [INBOX_FOLDER, "Bulk Mail"]
+
+    outcome = scan_backend(backend, _ruleset(), ["Bulk Mail"])
+    _check_outcome(outcome)
+    assert sorted(os.listdir(root / ".Deleted Items" / "new")) == ["a.host", "e.host"]
+    assert os.listdir(root / "new") == ["b.host"]
+    assert os.listdir(root / ".Copies" / "cur") == ["d.host:2,S"]
+    # Marked read: moved to cur/ with the S flag, and not scanned twice
+    assert os.listdir(root / ".Bulk Mail" / "cur") == ["d.host:2,S"]
+    assert sorted(os.listdir(root / ".Bulk Mail" / "new")) == ["c.host"]
+    assert outcome["stats"]["processed"] == len(MESSAGES)
+
+
+def test_eml_dry_run_changes_nothing_then_purge_deletes(tmp_path):
+    for name, raw in MESSAGES:
+        (tmp_path / f"{name}.eml").write_bytes(raw)
+    before = sorted(os.listdir(tmp_path))
+
+    outcome = scan_backend(EmlDirectoryBackend(str(tmp_path)), _ruleset(), [INBOX_FOLDER], dry_run=True)
+    _check_outcome(outcome)
+    assert sorted(os.listdir(tmp_path)) == before
+
+    scan_backend(EmlDirectoryBackend(str(tmp_path), purge=True), _ruleset(), [INBOX_FOLDER])
+    assert sorted(f for f in os.listdir(tmp_path) if f.endswith(".eml")) == ["b.eml", "c.eml", "d.eml"]
+    assert os.listdir(tmp_path / "Copies") == ["d.eml"]
+    assert not os.path.exists(tmp_path / "Deleted Items")
+
+
+def test_mbox_streaming_scan_rewrites_source_once(tmp_path):
+    inbox = tmp_path / "Inbox.mbox"
+    inbox.write_bytes(b"".join(b"From MAILER-DAEMON Mon Nov 10 10:00:00 2025\n" + raw + b"\n" for _, raw in MESSAGES))
+    backend = MboxBackend(str(tmp_path))
+    assert backend.list_folders() == [INBOX_FOLDER]
+
+    outcome = scan_backend(backend, _ruleset(), [INBOX_FOLDER])
+    _check_outcome(outcome)
+
+    def subjects(path):
+        out = []
+        for _start, _end, stream in iter_mbox_spans(str(path)):
+            msg, _raw_header = stream.close()
+            out.append((str(msg["Subject"]), str(msg.get("Status", ""))))
+        return out
+
+    assert subjects(inbox) == [("lunch", ""), ("quarterly", ""), ("weekly newsletter", "RO")]
+    assert [s for s, _ in subjects(tmp_path / "Deleted Items.mbox")] == ["hello", "casino"]
+    assert [s for s, _ in subjects(tmp_path / "Copies.mbox")] == ["weekly newsletter"]
+
+
+def test_mbox_flush_finds_entries_without_parsing(tmp_path, monkeypatch):
+    inbox = tmp_path / "Inbox.mbox"
+    inbox.write_bytes(b"".join(b"From MAILER-DAEMON Mon Nov 10 10:00:00 2025\n" + raw + b"\n" for _, raw in MESSAGES))
+    spans = [(start, end) for start, end, _stream in iter_mbox_spans(str(inbox))]
+    assert list(iter_mbox_offsets(str(inbox))) == spans
+    backend = MboxBackend(str(tmp_path))
+    messages = list(backend.iter_messages(INBOX_FOLDER))
+
+    def no_parsing():
+        raise AssertionError("flush() parsed the mbox")
+
+    monkeypatch.setattr(mail_backends, "StreamParser", no_parsing)
+    backend.remove(messages[1])
+    backend.flush()
+    assert len(list(iter_mbox_offsets(str(inbox)))) == len(MESSAGES) - 1
+
+
+def _write_mbox(path, raws):
+    path.write_bytes(b"".join(b"From MAILER-DAEMON Mon Nov 10 10:00:00 2025\n" + raw + b"\n" for raw in raws))
+
+
+def test_mbox_move_or_copy_into_its_own_folder_changes_nothing(tmp_path):
+    inbox = tmp_path / "Inbox.mbox"
+    _write_mbox(inbox, [raw for _, raw in MESSAGES])
+    before = inbox.read_bytes()
+    backend = MboxBackend(str(tmp_path))
+    messages = list(backend.iter_messages(INBOX_FOLDER))
+
+    backend.move(messages[0], INBOX_FOLDER)
+    backend.copy(messages[1], INBOX_FOLDER)
+    assert len(list(backend.iter_messages(INBOX_FOLDER))) == len(MESSAGES)
+    backend.flush()
+    assert inbox.read_bytes() == before and messages[0].folder == INBOX_FOLDER
+
+
+def test_mbox_move_and_copy_keep_the_read_state(tmp_path):
+    read = _eml("old@news.com", "seen", "already read").replace(b"\n\n", b"\nStatus: RO\nX-Status: F\n\n", 1)
+    _write_mbox(tmp_path / "Inbox.mbox", [read, MESSAGES[0][1], MESSAGES[1][1]])
+    backend = MboxBackend(str(tmp_path))
+    seen, marked, unread = backend.iter_messages(INBOX_FOLDER)
+
+    backend.move(seen, "Archive")
+    backend.mark_read(marked)
+    backend.move(marked, "Archive")
+    backend.copy(unread, "Archive")
+    backend.flush()
+    archived = list(MboxBackend(str(tmp_path)).iter_raw("Archive"))
+    assert [unread_state for _raw, unread_state in archived] == [False, False, True]
+    assert b"\nStatus: RO\nX-Status: F\n" in archived[0][0]
+    assert archived[1][0].count(b"Status:") == 1
+
+
+def test_mbox_messages_moved_into_a_later_folder_are_not_scanned_again(tmp_path):
+    rules = {"rules": [
+        {"name": "Later", "conditions": {"subject": ["^lunch$"]}, "exceptions": {},
+         "actions": {"move_to_folder": {"folder_name": "Later"}}},
+        {"name": "Spam", "conditions": {"subject": ["^casino$"]}, "exceptions": {}, "actions": {"delete": True}},
+    ]}
+    _write_mbox(tmp_path / "Inbox.mbox", [raw for _, raw in MESSAGES])
+    _write_mbox(tmp_path / "Later.mbox", [_eml("a@b.com", "casino", "spam"), _eml("c@d.com", "kept", "ham")])
+    backend = MboxBackend(str(tmp_path))
+
+    outcome = scan_backend(backend, CompiledRuleset(rules, {"safe_senders": []}), [INBOX_FOLDER, "Later"])
+    assert outcome["stats"]["processed"] == len(MESSAGES) + 2
+    assert [r["subject"] for r in outcome["results"]].count("lunch") == 1
+    assert outcome["stats"]["deleted"] == 2  # one casino in each folder
+    # Later's own spam is gone, the kept message is still its only original entry, and the moved one follows
+    assert [m.Subject for m in backend.iter_messages("Later")] == ["kept"]
+    assert [m.Subject for m in MboxBackend(str(tmp_path)).iter_messages("Later")] == ["kept", "lunch"]
+
+
+def test_parsed_messages_expose_outlook_fields(tmp_path):
+    for name, raw in MESSAGES:
+        (tmp_path / f"{name}.eml").write_bytes(raw)
+    ruleset = _ruleset()
+    for message in EmlDirectoryBackend(str(tmp_path)).iter_messages(INBOX_FOLDER):
+        assert message.header.startswith("from: someone <")
+        assert message.SenderEmailAddress and message.ReceivedTime is not None
+        verdict = ruleset.evaluate(message.view())
+        assert verdict.get("error") is None
+
+
+@pytest.mark.parametrize("days_back, expected", [(None, 5), (1, 0)])
+def test_days_back_skips_old_messages(tmp_path, days_back, expected):
+    for name, raw in MESSAGES:
+        (tmp_path / f"{name}.eml").write_bytes(raw)
+    outcome = scan_backend(EmlDirectoryBackend(str(tmp_path)), _ruleset(), [INBOX_FOLDER], days_back=days_back, dry_run=True)
+    assert outcome["stats"]["processed"] == expected
@@ -0,0 +1,156 @@
+import random
+
+from outlook_actions import OutlookActionQueue
+from retry_scheduler import RetryPolicy, RetryScheduler
+
+
+class FakeFlag:
+    def __init__(self, item):
+        self.item = item
+
+    def Clear(self):
+        self.item.calls.append("Flag.Clear")
+
+
+class FakeMailItem:
+    def __init__(self, name, unread=True, fail_saves=0):
+        object.__setattr__(self, "calls", [])
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "fail_saves", fail_saves)
+        object.__setattr__(self, "UnRead", unread)
+        object.__setattr__(self, "Flag", FakeFlag(self))
+
+    def __setattr__(self, name, value):
+        self.calls.append(f"{name}={value}")
+        object.__setattr__(self, name, value)
+
+    def Save(self):
+        if self.fail_saves:
+            object.__setattr__(self, "fail_saves", self.fail_saves - 1)
+            raise RuntimeError("item is locked")
+        self.calls.append("Save")
+
+    def Move(self, folder):
+        self.calls.append(f"Move {folder}")
+
+    def Delete(self):
+        self.calls.append("Delete")
+
+
+class FakeClock:
+    r"""Clock whose sleep() moves it forward, so waits cost no real time"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _queue(max_attempts=3, failure_threshold=5, reset_timeout=30, **kwargs):
+    clock = FakeClock()
+    policy = RetryPolicy(base_delay=1, multiplier=2, jitter=0, max_attempts=max_attempts)
+    retries = RetryScheduler(policy, failure_threshold, reset_timeout, clock=clock, sleep=clock.sleep)
+    return OutlookActionQueue(retries=retries, **kwargs), clock
+
+
+def test_category_read_flag_and_delete_are_one_commit():
+    queue, _ = _queue()
+    email = FakeMailItem("a")
+    queue.assign_category(email, "SpamHeader")
+    queue.mark_read(email)
+    queue.delete(email)
+    assert email.calls == [] and len(queue) == 1
+    assert queue.flush() == 0
+    assert email.calls == ["Categories=SpamHeader", "UnRead=False", "Flag.Clear", "Save", "Delete"]
+    assert queue.stats["saves"] == 1 and queue.stats["coalesced"] == 2
+
+
+def test_safe_sender_is_one_move_and_delete_replaces_move():
+    queue, _ = _queue()
+    safe, both = FakeMailItem("safe"), FakeMailItem("both", unread=False)
+    queue.move(safe, "Inbox")
+    queue.move(both, "Reading")
+    queue.delete(both)
+    queue.flush()
+    assert safe.calls == ["Move Inbox"]
+    # Already read: only the flag needs the Save
+    assert both.calls == ["Flag.Clear", "Save", "Delete"]
+
+
+def test_failures_are_parked_and_retried_while_evaluation_continues():
+    queue, clock = _queue(failure_threshold=10)
+    emails = [FakeMailItem(f"e{i}", fail_saves=1) for i in range(5)] + [FakeMailItem("ok")]
+    for email in emails:
+        queue.delete(email)
+    assert queue.flush(wait=False) == 0
+    assert clock.sleeps == [] and queue.parked == 5 and emails[-1].calls[-1] == "Delete"
+    assert queue.maybe_flush() == 0 and queue.parked == 5     # not due yet
+    clock.now += 1
+    queue.maybe_flush()
+    assert queue.parked == 0 and clock.sleeps == []
+    assert all(email.calls[-2:] == ["Save", "Delete"] for email in emails)
+    assert queue.retries.stats["retries"] == 5 and queue.stats["deletes"] == 6
+
+
+def test_final_flush_waits_with_exponential_backoff():
+    queue, clock = _queue(max_attempts=4)
+    email = FakeMailItem("locked", fail_saves=3)
+    queue.delete(email)
+    assert queue.flush() == 0
+    assert clock.sleeps == [1, 2, 4] and email.calls[-2:] == ["Save", "Delete"]
+    assert queue.retries.stats["waited_seconds"] == 7
+
+
+def test_emails_still_failing_after_the_last_attempt_are_reported():
+    logged = []
+    queue, _ = _queue(max_attempts=2, log=lambda message, level="INFO": logged.append(message))
+    stuck = FakeMailItem("stuck", fail_saves=5)
+    queue.delete(stuck)
+    assert queue.flush() == 1
+    assert "Delete" not in stuck.calls and queue.stats["failed"] == 1
+    assert any("item is locked" in message for message in logged)
+
+
+def test_circuit_breaker_stops_commits_to_a_failing_folder():
+    queue, clock = _queue(max_attempts=10, failure_threshold=2, reset_timeout=30)
+    queue.folder = "Bulk Mail"
+    failing = [FakeMailItem(f"b{i}", fail_saves=1) for i in range(4)]
+    for email in failing:
+        queue.delete(email)
+    queue.folder = "Inbox"
+    healthy = FakeMailItem("inbox")
+    queue.delete(healthy)
+    queue.flush(wait=False)
+    # Two failures opened the breaker: the other two emails were not tried at all
+    assert [len(email.calls) for email in failing[2:]] == [0, 0]
+    assert healthy.calls[-1] == "Delete"
+    assert queue.retries.stats["breaker_trips"] == 1 and queue.retries.stats["breaker_rejections"] == 2
+    clock.now += 30
+    assert queue.flush() == 0
+    assert all(email.calls[-1] == "Delete" for email in failing)
+
+
+def test_jitter_stays_within_the_backoff_bounds():
+    policy = RetryPolicy(base_delay=0.5, multiplier=2, max_delay=8, jitter=0.5, rng=random.Random(7))
+    delays = [policy.delay(attempt) for attempt in range(1, 7)]
+    caps = [0.5, 1, 2, 4, 8, 8]
+    assert all(cap / 2 <= delay <= cap for delay, cap in zip(delays, caps))
+    assert len(set(delays)) == len(delays)
+
+
+def test_maybe_flush_commits_full_chunks_only():
+    queue, _ = _queue(chunk_size=3)
+    emails = [FakeMailItem(f"e{i}") for i in range(4)]
+    for email in emails[:2]:
+        queue.mark_read(email)
+    assert queue.maybe_flush() == 0 and len(queue) == 2
+    queue.mark_read(emails[2])
+    queue.maybe_flush()
+    assert len(queue) == 0 and queue.stats["flushes"] == 1
+    assert emails[0].calls == ["UnRead=False", "Save"]
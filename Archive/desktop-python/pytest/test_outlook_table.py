@@ -0,0 +1,151 @@
+from datetime import datetime
+
+from outlook_table import (
+    PR_TRANSPORT_MESSAGE_HEADERS, TABLE_COLUMNS, TABLE_STRING_LIMIT, TableMailItem, email_transport_headers,
+    fetch_table_rows, new_fetch_stats,
+)
+
+
+class FakeMailItem:
+    def __init__(self, entry_id, headers):
+        self.EntryID = entry_id
+        self.Body = f"body of {entry_id}"
+        self.UnRead = True
+        self.saved = 0
+        self.PropertyAccessor = self
+        self._headers = headers
+
+    def GetProperty(self, name):
+        assert name == PR_TRANSPORT_MESSAGE_HEADERS
+        return self._headers
+
+    def Save(self):
+        self.saved += 1
+
+
+class FakeTable:
+    def __init__(self, rows):
+        self.rows = rows
+        self.position = 0
+        self.Columns = self
+        self.columns = []
+        self.get_array_calls = 0
+
+    def RemoveAll(self):
+        self.columns = []
+
+    def Add(self, name):
+        self.columns.append(name)
+
+    def Sort(self, column, descending):
+        self.rows.sort(key=lambda r: r["ReceivedTime"], reverse=descending)
+
+    @property
+    def EndOfTable(self):
+        return self.position >= len(self.rows)
+
+    def GetArray(self, max_rows):
+        self.get_array_calls += 1
+        batch = self.rows[self.position:self.position + max_rows]
+        self.position += len(batch)
+        return tuple(tuple(row[c] for c in self.columns) for row in batch)
+
+
+class FakeFolder:
+    Name = "Bulk Mail"
+    StoreID = "store-1"
+
+    def __init__(self, rows):
+        self.table = FakeTable(rows)
+        self.restriction = None
+
+    def GetTable(self, restriction, contents):
+        self.restriction = restriction
+        return self.table
+
+
+class FakeNamespace:
+    def __init__(self, items):
+        self.items = items
+        self.opened = []
+
+    def GetItemFromID(self, entry_id, store_id):
+        assert store_id == "store-1"
+        self.opened.append(entry_id)
+        return self.items[entry_id]
+
+
+def _setup(count, long_header_ids=()):
+    rows, items = [], {}
+    for i in range(count):
+        entry_id = f"id{i}"
+        headers = f"From: <s{i}@spam.com>\r\nSubject: s{i}\r\n"
+        if entry_id in long_header_ids:
+            headers += "X-Padding: " + "x" * TABLE_STRING_LIMIT + "\r\n"
+        items[entry_id] = FakeMailItem(entry_id, headers)
+        rows.append({"EntryID": entry_id, "Subject": f"s{i}", "SenderEmailAddress": f"s{i}@spam.com", "SenderName": "S",
+                     "ReceivedTime": datetime(2025, 11, 1 + i % 28, i % 24), "UnRead": True,
+                     # The table hands back at most TABLE_STRING_LIMIT characters
+                     PR_TRANSPORT_MESSAGE_HEADERS: headers[:TABLE_STRING_LIMIT]})
+    return FakeFolder(rows), FakeNamespace(items)
+
+
+def test_rows_are_fetched_in_batches_without_opening_items():
+    folder, namespace = _setup(1200)
+    stats = new_fetch_stats()
+    emails = fetch_table_rows(folder, "[ReceivedTime] >= '11/01/2025'", namespace, stats, batch_size=500)
+
+    assert folder.table.columns == list(TABLE_COLUMNS)
+    assert folder.restriction == "[ReceivedTime] >= '11/01/2025'"
+    assert folder.table.get_array_calls == 3
+    assert len(emails) == 1200 and stats["rows"] == 1200
+    received = [e.ReceivedTime for e in emails]
+    assert received == sorted(received, reverse=True)
+    for email in emails:
+        assert email.SenderEmailAddress.endswith("@spam.com")
+        assert email_transport_headers(email).startswith("From: ")
+    assert namespace.opened == [] and stats["items_opened"] == 0
+
+
+def test_body_and_writes_open_the_item_once():
+    folder, namespace = _setup(3)
+    stats = new_fetch_stats()
+    email = fetch_table_rows(folder, "", namespace, stats)[0]
+    assert not email.opened
+    assert email.Body == f"body of {email.EntryID}"
+    email.UnRead = False
+    email.Save()
+    item = namespace.items[email.EntryID]
+    assert namespace.opened == [email.EntryID] and stats["items_opened"] == 1
+    assert item.UnRead is False and item.saved == 1
+    assert email.UnRead is False
+
+
+def test_truncated_headers_are_reread_from_the_item():
+    folder, namespace = _setup(4, long_header_ids={"id2"})
+    stats = new_fetch_stats()
+    emails = {e.EntryID: e for e in fetch_table_rows(folder, "", namespace, stats)}
+    full = email_transport_headers(emails["id2"])
+    assert len(full) > TABLE_STRING_LIMIT and full == namespace.items["id2"]._headers
+    assert email_transport_headers(emails["id2"]) == full
+    assert stats["header_rereads"] == 1 and namespace.opened == ["id2"]
+
+
+def test_plain_mail_items_still_read_through_property_accessor():
+    item = FakeMailItem("x", "From: <a@b.com>\r\n")
+    assert email_transport_headers(item) == "From: <a@b.com>\r\n"
+    assert not isinstance(item, TableMailItem)
+
+
+def test_body_is_read_once_and_counted():
+    folder, namespace = _setup(5)
+    stats = new_fetch_stats()
+    emails = fetch_table_rows(folder, "", namespace, stats)
+    item = namespace.items[emails[0].EntryID]
+    assert emails[0].Body == item.Body
+    item.Body = "changed behind our back"
+    assert emails[0].Body != item.Body    # served from the row after the first read
+    emails[1].UnRead = False              # opens the item, not the body
+    assert stats["items_opened"] == 2 and stats["bodies_fetched"] == 1
+    assert emails[0].body_fetched and not emails[1].body_fetched
+    assert stats["rows"] - stats["bodies_fetched"] == 4
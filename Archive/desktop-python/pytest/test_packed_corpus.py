@@ -0,0 +1,159 @@
+import os
+
+import pytest
+
+import mail_backends
+from mail_backends import EmlDirectoryBackend, MaildirBackend, MboxBackend, scan_backend
+from packed_corpus import (
+    HEADER, PackedCorpus, PackedCorpusBackend, PackedCorpusWriter, evaluate_corpus, main, pack_backend,
+)
+from rule_engine import CompiledRuleset
+
+RULES = {"rules": [
+    {"name": "SpamFrom", "conditions": {"header": [r"@(?:[a-z0-9-]+\.)*spammy\.[a-z0-9.-]+$"]}, "exceptions": {},
+     "actions": {"delete": True}},
+    {"name": "Body", "conditions": {"body": [r"(?i).*casino.*"]}, "exceptions": {}, "actions": {"delete": True}},
+]}
+SAFE = {"safe_senders": [r"^[^@\s]+@(?:[a-z0-9-]+\.)*friend\.org$"]}
+
+
+def _eml(sender, subject, body):
+    return (f"From: <{sender}>\nSubject: {subject}\n"
+            f"Date: Mon, 10 Nov 2025 10:00:00 +0000\n\n{body}\n").encode()
+
+
+MESSAGES = [
+    _eml("x@mail.spammy.com", "hello", "hi"),
+    _eml("pal@friend.org", "lunch", "casino night?"),
+    _eml("stranger@else.net", "offer", "visit the casino"),
+    _eml("c@else.net", "notes", "plain"),
+]
+
+
+def _pack(tmp_path, messages=MESSAGES, folder="Bulk Mail"):
+    path = str(tmp_path / "corpus.sfpc")
+    with PackedCorpusWriter(path) as writer:
+        for raw in messages:
+            writer.add(raw, folder)
+    return path
+
+
+def test_random_access_reads_exact_bytes(tmp_path):
+    path = _pack(tmp_path)
+    with PackedCorpus(path) as corpus:
+        assert len(corpus) == 4
+        assert corpus.folders == ["Bulk Mail"]
+        for i in (3, 0, 2, 1):
+            assert corpus.raw(i) == MESSAGES[i]
+        assert bytes(corpus.raw_view(2)) == MESSAGES[2]
+        message = corpus.message(1)
+        assert message.SenderEmailAddress == "pal@friend.org"
+        assert message.folder == "Bulk Mail" and message.EntryID == 1
+        assert corpus.entry(0)[4].year == 2025
+        with pytest.raises(IndexError):
+            corpus.entry(4)
+
+
+def test_rejects_foreign_and_truncated_files(tmp_path):
+    bad = tmp_path / "bad.sfpc"
+    bad.write_bytes(b"x" * HEADER.size)
+    with pytest.raises(ValueError):
+        PackedCorpus(str(bad))
+    path = _pack(tmp_path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    bad.write_bytes(data[:-40])
+    with pytest.raises(ValueError):
+        PackedCorpus(str(bad))
+
+
+def test_failed_write_leaves_no_corpus(tmp_path):
+    path = str(tmp_path / "corpus.sfpc")
+    with pytest.raises(RuntimeError):
+        with PackedCorpusWriter(path) as writer:
+            writer.add(MESSAGES[0])
+            raise RuntimeError("interrupted")
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("kind", ["maildir", "mbox", "eml"])
+def test_pack_from_local_backends_matches_direct_scan(tmp_path, kind):
+    source = tmp_path / "source"
+    source.mkdir()
+    if kind == "maildir":
+        for sub in ("new", "cur", "tmp"):
+            (source / sub).mkdir()
+        for i, raw in enumerate(MESSAGES):
+            (source / "new" / f"{i}.host").write_bytes(raw)
+        backend = MaildirBackend(str(source))
+    elif kind == "mbox":
+        mbox = source / "Inbox.mbox"
+        mbox.write_bytes(b"".join(b"From sender Mon Nov 10 10:00:00 2025\n" + raw + b"\n" for raw in MESSAGES))
+        backend = MboxBackend(str(mbox))
+    else:
+        for i, raw in enumerate(MESSAGES):
+            (source / f"{i}.eml").write_bytes(raw)
+        backend = EmlDirectoryBackend(str(source))
+
+    ruleset = CompiledRuleset(RULES, SAFE)
+    direct = scan_backend(backend, ruleset, dry_run=True)
+    path = str(tmp_path / "corpus.sfpc")
+    assert pack_backend(backend, path) == 4
+
+    packed_backend = PackedCorpusBackend(path)
+    packed = scan_backend(packed_backend, ruleset, dry_run=True)
+    packed_backend.close()
+
+    def summary(outcome):
+        return sorted((r["subject"], r["rule"], bool(r["safe_sender"]), r["actions"]) for r in outcome["results"])
+    assert summary(packed) == summary(direct)
+    assert packed["stats"]["deleted"] == 2
+
+
+def test_packing_reads_raw_bytes_without_parsing(tmp_path, monkeypatch):
+    mbox = tmp_path / "Inbox.mbox"
+    read = MESSAGES[1].replace(b"\n\n", b"\nStatus: RO\n\n", 1)
+    mbox.write_bytes(b"".join(b"From sender Mon Nov 10 10:00:00 2025\n" + raw + b"\n" for raw in (MESSAGES[0], read)))
+
+    def no_parsing(*args, **kwargs):
+        raise AssertionError("packing parsed a message")
+    monkeypatch.setattr(mail_backends, "StreamParser", no_parsing)
+    path = str(tmp_path / "corpus.sfpc")
+    assert pack_backend(MboxBackend(str(mbox)), path) == 2
+
+    with PackedCorpus(path) as corpus:
+        assert [corpus.raw(i) for i in range(2)] == [MESSAGES[0] + b"\n", read + b"\n"]
+        assert [corpus.entry(i)[3] for i in range(2)] == [True, False]
+
+
+def test_parallel_evaluation_matches_in_process(tmp_path):
+    path = _pack(tmp_path, MESSAGES * 25)
+    serial = evaluate_corpus(path, RULES, SAFE, workers=1, chunk=7)
+    parallel = evaluate_corpus(path, RULES, SAFE, workers=2, chunk=7)
+    assert serial == parallel
+    assert [v["fired"][0][0] if v["fired"] else None for v in serial[:4]] == ["SpamFrom", None, "Body", None]
+
+
+def test_backend_is_read_only(tmp_path):
+    backend = PackedCorpusBackend(_pack(tmp_path))
+    outcome = scan_backend(backend, CompiledRuleset(RULES, SAFE))
+    backend.close()
+    # Two deletes and the safe sender's move to the Inbox are refused
+    assert outcome["stats"]["errors"] == 3
+
+
+def test_cli_pack_info_scan(tmp_path, capsys):
+    source = tmp_path / "eml"
+    source.mkdir()
+    for i, raw in enumerate(MESSAGES):
+        (source / f"{i}.eml").write_bytes(raw)
+    rules = tmp_path / "rules.yaml"
+    rules.write_text("rules: []\n")
+    safe = tmp_path / "safe.yaml"
+    safe.write_text("safe_senders: []\n")
+    out = str(tmp_path / "c.sfpc")
+    assert main(["pack", "--eml", str(source), "-o", out]) == 0
+    assert main(["info", out]) == 0
+    assert main(["scan", out, "--rules", str(rules), "--safe-senders", str(safe)]) == 0
+    printed = capsys.readouterr().out
+    assert "Packed 4 messages" in printed and "Evaluated 4 messages" in printed
@@ -0,0 +1,74 @@
+from phishing_features import FeatureStore, KeywordAutomaton, extract_email_features, extract_features, url_stubs
+
+
+class FakeMailItem:
+    r"""Counts property reads, to check that each one is read once"""
+
+    def __init__(self, **properties):
+        object.__setattr__(self, "properties", properties)
+        object.__setattr__(self, "reads", [])
+
+    def __getattr__(self, name):
+        if name not in self.properties:
+            raise AttributeError(name)
+        self.reads.append(name)
+        return self.properties[name]
+
+
+def test_automaton_finds_overlapping_keywords_in_one_scan():
+    automaton = KeywordAutomaton(["he", "she", "his", "hers", "verify account", "account suspended"])
+    assert automaton.find("uSHErs") == ["he", "she", "hers"]
+    assert automaton.find("Please VERIFY ACCOUNT suspended now") == ["verify account", "account suspended"]
+    assert automaton.find("") == [] and automaton.find("no match") == []
+
+
+def test_links_are_collected_with_display_text_and_mismatches():
+    html = ('<p>Hi <a href="http://evil.example.net/x">www.MyBank.com</a>'
+            '<a href=https://mybank.com/login>https://www.mybank.com</a>'
+            '<a href="https://track.example.org/c?u=1">Click <b>here</b></a>'
+            '<a href="mailto:help@mybank.com">help@mybank.com</a>')
+    features = extract_features(html_body=html)
+    assert features.links[2] == ("https://track.example.org/c?u=1", "Click here")
+    assert features.link_domains == ["evil.example.net", "mybank.com", "track.example.org"]
+    # Display text that names a host is compared with the href; "Click here" and same-site links are not mismatches
+    assert features.mismatched_links == [("http://evil.example.net/x", "www.MyBank.com")]
+
+
+def test_indicators_match_the_agent_checks():
+    features = extract_features(subject="URGENT: Action Required", sender="x@a.com",
+                                display_name="Bank <bank@b.com>", body="Enter your password to login",
+                                html_body='<a href="http://a.com">a.com</a>')
+    assert [indicator for indicator, _ in features.indicators()] == [
+        "Phishing indicator: Sender name/email mismatch",
+        "Phishing indicator: Found urgent language in subject",
+        "Phishing indicator: Found requests for sensitive information",
+    ]
+    assert features.urgent_words == ["urgent", "action required"]
+    assert features.sensitive_words == ["password", "login"]
+
+
+def test_each_property_is_read_once_and_missing_ones_are_empty():
+    email = FakeMailItem(Subject="hello", SenderEmailAddress="a@b.com", SenderName="A", Body=None,
+                         HTMLBody='<a href="https://x.com">x</a>' * 50)
+    features = extract_email_features(email)
+    assert sorted(email.reads) == ["Body", "HTMLBody", "SenderEmailAddress", "SenderName", "Subject"]
+    assert len(features.links) == 50 and features.link_domains == ["x.com"] and features.indicators() == []
+
+
+def test_url_stubs_match_the_line_by_line_report_format():
+    body = "Visit www.deals-now.com/offer today\r\nor http://cdn.example.org/a.png\nwww.deals-now.com again"
+    assert url_stubs(body) == ["/deals-now.com", ".deals-now.com", "/cdn.example", ".cdn.example",
+                               "/a.png", ".a.png"]
+    assert extract_features(body=body).url_stubs == url_stubs(body)
+
+
+def test_feature_store_extracts_each_message_once():
+    store = FeatureStore()
+    first = FakeMailItem(EntryID="id-1", Subject="s", SenderEmailAddress="a@b.com", SenderName="A",
+                         Body="see www.x.com", HTMLBody="")
+    # The second pass gets a new item object for the same message
+    again = FakeMailItem(EntryID="id-1", Subject="s", SenderEmailAddress="a@b.com", SenderName="A",
+                         Body="see www.x.com", HTMLBody="")
+    assert store.get(first) is store.get(again)
+    assert again.reads == ["EntryID"] and store.stats == {"extracted": 1, "reused": 1}
+    assert store.get(first).url_stubs == ["/x.com", ".x.com"]
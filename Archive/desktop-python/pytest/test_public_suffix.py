@@ -0,0 +1,48 @@
+import time
+
+import public_suffix
+from public_suffix import DomainParts, PublicSuffixTrie, lookup, registrable_domain
+
+RULES = """
+// ===BEGIN ICANN DOMAINS===
+com
+uk
+co.uk
+jp
+*.kawasaki.jp
+!city.kawasaki.jp
+// ===END ICANN DOMAINS===
+// ===BEGIN PRIVATE DOMAINS===
+github.io
+// ===END PRIVATE DOMAINS===
+""".splitlines()
+
+
+def test_trie_applies_longest_wildcard_and_exception_rules():
+    trie = PublicSuffixTrie(RULES)
+    assert trie.lookup("mail.example.co.uk") == DomainParts("co.uk", "example.co.uk", True)
+    assert trie.lookup("a.b.kawasaki.jp") == DomainParts("b.kawasaki.jp", "a.b.kawasaki.jp", True)
+    assert trie.lookup("www.city.kawasaki.jp") == DomainParts("kawasaki.jp", "city.kawasaki.jp", True)
+    assert trie.lookup("x.y.unlisted") == DomainParts("unlisted", "y.unlisted", False)
+    assert trie.lookup("co.uk").registrable == "co.uk" and trie.lookup("") is None
+    # github.io only counts when the private section is loaded
+    assert trie.lookup("me.github.io").registrable == "me.github.io"
+    assert PublicSuffixTrie(RULES, include_private=False).lookup("me.github.io").registrable == "github.io"
+
+
+def test_bundled_snapshot_knows_suffixes_beyond_the_old_hard_coded_ten():
+    assert registrable_domain("a@mail.news.example.co.uk") == "example.co.uk"
+    assert registrable_domain("@shop.example.com.mx") == "example.com.mx"
+    assert registrable_domain("promo@news.example.ltd.uk") == "example.ltd.uk"
+    assert registrable_domain("bounce.mail.deals-now.com") == "deals-now.com"
+    assert registrable_domain("localhost") == "localhost" and registrable_domain("") == ""
+    assert lookup("a.b.c.ygllc.d.e.f").listed is False
+
+
+def test_lookups_are_memoized_per_domain():
+    domains = [f"user{i}@mail{i % 3}.sender{i % 2000}.co.uk" for i in range(200000)]
+    started = time.perf_counter()
+    found = {registrable_domain(addr) for addr in domains}
+    assert len(found) == 2000
+    assert time.perf_counter() - started < 2.0
+    assert public_suffix._lookup_domain.cache_info().hits > 0
@@ -0,0 +1,148 @@
+from datetime import datetime
+
+import pytest
+
+from gmail_backend import GmailApiClient, GmailBackend, TokenBucket
+from gmail_standin import GmailStandinServer
+from imap_backend import ImapBackend
+from imap_standin import ImapStandinServer
+from mail_backends import EmlDirectoryBackend, scan_backend
+from query_planner import QueryPlan, imap_search_criteria, outlook_filter, required_terms
+from rule_engine import CompiledRuleset
+
+HEADER_RULES = {"rules": [
+    {"name": "SpamHeader", "conditions": {"header": [r"@(?:[a-z0-9-]+\.)*spammy\.[a-z0-9.-]+$",
+                                                     r"@(?:[a-z0-9-]+\.)*junkco\.[a-z0-9.-]+$"]},
+     "exceptions": {"from": [r"^ok@mail\.spammy\.com$"]}, "actions": {"delete": True}},
+    {"name": "Tag", "conditions": {"from": [r".*@paper\.com"]}, "exceptions": {},
+     "actions": {"assign_to_category": {"category_name": "News"}}},
+]}
+MIXED_RULES = {"rules": HEADER_RULES["rules"] + [
+    {"name": "Subject", "conditions": {"subject": [r"(?i).*winner.*"]}, "exceptions": {}, "actions": {"delete": True}},
+    {"name": "Body", "conditions": {"body": [r"(?i).*casino.*"]}, "exceptions": {}, "actions": {"delete": True}},
+]}
+# Non-delete body rule sorts before the pushed delete rule, which is evaluated last
+BODY_TAG_RULES = {"rules": HEADER_RULES["rules"] + [
+    {"name": "BodyTag", "conditions": {"body": [r"(?i).*casino.*"]}, "exceptions": {},
+     "actions": {"assign_to_category": {"category_name": "Casino"}}},
+]}
+# One pattern without a usable literal: the rule is split, not left out
+SPLIT_RULES = {"rules": [
+    {"name": "SpamHeader", "conditions": {"header": [r"@(?:[a-z0-9-]+\.)*spammy\.[a-z0-9.-]+$", r"^c\d+@"]},
+     "exceptions": {}, "actions": {"delete": True}},
+]}
+SAFE = {"safe_senders": [r"^[^@\s]+@(?:[a-z0-9-]+\.)*friend\.org$", r"^boss@work\.com$"]}
+
+SENDERS = ["x{i}@mail.spammy.com", "ok@mail.spammy.com", "y{i}@junkco.net", "news{i}@paper.com", "pal{i}@friend.org",
+           "boss@work.com", "s{i}@else.net", "c{i}@else.net", "z{i}@notspammy.org"]
+
+
+def _messages(count):
+    out = []
+    for i in range(count):
+        for n, sender in enumerate(SENDERS):
+            subject = "you are a winner" if n == 6 else f"note {i}"
+            body = "casino night" if n in (4, 7) else "plain"
+            out.append(f"From: <{sender.format(i=i)}>\r\nSubject: {subject}\r\n\r\n{body}\r\n".encode())
+    return out
+
+
+def _verdicts(outcome):
+    return sorted((r["sender"], r["safe_sender"], r["match"], r["rule"], r["matched_keyword"], tuple(r["actions"]))
+                  for r in outcome["results"])
+
+
+def test_required_terms():
+    assert required_terms(r"@(?:[a-z0-9-]+\.)*spammy\.[a-z0-9.-]+$") == ("spammy.",)
+    assert required_terms(r"@(?:[a-z0-9-]+\.)*spammy\.[a-z0-9.-]+$", token_match=True) == ("spammy",)
+    assert required_terms(r"(?i).*winner.*") == ("winner",)
+    assert required_terms(r"(?:cheap|free)pills\.") == ("pills.",)
+    assert required_terms(r"^(?:alpha|bravo)$") == ("alpha", "bravo")
+    # Unanchored tails may continue a token, so Gmail cannot search for them
+    assert required_terms(r".*@greyhub\.com", token_match=True) is None
+    assert required_terms(r"[a-z]+@x") is None
+
+
+def test_plan_splits_rules_by_dialect():
+    imap_plan = QueryPlan(MIXED_RULES, SAFE, "imap")
+    assert imap_plan.pushed_rules == ["SpamHeader", "Tag", "Subject"]
+    assert imap_plan.residual_rules == ["Body"]
+    gmail_plan = QueryPlan(MIXED_RULES, SAFE, "gmail")
+    assert gmail_plan.pushed_rules == ["SpamHeader"]
+    assert gmail_plan.residual_rules == ["Tag", "Subject", "Body"]
+    assert gmail_plan.residual_safe_senders == []
+    split_plan = QueryPlan(SPLIT_RULES, SAFE, "imap")
+    assert split_plan.pushed_rules == split_plan.residual_rules == ["SpamHeader"]
+    assert split_plan.residual.rules[0].rule["conditions"] == {"header": [r"^c\d+@"]}
+    assert imap_search_criteria([("from", "a.b"), ("subject", "win"), ("from", "c")]) == \
+        'OR FROM "a.b" OR SUBJECT "win" FROM "c"'
+
+
+def test_outlook_filter():
+    dasl = outlook_filter([("from", "spammy."), ("subject", "o'neil")], datetime(2025, 11, 1))
+    assert dasl == ("@SQL=\"urn:schemas:httpmail:datereceived\" >= '11/01/2025' AND ("
+                    "\"urn:schemas:httpmail:fromemail\" LIKE '%spammy.%' OR "
+                    "\"http://schemas.microsoft.com/mapi/proptag/0x0C1F001F\" LIKE '%spammy.%' OR "
+                    "\"urn:schemas:httpmail:subject\" LIKE '%o''neil%')")
+
+
+@pytest.fixture
+def imap_server():
+    server = ImapStandinServer()
+    for raw in _messages(6):
+        server.add_message("INBOX", raw)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.mark.parametrize("rules", [HEADER_RULES, MIXED_RULES, BODY_TAG_RULES, SPLIT_RULES],
+                         ids=["all_pushed", "with_residual", "last_rule_pushed", "split_rule"])
+def test_imap_planned_scan_matches_full_scan(imap_server, rules):
+    host, port = imap_server.server_address
+    ruleset = CompiledRuleset(rules, SAFE)
+    backend = ImapBackend(host, port, "user", "password")
+    full = scan_backend(backend, ruleset, ["Inbox"], dry_run=True)
+    plan = QueryPlan(rules, SAFE, backend.query_dialect)
+    planned = scan_backend(backend, plan.ruleset, ["Inbox"], dry_run=True, plan=plan)
+    backend.close()
+
+    decided = [v for v in _verdicts(full) if v[1] or v[5]]
+    assert [v for v in _verdicts(planned) if v[1] or v[5]] == decided
+    if rules is HEADER_RULES:
+        # Only candidates are fetched at all
+        assert plan.residual is None
+        assert planned["stats"]["processed"] == plan.stats["candidates"] < full["stats"]["processed"]
+    else:
+        assert _verdicts(planned) == _verdicts(full)
+        assert plan.stats["residual_evaluated"] == full["stats"]["processed"] - plan.stats["candidates"]
+
+
+def test_gmail_planned_scan_matches_full_scan():
+    server = GmailStandinServer()
+    for raw in _messages(6):
+        server.add_message(raw, ("INBOX",))
+    base_url = server.start()
+    try:
+        backend = GmailBackend(GmailApiClient(base_url, bucket=TokenBucket(1e9)))
+        full = scan_backend(backend, CompiledRuleset(MIXED_RULES, SAFE), ["Inbox"], dry_run=True)
+        plan = QueryPlan(MIXED_RULES, SAFE, backend.query_dialect)
+        planned = scan_backend(backend, plan.ruleset, ["Inbox"], dry_run=True, plan=plan)
+        backend.close()
+    finally:
+        server.stop()
+    assert _verdicts(planned) == _verdicts(full)
+    # Spam domains and safe senders come back from the store (the stand-in's substring
+    # search also returns notspammy.org: a superset is fine)
+    assert plan.stats["candidates"] >= 5 * 6
+
+
+def test_stores_without_search_fall_back_to_full_evaluation(tmp_path):
+    for i, raw in enumerate(_messages(1)):
+        (tmp_path / f"{i}.eml").write_bytes(raw)
+    backend = EmlDirectoryBackend(str(tmp_path))
+    plan = QueryPlan(MIXED_RULES, SAFE, "imap")
+    full = scan_backend(backend, CompiledRuleset(MIXED_RULES, SAFE), dry_run=True)
+    planned = scan_backend(backend, plan.ruleset, dry_run=True, plan=plan)
+    assert _verdicts(planned) == _verdicts(full)
+    assert plan.stats["fallback_folders"] == 1
@@ -0,0 +1,76 @@
+import hashlib
+import importlib.util
+import json
+import os
+
+import yaml
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+SCRIPT = os.path.join(REPO_ROOT, "mobile-app", "scripts", "rebuild_rules_yaml.py")
+
+_spec = importlib.util.spec_from_file_location("rebuild_rules_yaml", SCRIPT)
+rebuild_rules_yaml = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(rebuild_rules_yaml)
+
+PATTERNS = [
+    r"@(?:[a-z0-9-]+\.)*acme\.[a-z0-9.-]+$",
+    r"@.*\.ru$",
+    r"@spam\.net$",
+    r"@(?:[a-z0-9-]+\.)*widgets\.[a-z0-9.-]+$",
+    r"@.*\.xyz$",
+]
+
+
+def _rebuild(tmp_path, patterns):
+    source = tmp_path / "source.yaml"
+    source.write_text(yaml.safe_dump({"rules": [
+        {"name": "SpamAutoDeleteHeader", "conditions": {"header": list(patterns)}, "exceptions": {},
+         "actions": {"delete": True}}]}))
+    output = tmp_path / "out" / "rules.yaml"
+    output.parent.mkdir(exist_ok=True)
+    assert rebuild_rules_yaml.main(["--source", str(source), "--output", str(output)]) == 0
+    return output
+
+
+def test_index_matches_the_written_yaml_and_is_dropped_when_it_changes(tmp_path):
+    output = _rebuild(tmp_path, PATTERNS)
+    yaml_bytes = output.read_bytes()
+    rules = yaml.safe_load(yaml_bytes)["rules"]
+    index = rebuild_rules_yaml.load_index(output)
+
+    assert index is not None and index["sha256"] == hashlib.sha256(yaml_bytes).hexdigest()
+    assert index["ruleCount"] == 5 and index["names"] == [rule["name"] for rule in rules]
+    assert index["tlds"] == {"ru": [1], "xyz": [4]}
+    assert index["entireDomains"] == {"acme": [0], "widgets": [3]}
+    assert index["exactDomains"] == {"spam.net": [2]}
+    for table in ("tlds", "entireDomains", "exactDomains"):
+        for positions in index[table].values():
+            for position in positions:
+                assert rules[position]["conditions"]["header"] == [PATTERNS[position]]
+    assert all(rule["exceptions"] == {} for rule in rules)
+
+    output.write_bytes(yaml_bytes.replace(b"acme", b"acne"))
+    assert rebuild_rules_yaml.load_index(output) is None
+    assert json.loads(rebuild_rules_yaml.index_path_for(output).read_text())["sha256"] == index["sha256"]
+
+
+def test_rebuild_is_byte_identical_and_one_new_pattern_changes_one_rule(tmp_path):
+    output = _rebuild(tmp_path, PATTERNS)
+    manifest_path = rebuild_rules_yaml.manifest_path_for(output)
+    first_yaml, first_manifest = output.read_bytes(), manifest_path.read_text()
+
+    _rebuild(tmp_path, PATTERNS)
+    assert output.read_bytes() == first_yaml and manifest_path.read_text() == first_manifest
+
+    added = r"@(?:[a-z0-9-]+\.)*gadgets\.[a-z0-9.-]+$"
+    _rebuild(tmp_path, PATTERNS[:2] + [added] + PATTERNS[2:])
+    before = yaml.safe_load(first_yaml)["rules"]
+    after = yaml.safe_load(output.read_bytes())["rules"]
+    # Names come from the pattern, so the rules after the insertion keep theirs
+    assert [rule for rule in after if rule not in before] == [after[2]]
+    assert after[:2] + after[3:] == before and after[2]["conditions"]["header"] == [added]
+
+    old_lines, new_lines = first_manifest.splitlines(), manifest_path.read_text().splitlines()
+    new_only = [line for line in new_lines if line not in old_lines]
+    assert len(new_lines) == len(old_lines) + 1 and not [line for line in old_lines if line not in new_lines]
+    assert len(new_only) == 1 and after[2]["name"] in new_only[0]
@@ -0,0 +1,52 @@
+import csv
+import json
+import time
+from datetime import datetime, timedelta
+
+from report_engine import GROUP_FROM_DOMAIN, GROUP_URL_STUB, ReportEngine
+
+START = datetime(2026, 10, 1, 8, 0, 0)
+
+
+def test_groups_count_phishing_and_no_match_with_first_and_last_seen():
+    engine = ReportEngine()
+    engine.add(1, "@spam.com", START + timedelta(hours=2), None, False)
+    engine.add(2, "@spam.com", START, ["Phishing indicator: Found urgent language in subject"], False,
+               ["/spam.com", ".spam.com"])
+    engine.add(3, "@ok.org", START, None, True)      # matched a rule, no indicators: not reported
+    engine.add(4, "", None, ["x"], True, ["/spam.com", ".spam.com"])
+    assert (engine.emails, engine.phishing, engine.no_match) == (3, 2, 2)
+
+    spam = engine.groups[GROUP_FROM_DOMAIN]["@spam.com"]
+    assert (spam.count, spam.phishing, spam.no_match, spam.emails) == (2, 1, 2, [1, 2])
+    assert spam.first_seen == START and spam.last_seen == START + timedelta(hours=2)
+    assert engine.groups[GROUP_URL_STUB]["/spam.com"].emails == [2, 4]
+    assert [group.key for group in engine.top(GROUP_FROM_DOMAIN)] == ["@spam.com", "(no from domain)"]
+
+
+def test_write_renders_csv_json_and_top_n_text(tmp_path):
+    engine = ReportEngine(top_n=2)
+    for number, domain in enumerate(["@a.com", "@b.com", "@b.com", "@c.com", "@c.com", "@c.com"], 1):
+        engine.add(number, domain, START + timedelta(minutes=number), None, False)
+    prefix = str(tmp_path / "reports" / "OutlookRulesReport")
+    lines = engine.write(prefix)
+
+    assert lines[1] == "Top 2 of 3 From domains:" and lines[2].startswith("@c.com")
+    assert open(prefix + ".txt").read().splitlines() == lines
+    rows = list(csv.DictReader(open(prefix + ".csv", newline="")))
+    assert [(row["key"], row["count"]) for row in rows] == [("@c.com", "3"), ("@b.com", "2"), ("@a.com", "1")]
+    assert rows[0]["first_seen"] == "2026-10-01 08:04:00" and rows[0]["emails"] == "4 5 6"
+    doc = json.load(open(prefix + ".json"))
+    assert doc["emails"] == 6 and len(doc[GROUP_FROM_DOMAIN]) == 3
+
+
+def test_twenty_thousand_emails_aggregate_quickly(tmp_path):
+    started = time.perf_counter()
+    engine = ReportEngine()
+    for number in range(1, 20001):
+        phishing = ["x"] if number % 4 == 0 else None
+        engine.add(number, f"@d{number % 500}.com", START + timedelta(seconds=number), phishing, number % 4 == 0,
+                   [f"/s{number % 50}.com", f".s{number % 50}.com"])
+    engine.write(str(tmp_path / "report"))
+    assert engine.emails == 20000 and len(engine.groups[GROUP_FROM_DOMAIN]) == 500
+    assert time.perf_counter() - started < 2.0
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+import yaml
+
+import rules_lint
+from rules_lint import (
+    FINDING_BACKTRACKING, FINDING_DOUBLE_AT, FINDING_INVALID, FINDING_LEADING_DOTSTAR, FINDING_RULE_ERROR,
+    PLAN_HASH, PLAN_INVALID, PLAN_LITERAL, PLAN_PREFILTER, PLAN_REGEX, PLAN_SUFFIX, lint_ruleset, plan_pattern,
+)
+
+
+@pytest.mark.parametrize(
+    "key, pattern, plan",
+    [
+        ("header", r"^john\.doe@acme\.com$", PLAN_HASH),
+        ("header", r"@acme\.com$", PLAN_SUFFIX),
+        ("header", r"@(?:[a-z0-9-]+\.)*acme\.[a-z0-9.-]+$", PLAN_LITERAL),
+        ("from", r"^[^@\s]+@(?:[a-z0-9-]+\.)*acme\.com$", PLAN_SUFFIX),
+        ("from", r"^bill(?:ing)?\d*@", PLAN_PREFILTER),
+        ("subject", r"^acme$", PLAN_PREFILTER),        # subject text never uses the literal indexes
+        ("subject", r"^\d+$", PLAN_REGEX),
+        ("body", r"([a-z", PLAN_INVALID),
+    ],
+)
+def test_plan_pattern(key, pattern, plan):
+    assert plan_pattern(key, pattern)[0] == plan
+
+
+def _codes(pattern, key="header"):
+    rules = {"rules": [{"name": "r", "conditions": {key: [pattern]}, "exceptions": {}, "actions": {"delete": True}}]}
+    report, = lint_ruleset(rules, {"safe_senders": []}, message_count=20)
+    return [finding.code for finding in report.findings], report
+
+
+def test_findings_flag_dead_slow_and_invalid_patterns_with_measured_cost():
+    codes, report = _codes(r"^[^@\s]+@(?:[a-z0-9-]+\.)*@accountprotection\.microsoft\.com$")
+    assert codes == [FINDING_DOUBLE_AT] and report.cost_us > 0
+    assert _codes(r"(?:[a-z]+@)+x", "subject")[0] == []        # two '@' can appear in a subject
+
+    codes, report = _codes(r"(\w+\s?)+$", "subject")
+    assert codes == [FINDING_BACKTRACKING] and report.detail.startswith("attack strings: 8 chars")
+
+    codes, report = _codes(r".*@greyhub\.com", "from")
+    assert codes == [FINDING_LEADING_DOTSTAR] and "without the leading '.*'" in report.detail
+    assert _codes(r"^.*@greyhub\.com", "from")[0] == []
+
+    codes, report = _codes(r"([a-z", "body")
+    assert codes == [FINDING_INVALID] and report.cost_us is None
+
+    # The repo's domain conventions are not flagged
+    assert _codes(r"@(?:[a-z0-9-]+\.)*spam\.[a-z0-9.-]+$")[0] == []
+    assert _codes(r"^[^@\s]+@(?:[a-z0-9-]+\.)*spam\.com$")[0] == []
+
+
+def test_main_prints_plan_and_findings_and_fails_on_errors(tmp_path, capsys):
+    rules_file = tmp_path / "rules.yaml"
+    safe_file = tmp_path / "rules_safe_senders.yaml"
+    rules_file.write_text(yaml.safe_dump({"rules": [
+        {"name": "SpamAutoDeleteHeader", "conditions": {"header": [r"@(?:[a-z0-9-]+\.)*spam\.[a-z0-9.-]+$"]},
+         "exceptions": {}, "actions": {"delete": True}}]}))
+    safe_file.write_text(yaml.safe_dump({"safe_senders": [r"^[^@\s]+@(?:[a-z0-9-]+\.)*@cc\.aol\.com$"]}))
+
+    assert rules_lint.main(["--rules", str(rules_file), "--messages", "10"]) == 0
+    out = capsys.readouterr().out.splitlines()
+    assert out[0].startswith("Explain plan: 1 patterns (hash 0, suffix 0, literal 1,")
+    assert any(line.startswith("literal ") and "SpamAutoDeleteHeader conditions.header" in line for line in out)
+
+    args = ["--rules", str(rules_file), "--safe-senders", str(safe_file), "--messages", "10"]
+    assert rules_lint.main(args + ["--findings-only"]) == 1
+    out = capsys.readouterr().out
+    assert "Findings: 1 (1 errors, 0 warnings)" in out and "[error] double-at  safe_senders safe_senders:" in out
+    assert rules_lint.main(args + ["--json"]) == 1
+    reports = json.loads(capsys.readouterr().out)
+    assert [report["plan"] for report in reports] == [PLAN_SUFFIX, PLAN_LITERAL]
+
+
+def test_patterns_of_rules_the_engine_cannot_evaluate_are_flagged(capsys, tmp_path):
+    rules = {"rules": [
+        {"name": "NoExceptions", "conditions": {"header": [r"@(?:[a-z0-9-]+\.)*spam\.[a-z0-9.-]+$"]},
+         "actions": {"delete": True}},
+        {"name": "BadList", "conditions": {"subject": ["free", 7]}, "exceptions": {"from": [r"^a@b\.com$"]},
+         "actions": {"delete": True}},
+        {"name": "Fine", "conditions": {"subject": ["free"]}, "exceptions": {}, "actions": {"delete": True}},
+    ]}
+    reports = lint_ruleset(rules, {"safe_senders": []}, message_count=10)
+    assert [[finding.code for finding in report.findings] for report in reports] == [
+        [FINDING_RULE_ERROR], [FINDING_RULE_ERROR], [FINDING_RULE_ERROR], []]
+    assert "conditions.subject is not a list of strings" in reports[1].findings[0].message
+
+    rules_file = tmp_path / "rules.yaml"
+    rules_file.write_text(yaml.safe_dump(rules))
+    assert rules_lint.main(["--rules", str(rules_file), "--messages", "10", "--findings-only"]) == 1
+    out = capsys.readouterr().out
+    assert "[WARN] 3 of 4 patterns are in rules the engine cannot evaluate" in out
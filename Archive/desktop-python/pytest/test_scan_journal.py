@@ -0,0 +1,181 @@
+import json
+
+from outlook_actions import OutlookActionQueue
+from scan_journal import ScanJournal, read_records
+
+
+class Crash(BaseException):
+    r"""Outlook or the machine going away in the middle of a commit"""
+
+
+class FakeFolder:
+    def __init__(self, name, entry_id, store_id="store-1"):
+        self.Name = name
+        self.EntryID = entry_id
+        self.StoreID = store_id
+
+    def __repr__(self):
+        return self.Name
+
+
+class FakeMailItem:
+    def __init__(self, entry_id, parent):
+        self.EntryID = entry_id
+        self.Parent = parent
+        self.UnRead = True
+        self.calls = []
+        self.crash = False
+
+    def Save(self):
+        self.calls.append("Save")
+
+    def Move(self, folder):
+        if self.crash:
+            self.crash = False
+            raise Crash()
+        self.calls.append(f"Move {folder}")
+        self.Parent = folder
+
+    def Delete(self):
+        self.calls.append("Delete")
+        self.Parent = DELETED
+
+
+class FakeNamespace:
+    def __init__(self, items, folders):
+        self.items = {item.EntryID: item for item in items}
+        self.folders = {folder.EntryID: folder for folder in folders}
+
+    def GetItemFromID(self, entry_id, store_id=None):
+        return self.items[entry_id]
+
+    def GetFolderFromID(self, entry_id, store_id=None):
+        return self.folders[entry_id]
+
+
+BULK = FakeFolder("Bulk Mail", "id-bulk")
+INBOX = FakeFolder("Inbox", "id-inbox")
+DELETED = FakeFolder("Deleted Items", "id-deleted")
+
+
+def _params(account="me@example.com"):
+    return {"account": account, "folders": [{"name": "Bulk Mail", "entry_id": "id-bulk", "store_id": "store-1"}],
+            "since": "10/18/2025", "rules": "digest-1"}
+
+
+def _scan(journal, queue, emails):
+    r"""First pass in miniature: every third message is rescued to the Inbox, other even ones are deleted"""
+    queue.journal = journal
+    queue.folder = "Bulk Mail"
+    for email in emails:
+        n = int(email.EntryID[1:])
+        queue.maybe_flush()
+        if n % 3 == 0:
+            queue.move(email, INBOX)
+        elif n % 2 == 0:
+            queue.delete(email)
+        journal.mark_processed(email)
+    queue.flush()
+    journal.finish()
+
+
+def test_resume_skips_processed_messages_and_never_repeats_a_move_or_delete(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    emails = [FakeMailItem(f"m{n}", BULK) for n in range(25)]
+    emails[9].crash = True  # chunk of m8-m11: m8 is committed, then the scan dies in m9's Move
+    try:
+        _scan(ScanJournal.start(path, _params()), OutlookActionQueue(chunk_size=4), emails)
+    except Crash:
+        pass
+    assert emails[8].calls == ["Save", "Delete"] and emails[10].calls == []
+
+    journal = ScanJournal.resume(path, _params())
+    assert journal.processed == {f"m{n}" for n in range(12)}
+    assert set(journal.pending) == {"m8", "m9", "m10"}
+
+    resumed = OutlookActionQueue(chunk_size=4)
+    namespace = FakeNamespace(emails, [BULK, INBOX, DELETED])
+    assert journal.replay(namespace, resumed) == 2  # m9 and m10; m8 already left the folder
+    assert journal.stats["replay_skipped"] == 1
+    remaining, _, restored, _ = journal.split_processed(emails, [{}] * len(emails))
+    assert [email.EntryID for email in remaining] == [f"m{n}" for n in range(12, 25)]
+    skipped = {email.EntryID for email in emails} - {email.EntryID for email in remaining}
+    assert skipped == journal.processed and journal.stats["resumed_skipped"] == 12
+    assert restored == []  # no scan results were journaled, so nothing comes back for the report
+    _scan(journal, resumed, remaining)
+
+    for n, email in enumerate(emails):
+        expected = "Move Inbox" if n % 3 == 0 else "Delete" if n % 2 == 0 else None
+        assert (email.calls[-1] if email.calls else None) == expected, email.EntryID
+        assert sum(call in ("Delete", "Move Inbox") for call in email.calls) == (expected is not None)
+    assert ScanJournal.resume(path, _params()) is None  # finished
+
+
+def test_unconfirmed_commit_is_replayed_for_a_message_still_in_its_folder(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    email = FakeMailItem("m0", BULK)
+    journal = ScanJournal.start(path, _params())
+    queue = OutlookActionQueue()
+    queue.folder = "Bulk Mail"
+    queue.assign_category(email, "SpamHeader")
+    queue.delete(email)
+    journal.mark_processed(email)
+    journal.checkpoint(list(queue._pending.values()))  # crash before the commit
+
+    journal = ScanJournal.resume(path, _params())
+    resumed = OutlookActionQueue()
+    resumed.journal = journal
+    assert journal.replay(FakeNamespace([email], [BULK]), resumed) == 1
+    resumed.flush()
+    assert email.Categories == "SpamHeader" and email.calls == ["Save", "Delete"]
+    assert not journal.pending and read_records(path)[-1] == {"type": "done", "ids": ["m0"]}
+
+
+def test_torn_last_line_is_ignored_and_other_scans_are_not_resumed(tmp_path):
+    path = tmp_path / "journal.jsonl"
+    journal = ScanJournal.start(str(path), _params())
+    journal.mark_processed(FakeMailItem("m0", BULK))
+    journal.checkpoint([])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"type": "chunk", "processed": ["m1"')
+    assert ScanJournal.resume(str(path), _params()).processed == {"m0"}
+    assert ScanJournal.resume(str(path), _params("other@example.com")) is None
+    assert ScanJournal.resume(str(tmp_path / "missing.jsonl"), _params()) is None
+
+    changed = dict(_params(), rules="digest-2", since="10/19/2025")
+    resumed = ScanJournal.resume(str(path), changed)
+    assert resumed.params["since"] == "10/18/2025"  # the interrupted run's cutoff
+    assert json.loads(path.read_text().splitlines()[0])["params"]["rules"] == "digest-1"
+
+
+def test_processed_messages_are_checkpointed_per_chunk_without_actions(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    queue = OutlookActionQueue(chunk_size=5)
+    queue.journal = ScanJournal.start(path, _params())
+    for n in range(12):
+        queue.maybe_flush()
+        queue.journal.mark_processed(FakeMailItem(f"m{n}", BULK))
+    chunks = [record for record in read_records(path) if record["type"] == "chunk"]
+    assert [len(chunk["processed"]) for chunk in chunks] == [5, 5]
+
+
+def test_resume_restores_the_scan_results_the_report_and_triage_need(tmp_path):
+    path = str(tmp_path / "journal.jsonl")
+    emails = [FakeMailItem(f"m{n}", BULK) for n in range(6)]
+    infos = [{"processed": True, "match": n % 2 == 0, "email_header": f"From: <a{n}@x.com>",
+              "phishing_indicators": ["Suspicious URL"] if n == 2 else None} for n in range(6)]
+    journal = ScanJournal.start(path, _params())
+    for email, info in zip(emails[:4], infos[:4]):
+        journal.mark_processed(email, info)
+    journal.checkpoint([])  # the run dies before the report and the -u prompts
+
+    journal = ScanJournal.resume(path, _params())
+    fresh = [{"processed": False, "match": False, "email_header": "", "source_folder": "Bulk Mail"} for _ in emails]
+    todo, todo_infos, done, done_infos = journal.split_processed(emails, fresh)
+    assert [email.EntryID for email in todo] == ["m4", "m5"] and todo_infos == fresh[4:]
+    # m1 and m3 matched no rule, m2 showed phishing indicators; m0 matched and needs nothing
+    assert [email.EntryID for email in done] == ["m1", "m2", "m3"]
+    assert done_infos[0] == {"processed": True, "match": False, "email_header": "From: <a1@x.com>",
+                             "phishing_indicators": None, "source_folder": "Bulk Mail"}
+    assert done_infos[1]["match"] is True and done_infos[1]["phishing_indicators"] == ["Suspicious URL"]
+    assert journal.stats["resumed_skipped"] == 4 and journal.stats["restored"] == 3
@@ -0,0 +1,183 @@
+import threading
+
+import pytest
+
+from gmail_backend import GmailApiClient, GmailBackend, TokenBucket
+from gmail_standin import GmailStandinServer
+from imap_backend import ImapBackend
+from imap_standin import ImapStandinServer
+from mail_backends import scan_backend
+from rule_engine import CompiledRuleset
+from session_pool import SessionPool
+
+RULES = {"rules": [
+    {"name": "SpamHeader", "conditions": {"header": [r"@(?:[a-z0-9-]+\.)*spammy\.[a-z0-9.-]+$"]}, "exceptions": {},
+     "actions": {"delete": True}},
+]}
+SAFE = {"safe_senders": []}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeConnection:
+    def __init__(self, name):
+        self.name = name
+        self.alive = True
+        self.closed = False
+
+
+def _connector(opened):
+    def connect():
+        conn = FakeConnection(f"c{len(opened)}")
+        opened.append(conn)
+        return conn
+    return connect
+
+
+def _check(conn):
+    return conn.alive
+
+
+def _disconnect(conn):
+    conn.closed = True
+
+
+@pytest.fixture
+def imap_server():
+    server = ImapStandinServer()
+    server.add_folder("Bulk Mail")
+    for i in range(5):
+        server.add_message("Bulk Mail", f"From: <x{i}@mail.spammy.com>\r\nSubject: hi\r\n\r\nbuy\r\n".encode())
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_imap_backends_share_one_login_and_selected_folder(imap_server):
+    host, port = imap_server.server_address
+    pool = SessionPool(max_size=2)
+    ruleset = CompiledRuleset(RULES, SAFE)
+    first = ImapBackend(host, port, "user", "password", pool=pool)
+    first.prewarm().join()
+    scan_backend(first, ruleset, ["Bulk Mail"], dry_run=True)
+    first.close()
+    # Second pass, e.g. after rule updates: a new backend on the same account
+    second = ImapBackend(host, port, "user", "password", pool=pool)
+    outcome = scan_backend(second, ruleset, ["Bulk Mail"], dry_run=True)
+    second.close()
+    pool.close()
+
+    assert outcome["stats"]["deleted"] == 5
+    assert len(imap_server.commands("LOGIN")) == 1
+    assert len(imap_server.commands("SELECT")) == 1
+    assert pool.stats["created"] == 1 and pool.stats["reused"] == 1
+    assert len(imap_server.commands("LOGOUT")) == 1
+
+
+def test_pool_is_bounded_and_evicts_least_recently_used_idle_session():
+    opened = []
+    pool = SessionPool(max_size=2, clock=FakeClock())
+    a = pool.acquire("a", _connector(opened))
+    b = pool.acquire("b", _connector(opened))
+    with pytest.raises(TimeoutError):
+        pool.acquire("c", _connector(opened), timeout=0.05)
+    pool.release(a)
+    pool.release(b)
+    c = pool.acquire("c", _connector(opened), disconnect=_disconnect)
+    # 'a' was idle longest, so it made room for 'c'; 'b' is still pooled
+    assert [conn.name for conn in opened] == ["c0", "c1", "c2"] and c.conn is opened[2]
+    assert pool.stats["evicted_full"] == 1 and len(pool) == 2
+    assert pool.acquire("b", _connector(opened)) is b
+
+
+def test_waiting_acquire_gets_the_released_session():
+    opened = []
+    pool = SessionPool(max_size=1)
+    held = pool.acquire("a", _connector(opened))
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire("a", _connector(opened), timeout=5)))
+    waiter.start()
+    pool.release(held)
+    waiter.join(5)
+    assert got == [held] and len(opened) == 1
+
+
+def test_idle_sessions_are_evicted_and_stale_ones_health_checked():
+    clock = FakeClock()
+    opened = []
+    pool = SessionPool(max_size=4, idle_timeout=300, check_after=30, clock=clock)
+    session = pool.acquire("a", _connector(opened), _check, _disconnect)
+    pool.release(session)
+    clock.now = 10
+    assert pool.acquire("a", _connector(opened), _check, _disconnect) is session   # fresh: no check needed
+    pool.release(session)
+    clock.now = 100
+    session.conn.alive = False
+    replacement = pool.acquire("a", _connector(opened), _check, _disconnect)
+    assert replacement is not session and opened[0].closed and pool.stats["health_failures"] == 1
+    pool.release(replacement)
+    clock.now = 1000
+    assert pool.evict_idle() == 1 and opened[1].closed and pool.idle_count == 0
+
+
+def test_gmail_clients_share_connection_and_labels():
+    server = GmailStandinServer(token="tok")
+    base_url = server.start()
+    try:
+        pool = SessionPool()
+        counts = []
+        for _ in range(2):
+            client = GmailApiClient(base_url, "tok", TokenBucket(1e9), pool=pool)
+            backend = GmailBackend(client)
+            counts.append(len(backend.list_folders()))
+            backend.close()
+        pool.close()
+    finally:
+        server.stop()
+    assert counts[0] == counts[1]
+    assert pool.stats["created"] == 1 and pool.stats["reused"] == 1
+    assert len(server.requests("labels")) == 1
+
+
+class SlotCheckingCondition(threading.Condition):
+    r"""Records, at every wake-up, the slots the pool counts against the connections actually open"""
+
+    def __init__(self, pool, opened):
+        super().__init__()              # RLock: len(pool) re-enters it
+        self.pool = pool
+        self.opened = opened
+        self.seen = []
+
+    def notify_all(self):
+        live = sum(1 for conn in self.opened if not conn.closed)
+        self.seen.append((len(self.pool), live))
+        super().notify_all()
+
+
+def test_a_new_session_holds_its_slot_at_every_wake_up():
+    opened = []
+    pool = SessionPool(max_size=1)
+    pool._cond = SlotCheckingCondition(pool, opened)
+    session = pool.acquire("a", _connector(opened), disconnect=_disconnect)
+    pool.release(session)
+    pool.acquire("b", _connector(opened), disconnect=_disconnect)
+    # A waiter woken while a fresh connection is counted neither as opening
+    # nor as in use would see room and open one past max_size
+    assert pool._cond.seen and all(slots >= live for slots, live in pool._cond.seen)
+
+def test_failed_connect_frees_its_slot():
+    pool = SessionPool(max_size=1)
+
+    def refuse():
+        raise ConnectionRefusedError("no")
+
+    with pytest.raises(ConnectionRefusedError):
+        pool.acquire("a", refuse)
+    assert len(pool) == 0
+    assert pool.acquire("a", _connector([]), timeout=0.5).key == "a"
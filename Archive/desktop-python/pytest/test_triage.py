@@ -0,0 +1,102 @@
+import re
+
+from triage import TriageItem, TriageSession, registrable_domain
+
+
+def _item(sender, subject="hi", header_domain=None):
+    domain = header_domain if header_domain is not None else "@" + sender.split("@", 1)[1]
+    return TriageItem(None, {}, sender, domain, subject, ["/x.com"])
+
+
+def _backlog():
+    items = []
+    for i in range(300):
+        items.append(_item(f"news{i % 7}@mail{i % 3}.deals-now.com", f"Deal {i % 4}"))
+    for i in range(150):
+        items.append(_item(f"promo@shop{i % 5}.example.co.uk", "Sale"))
+    for i in range(50):
+        items.append(_item(f"person{i % 10}@gmail.com", "Hello"))
+    return items
+
+
+def test_registrable_domain_handles_multi_part_suffixes():
+    assert registrable_domain("a@mail.news.example.co.uk") == "example.co.uk"
+    assert registrable_domain("@shop.example.com.mx") == "example.com.mx"
+    assert registrable_domain("@bounce.mail.deals-now.com") == "deals-now.com"
+    assert registrable_domain("localhost") == "localhost"
+
+
+def test_clusters_are_by_domain_and_per_address_for_individual_mail():
+    session = TriageSession(_backlog())
+    # deals-now.com, shop0..4.example.co.uk share one registrable domain each; 10 gmail senders stay separate
+    assert len(session) == 2 + 10
+    first = session.next_cluster()
+    assert first.key == "deals-now.com" and len(first) == 300 and not first.individual
+    assert len(first.senders) == 21 and first.sample_subjects() == ["Deal 0", "Deal 1", "Deal 2"]
+    gmail = [cluster for cluster in session.clusters.values() if cluster.individual]
+    assert all(len(cluster) == 5 and cluster.key.endswith("@gmail.com") for cluster in gmail)
+
+
+def test_a_500_email_backlog_takes_tens_of_prompts():
+    session = TriageSession(_backlog())
+    prompts = 0
+    while True:
+        cluster = session.next_cluster()
+        if cluster is None:
+            break
+        prompts += 1
+        session.skip(cluster)
+    assert prompts == 12 and session.stats["skipped"] == 500
+
+
+def test_new_patterns_cover_remaining_emails_in_other_clusters():
+    items = [_item("a@x.deals-now.com"), _item("b@deals-now.net"), _item("c@gmail.com"), _item("d@gmail.com")]
+    session = TriageSession(items)
+    assert len(session) == 4
+    # A domain-anchored regex ('d') on deals-now also covers the .net cluster; only the new pattern is checked
+    removed = session.cover([re.compile(r"@(?:[a-z0-9-]+\.)*deals-now\.[a-z0-9.-]+$", re.I)])
+    assert [item.from_email for item, _ in removed] == ["a@x.deals-now.com", "b@deals-now.net"]
+    assert sorted(session.clusters) == ["c@gmail.com", "d@gmail.com"] and session.stats["covered"] == 2
+    assert session.cover([]) == []
+
+
+def test_reopen_puts_back_the_emails_an_answer_does_not_match():
+    session = TriageSession([_item(f"a@mail{i}.deals-now.com") for i in range(3)] + [_item("c@gmail.com")])
+    cluster = session.next_cluster()
+    assert cluster.from_domains == ["@mail0.deals-now.com", "@mail1.deals-now.com", "@mail2.deals-now.com"]
+    left = session.reopen(cluster, [re.compile("@mail0.deals-now.com", re.I)])
+    assert [item.from_email for item in left] == ["a@mail1.deals-now.com", "a@mail2.deals-now.com"]
+    assert session.next_cluster().key == "deals-now.com"
+    assert session.reopen(cluster, [re.compile(r"deals-now\.com", re.I)]) == []
+
+
+class FakeEmail:
+    def __init__(self, sender):
+        self.SenderEmailAddress = sender
+        self.Subject = "Deal"
+
+
+def test_safe_answer_covers_every_subdomain_of_a_cluster(monkeypatch):
+    from withOutlookRulesYAML import OutlookSecurityAgent
+
+    agent = OutlookSecurityAgent.__new__(OutlookSecurityAgent)  # no log files or Outlook; logging goes to root
+    agent.active_rules_file = agent.active_safe_senders_file = None
+    emails = [FakeEmail(f"news{i}@mail{i % 3}.deals-now.com") for i in range(9)]
+    infos = [{"processed": True, "match": False, "email_header": f"From: <{email.SenderEmailAddress}>\n",
+              "phishing_features": _item("x@y.com")} for email in emails]
+    answers = []
+
+    def answer(prompt, valid_responses=None, isregex=False, help_text=None):
+        answers.append(prompt)
+        return 's'
+
+    monkeypatch.setattr(agent, "get_safe_input", answer)
+    monkeypatch.setattr(agent, "export_safe_senders_to_yaml", lambda safe_senders: None)
+    rules = {"rules": [{"name": "SpamAutoDeleteHeader", "conditions": {"header": []}}]}
+    _, safe = agent.prompt_update_rules(emails, infos, rules, {"safe_senders": []})
+
+    assert len(answers) == 1
+    assert safe["safe_senders"] == ["@mail0.deals-now.com", "@mail1.deals-now.com", "@mail2.deals-now.com"]
+    for email, info in zip(emails, infos):
+        header = agent._compile_pattern_list(safe["safe_senders"])
+        assert agent._regex_match_header_any(header, info["email_header"], email.SenderEmailAddress)[0]
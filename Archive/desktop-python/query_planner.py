@@ -0,0 +1,389 @@
+r"""
+Query push-down planner: let the mail store find sender/subject candidates.
+
+Most rules (and every safe sender) only test the sender address or domain.  A
+regex cannot be sent to a store, but every match of a pattern such as
+'@(?:[a-z0-9-]+\.)*spammy\.[a-z0-9.-]+$' must contain the literal "spammy.", and
+stores can search for that:
+
+    Outlook   @SQL= DASL filter for Items.Restrict / Folder.GetTable
+    IMAP      UID SEARCH OR FROM "spammy." ...
+    Gmail     q={from:spammy ...}
+
+QueryPlan splits the ruleset in two:
+
+    pushed    rules whose conditions are all store-searchable, and safe senders with a literal
+    residual  everything else
+
+Correctness does not depend on the store search being exact, only on it returning
+a superset:
+    * candidates (messages any pushed term found) are evaluated with the full ruleset
+    * every other message cannot match a pushed rule or safe sender, so it is
+      evaluated with the residual ruleset only, and skipped entirely (not even
+      fetched) when there is no residual
+
+IMAP FROM/SUBJECT and DASL LIKE are substring searches.  Gmail matches from: on
+whole address tokens, so for Gmail a literal is pushed only when both of its ends
+fall on a token boundary ('@', '.', ^ or $) in every match.
+"""
+
+import re
+from collections import namedtuple
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+from rule_engine import CompiledRuleset, rule_sort_key, rules_list_from, safe_senders_list_from
+
+FIELD_FROM = "from"
+FIELD_SUBJECT = "subject"
+# Rule condition -> store field.  'header' rules match the From header's address
+# or the sender address, both of which a From search covers.
+CONDITION_FIELDS = {"from": FIELD_FROM, "header": FIELD_FROM, "subject": FIELD_SUBJECT, "body": None}
+
+MIN_LITERAL_LENGTH = 3
+TERMS_PER_QUERY = 25
+BOUNDARY_CHARS = "@."
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, "POSSESSIVE_REPEAT"):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+_STARTS = {sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING}
+_ENDS = {sre_constants.AT_END, sre_constants.AT_END_STRING}
+_SUBSTRING_OK = re.compile(r"^[\x20-\x7e]+$")
+_TOKEN_OK = re.compile(r"^[a-z0-9](?:[a-z0-9@._-]*[a-z0-9])?$")
+
+
+#------------------Required literals------------------
+
+Literal = namedtuple("Literal", "text left_bounded right_bounded")
+
+
+def _starts_at_boundary(items, idx, right_ctx):
+    r"""Is the position just before items[idx] followed by a token boundary?"""
+    if idx >= len(items):
+        return right_ctx
+    op, av = items[idx]
+    if op == sre_constants.LITERAL:
+        return chr(av) in BOUNDARY_CHARS
+    if op == sre_constants.AT:
+        return av in _ENDS
+    if op == sre_constants.SUBPATTERN:
+        return _starts_at_boundary(list(av[-1]), 0, _starts_at_boundary(items, idx + 1, right_ctx))
+    if op in _REPEATS:
+        body = _starts_at_boundary(list(av[2]), 0, False)
+        return body and (av[0] >= 1 or _starts_at_boundary(items, idx + 1, right_ctx))
+    return False
+
+
+def _ends_at_boundary(items, idx, left_ctx):
+    r"""Is the position just after items[idx] preceded by a token boundary?"""
+    if idx < 0:
+        return left_ctx
+    op, av = items[idx]
+    if op == sre_constants.LITERAL:
+        return chr(av) in BOUNDARY_CHARS
+    if op == sre_constants.AT:
+        return av in _STARTS
+    if op == sre_constants.SUBPATTERN:
+        inner = list(av[-1])
+        return _ends_at_boundary(inner, len(inner) - 1, _ends_at_boundary(items, idx - 1, left_ctx))
+    if op in _REPEATS:
+        inner = list(av[2])
+        body = _ends_at_boundary(inner, len(inner) - 1, False)
+        return body and (av[0] >= 1 or _ends_at_boundary(items, idx - 1, left_ctx))
+    return False
+
+
+def _requirements(items, left_ctx=False, right_ctx=False):
+    r"""
+    Literal sets every match of the sequence must contain.
+
+    Returns:
+        list: requirements; each is a tuple of Literal alternatives (any one of them
+              appears in every match)
+    """
+    items = list(items)
+    reqs = []
+    run, run_start = [], 0
+    for idx, (op, av) in enumerate(items):
+        if op == sre_constants.LITERAL:
+            if not run:
+                run_start = idx
+            run.append(chr(av))
+            continue
+        if run:
+            reqs.append((Literal("".join(run), _ends_at_boundary(items, run_start - 1, left_ctx),
+                                 _starts_at_boundary(items, idx, right_ctx)),))
+            run = []
+        if op == sre_constants.SUBPATTERN:
+            reqs.extend(_requirements(av[-1], _ends_at_boundary(items, idx - 1, left_ctx),
+                                      _starts_at_boundary(items, idx + 1, right_ctx)))
+        elif op in _REPEATS and av[0] >= 1:
+            reqs.extend(_requirements(av[2]))
+        elif op == sre_constants.BRANCH:
+            alternatives = []
+            for branch in av[1]:
+                best = _best(_requirements(branch, _ends_at_boundary(items, idx - 1, left_ctx),
+                                           _starts_at_boundary(items, idx + 1, right_ctx)), None)
+                if best is None:
+                    alternatives = None
+                    break
+                alternatives.extend(best)
+            if alternatives:
+                reqs.append(tuple(alternatives))
+    if run:
+        reqs.append((Literal("".join(run), _ends_at_boundary(items, run_start - 1, left_ctx), right_ctx),))
+    return reqs
+
+
+def _best(requirements, usable):
+    r"""Pick the requirement whose shortest alternative is longest (fewest alternatives on ties)"""
+    best, best_key = None, None
+    for req in requirements:
+        if usable is not None:
+            req = tuple(usable(lit) for lit in req)
+            if not all(req):
+                continue
+        key = (min(len(lit if isinstance(lit, str) else lit.text) for lit in req), -len(req))
+        if best_key is None or key > best_key:
+            best, best_key = req, key
+    return best
+
+
+def _compiles(pattern):
+    try:
+        re.compile(pattern, re.IGNORECASE)
+        return True
+    except re.error:
+        return False
+
+
+def _substring_term(lit):
+    text = lit.text.lower()
+    if len(text) >= MIN_LITERAL_LENGTH and _SUBSTRING_OK.match(text) and not set(text) & set('"\\%'):
+        return text
+    return None
+
+
+def _token_term(lit):
+    text = lit.text.lower()
+    left = lit.left_bounded or text[:1] in BOUNDARY_CHARS
+    right = lit.right_bounded or text[-1:] in BOUNDARY_CHARS
+    text = text.strip(BOUNDARY_CHARS)
+    if left and right and len(text) >= MIN_LITERAL_LENGTH and _TOKEN_OK.match(text):
+        return text
+    return None
+
+
+def required_terms(pattern, token_match=False):
+    r"""
+    Store search terms, one of which appears in every match of a regex.
+
+    Args:
+        pattern: regex as written in rules.yaml (matched case-insensitively)
+        token_match: only return whole tokens (for stores like Gmail that match words)
+
+    Returns:
+        tuple: lowercase terms (any-of), or None when nothing usable is required
+    """
+    try:
+        parsed = sre_parse.parse(pattern, re.IGNORECASE)
+    except (re.error, RecursionError):
+        return None
+    return _best(_requirements(parsed), _token_term if token_match else _substring_term)
+
+
+#------------------Store dialects------------------
+
+def _quote_imap(text):
+    return '"' + text + '"'
+
+
+def imap_search_criteria(terms):
+    r"""OR-chain of FROM/SUBJECT keys for UID SEARCH"""
+    keys = [f"{field.upper()} {_quote_imap(text)}" for field, text in terms]
+    criteria = keys[-1]
+    for key in reversed(keys[:-1]):
+        criteria = f"OR {key} {criteria}"
+    return criteria
+
+
+def gmail_query(terms):
+    r"""Gmail q= OR group ({...}); only from: terms are planned for Gmail"""
+    parts = [f"{field}:{text}" for field, text in terms]
+    return parts[0] if len(parts) == 1 else "{" + " ".join(parts) + "}"
+
+
+DASL_FIELDS = {
+    FIELD_FROM: ('"urn:schemas:httpmail:fromemail"', '"http://schemas.microsoft.com/mapi/proptag/0x0C1F001F"'),
+    FIELD_SUBJECT: ('"urn:schemas:httpmail:subject"',),
+}
+
+
+def outlook_filter(terms, cutoff=None):
+    r"""
+    DASL filter for Items.Restrict or Folder.GetTable.
+
+    Args:
+        terms: (field, text) pairs
+        cutoff: datetime; only items received on or after it
+
+    Returns:
+        str: "@SQL=..." filter
+    """
+    clauses = []
+    for field, text in terms:
+        value = text.replace("'", "''")
+        clauses.extend(f"{prop} LIKE '%{value}%'" for prop in DASL_FIELDS[field])
+    query = " OR ".join(clauses)
+    if cutoff is not None:
+        query = f"\"urn:schemas:httpmail:datereceived\" >= '{cutoff.strftime('%m/%d/%Y')}' AND ({query})"
+    return "@SQL=" + query
+
+
+StoreDialect = namedtuple("StoreDialect", "name fields token_match translate")
+
+DIALECTS = {
+    "imap": StoreDialect("imap", (FIELD_FROM, FIELD_SUBJECT), False, imap_search_criteria),
+    "outlook": StoreDialect("outlook", (FIELD_FROM, FIELD_SUBJECT), False, outlook_filter),
+    "gmail": StoreDialect("gmail", (FIELD_FROM,), True, gmail_query),
+}
+
+
+#------------------Plan------------------
+
+def new_plan_stats():
+    return {"candidates": 0, "residual_evaluated": 0, "fallback_folders": 0}
+
+
+class QueryPlan:
+    r"""
+    A ruleset split into store-side terms and a client-side residual.
+
+    A rule fires when any of its condition patterns matches, so it is split pattern
+    by pattern: patterns with a usable literal become search terms, and a copy of the
+    rule holding only the other patterns (same name, exceptions and actions) goes
+    into the residual ruleset.  A rule with nothing left over is fully pushed.
+
+    Attributes:
+        ruleset: CompiledRuleset of the full rules (candidates are evaluated with it)
+        residual: CompiledRuleset of what could not be pushed, or None
+        terms: unique (field, text) search terms
+        pushed_rules: names of rules with at least one pushed pattern
+        residual_rules: names of rules in the residual ruleset
+        residual_safe_senders: safe sender patterns without a usable literal
+        stats: candidates, residual_evaluated, fallback_folders
+    """
+
+    def __init__(self, rules_json, safe_senders, dialect):
+        self.dialect = DIALECTS[dialect] if isinstance(dialect, str) else dialect
+        self.ruleset = CompiledRuleset(rules_json, safe_senders)
+        self.terms = []
+        self._seen_terms = set()
+        self.pushed_rules, self.residual_rules = [], []
+        self.pushed_patterns = 0
+        self.stats = new_plan_stats()
+
+        residual_rules = []
+        fully_pushed = set()
+        for rule in rules_list_from(rules_json):
+            residual_rule = self._split_rule(rule)
+            if residual_rule is None:
+                fully_pushed.add(id(rule))
+            else:
+                residual_rules.append(residual_rule)
+                self.residual_rules.append(rule.get('name') if isinstance(rule, dict) else None)
+
+        residual_safe = []
+        for pattern in safe_senders_list_from(safe_senders):
+            if not _compiles(pattern):
+                continue
+            texts = self._terms_for(FIELD_FROM, pattern)
+            if texts is None:
+                residual_safe.append(pattern)
+        self.residual_safe_senders = residual_safe
+
+        self.residual = None
+        if residual_rules or residual_safe:
+            self.residual = CompiledRuleset({"rules": residual_rules}, {"safe_senders": residual_safe})
+
+        # process_emails() leaves match/rule_name from the last rule it evaluated.  A
+        # message outside the candidates never fires a pushed pattern, so its residual
+        # verdict only differs when the last rule overall is missing from the residual.
+        valid = sorted((r for r in rules_list_from(rules_json) if isinstance(r, dict) and 'actions' in r), key=rule_sort_key)
+        self._last_rule_pushed = bool(valid) and id(valid[-1]) in fully_pushed
+
+    def _terms_for(self, field, pattern):
+        r"""Add the pattern's search terms to the plan; None (nothing added) if it cannot be pushed"""
+        if field not in self.dialect.fields:
+            return None
+        texts = required_terms(pattern, self.dialect.token_match)
+        if texts is not None:
+            self.pushed_patterns += 1
+            for text in texts:
+                if (field, text) not in self._seen_terms:
+                    self._seen_terms.add((field, text))
+                    self.terms.append((field, text))
+        return texts
+
+    def _split_rule(self, rule):
+        r"""Push what can be pushed; return the residual copy of the rule, or None if nothing is left"""
+        if not isinstance(rule, dict) or 'actions' not in rule:
+            return rule
+        conditions = rule.get('conditions') or {}
+        residual_conditions = {}
+        pushed = False
+        for key, patterns in conditions.items():
+            if key not in CONDITION_FIELDS or not isinstance(patterns, list):
+                residual_conditions[key] = patterns
+                continue
+            remaining = []
+            for pattern in patterns:
+                if not _compiles(pattern):
+                    continue    # skipped by the evaluators too, so it never matches
+                if CONDITION_FIELDS[key] is not None and self._terms_for(CONDITION_FIELDS[key], pattern) is not None:
+                    pushed = True
+                else:
+                    remaining.append(pattern)
+            if remaining:
+                residual_conditions[key] = remaining
+        if pushed:
+            self.pushed_rules.append(rule.get('name'))
+        if not any(residual_conditions.get(key) for key in CONDITION_FIELDS):
+            return None
+        return dict(rule, conditions=residual_conditions)
+
+    def queries(self):
+        r"""Store queries in the plan's dialect, TERMS_PER_QUERY terms each"""
+        return [self.dialect.translate(self.terms[i:i + TERMS_PER_QUERY])
+                for i in range(0, len(self.terms), TERMS_PER_QUERY)]
+
+    def evaluate_folder(self, backend, folder, cutoff=None):
+        r"""
+        Yield (message, verdict) like backend.evaluate_folder(), with verdicts equal to
+        the full ruleset's, but evaluating non-candidates with the residual only.
+        """
+        candidates = backend.search_candidates(folder, self.queries(), cutoff) if self.terms else set()
+        if candidates is None:
+            self.stats["fallback_folders"] += 1
+            yield from backend.evaluate_folder(folder, self.ruleset, cutoff)
+            return
+        self.stats["candidates"] += len(candidates)
+        if candidates:
+            yield from backend.evaluate_folder(folder, self.ruleset, cutoff, select=candidates.__contains__)
+        if self.residual is None:
+            return
+        for message, verdict in backend.evaluate_folder(folder, self.residual, cutoff,
+                                                        select=lambda message_id: message_id not in candidates):
+            self.stats["residual_evaluated"] += 1
+            if self._last_rule_pushed and verdict["safe_sender"] is None and not verdict["delete"]:
+                verdict["match"], verdict["rule_name"], verdict["matched_keyword"] = False, None, ""
+            yield message, verdict
+
+    def summary(self):
+        return (f"{self.pushed_patterns} patterns pushed as {len(self.terms)} {self.dialect.name} terms; "
+                f"residual: {len(self.residual_rules)} rules, {len(self.residual_safe_senders)} safe senders")
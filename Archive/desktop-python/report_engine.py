@@ -0,0 +1,184 @@
+r"""
+Aggregating reports for withOutlookRulesYAML.py.
+
+from_report and URL_report printed one line per email: each looked its email up
+with emails_to_process.index(email) (quadratic in the number of emails), and each
+line went through simple_print, which opens and closes the simple log file.
+
+ReportEngine takes one compact record per reported email (phishing indicators
+or no rule match) in a single pass and keeps group-by counts:
+
+  - per From domain ("@<domain>.<>" from the header) and per URL stub
+    ("/<domain>.<>" and ".<domain>.<>" from the body of phishing emails);
+  - per group: emails, how many were phishing / matched no rule, first and last
+    seen (ReceivedTime) and the first few email numbers.
+
+write() renders everything once: <prefix>.csv (every group), <prefix>.json
+(every group plus totals) and <prefix>.txt (the top-N of each group-by, also
+returned so the caller can log it in one write).
+
+Usage:
+    engine = ReportEngine(top_n=25)
+    for number, (email, info) in enumerate(zip(emails, infos), 1):
+        engine.add(number, from_domain, email.ReceivedTime, info.get("phishing_indicators"), info["match"], stubs)
+    lines = engine.write("D:/Data/.../OutlookRulesReport")
+"""
+
+import csv
+import json
+import os
+
+DEFAULT_TOP_N = 25
+SAMPLE_EMAILS = 5
+GROUP_FROM_DOMAIN = "from_domain"
+GROUP_URL_STUB = "url_stub"
+UNKNOWN_DOMAIN = "(no from domain)"
+
+
+class ReportGroup:
+    r"""
+    Counts for one From domain or URL stub.
+
+    Attributes:
+        key: the domain or stub
+        count: reported emails in the group
+        phishing: emails with phishing indicators
+        no_match: emails that matched no rule
+        first_seen, last_seen: earliest / latest ReceivedTime (None if unknown)
+        emails: first SAMPLE_EMAILS email numbers
+    """
+    __slots__ = ("key", "count", "phishing", "no_match", "first_seen", "last_seen", "emails")
+
+    def __init__(self, key):
+        self.key = key
+        self.count = 0
+        self.phishing = 0
+        self.no_match = 0
+        self.first_seen = None
+        self.last_seen = None
+        self.emails = []
+
+    def add(self, number, received, phishing, no_match):
+        self.count += 1
+        self.phishing += phishing
+        self.no_match += no_match
+        if received is not None:
+            if self.first_seen is None or received < self.first_seen:
+                self.first_seen = received
+            if self.last_seen is None or received > self.last_seen:
+                self.last_seen = received
+        if len(self.emails) < SAMPLE_EMAILS:
+            self.emails.append(number)
+
+    def as_dict(self):
+        return {"key": self.key, "count": self.count, "phishing": self.phishing, "no_match": self.no_match,
+                "first_seen": _time_text(self.first_seen), "last_seen": _time_text(self.last_seen),
+                "emails": list(self.emails)}
+
+
+def _time_text(value):
+    if value is None:
+        return ""
+    try:
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    except Exception:
+        return str(value)
+
+
+class ReportEngine:
+    r"""
+    One-pass group-by over reported emails.
+
+    Args:
+        top_n: groups listed per group-by in the text report
+    """
+
+    def __init__(self, top_n=DEFAULT_TOP_N):
+        self.top_n = top_n
+        self.emails = 0
+        self.phishing = 0
+        self.no_match = 0
+        self.groups = {GROUP_FROM_DOMAIN: {}, GROUP_URL_STUB: {}}
+
+    def _group(self, group_by, key):
+        groups = self.groups[group_by]
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = ReportGroup(key)
+        return group
+
+    def add(self, number, from_domain, received=None, phishing_indicators=None, matched=True, url_stubs=()):
+        r"""
+        Count one email.  Emails with neither phishing indicators nor a missed match are ignored.
+
+        Args:
+            number: 1-based email number, as the log prints it
+            from_domain: "@<domain>" from the From: header line ("" if none)
+            received: ReceivedTime, for first/last seen
+            phishing_indicators: list of indicators, or None
+            matched: False if the email matched no rule
+            url_stubs: URL stubs of the body (counted for phishing emails, as URL_report did)
+
+        Returns:
+            bool: True if the email was counted
+        """
+        phishing = phishing_indicators is not None
+        no_match = matched is False
+        if not (phishing or no_match):
+            return False
+        self.emails += 1
+        self.phishing += phishing
+        self.no_match += no_match
+        self._group(GROUP_FROM_DOMAIN, from_domain or UNKNOWN_DOMAIN).add(number, received, phishing, no_match)
+        if phishing:
+            for stub in url_stubs:
+                self._group(GROUP_URL_STUB, stub).add(number, received, phishing, no_match)
+        return True
+
+    def top(self, group_by, n=None):
+        r"""Groups by descending count (ties by key); the first n, or all when n is None"""
+        ranked = sorted(self.groups[group_by].values(), key=lambda group: (-group.count, group.key))
+        return ranked if n is None else ranked[:n]
+
+    def text_lines(self):
+        r"""Top-N text report"""
+        lines = [f"Report: {self.emails} emails ({self.phishing} with phishing indicators, "
+                 f"{self.no_match} matched no rules)"]
+        for group_by, title, width in ((GROUP_FROM_DOMAIN, "From domains", 30), (GROUP_URL_STUB, "URL stubs", 30)):
+            groups = self.groups[group_by]
+            lines.append(f"Top {min(self.top_n, len(groups))} of {len(groups)} {title}:")
+            for group in self.top(group_by, self.top_n):
+                lines.append(f"{group.key.ljust(width)}| {group.count:>5} emails | {group.phishing:>5} phishing | "
+                             f"{group.no_match:>5} no match | {_time_text(group.first_seen)} - "
+                             f"{_time_text(group.last_seen)} | Emails {', '.join(map(str, group.emails))}")
+        return lines
+
+    def as_dict(self):
+        return {"emails": self.emails, "phishing": self.phishing, "no_match": self.no_match, "top_n": self.top_n,
+                GROUP_FROM_DOMAIN: [group.as_dict() for group in self.top(GROUP_FROM_DOMAIN)],
+                GROUP_URL_STUB: [group.as_dict() for group in self.top(GROUP_URL_STUB)]}
+
+    def write(self, prefix):
+        r"""
+        Write <prefix>.csv, <prefix>.json and <prefix>.txt, once each.
+
+        Returns:
+            list: the text report lines
+        """
+        directory = os.path.dirname(prefix)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lines = self.text_lines()
+        with open(prefix + ".csv", 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["group_by", "key", "count", "phishing", "no_match", "first_seen", "last_seen", "emails"])
+            for group_by in (GROUP_FROM_DOMAIN, GROUP_URL_STUB):
+                for group in self.top(group_by):
+                    row = group.as_dict()
+                    writer.writerow([group_by, row["key"], row["count"], row["phishing"], row["no_match"],
+                                     row["first_seen"], row["last_seen"], " ".join(map(str, row["emails"]))])
+        with open(prefix + ".json", 'w', encoding='utf-8') as f:
+            json.dump(self.as_dict(), f, indent=2)
+        with open(prefix + ".txt", 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        return lines
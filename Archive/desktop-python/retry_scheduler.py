@@ -0,0 +1,216 @@
+r"""
+Non-blocking retries for mailbox changes: backoff with jitter, parked in a
+delayed queue, and a circuit breaker per folder.
+
+The *_with_retry helpers that withOutlookRulesYAML.py used to have slept
+inline, so one locked item held up the whole scan for up to 10 seconds per
+action.  A RetryScheduler instead parks the failed work with a due time and
+hands it back once it is due.  The caller keeps evaluating in the meantime
+and only waits (wait_next()) for work that is still parked at the end of a
+pass.
+
+  RetryPolicy     delay before attempt n: base * multiplier**(n-1), capped at
+                  max_delay, scaled by a random factor in [1 - jitter, 1] so
+                  retries for many items do not all land at the same moment
+  CircuitBreaker  opens after failure_threshold consecutive failures in one
+                  folder.  While open, nothing is tried in that folder.  After
+                  reset_timeout one trial is let through (half-open); a success
+                  closes the breaker, a failure opens it again
+  RetryScheduler  the delayed queue plus one breaker per folder, and the
+                  counters that are reported (retries, seconds waited, trips)
+
+Used by outlook_actions.OutlookActionQueue.
+"""
+
+import heapq
+import itertools
+import random
+import time
+
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MULTIPLIER = 2.0
+DEFAULT_MAX_DELAY = 8.0
+DEFAULT_JITTER = 0.5
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+DEFAULT_MAX_TRIPS = 3
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half-open"
+
+
+def new_retry_stats():
+    return {"retries": 0, "waited_seconds": 0.0, "breaker_trips": 0, "breaker_rejections": 0}
+
+
+class RetryPolicy:
+    r"""
+    Exponential backoff with jitter.
+
+    Args:
+        base_delay: delay (seconds) before the first retry
+        multiplier: growth per attempt
+        max_delay: cap before jitter
+        jitter: fraction of the delay that is randomized (0 = fixed delays)
+        max_attempts: attempts in total, the first one included
+        rng: random.Random for the jitter (injectable for tests)
+    """
+
+    def __init__(self, base_delay=DEFAULT_BASE_DELAY, multiplier=DEFAULT_MULTIPLIER, max_delay=DEFAULT_MAX_DELAY,
+                 jitter=DEFAULT_JITTER, max_attempts=DEFAULT_MAX_ATTEMPTS, rng=None):
+        self.base_delay = base_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.max_attempts = max(1, max_attempts)
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt):
+        r"""Seconds to wait after failed attempt number `attempt` (1-based)"""
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        return delay * self.rng.uniform(1.0 - self.jitter, 1.0)
+
+
+class CircuitBreaker:
+    r"""
+    Consecutive-failure breaker for one folder.
+
+    Args:
+        failure_threshold: consecutive failures that open the breaker
+        reset_timeout: seconds open before one trial is allowed
+        clock: time source
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT,
+                 clock=time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = None
+
+    @property
+    def reopens_at(self):
+        return None if self.opened_at is None else self.opened_at + self.reset_timeout
+
+    def allow(self):
+        r"""True if an attempt may be made now (moves open -> half-open once reset_timeout has passed)"""
+        if self.state == BREAKER_OPEN:
+            if self.clock() < self.reopens_at:
+                return False
+            self.state = BREAKER_HALF_OPEN
+        return True
+
+    def record_success(self):
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        r"""Returns True if this failure opened the breaker"""
+        self.failures += 1
+        if self.state == BREAKER_HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = BREAKER_OPEN
+            self.opened_at = self.clock()
+            self.trips += 1
+            return True
+        return False
+
+
+class RetryScheduler:
+    r"""
+    Delayed queue of work items plus a CircuitBreaker per folder.
+
+    Args:
+        policy: RetryPolicy
+        failure_threshold, reset_timeout: for each folder's CircuitBreaker
+        max_trips: a folder whose breaker has opened more often than this is given up on
+        clock, sleep: injectable for tests
+    """
+
+    def __init__(self, policy=None, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT,
+                 max_trips=DEFAULT_MAX_TRIPS, clock=time.monotonic, sleep=time.sleep):
+        self.policy = policy or RetryPolicy()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_trips = max_trips
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = new_retry_stats()
+        self.breakers = {}
+        self._heap = []                 # (due, seq, item)
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def breaker(self, folder):
+        breaker = self.breakers.get(folder)
+        if breaker is None:
+            breaker = self.breakers[folder] = CircuitBreaker(self.failure_threshold, self.reset_timeout, self.clock)
+        return breaker
+
+    def given_up(self, folder):
+        r"""True once the folder's breaker has tripped more than max_trips times"""
+        return self.breaker(folder).trips > self.max_trips
+
+    def allow(self, folder):
+        r"""May an attempt be made in this folder now?  Counts a rejection when not"""
+        if self.breaker(folder).allow():
+            return True
+        self.stats["breaker_rejections"] += 1
+        return False
+
+    def record(self, folder, ok):
+        r"""Feed an attempt's outcome to the folder's breaker"""
+        breaker = self.breaker(folder)
+        if ok:
+            breaker.record_success()
+        elif breaker.record_failure():
+            self.stats["breaker_trips"] += 1
+
+    def park(self, item, folder, attempts):
+        r"""
+        Schedule item for another attempt after `attempts` failed ones.
+
+        Returns:
+            bool: False if the policy has no attempts left (the caller gives up on it)
+        """
+        if attempts >= self.policy.max_attempts or self.given_up(folder):
+            return False
+        due = self.clock() + self.policy.delay(attempts)
+        self.stats["retries"] += 1
+        heapq.heappush(self._heap, (due, next(self._seq), item))
+        return True
+
+    def defer(self, item, folder):
+        r"""Put an item back, without charging an attempt, until its folder's breaker lets a trial through"""
+        due = self.breaker(folder).reopens_at or self.clock()
+        heapq.heappush(self._heap, (due, next(self._seq), item))
+
+    def pop_due(self):
+        r"""
+        Remove and return the items that are due now.
+
+        Returns:
+            list: items in due order
+        """
+        now = self.clock()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def wait_next(self):
+        r"""Sleep until the next parked item is due; the time is added to waited_seconds"""
+        if not self._heap:
+            return 0.0
+        delay = max(0.0, self._heap[0][0] - self.clock())
+        if delay:
+            self.sleep(delay)
+            self.stats["waited_seconds"] += delay
+        return delay
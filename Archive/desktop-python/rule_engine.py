@@ -0,0 +1,1128 @@
+r"""
+Rule evaluation engine for withOutlookRulesYAML.py
+
+Two evaluators that must always return the same verdict for the same message:
+
+  reference_evaluate()
+      Literal port of the first-pass matching loop in
+      OutlookSecurityAgent.process_emails() (regex mode).  It recompiles every
+      pattern list for every rule and every email, exactly like the original
+      loop, and is kept as the slow source of truth.
+
+  CompiledRuleset
+      Compiles each pattern once and answers from/header/safe-sender lookups
+      through literal indexes (exact address, domain suffix, domain label),
+      falling back to the ordered regex list for anything it cannot index.
+
+differential_harness.py runs both over generated corpora and randomized
+rulesets and reports any divergence.
+
+A CompiledRuleset can also follow edits to the rules without being rebuilt:
+add_safe_sender / add_rule_pattern (and the remove_ variants) update one
+PatternMatcher in place (and the RuleGroup holding that rule, if any) and bump
+ruleset.version.  The evaluation plan is only rebuilt when an edit changes
+which rules can be coalesced or their order.  Each change is logged as a
+RulesetChange, so VerdictCache re-evaluates only the cached messages that a
+change can affect.
+
+Rules that differ only in their one condition pattern (the split rules format:
+same actions, executionOrder and condition type, no exceptions, delete) are
+coalesced at load into a RuleGroup: one PatternMatcher over all their patterns
+that still reports which rule matched.  CompiledRuleset.hits counts fired rules.
+
+A verdict is a plain dict (same spirit as the emails_added_info records):
+    safe_sender      pattern that matched the safe_senders list, or None
+    fired            [(rule_name, matched_keyword)] for every rule whose actions ran
+    suppressed       [(rule_name, exception_pattern)] for matches cancelled by an exception
+    match            final "match" value recorded for the email
+    rule_name        final "rule" recorded for the email (name only)
+    matched_keyword  final "matched_keyword" recorded for the email
+    delete           True if a fired rule carries a truthy delete action
+    error            present (True) only when the original loop would raise for this email
+"""
+
+import bisect
+import json
+import re
+import threading
+from collections import Counter, deque
+
+PR_TRANSPORT_MESSAGE_HEADERS = "http://schemas.microsoft.com/mapi/proptag/0x007D001E"
+
+CONDITION_KEYS = ("from", "subject", "body", "header")
+
+
+#------------------Message helpers (mirror OutlookSecurityAgent)------------------
+
+def sanitize_string(s):
+    r"""Remove non-ASCII characters (mirrors OutlookSecurityAgent._sanitize_string)"""
+    try:
+        return re.sub(r'[^\x00-\x7F]+', '', s)
+    except UnicodeEncodeError:
+        return re.sub(r'[^\x00-\x7F]+', '', s.encode('utf-8', 'replace').decode('utf-8'))
+
+
+def combine_email_header_lines(email_header):
+    r"""Unfold continuation lines, sanitize and lowercase a raw header block
+    (mirrors OutlookSecurityAgent.combine_email_header_lines, including the
+    IndexError on a block that starts with a continuation line)"""
+    email_header_list = []
+    for line in (email_header or "").splitlines():
+        if line.startswith((' ', '\t')):
+            email_header_list[-1] += ' ' + line.strip()
+        else:
+            email_header_list.append(line.strip())
+    return sanitize_string('\n'.join(email_header_list)).lower()
+
+
+def header_from(email_header):
+    r"""Return '@domain' from the first 'from:' header line, or '' (mirrors OutlookSecurityAgent.header_from)"""
+    if isinstance(email_header, list):
+        email_header = "\n".join(email_header)
+    for line in (email_header or "").splitlines():
+        if line.lower().startswith("from:"):
+            from_domain = re.search(r'@[\w.-]+', line)
+            return from_domain.group(0) if from_domain else ""
+    return ""
+
+
+class MessageView:
+    r"""
+    The four fields the rules look at, detached from the mail store.
+
+    Attributes:
+        sender:  SenderEmailAddress as delivered by the store (not lowercased)
+        subject: Subject
+        body:    plain-text Body
+        header:  combined header block (see combine_email_header_lines)
+    """
+    __slots__ = ("sender", "subject", "body", "header")
+
+    def __init__(self, sender="", subject="", body="", header=""):
+        self.sender = sender or ""
+        self.subject = subject or ""
+        self.body = body or ""
+        self.header = header or ""
+
+    @classmethod
+    def from_outlook_item(cls, email):
+        r"""Build a view from an Outlook MailItem (one COM read per property)"""
+        try:
+            raw_header = email.PropertyAccessor.GetProperty(PR_TRANSPORT_MESSAGE_HEADERS)
+            email_header = combine_email_header_lines(raw_header)
+        except Exception:
+            email_header = ""
+        return cls(email.SenderEmailAddress, email.Subject, email.Body, email_header)
+
+    def __repr__(self):
+        return f"MessageView(sender={self.sender!r}, subject={self.subject!r})"
+
+
+def new_verdict():
+    return {
+        "safe_sender": None,
+        "fired": [],
+        "suppressed": [],
+        "match": False,
+        "rule_name": None,
+        "matched_keyword": "",
+        "delete": False,
+    }
+
+
+def rules_list_from(rules_json):
+    r"""Extract the rules array the same way process_emails() does"""
+    if isinstance(rules_json, dict) and "rules" in rules_json:
+        return rules_json["rules"]
+    return rules_json if isinstance(rules_json, list) else [rules_json]
+
+
+def safe_senders_list_from(safe_senders):
+    if isinstance(safe_senders, dict):
+        return safe_senders.get("safe_senders", []) or []
+    return list(safe_senders or [])
+
+
+def rule_sort_key(rule):
+    r"""Same key as process_emails(): non-delete rules first, stable otherwise"""
+    return rule['actions'].get('delete', False)
+
+
+def rule_needs_body(rule):
+    r"""True if a condition or exception list of the rule has body patterns (an empty list never matches)"""
+    for key in ('conditions', 'exceptions'):
+        container = rule.get(key)
+        if isinstance(container, dict) and container.get('body'):
+            return True
+    return False
+
+
+def header_first_sort_key(rule):
+    r"""
+    Two-phase order: non-delete rules first (as rule_sort_key), then delete rules
+    that from/subject/header can decide, then delete rules that need the body.
+
+    A message deleted in the second group never has its body read.  Only the
+    credited delete rule can differ from rule_sort_key order: the first delete
+    rule that matches still stops evaluation.
+    """
+    deletes = rule_sort_key(rule)
+    return (deletes, bool(deletes) and rule_needs_body(rule))
+
+
+#------------------Reference evaluator (slow, literal port)------------------
+
+def _compile_pattern_list(patterns):
+    compiled = []
+    for p in patterns:
+        try:
+            compiled.append(re.compile(p, re.IGNORECASE))
+        except re.error:
+            pass
+    return compiled
+
+
+def _any_regex_match(compiled_patterns, text):
+    tl = text or ""
+    for pat in compiled_patterns:
+        if pat.search(tl):
+            return True, pat.pattern
+    return False, None
+
+
+def _regex_match_header_any(compiled_patterns, email_header, sender_email):
+    if not compiled_patterns:
+        return False, None
+    from_tok = (header_from(email_header) or "").strip().lower()
+    sender_tok = (sender_email or "").strip().lower()
+    candidates = []
+    if from_tok:
+        candidates.append(from_tok)
+    if sender_tok:
+        candidates.append(sender_tok)
+    for cand in candidates:
+        m, pat = _any_regex_match(compiled_patterns, cand)
+        if m:
+            return True, pat
+    return False, None
+
+
+def reference_evaluate(rules_json, safe_senders, message, sort_key=rule_sort_key):
+    r"""
+    Decide what process_emails() would do with one message, without touching the store.
+
+    Args:
+        rules_json: rules document (dict with 'rules') or list of rules
+        safe_senders: safe_senders document (dict with 'safe_senders') or list of patterns
+        message: MessageView (or anything with sender/subject/body/header)
+        sort_key: rule order (rule_sort_key, or header_first_sort_key for --rule-order header-first)
+
+    Returns:
+        dict: verdict (see module docstring)
+    """
+    verdict = new_verdict()
+    compiled_safe_senders = _compile_pattern_list(safe_senders_list_from(safe_senders))
+    matched_safe, matched_pat = _regex_match_header_any(compiled_safe_senders, message.header, message.sender)
+    if matched_safe:
+        verdict["safe_sender"] = matched_pat
+        return verdict
+
+    rules = sorted(rules_list_from(rules_json), key=sort_key)
+    try:
+        for rule in rules:
+            if not isinstance(rule, dict) or 'actions' not in rule:
+                continue
+            conditions = rule['conditions']
+            exceptions = rule['exceptions']
+            match = False
+            matched_keyword = ""
+
+            if 'from' in conditions:
+                m, pat = _any_regex_match(_compile_pattern_list(conditions['from']), message.sender.lower())
+                if m:
+                    match, matched_keyword = True, pat
+            if 'subject' in conditions:
+                m, pat = _any_regex_match(_compile_pattern_list(conditions['subject']), message.subject)
+                if m:
+                    match, matched_keyword = True, pat
+            if 'body' in conditions:
+                m, pat = _any_regex_match(_compile_pattern_list(conditions['body']), message.body)
+                if m:
+                    match, matched_keyword = True, pat
+            if 'header' in conditions:
+                m, pat = _regex_match_header_any(_compile_pattern_list(conditions['header']), message.header, message.sender)
+                if m:
+                    match, matched_keyword = True, pat
+
+            exception_pat = None
+            if match and 'from' in exceptions:
+                from_addresses = [addr.lower() for addr in exceptions['from']]
+                m, pat = _any_regex_match(_compile_pattern_list(from_addresses), message.sender.lower())
+                if m:
+                    match, exception_pat = False, pat
+            if match and 'subject' in exceptions:
+                m, pat = _any_regex_match(_compile_pattern_list(exceptions['subject']), message.subject)
+                if m:
+                    match, exception_pat = False, pat
+            if match and 'body' in exceptions:
+                m, pat = _any_regex_match(_compile_pattern_list(exceptions['body']), message.body)
+                if m:
+                    match, exception_pat = False, pat
+            if match and 'header' in exceptions:
+                m, pat = _regex_match_header_any(_compile_pattern_list(exceptions['header']), message.header, message.sender)
+                if m:
+                    match, exception_pat = False, pat
+
+            # The original loop overwrites the email's record with every rule it evaluates
+            verdict["match"] = match
+            verdict["rule_name"] = rule.get('name') if match else None
+            verdict["matched_keyword"] = matched_keyword if match else ""
+            if exception_pat is not None:
+                verdict["suppressed"].append((rule.get('name'), exception_pat))
+
+            if match:
+                verdict["fired"].append((rule.get('name'), matched_keyword))
+                actions = rule['actions']
+                if 'delete' in actions and actions['delete']:
+                    verdict["delete"] = True
+                    break
+    except Exception:
+        verdict["error"] = True
+    return verdict
+
+
+#------------------Compiled evaluator (fast path)------------------
+
+# ASCII only: a few non-ASCII letters case-fold onto ASCII ones under re.IGNORECASE
+_LITERAL_CHAR = re.compile(r'\\[\x20-\x2f\x3a-\x40\x5b-\x60\x7b-\x7e]|[A-Za-z0-9_@-]')
+
+# Pattern shapes whose match implies a literal tail, preceded by '.' or '@', at the end of the text
+_TAIL_FORMS = (
+    re.compile(r'^\^\[\^@\\s\]\+@\(\?:\[a-z0-9-\]\+\\\.\)\*(?P<lit>.+)\$$'),   # ^[^@\s]+@(?:[a-z0-9-]+\.)*lit$
+    re.compile(r'^@\(\?:\[a-z0-9-\]\+\\\.\)\*(?P<lit>.+)\$$'),                 # @(?:[a-z0-9-]+\.)*lit$
+    re.compile(r'^@\.\*\\\.(?P<lit>.+)\$$'),                                   # @.*\.lit$
+    re.compile(r'^@(?P<lit>.+)\$$'),                                           # @lit$
+)
+# Pattern shapes whose match implies a literal domain label, preceded by '.' or '@' and followed by '.'
+_LABEL_FORMS = (
+    re.compile(r'^@\(\?:\[a-z0-9-\]\+\\\.\)\*(?P<lit>.+)\\\.\[a-z0-9\.-\]\+\$$'),  # @(?:[a-z0-9-]+\.)*lit\.[a-z0-9.-]+$
+    re.compile(r'^@(?P<lit>.+)\\\.\[a-z0-9\.-\]\+\$$'),                           # @lit\.[a-z0-9.-]+$
+)
+_EXACT_FORM = re.compile(r'^\^(?P<lit>.+)\$$')                                   # ^lit$
+
+_SPLIT_LABELS = re.compile(r'[.@]')
+
+MATCHER_EXACT = "exact"
+MATCHER_TAIL = "suffix"
+MATCHER_LABEL = "label"
+MATCHER_REGEX = "regex"
+
+
+def unescape_literal(fragment):
+    r"""Return the literal text a regex fragment matches, or None if it is not a plain literal"""
+    out = []
+    pos = 0
+    while pos < len(fragment):
+        m = _LITERAL_CHAR.match(fragment, pos)
+        if not m:
+            return None
+        tok = m.group(0)
+        out.append(tok[1] if tok.startswith('\\') else tok)
+        pos = m.end()
+    return ''.join(out) if out else None
+
+
+def classify_pattern(pattern):
+    r"""
+    Decide which index a pattern can live in.
+
+    Returns:
+        tuple: (kind, key) where kind is one of MATCHER_EXACT, MATCHER_TAIL,
+               MATCHER_LABEL or MATCHER_REGEX (key is None for MATCHER_REGEX)
+    """
+    m = _EXACT_FORM.match(pattern)
+    if m:
+        lit = unescape_literal(m.group('lit'))
+        if lit:
+            return MATCHER_EXACT, lit.lower()
+    for form in _TAIL_FORMS:
+        m = form.match(pattern)
+        if m:
+            lit = unescape_literal(m.group('lit'))
+            if lit:
+                return MATCHER_TAIL, lit.lower()
+    for form in _LABEL_FORMS:
+        m = form.match(pattern)
+        if m:
+            lit = unescape_literal(m.group('lit'))
+            if lit and '@' not in lit:
+                label = lit.split('.')[0]
+                if label:
+                    return MATCHER_LABEL, label.lower()
+    return MATCHER_REGEX, None
+
+
+# Removed ids are left in PatternMatcher.scan/ordered until they outnumber the live ones
+_COMPACT_MIN = 64
+
+
+def _insert_sorted(ids, pos):
+    if not ids or pos > ids[-1]:
+        ids.append(pos)
+    else:
+        bisect.insort(ids, pos)
+
+
+def is_indexable_text(text):
+    r"""Index lookups are only exact for lowercase ASCII text without whitespace"""
+    return text.isascii() and text == text.lower() and not any(c.isspace() for c in text)
+
+
+class PatternMatcher:
+    r"""
+    An ordered pattern list compiled once.
+
+    first_match(text) returns the same pattern _any_regex_match() would: the first
+    pattern in list order whose regex searches successfully, or None.
+
+    add() appends one pattern and remove() drops the first occurrence of one,
+    without recompiling the others: each pattern has an id that grows with its
+    list position and the literal indexes map a key to a dict of ids.  A removed
+    id stays in the ordered id lists (lookups skip it) until removed ids outnumber
+    the live ones, so both edits are O(1) amortized.  version counts the changes.
+    """
+
+    def __init__(self, patterns=()):
+        self.patterns = {}      # id -> pattern
+        self.compiled = {}      # id -> compiled regex (invalid regexes are skipped, like _compile_pattern_list)
+        self.exact = {}         # key -> {id: None}
+        self.tail = {}
+        self.label = {}
+        self.scan = []          # ids that need the full regex, ascending (may hold removed ids)
+        self.ordered = []       # ids of the compiled patterns, ascending (may hold removed ids)
+        self.version = 0
+        self._ids = {}          # pattern -> deque of its ids, ascending (for remove)
+        self._next_id = 0
+        self._removed = 0       # removed ids still in scan/ordered
+        for pattern in patterns:
+            self._insert(pattern)
+
+    def _index_for(self, kind):
+        return {MATCHER_EXACT: self.exact, MATCHER_TAIL: self.tail, MATCHER_LABEL: self.label}.get(kind)
+
+    def _insert(self, pattern, compiled=None, pos=None):
+        r"""Index one pattern under pos (default: after every id so far); ids are never reused"""
+        if pos is None:
+            pos = self._next_id
+        self._next_id = max(self._next_id, pos + 1)
+        self.patterns[pos] = pattern
+        ids = self._ids.setdefault(pattern, deque())
+        if not ids or pos > ids[-1]:
+            ids.append(pos)
+        else:
+            ids.insert(bisect.bisect_left(ids, pos), pos)
+        if compiled is None:
+            try:
+                compiled = re.compile(pattern, re.IGNORECASE)
+            except re.error:
+                return pos
+        self.compiled[pos] = compiled
+        kind, key = classify_pattern(pattern)
+        index = self._index_for(kind)
+        if index is None:
+            _insert_sorted(self.scan, pos)
+        else:
+            index.setdefault(key, {})[pos] = None
+        _insert_sorted(self.ordered, pos)
+        return pos
+
+    def add(self, pattern):
+        r"""Append a pattern (as appending to the YAML list would); returns its id"""
+        pos = self._insert(pattern)
+        self.version += 1
+        return pos
+
+    def remove(self, pattern):
+        r"""Remove the first occurrence of pattern; returns False if it is not in the list"""
+        return self.remove_first(pattern) is not None
+
+    def remove_first(self, pattern):
+        r"""Remove the first occurrence of pattern; returns its id, or None if it is not in the list"""
+        ids = self._ids.get(pattern)
+        if not ids:
+            return None
+        pos = ids.popleft()
+        if not ids:
+            del self._ids[pattern]
+        self._drop(pos, pattern)
+        return pos
+
+    def discard(self, pos):
+        r"""Remove the pattern with id pos; returns False if there is none"""
+        pattern = self.patterns.get(pos)
+        if pattern is None:
+            return False
+        ids = self._ids[pattern]
+        ids.remove(pos)
+        if not ids:
+            del self._ids[pattern]
+        self._drop(pos, pattern)
+        return True
+
+    def _drop(self, pos, pattern):
+        del self.patterns[pos]
+        self.version += 1
+        if self.compiled.pop(pos, None) is None:
+            return
+        kind, key = classify_pattern(pattern)
+        index = self._index_for(kind)
+        if index is not None:
+            bucket = index[key]
+            del bucket[pos]
+            if not bucket:
+                del index[key]
+        self._removed += 1
+        if self._removed > _COMPACT_MIN and self._removed > len(self.compiled):
+            self.scan = [pos for pos in self.scan if pos in self.compiled]
+            self.ordered = [pos for pos in self.ordered if pos in self.compiled]
+            self._removed = 0
+
+    def pattern_list(self):
+        r"""The patterns in list order"""
+        return [self.patterns[pos] for pos in sorted(self.patterns)]
+
+    def __len__(self):
+        return len(self.compiled)
+
+    def _candidates(self, text):
+        found = set(self.exact.get(text, ()))
+        if self.label:
+            for seg in set(_SPLIT_LABELS.split(text)):
+                found.update(self.label.get(seg, ()))
+        if self.tail:
+            for i, ch in enumerate(text):
+                if ch == '.' or ch == '@':
+                    found.update(self.tail.get(text[i + 1:], ()))
+        return found
+
+    def first_match(self, text):
+        pos = self.first_id(text)
+        return None if pos is None else self.patterns[pos]
+
+    def first_id(self, text):
+        r"""Id of the pattern first_match() returns, or None"""
+        text = text or ""
+        if not self.compiled:
+            return None
+        if not is_indexable_text(text):
+            for pos in self.ordered:
+                compiled = self.compiled.get(pos)
+                if compiled is not None and compiled.search(text):
+                    return pos
+            return None
+
+        best = None
+        for pos in sorted(self._candidates(text)):
+            if self.compiled[pos].search(text):
+                best = pos
+                break
+        for pos in self.scan:
+            if best is not None and pos >= best:
+                break
+            compiled = self.compiled.get(pos)
+            if compiled is not None and compiled.search(text):
+                best = pos
+                break
+        return best
+
+    def first_match_header(self, from_tok, sender_tok):
+        r"""Same candidate order as _regex_match_header_any(): From-line domain, then sender"""
+        if not self.compiled:
+            return None
+        for cand in (from_tok, sender_tok):
+            if cand:
+                pat = self.first_match(cand)
+                if pat is not None:
+                    return pat
+        return None
+
+
+class _SlotError(Exception):
+    r"""Raised at evaluation time where the original loop would have raised"""
+
+
+class _NeedsBody(Exception):
+    r"""Raised by a headers-only evaluation when a rule it reaches has to look at the body"""
+
+
+def _pattern_slot(container, key, lowercase=False):
+    r"""Compile one condition/exception list; returns None (absent), a PatternMatcher, or _SlotError"""
+    try:
+        if key not in container:
+            return None
+        values = list(container[key])
+    except Exception:
+        return _SlotError
+    if not all(isinstance(v, str) for v in values):
+        return _SlotError
+    if lowercase:
+        values = [v.lower() for v in values]
+    return PatternMatcher(values)
+
+
+class CompiledRule:
+    r"""One rule with its condition and exception lists compiled once"""
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.name = rule.get('name')
+        self.error = False
+        self.deletes = False
+        self.actions_key = None     # json of the actions, computed once by coalesce_key()
+        self.conditions = {}
+        self.exceptions = {}
+        try:
+            conditions = rule['conditions']
+            exceptions = rule['exceptions']
+        except Exception:
+            self.error = True
+            return
+        for key in CONDITION_KEYS:
+            slot = _pattern_slot(conditions, key)
+            if slot is not None:
+                self.conditions[key] = slot
+            slot = _pattern_slot(exceptions, key, lowercase=(key == 'from'))
+            if slot is not None:
+                self.exceptions[key] = slot
+        actions = rule['actions']
+        self.deletes = bool('delete' in actions and actions['delete'])
+
+    def slot(self, key, exception=False, create=False):
+        r"""The PatternMatcher for one condition/exception list (created empty when create=True)"""
+        slots = self.exceptions if exception else self.conditions
+        slot = slots.get(key)
+        if slot is _SlotError:
+            raise ValueError(f"rule {self.name!r}: {key} list is not a list of strings")
+        if slot is None and create:
+            slot = slots[key] = PatternMatcher()
+        return slot
+
+    def _first(self, slot, key, view):
+        if slot is _SlotError:
+            raise _SlotError()
+        if key == 'from':
+            return slot.first_match(view.sender_lower)
+        if key == 'subject':
+            return slot.first_match(view.subject)
+        if key == 'body':
+            if view.body is None:
+                if not len(slot):
+                    return None
+                raise _NeedsBody()
+            return slot.first_match(view.body)
+        return slot.first_match_header(view.from_tok, view.sender_tok)
+
+    def evaluate(self, view):
+        r"""Returns (match, matched_keyword, exception_pattern)"""
+        if self.error:
+            raise _SlotError()
+        match = False
+        matched_keyword = ""
+        for key in CONDITION_KEYS:
+            slot = self.conditions.get(key)
+            if slot is not None:
+                pat = self._first(slot, key, view)
+                if pat is not None:
+                    match, matched_keyword = True, pat
+        exception_pat = None
+        for key in CONDITION_KEYS:
+            if not match:
+                break
+            slot = self.exceptions.get(key)
+            if slot is not None:
+                pat = self._first(slot, key, view)
+                if pat is not None:
+                    match, exception_pat = False, pat
+        return match, matched_keyword, exception_pat
+
+
+def coalesce_key(crule):
+    r"""
+    Group signature of a rule that can be evaluated inside a RuleGroup, or None.
+
+    Eligible: a delete rule (its first match ends evaluation) with every exception
+    list empty and exactly one non-empty condition list.  Rules share a group when
+    that condition key, the actions, executionOrder and condition type are equal.
+    """
+    if crule.error or not crule.deletes:
+        return None
+    slots = list(crule.conditions.values()) + list(crule.exceptions.values())
+    if any(slot is _SlotError for slot in slots) or any(len(slot) for slot in crule.exceptions.values()):
+        return None
+    keys = [key for key, slot in crule.conditions.items() if len(slot)]
+    if len(keys) != 1:
+        return None
+    rule = crule.rule
+    if crule.actions_key is None:
+        try:
+            crule.actions_key = json.dumps(rule['actions'], sort_keys=True, default=str)
+        except Exception:
+            return None
+    conditions = rule.get('conditions')
+    return keys[0], crule.actions_key, str(rule.get('executionOrder')), str(conditions.get('type'))
+
+
+# A RuleGroup pattern id is (index of its rule in the group) << _OWNER_SHIFT | (its id in the rule's list)
+_OWNER_SHIFT = 32
+
+
+class RuleGroup:
+    r"""
+    Consecutive rules with the same coalesce_key, evaluated as one PatternMatcher.
+
+    The group's matcher holds every rule's patterns in rule order: a pattern's id
+    is built from its rule's index and its id in that rule's own list, so the
+    first matching pattern still names the first matching rule (and its keyword)
+    exactly as evaluating the rules one by one would, and a pattern added to or
+    removed from one rule is mirrored without touching the others.
+    """
+
+    def __init__(self, key, rules):
+        self.key = key
+        self.rules = rules
+        self.matcher = PatternMatcher()
+        for index, crule in enumerate(rules):
+            slot = crule.conditions[key]
+            for pos in list(slot.compiled):
+                self.add(index, slot, pos)
+
+    def add(self, index, slot, pos):
+        r"""Mirror pattern pos of rule index's list (slot); reuses its compiled regex, invalid ones never match"""
+        compiled = slot.compiled.get(pos)
+        if compiled is not None:
+            self.matcher._insert(slot.patterns[pos], compiled, index << _OWNER_SHIFT | pos)
+
+    def discard(self, index, pos):
+        r"""Mirror the removal of pattern pos from rule index's list"""
+        self.matcher.discard(index << _OWNER_SHIFT | pos)
+
+    def first(self, view):
+        r"""
+        Returns:
+            tuple: (CompiledRule, matched pattern) of the first matching rule, or None
+        """
+        if self.key == 'header':
+            pos_from = self.matcher.first_id(view.from_tok) if view.from_tok else None
+            pos_sender = self.matcher.first_id(view.sender_tok) if view.sender_tok else None
+            # The earliest rule wins; within one rule the From-line token is tried first
+            if pos_from is None:
+                pos = pos_sender
+            elif pos_sender is None or pos_from >> _OWNER_SHIFT <= pos_sender >> _OWNER_SHIFT:
+                pos = pos_from
+            else:
+                pos = pos_sender
+        elif self.key == 'from':
+            pos = self.matcher.first_id(view.sender_lower)
+        elif self.key == 'subject':
+            pos = self.matcher.first_id(view.subject)
+        else:
+            if view.body is None:
+                raise _NeedsBody()
+            pos = self.matcher.first_id(view.body)
+        if pos is None:
+            return None
+        return self.rules[pos >> _OWNER_SHIFT], self.matcher.patterns[pos]
+
+
+class _PreparedView:
+    r"""Per-message tokens computed once instead of once per rule"""
+    __slots__ = ("sender_lower", "subject", "body", "from_tok", "sender_tok")
+
+    def __init__(self, message, with_body=True):
+        self.sender_lower = message.sender.lower()
+        self.subject = message.subject
+        self.body = message.body if with_body else None
+        self.from_tok = (header_from(message.header) or "").strip().lower()
+        self.sender_tok = (message.sender or "").strip().lower()
+
+
+class CompiledRuleset:
+    r"""
+    Rules and safe senders compiled once for a whole run.
+
+    Args:
+        rules_json: rules document (dict with 'rules') or list of rules
+        safe_senders: safe_senders document (dict with 'safe_senders') or list of patterns
+        sort_key: rule order, as for reference_evaluate()
+        coalesce: evaluate runs of equivalent rules as one RuleGroup (see coalesce_key)
+
+    The split rules format has thousands of one-pattern delete rules that differ
+    only in that pattern.  With coalesce, each run of them is one matcher, so the
+    cost of an evaluation follows the number of distinct groups, not of rules.
+    hits counts fired rules by name.
+
+    Several threads may evaluate with one ruleset (account_scan.py); the edits
+    (add_/remove_ methods) must not run while they do.  The hit counter and the
+    plan rebuilt after an edit share one lock.
+
+    changes keeps the last MAX_CHANGE_LOG RulesetChanges; a VerdictCache entry
+    older than that is re-evaluated.
+    """
+
+    def __init__(self, rules_json, safe_senders, sort_key=rule_sort_key, coalesce=True):
+        self.safe_senders = PatternMatcher(safe_senders_list_from(safe_senders))
+        self.sort_key = sort_key
+        self.coalesce = coalesce
+        self.hits = Counter()
+        self._hits_lock = threading.Lock()
+        self._plan = None       # CompiledRules and RuleGroups in rule order, rebuilt when grouping or order changes
+        self._groups = {}       # (coalesce key, rule ids) -> RuleGroup in the plan, reused by the next rebuild
+        self._member = {}       # id(CompiledRule) -> (RuleGroup, index in it) for the grouped rules
+        self.rules = []
+        self._position = {}     # id(CompiledRule) -> index in the rules document, the stable-sort tie-break
+        self._by_name = {}      # rule name -> its CompiledRules (error rules left out)
+        for position, rule in enumerate(rules_list_from(rules_json)):
+            if not isinstance(rule, dict) or 'actions' not in rule:
+                continue
+            crule = CompiledRule(rule)
+            self._position[id(crule)] = position
+            self.rules.append(crule)
+            if not crule.error:
+                self._by_name.setdefault(crule.name, []).append(crule)
+        self._sort()
+        self.version = 0
+        self.changes = []       # RulesetChange per version, oldest first (the last MAX_CHANGE_LOG)
+        self._changes_dropped = 0
+        self.plan()
+
+    # --- incremental updates
+
+    def _record(self, target, key, pattern):
+        self.version += 1
+        self.changes.append(RulesetChange(self.version, target, key, pattern))
+        if len(self.changes) > MAX_CHANGE_LOG:
+            drop = len(self.changes) - MAX_CHANGE_LOG // 2
+            del self.changes[:drop]
+            self._changes_dropped += drop
+
+    # --- coalescing
+
+    def plan(self):
+        r"""The evaluation steps: CompiledRules and RuleGroups, in rule order"""
+        plan = self._plan
+        if plan is None:
+            # After an edit the first evaluating threads race here; one of them rebuilds
+            with self._hits_lock:
+                if self._plan is None:
+                    self._plan = self._build_plan()
+                plan = self._plan
+        return plan
+
+    def _build_plan(self):
+        steps, run, run_key = [], [], None
+        groups, member = {}, {}
+
+        def flush():
+            if len(run) >= 2:
+                # Edits to a grouped rule are mirrored in its group, so a run of the same rules reuses it
+                key = (run_key, tuple(id(crule) for crule in run))
+                group = self._groups.get(key) or RuleGroup(run_key[0], list(run))
+                groups[key] = group
+                for index, crule in enumerate(run):
+                    member[id(crule)] = (group, index)
+                steps.append(group)
+            else:
+                steps.extend(run)
+
+        for crule in self.rules:
+            key = self._coalesce_key(crule)
+            if key is None or key != run_key:
+                flush()
+                run, run_key = [], key
+            if key is None:
+                steps.append(crule)
+            else:
+                run.append(crule)
+        flush()
+        self._groups = groups
+        self._member = member
+        return steps
+
+    def _coalesce_key(self, crule):
+        return coalesce_key(crule) if self.coalesce else None
+
+    def coalesce_stats(self):
+        steps = self.plan()
+        groups = [step for step in steps if isinstance(step, RuleGroup)]
+        return {"rules": len(self.rules), "steps": len(steps), "groups": len(groups),
+                "grouped_rules": sum(len(group.rules) for group in groups)}
+
+    def _named(self, rule_name):
+        rules = self._by_name.get(rule_name)
+        if not rules:
+            raise KeyError(f"no rule named {rule_name!r}")
+        return rules
+
+    def add_safe_sender(self, pattern):
+        r"""Mirror a pattern appended to the safe_senders list"""
+        self.safe_senders.add(pattern)
+        self._record(CHANGE_SAFE_SENDER, 'header', pattern)
+
+    def remove_safe_sender(self, pattern):
+        r"""Mirror the removal of a pattern's first occurrence from safe_senders; returns False if absent"""
+        if not self.safe_senders.remove(pattern):
+            return False
+        self._record(CHANGE_SAFE_SENDER, 'header', pattern)
+        return True
+
+    def add_rule_pattern(self, rule_name, key, pattern, exception=False):
+        r"""
+        Mirror a pattern appended to a rule's condition (or exception) list.
+
+        Only the compiled side changes: update the rules document first (as the
+        interactive updates do) so reference_evaluate() and exports agree, and so
+        the rule order sees the new body list.  Every
+        rule of that name is updated, like the interactive updates do.
+
+        Args:
+            rule_name: rule 'name'
+            key: 'from', 'subject', 'body' or 'header'
+            pattern: the regex
+            exception: True for the exceptions list
+        """
+        if key not in CONDITION_KEYS:
+            raise ValueError(f"unknown condition key {key!r}")
+        if exception and key == 'from':
+            pattern = pattern.lower()    # exception 'from' lists are lowercased when compiled
+        regroup = False
+        crules = self._named(rule_name)
+        for crule in crules:
+            before = self._coalesce_key(crule)
+            slot = crule.slot(key, exception, create=True)
+            pos = slot.add(pattern)
+            self._mirror(crule, key, exception, lambda group, index: group.add(index, slot, pos))
+            regroup |= self._coalesce_key(crule) != before
+        self._record(CHANGE_EXCEPTION if exception else CHANGE_CONDITION, key, pattern)
+        if self._resort(key, crules) or regroup:
+            self._plan = None
+
+    def remove_rule_pattern(self, rule_name, key, pattern, exception=False):
+        r"""Mirror the removal of a pattern's first occurrence from a rule list; returns False if absent"""
+        if exception and key == 'from':
+            pattern = pattern.lower()
+        removed = regroup = False
+        crules = self._named(rule_name)
+        for crule in crules:
+            slot = crule.slot(key, exception)
+            if slot is None:
+                continue
+            before = self._coalesce_key(crule)
+            pos = slot.remove_first(pattern)
+            if pos is None:
+                continue
+            removed = True
+            self._mirror(crule, key, exception, lambda group, index: group.discard(index, pos))
+            regroup |= self._coalesce_key(crule) != before
+        if removed:
+            self._record(CHANGE_EXCEPTION if exception else CHANGE_CONDITION, key, pattern)
+            if self._resort(key, crules) or regroup:
+                self._plan = None
+        return removed
+
+    def _mirror(self, crule, key, exception, apply):
+        r"""Apply an edit of crule's key list to its RuleGroup when that list is the one the group matches on"""
+        member = self._member.get(id(crule))
+        if member is not None and not exception and member[0].key == key:
+            apply(*member)
+
+    def _resort(self, key, crules):
+        r"""
+        A body list that became (non-)empty can move a rule under header_first_sort_key.
+
+        Returns:
+            bool: True if the rule order changed (recorded as a CHANGE_REORDER)
+        """
+        if key != 'body' or all(self._order_key(crule) == self._sort_keys[id(crule)] for crule in crules):
+            return False
+        order = [id(crule) for crule in self.rules]
+        self._sort()
+        if order == [id(crule) for crule in self.rules]:
+            return False
+        self._record(CHANGE_REORDER, None, None)
+        return True
+
+    def _sort(self):
+        self.rules.sort(key=self._order_key)
+        self._sort_keys = {id(crule): self._order_key(crule) for crule in self.rules}
+
+    def _order_key(self, crule):
+        # sorted(document, key=sort_key) is stable: ties keep document order, not the current order
+        return self.sort_key(crule.rule), self._position[id(crule)]
+
+    def changes_since(self, version):
+        r"""RulesetChanges made after version (oldest first), or None if they are no longer all logged"""
+        if version < self._changes_dropped:
+            return None
+        return self.changes[version - self._changes_dropped:]     # one change per version, starting at 1
+
+    def affects(self, message, since):
+        r"""
+        Could the changes made after version `since` change this message's verdict?
+
+        Appending or removing a pattern that does not match the message's token
+        for that list cannot change which pattern matches first, so only changes
+        whose pattern matches (or a rule reorder) count.
+        """
+        changes = self.changes_since(since)
+        if changes is None:
+            return True
+        if not changes:
+            return False
+        view = _PreparedView(message)
+        for change in changes:
+            if change.affects(view):
+                return True
+        return False
+
+    def evaluate(self, message):
+        r"""Return the verdict reference_evaluate() would return for this message"""
+        return self._evaluate_view(_PreparedView(message))
+
+    def evaluate_headers(self, message):
+        r"""
+        Evaluate without the body (message.body is ignored).
+
+        Returns:
+            dict: the same verdict evaluate() returns, or None when a rule reached
+                  before the verdict is final has a non-empty body condition or
+                  exception list (the caller fetches the body and calls evaluate())
+        """
+        try:
+            return self._evaluate_view(_PreparedView(message, with_body=False))
+        except _NeedsBody:
+            return None
+
+    def _count_hit(self, name):
+        with self._hits_lock:
+            self.hits[name] += 1
+
+    def _evaluate_view(self, view):
+        verdict = new_verdict()
+        safe_pat = self.safe_senders.first_match_header(view.from_tok, view.sender_tok)
+        if safe_pat is not None:
+            verdict["safe_sender"] = safe_pat
+            return verdict
+        try:
+            for crule in self.plan():
+                if isinstance(crule, RuleGroup):
+                    found = crule.first(view)
+                    if found is None:
+                        verdict["match"], verdict["rule_name"], verdict["matched_keyword"] = False, None, ""
+                        continue
+                    crule, matched_keyword = found
+                    verdict["match"], verdict["rule_name"], verdict["matched_keyword"] = True, crule.name, matched_keyword
+                    verdict["fired"].append((crule.name, matched_keyword))
+                    self._count_hit(crule.name)
+                    verdict["delete"] = True
+                    break
+                match, matched_keyword, exception_pat = crule.evaluate(view)
+                verdict["match"] = match
+                verdict["rule_name"] = crule.name if match else None
+                verdict["matched_keyword"] = matched_keyword if match else ""
+                if exception_pat is not None:
+                    verdict["suppressed"].append((crule.name, exception_pat))
+                if match:
+                    verdict["fired"].append((crule.name, matched_keyword))
+                    self._count_hit(crule.name)
+                    if crule.deletes:
+                        verdict["delete"] = True
+                        break
+        except _SlotError:
+            verdict["error"] = True
+        return verdict
+
+
+CHANGE_SAFE_SENDER = "safe_sender"
+CHANGE_CONDITION = "condition"
+CHANGE_EXCEPTION = "exception"
+CHANGE_REORDER = "reorder"
+
+MAX_CHANGE_LOG = 4096
+
+
+class RulesetChange:
+    r"""
+    One incremental change to a CompiledRuleset.
+
+    Attributes:
+        version: ruleset version after the change
+        target: CHANGE_SAFE_SENDER, CHANGE_CONDITION, CHANGE_EXCEPTION or CHANGE_REORDER
+        key: list the pattern went into ('from', 'subject', 'body', 'header')
+        pattern: the regex added or removed
+    """
+    __slots__ = ("version", "target", "key", "pattern", "compiled")
+
+    def __init__(self, version, target, key, pattern):
+        self.version = version
+        self.target = target
+        self.key = key
+        self.pattern = pattern
+        try:
+            self.compiled = re.compile(pattern, re.IGNORECASE) if pattern is not None else None
+        except re.error:
+            self.compiled = None
+
+    def affects(self, view):
+        if self.target == CHANGE_REORDER:
+            return True
+        if self.compiled is None:
+            return False        # invalid regexes are skipped, so they never match
+        if self.key == 'from':
+            return bool(self.compiled.search(view.sender_lower))
+        if self.key == 'subject':
+            return bool(self.compiled.search(view.subject))
+        if self.key == 'body':
+            return view.body is None or bool(self.compiled.search(view.body))
+        return any(self.compiled.search(tok) for tok in (view.from_tok, view.sender_tok) if tok)
+
+
+class VerdictCache:
+    r"""
+    Verdicts per message key, kept valid across incremental ruleset changes.
+
+    A cached verdict is re-evaluated only when a change made since it was computed
+    could affect that message (CompiledRuleset.affects); otherwise it is re-stamped
+    with the current version.
+
+    Args:
+        ruleset: CompiledRuleset
+    """
+
+    def __init__(self, ruleset):
+        self.ruleset = ruleset
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "invalidated": 0}
+        self._entries = {}      # key -> (version, verdict)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def evaluate(self, key, message):
+        r"""Verdict for message, cached under key (e.g. the EntryID or UID)"""
+        version = self.ruleset.version
+        entry = self._entries.get(key)
+        if entry is not None:
+            cached_version, verdict = entry
+            if cached_version == version:
+                self.stats["hits"] += 1
+                return verdict
+            if not self.ruleset.affects(message, cached_version):
+                self.stats["revalidated"] += 1
+                self._entries[key] = (version, verdict)
+                return verdict
+            self.stats["invalidated"] += 1
+        else:
+            self.stats["misses"] += 1
+        verdict = self.ruleset.evaluate(message)
+        self._entries[key] = (version, verdict)
+        return verdict
+
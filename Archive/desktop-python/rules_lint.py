@@ -0,0 +1,539 @@
+#!/usr/bin/env python3
+r"""
+Ruleset performance linter and explain-plan for rules.yaml / rules_safe_senders.yaml
+
+For every pattern, reports the matcher the compiled engine (rule_engine.py) gives it:
+
+    hash       '^literal$' on from/header: one dict lookup (PatternMatcher.exact)
+    suffix     '@domain.com$' forms: dict lookups per '.'/'@' position (PatternMatcher.tail)
+    literal    '@(?:[a-z0-9-]+\.)*label\.[a-z0-9.-]+$' forms: dict lookups per label (PatternMatcher.label)
+    prefilter  a regex with a literal every match contains (query_planner.required_terms), so a
+               store search or substring test can rule messages out before the regex runs
+    regex      a regex with no usable literal: searched against every message
+    invalid    does not compile (skipped by the engine, like _compile_pattern_list)
+
+Subject and body text has spaces and capitals, so the literal indexes never apply
+there: those patterns are planned as prefilter or regex.
+
+Findings:
+
+    invalid-regex      (error)   the pattern is silently ignored
+    double-at          (error)   a from/header pattern that needs two '@' can never match one address,
+                                 e.g. '^[^@\s]+@(?:[a-z0-9-]+\.)*@accountprotection\.microsoft\.com$'
+    rule-error         (error)   the pattern's rule cannot be evaluated (no 'exceptions' mapping, or a
+                                 list that is not a list of strings): every message that reaches it
+                                 gets an error verdict, so its plan never runs
+    backtracking-risk  (warning) an unbounded repeat of a group whose own unbounded repeat is not
+                                 followed by a character it cannot consume, e.g. '(\w+\s?)+$'
+    leading-dotstar    (warning) an unanchored leading '.*' / '.+': search() already scans every
+                                 start position, so the prefix only adds backtracking
+
+Every pattern is timed the way the engine runs it (a one-pattern PatternMatcher
+over a generated corpus, see differential_harness.generate_corpus), and findings
+carry that per-message cost.  backtracking-risk patterns are also timed on
+growing attack strings, stopping once one search takes longer than a budget.
+
+Usage:
+    python rules_lint.py --rules rules.yaml --safe-senders rules_safe_senders.yaml
+    python rules_lint.py --rules rules.yaml --findings-only
+    python rules_lint.py --rules rules.yaml --json > lint.json
+
+Exit code is 1 when any error finding is reported.
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from collections import Counter, namedtuple
+
+import yaml
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+from differential_harness import addresses_for_rules, generate_corpus
+from query_planner import required_terms
+from rule_engine import (
+    CONDITION_KEYS, MATCHER_EXACT, MATCHER_LABEL, MATCHER_TAIL,
+    CompiledRule, PatternMatcher, classify_pattern, header_from, rules_list_from, safe_senders_list_from,
+)
+
+PLAN_HASH = "hash"
+PLAN_SUFFIX = "suffix"
+PLAN_LITERAL = "literal"
+PLAN_PREFILTER = "prefilter"
+PLAN_REGEX = "regex"
+PLAN_INVALID = "invalid"
+PLANS = (PLAN_HASH, PLAN_SUFFIX, PLAN_LITERAL, PLAN_PREFILTER, PLAN_REGEX, PLAN_INVALID)
+_INDEX_PLANS = {MATCHER_EXACT: PLAN_HASH, MATCHER_TAIL: PLAN_SUFFIX, MATCHER_LABEL: PLAN_LITERAL}
+ADDRESS_KEYS = ("from", "header")     # matched against one address; safe senders use 'header'
+SAFE_SENDERS = "safe_senders"
+
+SEVERITY_ERROR = "error"
+SEVERITY_WARNING = "warning"
+FINDING_INVALID = "invalid-regex"
+FINDING_DOUBLE_AT = "double-at"
+FINDING_RULE_ERROR = "rule-error"
+FINDING_BACKTRACKING = "backtracking-risk"
+FINDING_LEADING_DOTSTAR = "leading-dotstar"
+
+DEFAULT_MESSAGES = 200
+DEFAULT_BODY_CHARS = 2000
+ATTACK_LENGTHS = (8, 12, 16, 20, 24)
+ATTACK_BUDGET_SECONDS = 0.05
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+if hasattr(sre_constants, "POSSESSIVE_REPEAT"):
+    _REPEATS.add(sre_constants.POSSESSIVE_REPEAT)
+_CHAR_OPS = {sre_constants.LITERAL, sre_constants.NOT_LITERAL, sre_constants.ANY, sre_constants.IN}
+_STARTS = {sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING}
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: str.isdigit,
+    sre_constants.CATEGORY_NOT_DIGIT: lambda c: not c.isdigit(),
+    sre_constants.CATEGORY_SPACE: str.isspace,
+    sre_constants.CATEGORY_NOT_SPACE: lambda c: not c.isspace(),
+    sre_constants.CATEGORY_WORD: lambda c: c.isalnum() or c == '_',
+    sre_constants.CATEGORY_NOT_WORD: lambda c: not (c.isalnum() or c == '_'),
+}
+# Characters tried when deciding whether two single-character items can match the same character
+_PROBE_CHARS = [chr(i) for i in range(1, 128)] + ["é", "ſ", "K", " "]
+
+PatternRef = namedtuple("PatternRef", "source key exception pattern rule_error")
+Finding = namedtuple("Finding", "code severity message")
+
+
+class PatternReport:
+    r"""
+    Plan, measured cost and findings for one pattern.
+
+    Attributes:
+        ref: PatternRef (source is the rule name, or SAFE_SENDERS)
+        plan: one of PLANS
+        terms: literal prefilter terms (any-of), or None
+        cost_us: measured microseconds per message, or None for invalid patterns
+        findings: list of Finding
+        detail: extra measurements for findings (text)
+    """
+    __slots__ = ("ref", "plan", "terms", "cost_us", "findings", "detail")
+
+    def __init__(self, ref, plan, terms=None):
+        self.ref = ref
+        self.plan = plan
+        self.terms = terms
+        self.cost_us = None
+        self.findings = []
+        self.detail = ""
+
+    @property
+    def slot(self):
+        if self.ref.source == SAFE_SENDERS:
+            return SAFE_SENDERS
+        return f"{'exceptions' if self.ref.exception else 'conditions'}.{self.ref.key}"
+
+    def as_dict(self):
+        return {"source": self.ref.source, "key": self.ref.key, "exception": self.ref.exception,
+                "pattern": self.ref.pattern, "plan": self.plan, "terms": list(self.terms or ()),
+                "cost_us": self.cost_us, "detail": self.detail,
+                "findings": [finding._asdict() for finding in self.findings]}
+
+
+#------------------Patterns and plans------------------
+
+def rule_error(rule):
+    r"""Why the engine cannot evaluate rule (it returns an error verdict on reaching it), or None"""
+    if 'actions' not in rule:
+        return None         # skipped by the engine, not an error
+    try:
+        crule = CompiledRule(rule)
+    except Exception as e:
+        return f"compiling it raises {type(e).__name__}"
+    if crule.error:
+        return "it has no 'conditions' and 'exceptions' mappings"
+    bad = []
+    for exception, name in ((False, "conditions"), (True, "exceptions")):
+        for key in CONDITION_KEYS:
+            try:
+                crule.slot(key, exception)
+            except ValueError:
+                bad.append(f"{name}.{key}")
+    return f"{', '.join(bad)} is not a list of strings" if bad else None
+
+
+def iter_patterns(rules_json, safe_senders):
+    r"""PatternRefs for every safe sender and every string in a rule's condition/exception lists"""
+    for pattern in safe_senders_list_from(safe_senders):
+        if isinstance(pattern, str):
+            yield PatternRef(SAFE_SENDERS, "header", False, pattern, None)
+    for rule in rules_list_from(rules_json):
+        if not isinstance(rule, dict):
+            continue
+        error = rule_error(rule)
+        for exception, container in ((False, rule.get("conditions")), (True, rule.get("exceptions"))):
+            if not isinstance(container, dict):
+                continue
+            for key in CONDITION_KEYS:
+                values = container.get(key)
+                if isinstance(values, list):
+                    for pattern in values:
+                        if isinstance(pattern, str):
+                            yield PatternRef(rule.get("name"), key, exception, pattern, error)
+
+
+def plan_pattern(key, pattern):
+    r"""
+    Returns:
+        tuple: (plan, prefilter terms or None)
+    """
+    try:
+        re.compile(pattern, re.IGNORECASE)
+    except re.error:
+        return PLAN_INVALID, None
+    if key in ADDRESS_KEYS:
+        kind, _ = classify_pattern(pattern)
+        if kind in _INDEX_PLANS:
+            return _INDEX_PLANS[kind], None
+    terms = required_terms(pattern)
+    return (PLAN_PREFILTER, terms) if terms else (PLAN_REGEX, None)
+
+
+#------------------Static checks------------------
+
+def _parse(pattern):
+    try:
+        return sre_parse.parse(pattern, re.IGNORECASE)
+    except (re.error, RecursionError):
+        return None
+
+
+def _accepts(item, ch):
+    r"""True if a single-character item (LITERAL, NOT_LITERAL, ANY, IN) matches ch, case-insensitively"""
+    op, av = item
+    folded = {ch, ch.lower(), ch.upper()}
+    if op is sre_constants.LITERAL:
+        return chr(av) in folded or chr(av).lower() in folded
+    if op is sre_constants.NOT_LITERAL:
+        return not (chr(av) in folded or chr(av).lower() in folded)
+    if op is sre_constants.ANY:
+        return ch != "\n"
+    negate, hit = False, False
+    for sub_op, sub_av in av:
+        if sub_op is sre_constants.NEGATE:
+            negate = True
+        elif sub_op is sre_constants.LITERAL:
+            hit = hit or chr(sub_av) in folded
+        elif sub_op is sre_constants.RANGE:
+            hit = hit or any(sub_av[0] <= ord(c) <= sub_av[1] for c in folded)
+        elif sub_op is sre_constants.CATEGORY:
+            test = _CATEGORIES.get(sub_av)
+            hit = hit or (test is not None and test(ch))
+    return hit != negate
+
+
+def _overlap(item_a, item_b):
+    return any(_accepts(item_a, c) and _accepts(item_b, c) for c in _PROBE_CHARS)
+
+
+def _single_char(items):
+    r"""The single-character item a repeat body consists of, or None"""
+    items = list(items)
+    if len(items) == 1 and items[0][0] in _CHAR_OPS:
+        return items[0]
+    return None
+
+
+def _next_char_item(items, start):
+    r"""
+    The next character a sequence must consume from position start.
+
+    Returns:
+        tuple: (single-char item or None, reached_end)
+    """
+    for op, av in items[start:]:
+        if op in _CHAR_OPS:
+            return (op, av), False
+        if op in _REPEATS:
+            lo, _, body = av
+            char = _single_char(body)
+            if lo >= 1:
+                return char, False
+            continue            # optional: look past it
+        if op is sre_constants.SUBPATTERN:
+            return _next_char_item(list(av[-1]), 0)[0], False
+        return None, False      # anchors at the end, branches, ...: treat as unguarded
+    return None, True
+
+
+def _unguarded_repeat(body):
+    r"""The single-char unbounded repeat inside an outer repeat's body that nothing stops from overlapping"""
+    items = list(body)
+    if len(items) == 1 and items[0][0] is sre_constants.SUBPATTERN:
+        items = list(items[0][1][-1])
+    for i, (op, av) in enumerate(items):
+        if op not in _REPEATS or av[1] != sre_constants.MAXREPEAT:
+            continue
+        char = _single_char(av[2])
+        if char is None:
+            continue
+        following, reached_end = _next_char_item(items, i + 1)
+        if reached_end:
+            following, _ = _next_char_item(items, 0)      # the outer repeat starts its body again
+        if following is None or _overlap(char, following):
+            return char
+    return None
+
+
+def backtracking_risk(parsed):
+    r"""
+    Nested unbounded repeats that can split the same text in many ways ('(a+)+', '(\w+\s?)*').
+
+    The repo's usual '(?:[a-z0-9-]+\.)*' is not flagged: the inner repeat cannot consume '.'.
+
+    Returns:
+        the risky inner single-character item, or None
+    """
+    for op, av in parsed:
+        if op in _REPEATS:
+            lo, hi, body = av
+            if hi == sre_constants.MAXREPEAT:
+                char = _unguarded_repeat(body)
+                if char is not None:
+                    return char
+            found = backtracking_risk(body)
+        elif op is sre_constants.SUBPATTERN:
+            found = backtracking_risk(av[-1])
+        elif op is sre_constants.BRANCH:
+            found = next((f for f in (backtracking_risk(b) for b in av[1]) if f is not None), None)
+        else:
+            found = None
+        if found is not None:
+            return found
+    return None
+
+
+def leading_dotstar(parsed):
+    r"""True if the pattern starts with '.*' or '.+' and is not anchored with '^'"""
+    items = list(parsed)
+    if not items:
+        return False
+    op, av = items[0]
+    if op is sre_constants.AT and av in _STARTS:
+        return False
+    return op in _REPEATS and _single_char(av[2]) is not None and _single_char(av[2])[0] is sre_constants.ANY
+
+
+def required_at_signs(items):
+    r"""Number of '@' characters every match must contain (mandatory path only)"""
+    count = 0
+    for op, av in items:
+        if op is sre_constants.LITERAL and av == ord('@'):
+            count += 1
+        elif op is sre_constants.SUBPATTERN:
+            count += required_at_signs(av[-1])
+        elif op in _REPEATS and av[0] >= 1:
+            count += av[0] * required_at_signs(av[2])
+        elif op is sre_constants.BRANCH:
+            count += min(required_at_signs(branch) for branch in av[1])
+    return count
+
+
+def static_findings(ref, plan):
+    r"""Findings that need no measurement"""
+    findings = []
+    if ref.rule_error:
+        findings.append(Finding(FINDING_RULE_ERROR, SEVERITY_ERROR,
+                                f"the rule cannot be evaluated ({ref.rule_error}); the engine returns an error "
+                                "verdict instead, so this plan never runs"))
+    if plan == PLAN_INVALID:
+        return findings + [Finding(FINDING_INVALID, SEVERITY_ERROR, "does not compile; the engine skips it")], None
+    parsed = _parse(ref.pattern)
+    if parsed is None:
+        return findings, None
+    if ref.key in ADDRESS_KEYS:
+        ats = required_at_signs(parsed)
+        if ats >= 2:
+            findings.append(Finding(FINDING_DOUBLE_AT, SEVERITY_ERROR,
+                                    f"every match needs {ats} '@' but {ref.key} text is one address: never matches"))
+    risky = backtracking_risk(parsed)
+    if risky is not None:
+        findings.append(Finding(FINDING_BACKTRACKING, SEVERITY_WARNING,
+                                "nested unbounded repeats can backtrack exponentially on a near-miss"))
+    if leading_dotstar(parsed):
+        findings.append(Finding(FINDING_LEADING_DOTSTAR, SEVERITY_WARNING,
+                                "unanchored leading '.*' adds backtracking at every start position; search() "
+                                "already scans, so drop it"))
+    return findings, risky
+
+
+#------------------Measurement------------------
+
+def corpus_texts(messages, body_chars=DEFAULT_BODY_CHARS):
+    r"""Per condition key, the texts the engine passes to PatternMatcher for each message"""
+    texts = {"from": [], "subject": [], "body": [], "header": []}
+    for message in messages:
+        texts["from"].append(message.sender.lower())
+        texts["subject"].append(message.subject)
+        body = message.body
+        if body_chars and body:
+            body = (body + " ") * (body_chars // (len(body) + 1) + 1)
+            body = body[:body_chars]
+        texts["body"].append(body)
+        texts["header"].append(((header_from(message.header) or "").strip().lower(),
+                                (message.sender or "").strip().lower()))
+    return texts
+
+
+def measure(key, pattern, texts):
+    r"""Microseconds per message for a one-pattern PatternMatcher, called as CompiledRule does"""
+    matcher = PatternMatcher([pattern])
+    samples = texts[key]
+    if not samples:
+        return 0.0
+    started = time.perf_counter()
+    if key == "header":
+        for from_tok, sender_tok in samples:
+            matcher.first_match_header(from_tok, sender_tok)
+    else:
+        for text in samples:
+            matcher.first_match(text)
+    return (time.perf_counter() - started) * 1e6 / len(samples)
+
+
+def attack_ladder(pattern, char_item, lengths=ATTACK_LENGTHS, budget=ATTACK_BUDGET_SECONDS):
+    r"""
+    Time one search on '<c>' * n + '<fail>' for growing n (c accepted by the risky repeat).
+
+    Returns:
+        list: (n, microseconds), stopping after the first search over budget
+    """
+    compiled = re.compile(pattern, re.IGNORECASE)
+    char = next((c for c in "a1-_. " + "".join(_PROBE_CHARS) if _accepts(char_item, c)), "a")
+    fail = next((c for c in "!\n\x00#" if not _accepts(char_item, c)), "!")
+    timings = []
+    for n in lengths:
+        text = char * n + fail
+        started = time.perf_counter()
+        compiled.search(text)
+        elapsed = time.perf_counter() - started
+        timings.append((n, elapsed * 1e6))
+        if elapsed > budget:
+            break
+    return timings
+
+
+def _strip_leading_dotstar(pattern):
+    m = re.match(r'^(?:\(\?[aiLmsux]+\))?\.[*+]\??', pattern)
+    return pattern[:m.start()] + pattern[m.end():] if m else pattern
+
+
+#------------------Lint------------------
+
+def lint_ruleset(rules_json, safe_senders, message_count=DEFAULT_MESSAGES, seed=1, body_chars=DEFAULT_BODY_CHARS):
+    r"""
+    Plan, measure and check every pattern.
+
+    Returns:
+        list: PatternReport per pattern, in file order (safe senders first)
+    """
+    rng = random.Random(seed)
+    messages = generate_corpus(rng, message_count, addresses_for_rules(rules_json, safe_senders))
+    texts = corpus_texts(messages, body_chars)
+    reports = []
+    for ref in iter_patterns(rules_json, safe_senders):
+        plan, terms = plan_pattern(ref.key, ref.pattern)
+        report = PatternReport(ref, plan, terms)
+        report.findings, risky = static_findings(ref, plan)
+        if plan != PLAN_INVALID:
+            pattern = ref.pattern.lower() if ref.exception and ref.key == "from" else ref.pattern
+            if risky is None:
+                report.cost_us = measure(ref.key, pattern, texts)
+            else:
+                # Corpus texts truncated so a catastrophic pattern cannot stall the lint
+                short = {key: [t if isinstance(t, tuple) else t[:ATTACK_LENGTHS[-1]] for t in values]
+                         for key, values in texts.items()}
+                report.cost_us = measure(ref.key, pattern, short)
+                ladder = attack_ladder(pattern, risky)
+                report.detail = "attack strings: " + ", ".join(f"{n} chars {us:.1f} us" for n, us in ladder)
+            if any(f.code == FINDING_LEADING_DOTSTAR for f in report.findings):
+                stripped = _strip_leading_dotstar(pattern)
+                if stripped != pattern:
+                    without = f"{measure(ref.key, stripped, texts):.2f} us/msg without the leading '.*'"
+                    report.detail = f"{report.detail}; {without}" if report.detail else without
+        reports.append(report)
+    return reports
+
+
+def summary_lines(reports):
+    counts = Counter(report.plan for report in reports)
+    lines = [f"Explain plan: {len(reports)} patterns (" +
+             ", ".join(f"{plan} {counts.get(plan, 0)}" for plan in PLANS) + ")"]
+    unevaluable = sum(1 for report in reports if report.ref.rule_error)
+    if unevaluable:
+        lines.append(f"[WARN] {unevaluable} of {len(reports)} patterns are in rules the engine cannot evaluate "
+                     f"({FINDING_RULE_ERROR} findings): their plans never run")
+    total = sum(report.cost_us or 0.0 for report in reports)
+    lines.append(f"Measured cost: {total:.1f} us per message if every pattern ran alone "
+                 f"(prefilter/regex: {sum(r.cost_us or 0.0 for r in reports if r.plan in (PLAN_PREFILTER, PLAN_REGEX)):.1f} us)")
+    return lines
+
+
+def plan_lines(reports):
+    lines = []
+    for report in reports:
+        cost = "-" if report.cost_us is None else f"{report.cost_us:.2f}"
+        terms = f"  terms {list(report.terms)}" if report.terms else ""
+        lines.append(f"{report.plan:<9} {cost:>8} us/msg  {report.ref.source} {report.slot}: "
+                     f"{report.ref.pattern}{terms}")
+    return lines
+
+
+def finding_lines(reports):
+    found = [(finding, report) for report in reports for finding in report.findings]
+    errors = sum(1 for finding, _ in found if finding.severity == SEVERITY_ERROR)
+    lines = [f"Findings: {len(found)} ({errors} errors, {len(found) - errors} warnings)"]
+    found.sort(key=lambda pair: (pair[0].severity != SEVERITY_ERROR, -(pair[1].cost_us or 0.0)))
+    for finding, report in found:
+        cost = "not run" if report.cost_us is None else f"{report.cost_us:.2f} us/msg"
+        lines.append(f"[{finding.severity}] {finding.code}  {report.ref.source} {report.slot}: {report.ref.pattern}")
+        lines.append(f"    {cost}; {finding.message}" + (f" ({report.detail})" if report.detail else ""))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Explain how each rule pattern is matched and flag slow or dead patterns')
+    parser.add_argument('--rules', default='rules.yaml', help='rules.yaml to lint')
+    parser.add_argument('--safe-senders', help='rules_safe_senders.yaml to lint with --rules')
+    parser.add_argument('--messages', type=int, default=DEFAULT_MESSAGES, help='Generated messages to time each pattern on')
+    parser.add_argument('--body-chars', type=int, default=DEFAULT_BODY_CHARS, help='Body length of the generated messages')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--findings-only', action='store_true', help='Skip the per-pattern plan')
+    parser.add_argument('--json', action='store_true', help='Print every report as JSON instead of text')
+    args = parser.parse_args(argv)
+
+    with open(args.rules, 'r', encoding='utf-8') as f:
+        rules_json = yaml.safe_load(f) or {"rules": []}
+    safe_senders = {"safe_senders": []}
+    if args.safe_senders:
+        with open(args.safe_senders, 'r', encoding='utf-8') as f:
+            safe_senders = yaml.safe_load(f) or {"safe_senders": []}
+
+    reports = lint_ruleset(rules_json, safe_senders, args.messages, args.seed, args.body_chars)
+    errors = sum(1 for report in reports for finding in report.findings if finding.severity == SEVERITY_ERROR)
+    if args.json:
+        print(json.dumps([report.as_dict() for report in reports], indent=1))
+    else:
+        lines = summary_lines(reports)
+        if not args.findings_only:
+            lines += plan_lines(reports)
+        lines += finding_lines(reports)
+        print("\n".join(lines))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,390 @@
+r"""
+Checkpoint journal for resumable scans in withOutlookRulesYAML.py.
+
+A first pass over a large Bulk Mail folder can run for hours.  If it dies
+halfway (a COM error, Outlook closing, a reboot), the next run fetched and
+evaluated every message again, and the actions committed before the crash were
+only skipped because those messages had already left the folder.
+
+ScanJournal appends one JSON line per checkpoint to a journal file next to the
+logs:
+
+    {"type": "scan", "scan_id": ..., "params": {...}}          one per scan
+    {"type": "chunk", "processed": [ids], "intents": [...],     before each commit
+     "info": {id: {...}}}
+    {"type": "done", "ids": [ids]}                             after each commit
+    {"type": "finished"}                                       end of the first pass
+
+The chunk line is written (and fsync'ed) before OutlookActionQueue commits the
+chunk, so it is a write-ahead record: each intent holds what one message should
+end up as (properties, flag clear, move target by EntryID, delete).  The done
+line lists the messages whose commit finished (or was given up on).  "info" keeps
+the scan result (match, phishing indicators, header) of the messages the report
+and the interactive updates (-u) look at: those that matched no rule or showed
+phishing indicators.  A crash loses at most the messages evaluated since the last
+chunk; they are evaluated again.  A torn last line is ignored.
+
+With --resume the journal of an unfinished scan is read back:
+
+  - messages listed as processed are not evaluated again; the ones with an info
+    entry are handed back with that info (split_processed), so the report and -u
+    still include them although the interrupted run never got that far;
+  - intents without a done entry are replayed through the action queue, but only
+    for messages still in their source folder.  A message that was already moved
+    or deleted is left alone, so a replay never moves or deletes twice (deleting
+    from Deleted Items would be permanent).  Setting properties again is harmless.
+
+The scan keeps the ReceivedTime cutoff of the interrupted run, so "the last N
+days" does not shift between the two runs.  Only the first pass is journaled:
+the second pass re-reads the folders after the interactive updates and is cheap
+to run again.
+
+Usage:
+    journal = ScanJournal.resume(path, params, log) or ScanJournal.start(path, params, log)
+    journal.replay(namespace, action_queue)
+    action_queue.journal = journal
+    ...
+    journal.mark_processed(email, info) # after each email's actions are queued
+    ...
+    action_queue.flush(); journal.finish()
+"""
+
+import json
+import os
+import time
+import uuid
+
+SCAN_JOURNAL_VERSION = 1
+RECORD_SCAN = "scan"
+RECORD_CHUNK = "chunk"
+RECORD_DONE = "done"
+RECORD_FINISHED = "finished"
+
+
+def new_journal_stats():
+    return {"chunks": 0, "processed": 0, "resumed_skipped": 0, "restored": 0, "replayed": 0, "replay_skipped": 0}
+
+
+def message_id(email):
+    r"""EntryID of a MailItem or TableMailItem, or None"""
+    try:
+        return email.EntryID or None
+    except Exception:
+        return None
+
+
+def folder_ref(folder):
+    r"""{"name", "entry_id", "store_id"} of a MAPIFolder (ids None when the folder has none)"""
+    ref = {"name": getattr(folder, "Name", None), "entry_id": None, "store_id": None}
+    try:
+        ref["entry_id"] = folder.EntryID
+        ref["store_id"] = folder.StoreID
+    except Exception:
+        pass
+    return ref
+
+
+def scan_result(info):
+    r"""
+    The part of an emails_added_info entry worth journaling: only for emails the report or -u include.
+
+    Returns:
+        dict: {"match", "phishing_indicators", "email_header"}, or None for a matched email without indicators
+    """
+    if not info or not info.get("processed"):
+        return None
+    indicators = info.get("phishing_indicators")
+    if info.get("match") is not False and not indicators:
+        return None
+    return {"match": bool(info.get("match")),
+            "phishing_indicators": [str(i) for i in indicators] if indicators is not None else None,
+            "email_header": info.get("email_header") or ""}
+
+
+def read_records(path):
+    r"""
+    Records of a journal file, stopping at the first unreadable line (a write cut short by a crash).
+
+    Returns:
+        list: dicts, in file order ([] when the file does not exist)
+    """
+    records = []
+    if not path or not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not isinstance(record, dict):
+                break
+            records.append(record)
+    return records
+
+
+class ScanJournal:
+    r"""
+    Append-only checkpoint journal of one scan.
+
+    Use ScanJournal.start() for a new scan and ScanJournal.resume() to continue one.
+
+    Args:
+        path: journal file (None keeps the journal in memory only)
+        params: scan parameters (account, folders, cutoff, rules digest); compared on resume
+        log: callable(message, level="INFO"), e.g. OutlookSecurityAgent.log_print
+        scan_id: id of the scan (new one when None)
+
+    Attributes:
+        processed: ids of the messages already evaluated (in this or the interrupted run)
+        pending: id -> intent of the messages whose commit is not known to have finished
+        results: id -> scan_result() of processed messages the report and -u need
+        folders: folder name -> folder_ref(), for the source folders of the scan
+    """
+
+    def __init__(self, path, params, log=None, scan_id=None):
+        self.path = path
+        self.params = params
+        self.log = log or (lambda message, level="INFO": None)
+        self.scan_id = scan_id or uuid.uuid4().hex
+        self.stats = new_journal_stats()
+        self.processed = set()
+        self.pending = {}
+        self.results = {}
+        self.folders = {ref["name"]: ref for ref in params.get("folders", [])}
+        self.finished = False
+        self._buffer = []               # processed ids not yet written
+        self._buffer_results = {}       # their scan results
+
+    # --- opening
+
+    @classmethod
+    def start(cls, path, params, log=None):
+        r"""New scan: replaces any previous journal"""
+        journal = cls(path, params, log)
+        journal._write([{"type": RECORD_SCAN, "version": SCAN_JOURNAL_VERSION, "scan_id": journal.scan_id,
+                         "started": time.strftime('%Y-%m-%d %H:%M:%S'), "params": params}], truncate=True)
+        return journal
+
+    @classmethod
+    def resume(cls, path, params, log=None):
+        r"""
+        Continue the unfinished scan in path.
+
+        Args:
+            params: parameters of the new run; "account" and the folder names must match the journal's.
+                A different rules digest is logged and the scan continues with the new rules.
+
+        Returns:
+            ScanJournal with the journal's params (keep its "since" cutoff), or None when there is nothing to resume
+        """
+        log = log or (lambda message, level="INFO": None)
+        try:
+            records = read_records(path)
+        except OSError as e:
+            log(f"Cannot read scan journal {path}: {e}")
+            return None
+        if not records or records[0].get("type") != RECORD_SCAN or records[0].get("version") != SCAN_JOURNAL_VERSION:
+            log(f"No scan to resume in {path}")
+            return None
+        header = records[0]
+        old = header.get("params", {})
+        if old.get("account") != params.get("account") or \
+                [f["name"] for f in old.get("folders", [])] != [f["name"] for f in params.get("folders", [])]:
+            log(f"Scan journal {path} is for {old.get('account')} {[f['name'] for f in old.get('folders', [])]}, "
+                f"not this run; starting a new scan")
+            return None
+        journal = cls(path, old, log, header.get("scan_id"))
+        for record in records[1:]:
+            kind = record.get("type")
+            if kind == RECORD_CHUNK:
+                journal.processed.update(record.get("processed", []))
+                journal.results.update(record.get("info", {}))
+                for intent in record.get("intents", []):
+                    journal.processed.add(intent["id"])
+                    journal.pending[intent["id"]] = intent
+            elif kind == RECORD_DONE:
+                for done_id in record.get("ids", []):
+                    journal.pending.pop(done_id, None)
+            elif kind == RECORD_FINISHED:
+                journal.finished = True
+        if journal.finished:
+            log(f"Scan {journal.scan_id} in {path} already finished; starting a new scan")
+            return None
+        if old.get("rules") != params.get("rules"):
+            log(f"Rules changed since scan {journal.scan_id} was interrupted; "
+                f"the {len(journal.processed)} messages already processed are not re-evaluated")
+        log(f"Resuming scan {journal.scan_id} (started {header.get('started')}): "
+            f"{len(journal.processed)} messages already processed, {len(journal.pending)} commit(s) to replay")
+        return journal
+
+    # --- recording
+
+    def is_processed(self, email):
+        return message_id(email) in self.processed
+
+    def split_processed(self, emails, infos):
+        r"""
+        Separate the emails the interrupted run already processed.
+
+        The processed emails with a journaled scan result get it back in their info (processed = True),
+        so the report and the interactive updates see them without evaluating them again.
+
+        Args:
+            emails: list of emails
+            infos: parallel list of per-email info dicts
+
+        Returns:
+            tuple: (emails, infos) still to process, (emails, infos) restored from the journal
+        """
+        if not self.processed:
+            return emails, infos, [], []
+        todo, done = [], []
+        for email, info in zip(emails, infos):
+            if not self.is_processed(email):
+                todo.append((email, info))
+                continue
+            result = self.results.get(message_id(email))
+            if result is not None:
+                info.update(result, processed=True)
+                done.append((email, info))
+        self.stats["resumed_skipped"] += len(emails) - len(todo)
+        self.stats["restored"] += len(done)
+        return [e for e, _ in todo], [i for _, i in todo], [e for e, _ in done], [i for _, i in done]
+
+    @property
+    def buffered(self):
+        r"""Number of processed messages not yet written"""
+        return len(self._buffer)
+
+    def mark_processed(self, email, info=None):
+        r"""
+        Record that an email was evaluated and its actions (if any) are queued.
+
+        Args:
+            info: the email's emails_added_info entry; its scan_result() is journaled for a resumed run
+        """
+        entry_id = message_id(email)
+        if entry_id is not None and entry_id not in self.processed:
+            self.processed.add(entry_id)
+            self._buffer.append(entry_id)
+            result = scan_result(info)
+            if result is not None:
+                self.results[entry_id] = self._buffer_results[entry_id] = result
+            self.stats["processed"] += 1
+
+    def checkpoint(self, changes):
+        r"""
+        Write-ahead record of a chunk, called by OutlookActionQueue.flush() before committing it.
+
+        Args:
+            changes: outlook_actions.PendingChange objects about to be committed
+        """
+        intents = [intent for intent in (self._intent(change) for change in changes) if intent is not None]
+        if not intents and not self._buffer:
+            return
+        for intent in intents:
+            self.processed.add(intent["id"])
+            self.pending[intent["id"]] = intent
+        record = {"type": RECORD_CHUNK, "processed": self._buffer, "intents": intents}
+        if self._buffer_results:
+            record["info"] = self._buffer_results
+        self._write([record])
+        self._buffer = []
+        self._buffer_results = {}
+        self.stats["chunks"] += 1
+
+    def committed(self, changes):
+        r"""Record the changes whose commit finished or was given up on"""
+        ids = [entry_id for entry_id in (message_id(change.email) for change in changes)
+               if entry_id is not None and self.pending.pop(entry_id, None) is not None]
+        if ids:
+            self._write([{"type": RECORD_DONE, "ids": ids}])
+
+    def finish(self):
+        r"""Mark the first pass complete; a later --resume starts a new scan"""
+        self.checkpoint([])
+        self._write([{"type": RECORD_FINISHED}])
+        self.finished = True
+
+    def _intent(self, change):
+        entry_id = message_id(change.email)
+        if entry_id is None:
+            return None
+        return {"id": entry_id, "folder": change.folder,
+                "properties": {name: _json_value(value) for name, value in change.properties.items()},
+                "clear_flag": change.clear_flag, "delete": change.delete,
+                "move_to": folder_ref(change.move_to) if change.move_to is not None else None}
+
+    def _write(self, records, truncate=False):
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'w' if truncate else 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, sort_keys=True) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            self.log(f"Could not write scan journal {self.path}: {e}")
+
+    # --- replay
+
+    def replay(self, namespace, queue):
+        r"""
+        Queue again the changes of the interrupted run that may not have been committed.
+
+        A change is replayed only while its message is still in its source folder, so
+        a move or delete that did finish is never repeated.
+
+        Args:
+            namespace: Outlook MAPI Namespace (GetItemFromID, GetFolderFromID)
+            queue: OutlookActionQueue; the caller flushes it
+
+        Returns:
+            int: number of messages queued again
+        """
+        replayed = 0
+        for entry_id, intent in list(self.pending.items()):
+            source = self.folders.get(intent.get("folder")) or {}
+            try:
+                email = namespace.GetItemFromID(entry_id, source.get("store_id"))
+                in_source = email.Parent.EntryID == source.get("entry_id")
+            except Exception as e:
+                self.log(f"Replay: message {entry_id[:16]}... no longer opens ({e}); skipped", "DEBUG")
+                in_source = False
+            if not in_source:
+                self.pending.pop(entry_id)
+                self.stats["replay_skipped"] += 1
+                continue
+            move_to = None
+            if intent.get("move_to") and not intent.get("delete"):
+                try:
+                    move_to = namespace.GetFolderFromID(intent["move_to"]["entry_id"], intent["move_to"]["store_id"])
+                except Exception as e:
+                    self.log(f"Replay: target folder {intent['move_to'].get('name')} no longer opens: {e}")
+            queue.folder = intent.get("folder")
+            for name, value in intent.get("properties", {}).items():
+                if name == "UnRead":
+                    queue.mark_read(email)
+                else:
+                    queue.set_property(email, name, value)
+            if intent.get("clear_flag"):
+                queue.clear_flag(email)
+            if intent.get("delete"):
+                queue.delete(email)
+            elif move_to is not None:
+                queue.move(email, move_to)
+            replayed += 1
+        self.stats["replayed"] += replayed
+        return replayed
+
+
+def _json_value(value):
+    r"""Property values as JSON (TaskDueDate may be a datetime)"""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
@@ -0,0 +1,337 @@
+r"""
+Pooled, logged-in sessions for the network mail backends.
+
+A fresh ImapBackend or GmailApiClient used to open (and log in on) its own
+connection, so every backend built for another folder pass, the second pass or
+another account paid the TCP/TLS and LOGIN handshake again.  A SessionPool keeps
+those connections alive between uses:
+
+  - sessions are keyed by account (imap_session_key / http_session_key); an idle
+    session for the key is handed out before a new one is opened;
+  - the pool is bounded (max_size sessions across all keys).  When it is full, the
+    least recently used idle session of another key is closed to make room, and
+    otherwise acquire() waits for a release;
+  - sessions idle for longer than idle_timeout are closed (evict_idle(), also run on
+    every acquire), and a session idle for longer than check_after is health checked
+    (IMAP NOOP, or a non-blocking peek at the HTTP socket) before it is reused;
+  - prewarm() opens sessions on a background thread, so the login happens while
+    other work runs instead of in front of the first folder;
+  - each session carries a state dict the backend keeps per connection (the IMAP
+    selected folder and folder list, the Gmail label map).
+
+The pool is thread safe: concurrent scans of several accounts can share one.
+
+Usage:
+    pool = SessionPool(max_size=4)
+    first = ImapBackend(host, port, user, password, pool=pool)
+    ...
+    first.close()                                           # the session goes back to the pool
+    second = ImapBackend(host, port, user, password, pool=pool)   # no new LOGIN
+"""
+
+import select
+import threading
+import time
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_TIMEOUT = 300      # seconds; many IMAP servers drop idle clients after 30 minutes
+DEFAULT_CHECK_AFTER = 30        # seconds idle before a reused session is health checked
+
+
+def new_pool_stats():
+    return {"created": 0, "reused": 0, "health_failures": 0, "evicted_idle": 0, "evicted_full": 0,
+            "waits": 0, "discarded": 0}
+
+
+def imap_session_key(host, port, user, use_ssl):
+    return ("imap", host, port, user, bool(use_ssl))
+
+
+def http_session_key(scheme, netloc, token):
+    return ("http", scheme, netloc, token)
+
+
+def imap_noop(conn):
+    r"""Health check for an imaplib connection"""
+    return conn.noop()[0] == 'OK'
+
+
+def imap_logout(conn):
+    conn.logout()
+
+
+def http_alive(conn):
+    r"""
+    Health check for an http.client connection without a round trip.
+
+    A keep-alive socket with something to read while no request is outstanding
+    has been closed (or reset) by the server.
+    """
+    sock = getattr(conn, "sock", None)
+    if sock is None:
+        return True     # http.client connects on the next request
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return False
+    return not readable
+
+
+class PooledSession:
+    r"""
+    One pooled connection.
+
+    Attributes:
+        key: account key it was opened for
+        conn: the connection object the connect callable returned
+        state: per-connection dict the backend caches into (selected folder, ...)
+        uses: number of times it has been acquired
+    """
+
+    def __init__(self, key, conn, check=None, disconnect=None, clock=time.monotonic):
+        self.key = key
+        self.conn = conn
+        self.check = check
+        self.disconnect = disconnect
+        self.state = {}
+        self.uses = 0
+        self.created = self.last_used = clock()
+
+    def close(self):
+        if self.disconnect is not None:
+            try:
+                self.disconnect(self.conn)
+            except Exception:
+                pass
+        self.conn = None
+
+
+class SessionPool:
+    r"""
+    Bounded pool of logged-in sessions keyed by account.
+
+    Args:
+        max_size: most sessions open at once, across all keys
+        idle_timeout: idle sessions older than this (seconds) are closed
+        check_after: idle sessions older than this (seconds) are health checked before reuse
+        clock: idle-time clock, injectable for tests (waits for a free slot use real time)
+    """
+
+    def __init__(self, max_size=DEFAULT_POOL_SIZE, idle_timeout=DEFAULT_IDLE_TIMEOUT, check_after=DEFAULT_CHECK_AFTER,
+                 clock=time.monotonic):
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.clock = clock
+        self.stats = new_pool_stats()
+        self._idle = []                 # PooledSession, least recently used first
+        self._in_use = set()
+        self._opening = {}              # key -> sessions being opened
+        self._prewarming = {}           # key -> prewarm threads still running
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        with self._cond:
+            return len(self._idle) + len(self._in_use) + sum(self._opening.values())
+
+    @property
+    def idle_count(self):
+        with self._cond:
+            return len(self._idle)
+
+    # --- acquire / release
+
+    def acquire(self, key, connect, check=None, disconnect=None, timeout=None):
+        r"""
+        Hand out a session for key: a healthy idle one if there is one, else a new one.
+
+        Args:
+            key: account key (imap_session_key / http_session_key)
+            connect: callable returning a new logged-in connection
+            check: callable(conn) -> bool, run on sessions idle for longer than check_after
+            disconnect: callable(conn) closing a connection (errors are ignored)
+            timeout: seconds to wait when the pool is full (None waits forever)
+
+        Returns:
+            PooledSession: pass it back to release()
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            to_close = []
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise RuntimeError("session pool is closed")
+                    to_close += self._evict_idle_locked()
+                    session = self._take_idle_locked(key)
+                    if session is not None:
+                        break
+                    # A prewarm for this key is logging in: wait for it rather than log in twice
+                    if not self._prewarming.get(key) and self._make_room_locked(to_close):
+                        self._opening[key] = self._opening.get(key, 0) + 1
+                        break
+                    self._wait_locked(deadline, key)
+            self._close_all(to_close)
+            if session is None:
+                return self._hand_out(self._open(key, connect, check, disconnect))
+            if self._healthy(session):
+                return self._hand_out(session)
+
+    def release(self, session, discard=False):
+        r"""Return a session; discard=True closes it instead (e.g. after a protocol error)"""
+        with self._cond:
+            self._in_use.discard(session)
+            keep = not (discard or self._closed or session.conn is None)
+            if keep:
+                session.last_used = self.clock()
+                self._idle.append(session)
+            elif discard:
+                self.stats["discarded"] += 1
+            self._cond.notify_all()
+        if not keep:
+            session.close()
+
+    def prewarm(self, key, connect, check=None, disconnect=None, count=1):
+        r"""
+        Open up to count sessions for key on a background thread (the pool bound still applies).
+
+        Returns:
+            threading.Thread: already started; join() it to wait for the logins
+        """
+        with self._cond:
+            self._prewarming[key] = self._prewarming.get(key, 0) + 1
+
+        def _run():
+            try:
+                for _ in range(count):
+                    to_close = []
+                    with self._cond:
+                        room = not self._closed and self._make_room_locked(to_close)
+                        if room:
+                            self._opening[key] = self._opening.get(key, 0) + 1
+                    self._close_all(to_close)
+                    if not room:
+                        break
+                    self.release(self._open(key, connect, check, disconnect))
+            except Exception:
+                pass            # the first acquire() opens (and reports) its own session
+            finally:
+                with self._cond:
+                    self._prewarming[key] -= 1
+                    if not self._prewarming[key]:
+                        del self._prewarming[key]
+                    self._cond.notify_all()
+
+        thread = threading.Thread(target=_run, name=f"prewarm-{key[0]}", daemon=True)
+        thread.start()
+        return thread
+
+    def evict_idle(self):
+        r"""Close idle sessions older than idle_timeout; returns how many were closed"""
+        with self._cond:
+            stale = self._evict_idle_locked()
+        self._close_all(stale)
+        return len(stale)
+
+    def close(self):
+        r"""Close every idle session; sessions still in use are closed when released"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        self._close_all(idle)
+
+    # --- internals (the *_locked ones run under self._cond)
+
+    @staticmethod
+    def _close_all(sessions):
+        r"""Outside the lock: closing is a LOGOUT round trip"""
+        for session in sessions:
+            session.close()
+
+    def _take_idle_locked(self, key):
+        for i in range(len(self._idle) - 1, -1, -1):
+            if self._idle[i].key == key:
+                session = self._idle.pop(i)
+                self._in_use.add(session)
+                return session
+        return None
+
+    def _make_room_locked(self, to_close):
+        r"""True if one more session fits, closing (via to_close) the least recently used idle one if needed"""
+        total = len(self._idle) + len(self._in_use) + sum(self._opening.values())
+        if total < self.max_size:
+            return True
+        if self._idle:
+            to_close.append(self._idle.pop(0))
+            self.stats["evicted_full"] += 1
+            return True
+        return False
+
+    def _wait_locked(self, deadline, key):
+        self.stats["waits"] += 1
+        if deadline is None:
+            self._cond.wait()
+            return
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"no session for {key!r} within the timeout (pool size {self.max_size})")
+        self._cond.wait(remaining)
+
+    def _evict_idle_locked(self):
+        if self.idle_timeout is None:
+            return []
+        now = self.clock()
+        keep, stale = [], []
+        for session in self._idle:
+            (stale if now - session.last_used > self.idle_timeout else keep).append(session)
+        self._idle = keep
+        self.stats["evicted_idle"] += len(stale)
+        return stale
+
+    def _healthy(self, session):
+        r"""Not under the lock: a NOOP is a round trip"""
+        if session.check is None or self.clock() - session.last_used <= self.check_after:
+            return True
+        try:
+            healthy = bool(session.check(session.conn))
+        except Exception:
+            healthy = False
+        if not healthy:
+            with self._cond:
+                self.stats["health_failures"] += 1
+                self._in_use.discard(session)
+                self._cond.notify_all()
+            session.close()
+        return healthy
+
+    def _open(self, key, connect, check, disconnect):
+        r"""Not under the lock: connect() is the handshake"""
+        try:
+            conn = connect()
+        except BaseException:
+            with self._cond:
+                self._done_opening_locked(key)
+            raise
+        session = PooledSession(key, conn, check, disconnect, self.clock)
+        with self._cond:
+            # one critical section: a waiter must never see the slot free
+            # between "no longer opening" and "now in use"
+            self.stats["created"] += 1
+            self._in_use.add(session)
+            self._done_opening_locked(key)
+        return session
+
+    def _done_opening_locked(self, key):
+        self._opening[key] -= 1
+        if not self._opening[key]:
+            del self._opening[key]
+        self._cond.notify_all()
+
+    def _hand_out(self, session):
+        with self._cond:
+            if session.uses:
+                self.stats["reused"] += 1
+            session.uses += 1
+        return session
@@ -0,0 +1,208 @@
+r"""
+Domain-clustered triage for the interactive rule updates (-u).
+
+prompt_update_rules used to ask about unfiltered emails one at a time.  Before
+each prompt it recompiled every safe-sender pattern and every rule's header
+patterns, to skip emails already covered by an answer given earlier in the
+session.  A backlog of 500 emails from a few dozen senders meant hundreds of
+prompts and hundreds of full recompiles.
+
+TriageSession groups the emails into clusters first:
+
+  - by registrable domain of the From address (example.co.uk for
+    mail.news.example.co.uk, from the Public Suffix List in public_suffix.py),
+    so one answer covers every email of the cluster;
+  - senders at INDIVIDUAL_EMAIL_DOMAINS (gmail.com, ...) are clustered per
+    address instead, because a domain answer would cover unrelated people.
+
+next_cluster() hands out the largest open cluster.  cover() takes only the
+patterns that were just added (compiled once) and removes the remaining emails
+they match from every cluster, so later clusters shrink or disappear without
+recompiling anything that was already checked.
+
+Matching uses the same tokens as OutlookSecurityAgent._regex_match_header_any:
+the "@domain" from the From: header line and the sender address.
+"""
+
+from public_suffix import registrable_domain
+
+INDIVIDUAL_EMAIL_DOMAINS = frozenset((
+    "gmail.com", "yahoo.com", "hotmail.com", "outlook.com", "aol.com", "protonmail.com",
+))
+SAMPLE_SUBJECTS = 3
+
+
+class TriageItem:
+    r"""
+    One unfiltered email.
+
+    Attributes:
+        email, info: the item and its emails_added_info entry
+        from_email: sender address, lowercased
+        from_domain: "@domain" from the From: header line ("" if none)
+        subject: sanitized subject
+        url_stubs: URL stubs of the body
+    """
+    __slots__ = ("email", "info", "from_email", "from_domain", "subject", "url_stubs")
+
+    def __init__(self, email, info, from_email, from_domain, subject="", url_stubs=()):
+        self.email = email
+        self.info = info
+        self.from_email = (from_email or "").strip().lower()
+        self.from_domain = (from_domain or "").strip().lower()
+        self.subject = subject
+        self.url_stubs = list(url_stubs)
+
+    def matches(self, compiled_patterns):
+        r"""First pattern that matches the From: domain or the sender address, or None"""
+        for token in (self.from_domain, self.from_email):
+            if token:
+                for pattern in compiled_patterns:
+                    if pattern.search(token):
+                        return pattern.pattern
+        return None
+
+
+def cluster_key(item):
+    r"""
+    Returns:
+        tuple: (key, individual) - the sender address for INDIVIDUAL_EMAIL_DOMAINS, else the registrable domain
+    """
+    domain = registrable_domain(item.from_domain or item.from_email)
+    if domain in INDIVIDUAL_EMAIL_DOMAINS or not domain:
+        return item.from_email or item.from_domain, True
+    return domain, False
+
+
+class TriageCluster:
+    r"""
+    Unfiltered emails that one answer covers.
+
+    Attributes:
+        key: registrable domain, or the sender address when individual
+        individual: True for a per-address cluster (INDIVIDUAL_EMAIL_DOMAINS)
+        items: TriageItems still open, in scan order
+    """
+
+    def __init__(self, key, individual, order):
+        self.key = key
+        self.individual = individual
+        self.order = order
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    @property
+    def from_domain(self):
+        r"""The "@domain" of the first email, as the per-email prompt showed it"""
+        return self.items[0].from_domain if self.items else ""
+
+    @property
+    def from_domains(self):
+        r"""Distinct "@domain"s of the emails (the sender address for an email without one)"""
+        return list(dict.fromkeys(item.from_domain or item.from_email for item in self.items
+                                  if item.from_domain or item.from_email))
+
+    @property
+    def senders(self):
+        return list(dict.fromkeys(item.from_email for item in self.items if item.from_email))
+
+    def sample_subjects(self, n=SAMPLE_SUBJECTS):
+        return list(dict.fromkeys(item.subject for item in self.items))[:n]
+
+    def url_stubs(self, n=None):
+        stubs = list(dict.fromkeys(stub for item in self.items for stub in item.url_stubs))
+        return stubs if n is None else stubs[:n]
+
+
+def new_triage_stats():
+    return {"emails": 0, "clusters": 0, "prompts": 0, "covered": 0, "skipped": 0}
+
+
+class TriageSession:
+    r"""
+    Clusters of unfiltered emails, largest first, shrunk as patterns are added.
+
+    Args:
+        items: TriageItems
+    """
+
+    def __init__(self, items):
+        self.stats = new_triage_stats()
+        self.clusters = {}
+        for item in items:
+            key, individual = cluster_key(item)
+            cluster = self.clusters.get(key)
+            if cluster is None:
+                cluster = self.clusters[key] = TriageCluster(key, individual, len(self.clusters))
+            cluster.items.append(item)
+            self.stats["emails"] += 1
+        self.stats["clusters"] = len(self.clusters)
+
+    def __len__(self):
+        return len(self.clusters)
+
+    @property
+    def open_emails(self):
+        return sum(len(cluster) for cluster in self.clusters.values())
+
+    def next_cluster(self):
+        r"""Remove and return the largest open cluster (earliest seen on ties), or None when done"""
+        if not self.clusters:
+            return None
+        cluster = min(self.clusters.values(), key=lambda c: (-len(c), c.order))
+        del self.clusters[cluster.key]
+        self.stats["prompts"] += 1
+        return cluster
+
+    def skip(self, cluster):
+        r"""Record that no decision was made for a cluster"""
+        self.stats["skipped"] += len(cluster)
+
+    def reopen(self, cluster, compiled_patterns):
+        r"""
+        Put back the emails of an answered cluster that the answer's patterns do not match.
+
+        Args:
+            cluster: the TriageCluster returned by next_cluster()
+            compiled_patterns: list of compiled regexes of the answer
+
+        Returns:
+            list: TriageItems put back (they are prompted again)
+        """
+        left = [item for item in cluster.items if item.matches(compiled_patterns) is None]
+        if left:
+            reopened = self.clusters.get(cluster.key)
+            if reopened is None:
+                reopened = self.clusters[cluster.key] = TriageCluster(cluster.key, cluster.individual, cluster.order)
+            reopened.items = left + reopened.items
+        return left
+
+    def cover(self, compiled_patterns):
+        r"""
+        Drop the open emails that the newly added patterns match.
+
+        Args:
+            compiled_patterns: list of compiled regexes (only the new ones)
+
+        Returns:
+            list: (TriageItem, matched pattern) removed, in cluster order
+        """
+        if not compiled_patterns:
+            return []
+        removed = []
+        for key in list(self.clusters):
+            cluster = self.clusters[key]
+            keep = []
+            for item in cluster.items:
+                pattern = item.matches(compiled_patterns)
+                if pattern is None:
+                    keep.append(item)
+                else:
+                    removed.append((item, pattern))
+            cluster.items = keep
+            if not keep:
+                del self.clusters[key]
+        self.stats["covered"] += len(removed)
+        return removed
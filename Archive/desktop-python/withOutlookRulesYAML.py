@@ -94,6 +94,40 @@
 #       - Renamed rules_safe_sendersregex.yaml back to rules_safe_senders.yaml
 #       - Updated all code references to use consolidated filenames
 #       - Files now contain regex patterns (legacy mode deprecated 10/14/2025)
+# 10/18/2026:
+#       - Added bulk column fetch (outlook_table.py): folders are read with Folder.GetTable in batches of rows
+#       - Emails are TableMailItem rows; the full MailItem is opened only for body rules, actions and reports
+#       - New --fetch-mode flag (table|items); "items" keeps the previous Items.Restrict behavior
+#       - Two-phase rule order (--rule-order header-first, the default): delete rules decided by from/subject/header
+#         run before delete rules that need the body, so those emails never download a body
+#       - Empty body lists no longer read email.Body; table rows cache Body/HTMLBody after the first read
+#       - Table fetch log line reports how many body fetches were avoided
+#       - Mailbox changes go through an action queue (outlook_actions.py): read/flag/category/delete are coalesced
+#         into one Save per email and committed per chunk; safe senders are moved to the Inbox with one Move
+#       - Failed commits are parked and retried with exponential backoff and jitter (retry_scheduler.py) while
+#         evaluation continues, instead of sleeping inline; a circuit breaker per source folder stops commits to a
+#         folder that keeps failing. The log reports retries, seconds waited and breaker trips
+#       - Folder lookups are cached (folder_cache.py): in memory for the run, and by EntryID in OutlookFolderCache.json
+#         so later runs open folders with one GetFolderFromID call and search the tree only on a miss
+#       - Phishing checks use one feature record per email (phishing_features.py): the HTML is tokenized once for
+#         links, keywords come from a precompiled Aho-Corasick automaton. Mismatched link text now compares the
+#         link's display text with its href host (the old check compared each href with the HTML it came from)
+#       - URL stubs and link domains are extracted once per message (FeatureStore, keyed by EntryID) and stored with
+#         the scan info; the report, prompt_update_rules and the second pass read them instead of re-reading Body
+#       - from_report/URL_report removed, replaced by one aggregating report (report_engine.py): counts, first/last seen and
+#         top-N per From domain and URL stub, written once to OutlookRulesReport.csv/.json/.txt
+#       - Interactive updates (-u) prompt once per domain cluster (triage.py) instead of once per email; answers
+#         apply to the whole cluster and new patterns are checked against the remaining emails only
+#       - Registrable domains come from a bundled Public Suffix List snapshot (public_suffix.py, compiled into a
+#         reversed-label trie): build_sender_domain_safe_regex no longer uses 10 hard-coded multi-part suffixes, and
+#         build_domain_regex_from_address anchors on the registrable domain (SKIP_LABELS only for unlisted TLDs)
+#       - First-pass checkpoints (scan_journal.py): processed EntryIDs and the queued actions of each chunk are written
+#         to OutlookScanJournal.jsonl before the chunk is committed; --resume continues an interrupted scan, skipping
+#         processed messages and replaying unconfirmed commits only for messages still in their source folder.
+#         The scan results of no-match and phishing emails are journaled too, so the report and -u still cover them
+#       - Several accounts and folders (EMAIL_ACCOUNTS or --accounts accounts.yaml) are scanned concurrently by
+#         account_scan.py: one worker per store (own COM apartment for Outlook, own session for IMAP/Gmail), one
+#         shared CompiledRuleset, results merged into one report. A single Outlook account keeps process_emails()
 #------------------General Documentation------------------
 #
 # See README.md and memory-bank/*.md files for detailed documentation
@@ -109,6 +143,18 @@ import yaml
 import copy
 import traceback
 import argparse
+import hashlib
+
+import account_scan
+from folder_cache import FolderCache
+import public_suffix
+from outlook_actions import OutlookActionQueue
+from outlook_table import email_transport_headers, fetch_table_rows, new_fetch_stats
+from phishing_features import FeatureStore, url_stubs
+from report_engine import ReportEngine
+from scan_journal import ScanJournal, folder_ref
+from triage import TriageItem, TriageSession
+from rule_engine import CompiledRuleset, header_first_sort_key, rule_sort_key
 
 # Code update timestamp: 2025-07-17 21:15:00
 print("Loading withOutlookRulesYAML.py - updated 2025-07-17 21:15:00")
@@ -138,12 +184,17 @@ CRLF = "\n"
 EMAIL_ADDRESS = "kimmeyharold@aol.com"
 # EMAIL_BULK_FOLDER_NAME = "Bulk Mail"  # Commented out - now using list below
 EMAIL_BULK_FOLDER_NAMES = ["Bulk Mail", "bulk"]  # Changed from single folder to list of folders
+# Stores to scan (account_scan.py); --accounts <file> replaces the list. More than one store is scanned concurrently
+EMAIL_ACCOUNTS = [{"kind": "outlook", "account": EMAIL_ADDRESS, "folders": EMAIL_BULK_FOLDER_NAMES}]
 EMAIL_INBOX_FOLDER_NAME = "Inbox"
 WIN32_CLIENT_DISPATCH = "Outlook.Application"
 OUTLOOK_GETNAMESPACE = "MAPI"
 OUTLOOK_SECURITY_LOG_PATH = f"D:/Data/Harold/OutlookRulesProcessing/"
 OUTLOOK_SECURITY_LOG = OUTLOOK_SECURITY_LOG_PATH + "OutlookRulesProcessingDEBUG_INFO.log"
 OUTLOOK_SIMPLE_LOG = OUTLOOK_SECURITY_LOG_PATH + "OutlookRulesProcessingSimple.log"
+OUTLOOK_FOLDER_CACHE = OUTLOOK_SECURITY_LOG_PATH + "OutlookFolderCache.json"  # folder EntryIDs (folder_cache.py)
+OUTLOOK_SCAN_JOURNAL = OUTLOOK_SECURITY_LOG_PATH + "OutlookScanJournal.jsonl"  # first-pass checkpoints (scan_journal.py)
+OUTLOOK_REPORT_PREFIX = OUTLOOK_SECURITY_LOG_PATH + "OutlookRulesReport"  # .csv, .json and .txt (report_engine.py)
 OUTLOOK_RULES_PATH = f"D:/Data/Harold/github/OutlookMailSpamFilter/"
 OUTLOOK_RULES_FILE = OUTLOOK_RULES_PATH + "outlook_rules.csv"
 OUTLOOK_SAFE_SENDERS_FILE = OUTLOOK_RULES_PATH + "OutlookSafeSenders.csv"
@@ -167,6 +218,12 @@ YAML_INTERNATIONAL_RULES_FILE   = YAML_RULES_PATH + "rules_international.yaml"
 OUTLOOK_RULES_SUBSET            = "SpamAutoDelete"
 DAYS_BACK_DEFAULT = 365 # default number of days to go back in the calendar
 CRLF = "\n"             # Carriage return and line feed for formatting
+FETCH_MODE_TABLE = "table"  # Folder.GetTable bulk column fetch; full items opened on demand
+FETCH_MODE_ITEMS = "items"  # Items.Restrict, one COM MailItem (and round trip per property) per email
+FETCH_MODE_DEFAULT = FETCH_MODE_TABLE
+RULE_ORDER_HEADER_FIRST = "header-first"    # delete rules that need the body run after the ones that do not
+RULE_ORDER_FILE = "file"                    # rules.yaml order (non-delete rules still first)
+RULE_ORDER_DEFAULT = RULE_ORDER_HEADER_FIRST
 
 
 def print_to(message, to_log=False, to_simple=False, to_console=False, log_instance=None):
@@ -233,6 +290,14 @@ class OutlookSecurityAgent:
         """
         self.debug_mode = debug_mode
         self.test_mode = test_mode
+        self.fetch_mode = FETCH_MODE_DEFAULT  # main() sets this from --fetch-mode
+        self.fetch_stats = new_fetch_stats()
+        self.rule_order = RULE_ORDER_DEFAULT  # main() sets this from --rule-order
+        self.resume = False  # main() sets this from --resume
+        self.scan_journal_file = OUTLOOK_SCAN_JOURNAL
+        self.scan_journal = None
+        self.action_queue = OutlookActionQueue(self.log_print)
+        self.feature_store = FeatureStore()  # phishing features and URL stubs per message, shared by both passes
         
         # Check if win32com is available before trying to use it
         if not WIN32COM_AVAILABLE:
@@ -243,6 +308,7 @@ class OutlookSecurityAgent:
         else:
             self.outlook = win32com.client.Dispatch(WIN32_CLIENT_DISPATCH)
             self.namespace = self.outlook.GetNamespace(OUTLOOK_GETNAMESPACE)
+        self.folder_cache = FolderCache(self.namespace, OUTLOOK_FOLDER_CACHE, self.log_print)
 
         # Default file paths
         self.YAMO_RULES_PATH = YAML_RULES_PATH  # Set appropriate default path
@@ -292,7 +358,8 @@ class OutlookSecurityAgent:
             else:
                 self.log_print(f"Could not find folder '{folder_name}' in account '{email_address}' after {max_retries} attempts")
         
-        if not self.target_folders and not test_mode:
+        # folder_names=[] (main() scanning several stores through account_scan.py) needs no folders here
+        if not self.target_folders and folder_names and not test_mode:
             raise ValueError(f"Could not find any of the specified folders {folder_names} in account '{email_address}'")
         elif not self.target_folders and test_mode:
             self.log_print(f"Test mode: No folders found, but continuing (expected in test environment)")
@@ -315,7 +382,9 @@ class OutlookSecurityAgent:
         Output form:
             '@(?:[a-z0-9-]+\.)*<anchor>\.[a-z0-9.-]+$'
 
-        Where <anchor> is chosen by scanning left from the TLD to find a label that:
+        Where <anchor> is the first label of the registrable domain (google for mail.google.com,
+        example for news.example.co.uk) when the public suffix is on the Public Suffix List.
+        For an unlisted TLD, <anchor> is chosen by scanning left from the TLD to find a label that:
           - is not a common infra label (www, mail, smtp, ...), and
           - is at least 3 chars (to avoid overly-generic anchors), and
           - matches [a-z0-9-]+
@@ -346,6 +415,13 @@ class OutlookSecurityAgent:
             self.log_print(f"Found selected highest sub-domain in add domain request: {re.escape(anchor)} from: {addr_or_domain}")
             return f"@(?:[a-z0-9-]+\\.)*{re.escape(anchor)}\\.[a-z0-9.-]+$"
 
+        # 10/18/2026: the anchor is the registrable domain's label from the Public Suffix List (public_suffix.py);
+        # the SKIP_LABELS scan below is only used when the TLD is not on the list
+        parts = public_suffix.lookup(domain)
+        anchor = None
+        if parts.listed and parts.registrable != parts.suffix:
+            anchor = parts.registrable.split('.', 1)[0]
+
         SKIP_LABELS = {
             'www', 'mail', 'smtp', 'mx', 'ns', 'cdn', 'img', 'static', 'assets',
             'api', 'dev', 'test', 'stg', 'stage', 'beta',
@@ -353,12 +429,12 @@ class OutlookSecurityAgent:
             'news', 'shop', 'store', 'support'
         }
 
-        anchor = None
-        for i in range(len(labels) - 2, -1, -1):
-            candidate = labels[i]
-            if candidate and candidate not in SKIP_LABELS and re.fullmatch(r'[a-z0-9-]{3,}', candidate):
-                anchor = candidate
-                break
+        if not anchor:
+            for i in range(len(labels) - 2, -1, -1):
+                candidate = labels[i]
+                if candidate and candidate not in SKIP_LABELS and re.fullmatch(r'[a-z0-9-]{3,}', candidate):
+                    anchor = candidate
+                    break
         if not anchor:
             anchor = labels[-2]
                     
@@ -388,21 +464,23 @@ class OutlookSecurityAgent:
         if not dom:
             return ''
 
-        # Reduce to registrable domain (SLD + TLD), with a small set of common multi-part public suffixes.
-        labels = [p for p in dom.split('.') if p]
-        base = dom
-        if len(labels) >= 2:
-            # Common multi-part public suffixes. Extend as needed.
-            MULTI_PART_SUFFIXES = {
-                'co.uk', 'ac.uk', 'gov.uk', 'org.uk',
-                'com.au', 'net.au', 'org.au',
-                'com.br', 'com.cn', 'co.jp'
-            }
-            last2 = '.'.join(labels[-2:])
-            if last2 in MULTI_PART_SUFFIXES and len(labels) >= 3:
-                base = '.'.join(labels[-3:])  # e.g., example.co.uk
-            else:
-                base = '.'.join(labels[-2:])  # e.g., cursor.com
+        # Reduce to registrable domain (public suffix + one label, e.g. cursor.com, example.co.uk)
+        # 10/18/2026: replaced by public_suffix.registrable_domain (bundled Public Suffix List instead of 10 suffixes)
+        # labels = [p for p in dom.split('.') if p]
+        # base = dom
+        # if len(labels) >= 2:
+        #     # Common multi-part public suffixes. Extend as needed.
+        #     MULTI_PART_SUFFIXES = {
+        #         'co.uk', 'ac.uk', 'gov.uk', 'org.uk',
+        #         'com.au', 'net.au', 'org.au',
+        #         'com.br', 'com.cn', 'co.jp'
+        #     }
+        #     last2 = '.'.join(labels[-2:])
+        #     if last2 in MULTI_PART_SUFFIXES and len(labels) >= 3:
+        #         base = '.'.join(labels[-3:])  # e.g., example.co.uk
+        #     else:
+        #         base = '.'.join(labels[-2:])  # e.g., cursor.com
+        base = public_suffix.registrable_domain(dom) or dom
 
         # Anchor: any local part, then any number of subdomains, then the registrable domain
         # return f"^[^@\\s]+@(?:[a-z0-9-]+\\.)*{re.escape(dom)}$"  # prior behavior (kept for reference)
@@ -488,7 +566,12 @@ class OutlookSecurityAgent:
             return re.sub(r'[^\x00-\x7F]+', '', s.encode('utf-8', 'replace').decode('utf-8'))
 
     def _get_account_folder(self, email_address, folder_name):
-        r"""Get a specific folder from a specific email account"""
+        r"""Get a specific folder from a specific email account (cached per run, EntryIDs persisted across runs)"""
+        return self.folder_cache.get(email_address, folder_name,
+                                     lambda: self._resolve_account_folder(email_address, folder_name))
+
+    def _resolve_account_folder(self, email_address, folder_name):
+        r"""Find a folder by walking the accounts and, if needed, the account's folder tree"""
         self.log_print(f"Searching for folder: {folder_name} in account: {email_address}", "DEBUG")
 
         try:
@@ -1315,121 +1398,66 @@ class OutlookSecurityAgent:
 
         return blank
 
-    def from_report(self, emails_to_process, emails_added_info, rules_json):
-        r"""
-        Generate a report of emails with phishing indicators or no rule matches, including the From domain.
-
-        Args:
-            emails_to_process (list): List of emails to process.
-            emails_added_info (list): List of dictionaries containing additional information about each email.
-        """
-
-        processed_count = 0
-
-        # Print a list for Phishing OR Match=false with From: "@<domain>.<>" so they can be easily added to the rules
-
-        for email in emails_to_process:
-            processed_count += 1
-            email_index = emails_to_process.index(email)
-            try:
-                if ("phishing_indicators" in emails_added_info[email_index] and
-                    emails_added_info[email_index]["phishing_indicators"] is not None):
-                    # Create a string from email.header for the From: line with format: "@<domain>.<> (20 characters or less,
-                    # padded to 20) Email <n> (with 2 leading blanks)"
-
-                    email_header = emails_added_info[email_index]["email_header"]
-                    from_domain = self.header_from(email_header)
-
-                    output_string = (from_domain.ljust(20) +
-                                    f"| Email {email_index+1:>3} | " +
-                                    f"Phishing indicators: {emails_added_info[email_index]['phishing_indicators']}")
-                    self.log_print(f"{output_string}", level="INFO")
-                    simple_print(f"{output_string}")
-            except Exception as e:
-                simple_print(f"Error processing phishing indicators for email: {str(e)}")
-
-            try:
-                if (emails_added_info[email_index]["match"] == False):
-                    # Create a string from email.header for the From: line with format: "@<domain>.<> (20 characters or less,
-                    # padded to 20) Email <n> (with 2 leading blanks)"
-
-                    email_header = emails_added_info[email_index]["email_header"]
-                    from_domain = self.header_from(email_header)
-
-                    output_string = from_domain.ljust(20) + f"| Email {email_index+1:>3} | Matched no rules"
-                    self.log_print(f"{output_string}", level="INFO")
-                    simple_print(f"{output_string}")
-
-            except Exception as e:
-                self.log_print(f"Error processing match = false email: {str(e)}")
-
-            if (DEBUG) and (processed_count >= DEBUG_EMAILS_TO_PROCESS):
-                break  # Stop processing more emails in debug mode, then write the report and prompt for rule updates
-
-
     def get_unique_URL_stubs(self, email_body):
         r"""
         Extract unique URL stubs from the email body in the formats "/<domain>.<>"
         Args:
             email_body (str): The body of the email.
         """
+        # 10/18/2026: replaced the line-by-line loop with phishing_features.url_stubs (one scan of the body)
+        return url_stubs(email_body)
 
-        unique_stubs = []
-        seen_stubs = set()
-        url_pattern = re.compile(r'(\.[\w-]+\.[\w-]+)|(/[\w-]+\.[\w-]+)')
-        for line in email_body.splitlines():
-            matches = url_pattern.findall(line)
-            for match in matches:
-                stub = match[0] if match[0] else match[1]
-                # Remove leading "/" or "."
-                cleaned_stub = stub.lstrip('/.')
-                # Add both versions to the list if not seen before
-                if '/' + cleaned_stub not in seen_stubs:
-                    unique_stubs.append('/' + cleaned_stub)
-                    seen_stubs.add('/' + cleaned_stub)
-                if '.' + cleaned_stub not in seen_stubs:
-                    unique_stubs.append('.' + cleaned_stub)
-                    seen_stubs.add('.' + cleaned_stub)
-        return unique_stubs
-
-    def URL_report(self, emails_to_process, emails_added_info):
+    def _email_features(self, email, email_info):
         r"""
-        Generate a report of emails with phishing indicators or no rule matches,
-            including unique URL stubs "/<domain>.<>" and ".<domain>.<>" from the body.
+        PhishingFeatures (URL stubs, link domains, ...) for an email, from its scan info or the feature store.
 
         Args:
-            emails_to_process (list): List of emails to process.
-            emails_added_info (list): List of dictionaries containing additional information about each email.
+            email: MailItem or TableMailItem
+            email_info (dict): the email's entry in emails_added_info; the features are stored there
         """
+        features = email_info.get("phishing_features")
+        if features is None:
+            features = email_info["phishing_features"] = self.feature_store.get(email)
+        return features
 
-        processed_count = 0
+    def _write_reports(self, emails_to_process, emails_added_info):
+        r"""
+        Aggregate phishing / match = False emails by From domain and URL stub (report_engine.py) and write
+        OUTLOOK_REPORT_PREFIX .csv/.json/.txt once.  Replaces the per-line from_report and URL_report (removed).
 
-        # Print a list for Phishing OR Match=false, report body unique URL stubs "/<domain>.<>" and ".<domain>.<>" so they can be easily added to the rules
-        #     collect them all first, then determine uniqueness, then print one per line
+        Args:
+            emails_to_process (list): List of emails processed.
+            emails_added_info (list): List of dictionaries containing additional information about each email.
 
-        for email in emails_to_process:
-            processed_count += 1
-            email_index = emails_to_process.index(email)
+        Returns:
+            ReportEngine: the aggregated counts
+        """
+        engine = ReportEngine()
+        for number, (email, email_info) in enumerate(zip(emails_to_process, emails_added_info), 1):
             try:
-                if ("phishing_indicators" in emails_added_info[email_index] and
-                    emails_added_info[email_index]["phishing_indicators"] is not None):
-                    # Create a string from email.header for the From: line with format: "@<domain>.<> (20 characters or less,
-                    # padded to 20) Email <n> (with 2 leading blanks)"
-
-                    unique_URL_stubs = self.get_unique_URL_stubs(email.Body)
-
-                    for stub in unique_URL_stubs:
-                        output_string = (stub.ljust(30) +
-                                    f"| Email {email_index+1:>3} | " +
-                                    f"From: {self._sanitize_string(email.SenderEmailAddress)}")
-                        self.log_print(f"{output_string}",level="INFO")
-                        simple_print(f"{output_string}")
+                indicators = email_info.get("phishing_indicators")
+                if indicators is None and email_info.get("match") is not False:
+                    continue
+                try:
+                    received = email.ReceivedTime
+                except Exception:
+                    received = None
+                stubs = self._email_features(email, email_info).url_stubs if indicators is not None else ()
+                engine.add(number, self.header_from(email_info.get("email_header", "")), received, indicators,
+                           email_info.get("match"), stubs)
             except Exception as e:
-                self.log_print(f"Error processing phishing indicators for email: {str(e)}")
-
+                self.log_print(f"Error adding email {number} to the report: {str(e)}")
 
-            if (DEBUG) and (processed_count >= DEBUG_EMAILS_TO_PROCESS):
-                break  # Stop processing more emails in debug mode, then write the report and prompt for rule updates
+        try:
+            lines = engine.write(OUTLOOK_REPORT_PREFIX)
+            self.log_print(f"Report written to {OUTLOOK_REPORT_PREFIX}.csv/.json/.txt")
+        except OSError as e:
+            self.log_print(f"Error writing report files: {str(e)}")
+            lines = engine.text_lines()
+        report = "\n".join(lines)
+        self.log_print(report)
+        simple_print(report)  # one write to the simple log
+        return engine
 
     def _process_conditions(self, conditions_obj, is_exception):
         """Helper method to process rule conditions or exceptions"""
@@ -1788,405 +1816,318 @@ class OutlookSecurityAgent:
 
     def prompt_update_rules(self, emails_to_process, emails_added_info, rules_json, safe_senders):
         r"""
-        Prompt user to update rules based on unfiltered emails.
+        Prompt user to update rules based on unfiltered emails, one prompt per domain cluster (triage.py).
+
+        Unfiltered emails are grouped by registrable domain (per address for gmail.com and the other
+        individual-mail domains).  The largest cluster is shown first with its count, senders and sample
+        subjects; the answer is applied to the whole cluster, and the patterns it added are checked against
+        the remaining emails only, so clusters they cover are not prompted.
 
         Args:
             emails_to_process (list): List of emails processed.
             emails_added_info (list): Additional info about processed emails.
             rules_json (list): Current rules in JSON format that may be updated.
+            safe_senders (dict): Current safe senders that may be updated.
 
         Returns:
-            list: Updated rules in JSON format.
+            tuple: (rules_json, safe_senders), updated.
         """
         self.log_print(f"{CRLF}Checking for emails that can be added to rules...")
-        # Surface current mode and file paths for clarity during interactive updates
         self.log_print(f"Interactive updates will write to: rules={self.active_rules_file}, safe_senders={self.active_safe_senders_file}")
-        unfiltered_emails = []
-
         self.log_print(f"Number of emails to process: {len(emails_to_process)}")
 
-        # Find unfiltered emails (those with match=False)
+        items = []
         for i, email_info in enumerate(emails_added_info):
             if email_info["processed"] and email_info["match"] == False and i < len(emails_to_process):
-                unfiltered_emails.append((emails_to_process[i], email_info))
+                email = emails_to_process[i]
+                try:
+                    items.append(TriageItem(email, email_info,
+                                            self._sanitize_string(email.SenderEmailAddress),
+                                            self.header_from(email_info["email_header"]),
+                                            self._sanitize_string(email.Subject),
+                                            self._email_features(email, email_info).url_stubs))
+                except Exception as e:
+                    self.log_print(f"Error reading unfiltered email for rule updates: {str(e)}")
 
-        if not unfiltered_emails:
+        if not items:
             self.log_print("No unfiltered emails found to update rules.")
             return rules_json, safe_senders
-        else:
-            self.log_print(f"Found {len(unfiltered_emails)} unfiltered emails to process for rule updates.")
-
-        self.log_print(f"Found {len(unfiltered_emails)} unfiltered emails. Processing for possible rule updates...")
-        simple_print(f"\nBeginning interactive rule update for {len(unfiltered_emails)} unfiltered emails")
 
-        # Process each unfiltered email
-        # NOTE:  assumes user will only want to update 1 rule per email
-        count = 0
+        session = TriageSession(items)
+        # Emails already covered by the current safe senders or header rules (patterns compiled once)
+        for label, patterns in [("safe_senders", safe_senders.get("safe_senders", []))] + \
+                [(f"rule '{rule['name']}'", rule.get("conditions", {}).get("header", [])) for rule in rules_json["rules"]]:
+            for item, pattern in session.cover(self._compile_pattern_list(patterns)):
+                self.log_print(f"Skipping email from {item.from_email} (matches {label}, pattern: {pattern})")
+        self.log_print(f"Found {session.open_emails} unfiltered emails in {len(session)} domain clusters. Processing for possible rule updates...")
+        simple_print(f"\nBeginning interactive rule update for {session.open_emails} unfiltered emails in {len(session)} domain clusters")
+
+        help_text = (
+            "Options (apply to every email in the cluster):\n"
+            "  d  - Add sender domain regex to SpamAutoDeleteHeader (blocks by domain)\n"
+            "  e  - Add each sender email to SpamAutoDeleteHeader (blocks these emails)\n"
+            "  s  - Add literal address/domain to safe_senders (never block)\n"
+            "  sd - Add sender-domain regex to safe_senders (never block any subdomain)\n"
+            "  ?  - Show this help\n"
+            "  Enter - skip this cluster"
+        )
+        expected_responses = ['d', 'e', 's', 'sd', '?']
 
-        for email, email_info in unfiltered_emails:
+        while True:
+            cluster = session.next_cluster()
+            if cluster is None:
+                break
             try:
-                rule_updated = False
-                count += 1
-                #   self.log_print(f"before assigning email_header")
-                email_header = email_info["email_header"]
-                #   self.log_print(f"for loop email_header: {email_header}")  # Debugging output
-                subject = self._sanitize_string(email.Subject)
-                self.log_print(f"Subject: {subject}")
-                from_email = self._sanitize_string(email.SenderEmailAddress).lower()
-                self.log_print(f"From: {from_email}")
-                from_domain = self.header_from(email_header)
-                self.log_print(f"Domain: {from_domain}")
-                unique_urls = self.get_unique_URL_stubs(email.Body) # Extract URLs
-                self.log_print(f"Unique URLs: {unique_urls}")
-
-                # Check if the email matches any safe_senders patterns (using regex matching for newly added patterns)
-                # Compile safe_senders patterns before checking to include any newly added patterns
-                compiled_safe_senders = self._compile_pattern_list(safe_senders.get("safe_senders", []))
-                matched_safe, matched_safe_pat = self._regex_match_header_any(compiled_safe_senders, email_header, from_email)
-                if matched_safe:
-                    self.log_print(f"Skipping email from safe sender (matched pattern: {matched_safe_pat}): {from_email}")
-                    simple_print(f"Skipping email from safe sender (matched pattern: {matched_safe_pat}): {from_email}")
-                    continue
-
-                # Check if the email matches any header rules (using regex matching for newly added patterns)
-                # Compile header patterns from all rules before checking to include any newly added patterns
-                skip_email = False
-                for rule in rules_json["rules"]:
-                    header_patterns = rule.get("conditions", {}).get("header", [])
-                    if header_patterns:
-                        compiled_headers = self._compile_pattern_list(header_patterns)
-                        matched_header, matched_header_pat = self._regex_match_header_any(compiled_headers, email_header, from_email)
-                        if matched_header:
-                            self.log_print(f"Skipping email as it matches rule '{rule['name']}' (matched pattern: {matched_header_pat})")
-                            simple_print(f"Skipping email as it matches rule '{rule['name']}' (matched pattern: {matched_header_pat})")
-                            skip_email = True
-                            break
-                if skip_email:
-                    continue
-
-                # Display email details
+                senders = cluster.senders
                 print(f"{CRLF}" + "=" * 60)
-                print(f"Subject: {subject}")
-                print(f"From: {from_email}")
-                print(f"Domain: {from_domain}")
-                print(f"Unique URLs: {unique_urls}")
-
-                response = ""
-
-                # Step 1: Suggest header rule
-                #*** for the following domains that host individual email addresses, only suggest adding full email address to header rules:
-                #   gmail.com, yahoo.com, hotmail.com, outlook.com, aol.com, protonmail.com,
-                domains_with_individual_emails = from_domain in [
-                    "@gmail.com", "@yahoo.com", "@hotmail.com", "@outlook.com", "@aol.com", "@protonmail.com",
-                ]
-
-
-                if from_domain:
-                    if domains_with_individual_emails:
-                        # For individual email domains, suggest adding full email address
-                        expected_responses = ['d', 'e', 's', 'sd', '?']   # Treat 'd' and 'e' as 'e' for adding to header rule; 'sd' adds sender domain regex to safe_senders
-                        prompt = f"{CRLF}Add '{from_email}' to SpamAutoDeleteHeader rule or safe_senders? ({'/'.join(expected_responses)}): "
-                        help_text = (
-                            "Options:\n"
-                            "  d  - Add sender domain regex to SpamAutoDeleteHeader (blocks by domain)\n"
-                            "  e  - Add full sender email to SpamAutoDeleteHeader (blocks this email)\n"
-                            "  s  - Add literal address/domain to safe_senders (never block)\n"
-                            "  sd - Add sender-domain regex to safe_senders (never block any subdomain)\n"
-                            "  ?  - Show this help"
-                        )
-                        response = self.get_safe_input(prompt, expected_responses, help_text=help_text)
-                        if response in ['e', 'd']:  # Treat 'd' and 'e' as 'e' for adding to header rule
-                            # Add from_email to safe_senders list
-                            for rule in rules_json["rules"]:
-                                if rule["name"] == "SpamAutoDeleteHeader":
-                                    if "header" not in rule["conditions"]:
-                                        rule["conditions"]["header"] = []
-                                    rule["conditions"]["header"].append(from_email)
-                                    rule_updated = True
-                                    self.log_print(f"Added '{from_email}' to SpamAutoDeleteHeader rule")
-                                    simple_print(f"Added '{from_email}' to SpamAutoDeleteHeader rule")
-                                    try:
-                                        # Persist immediately to the active file
-                                        self.export_rules_to_yaml(rules_json)
-                                        self.log_print(f"Appended to: {self.active_rules_file}")
-                                    except Exception:
-                                        pass
-                        elif response == 's':
-                            # Add from_domain to safe_senders list
-                            safe_senders["safe_senders"].append(from_email)  # working HK 05/18/25
-                            self.log_print(f"Added '{from_email}' to safe_senders list")
-                            simple_print(f"Added '{from_email}' to safe_senders list")
-                            rule_updated = True
-                            try:
-                                self.export_safe_senders_to_yaml(safe_senders)
-                                self.log_print(f"Appended to: {self.active_safe_senders_file}")
-                            except Exception:
-                                pass
-                        elif response == 'sd':
-                            # Add sender's domain as a regex to safe_senders (any local part, any subdomains)
-                            domain_regex = self.build_sender_domain_safe_regex(from_domain or from_email)
-                            if domain_regex:
-                                if domain_regex not in safe_senders.get("safe_senders", []):
-                                    safe_senders["safe_senders"].append(domain_regex)
-                                self.log_print(f"Added sender-domain regex '{domain_regex}' to safe_senders list")
-                                simple_print(f"Added sender-domain regex to safe_senders: {domain_regex}")
-                                rule_updated = True
-                                try:
-                                    self.export_safe_senders_to_yaml(safe_senders)
-                                    self.log_print(f"Appended to: {self.active_safe_senders_file}")
-                                except Exception:
-                                    pass
-                    else:
-                        expected_responses = ['d', 'e', 's', 'sd', '?']   # 'sd' adds sender domain regex to safe_senders
-                        prompt = f"{CRLF}Add '{from_email}' to SpamAutoDeleteHeader rule or safe_senders? ({'/'.join(expected_responses)}): "
-                        help_text = (
-                            "Options:\n"
-                            "  d  - Add sender domain regex to SpamAutoDeleteHeader (blocks by domain)\n"
-                            "  e  - Add full sender email to SpamAutoDeleteHeader (blocks this email)\n"
-                            "  s  - Add literal address/domain to safe_senders (never block)\n"
-                            "  sd - Add sender-domain regex to safe_senders (never block any subdomain)\n"
-                            "  ?  - Show this help"
-                        )
-                        response = self.get_safe_input(prompt, expected_responses, help_text=help_text)
-                        if response == 'd':
-                            # Find the SpamAutoDeleteHeader rule in the rules list and append to its header conditions
-                            # On 'd', add a domain-based regex anchored on the first meaningful subdomain below the TLD
-                            for rule in rules_json["rules"]:
-                                if rule["name"] == "SpamAutoDeleteHeader":
-                                    if "header" not in rule["conditions"]:
-                                        rule["conditions"]["header"] = []
-
-                                    try:
-                                        domain_regex = self.build_domain_regex_from_address(from_domain or from_email)
-                                    except Exception:
-                                        # Conservative default if unexpected input
-                                        domain_regex = '@(?:[a-z0-9-]+\\.)*[a-z0-9-]+\\.[a-z0-9.-]+$'
-
-                                    # Avoid duplicates
-                                    if domain_regex not in rule["conditions"]["header"]:
-                                        rule["conditions"]["header"].append(domain_regex)
-                                        rule_updated = True
-                                        self.log_print(f"Added domain regex '{domain_regex}' to SpamAutoDeleteHeader rule")
-                                        simple_print(f"Added domain regex '{domain_regex}' to SpamAutoDeleteHeader rule")
-                                        try:
-                                            self.export_rules_to_yaml(rules_json)
-                                            self.log_print(f"Appended to: {self.active_rules_file}")
-                                        except Exception:
-                                            pass
-
-                        elif response == 's':
-                            # Add from_domain to safe_senders list
-                            safe_senders["safe_senders"].append(from_domain)  # working HK 05/18/25
-                            self.log_print(f"Added '{from_domain}' to safe_senders list")
-                            simple_print(f"Added '{from_domain}' to safe_senders list")
-                            rule_updated = True
-                            try:
-                                self.export_safe_senders_to_yaml(safe_senders)
-                                self.log_print(f"Appended to: {self.active_safe_senders_file}")
-                            except Exception:
-                                pass
-                        elif response == 'sd':
-                            # Add sender's domain as a regex to safe_senders (any local part, any subdomains)
-                            domain_regex = self.build_sender_domain_safe_regex(from_domain or from_email)
-                            if domain_regex:
-                                if domain_regex not in safe_senders.get("safe_senders", []):
-                                    safe_senders["safe_senders"].append(domain_regex)
-                                self.log_print(f"Added sender-domain regex '{domain_regex}' to safe_senders list")
-                                simple_print(f"Added sender-domain regex to safe_senders: {domain_regex}")
-                                rule_updated = True
-                                try:
-                                    self.export_safe_senders_to_yaml(safe_senders)
-                                    self.log_print(f"Appended to: {self.active_safe_senders_file}")
-                                except Exception:
-                                    pass
+                print(f"Cluster: {cluster.key} ({len(cluster)} emails, {len(senders)} senders, {session.open_emails} emails in {len(session)} clusters left)")
+                print(f"Domain: {cluster.from_domain}")
+                print(f"From: {', '.join(senders[:5])}{' ...' if len(senders) > 5 else ''}")
+                for subject in cluster.sample_subjects():
+                    print(f"Subject: {subject}")
+                print(f"Unique URLs: {cluster.url_stubs(10)}")
+                self.log_print(f"Cluster {cluster.key}: {len(cluster)} emails from {senders}")
+
+                prompt = f"{CRLF}Add '{cluster.key}' ({len(cluster)} emails) to SpamAutoDeleteHeader rule or safe_senders? ({'/'.join(expected_responses)}): "
+                response = self.get_safe_input(prompt, expected_responses, help_text=help_text)
+
+                if response == 'd' and not cluster.individual:
+                    try:
+                        domain_regex = self.build_domain_regex_from_address(cluster.from_domain or senders[0])
+                    except Exception:
+                        # Conservative default if unexpected input
+                        domain_regex = '@(?:[a-z0-9-]+\\.)*[a-z0-9-]+\\.[a-z0-9.-]+$'
+                    patterns = [domain_regex]
+                    added = self._add_header_patterns(rules_json, patterns)
+                elif response in ['d', 'e']:    # 'd' on an individual-mail cluster blocks the address, as 'e'
+                    patterns = senders
+                    added = self._add_header_patterns(rules_json, patterns)
+                elif response == 's':
+                    # Every "@domain" of the cluster (mail0.x.com, mail1.x.com, ...), not only the first email's
+                    patterns = senders if cluster.individual else cluster.from_domains
+                    added = self._add_safe_senders(safe_senders, patterns)
+                elif response == 'sd':
+                    domain_regex = self.build_sender_domain_safe_regex(cluster.from_domain or senders[0])
+                    patterns = [domain_regex] if domain_regex else []
+                    added = self._add_safe_senders(safe_senders, patterns)
+                else:
+                    session.skip(cluster)
+                    continue
 
+                # Emails of the cluster the answer does not match are prompted again, not dropped
+                reopened = session.reopen(cluster, self._compile_pattern_list(patterns))
+                if reopened:
+                    self.log_print(f"{len(reopened)} emails of cluster {cluster.key} not matched by {patterns}; prompting again")
+                covered = session.cover(self._compile_pattern_list(added))
+                if covered:
+                    self.log_print(f"New patterns also cover {len(covered)} emails in other clusters")
             except Exception as e:
-                self.log_print(f"Error processing email for rule updates: {str(e)} {email_header}")
-                simple_print(f"Error processing email: {str(e)}")
+                self.log_print(f"Error processing cluster {cluster.key} for rule updates: {str(e)}")
+                simple_print(f"Error processing cluster: {str(e)}")
 
+        stats = session.stats
+        self.log_print(f"Triage: {stats['emails']} emails in {stats['clusters']} clusters, {stats['prompts']} prompts, "
+                       f"{stats['covered']} emails covered by rules, {stats['skipped']} skipped")
         self.log_print("Rule update process completed")
         simple_print("\nRule update process completed")
         return rules_json, safe_senders
 
-    def check_phishing_indicators(self, email):
-        """Check for phishing indicators in an email"""
-        indicators = []
+    def _add_header_patterns(self, rules_json, patterns):
+        r"""Append patterns (skipping duplicates) to SpamAutoDeleteHeader's header list and persist; returns the ones added"""
+        added = []
+        for rule in rules_json["rules"]:
+            if rule["name"] == "SpamAutoDeleteHeader":
+                header = rule["conditions"].setdefault("header", [])
+                for pattern in patterns:
+                    if pattern and pattern not in header:
+                        header.append(pattern)
+                        added.append(pattern)
+                        self.log_print(f"Added '{pattern}' to SpamAutoDeleteHeader rule")
+                        simple_print(f"Added '{pattern}' to SpamAutoDeleteHeader rule")
+        if added:
+            try:
+                # Persist immediately to the active file
+                self.export_rules_to_yaml(rules_json)
+                self.log_print(f"Appended to: {self.active_rules_file}")
+            except Exception:
+                pass
+        return added
+
+    def _add_safe_senders(self, safe_senders, patterns):
+        r"""Append patterns (skipping duplicates) to safe_senders and persist; returns the ones added"""
+        added = []
+        entries = safe_senders.setdefault("safe_senders", [])
+        for pattern in patterns:
+            if pattern and pattern not in entries:
+                entries.append(pattern)
+                added.append(pattern)
+                self.log_print(f"Added '{pattern}' to safe_senders list")
+                simple_print(f"Added '{pattern}' to safe_senders list")
+        if added:
+            try:
+                self.export_safe_senders_to_yaml(safe_senders)
+                self.log_print(f"Appended to: {self.active_safe_senders_file}")
+            except Exception:
+                pass
+        return added
 
-        try:
-            # Check sender mismatch
-            sender = email.SenderEmailAddress.lower()
-            display_name = email.SenderName.lower()
-            if '@' in display_name and display_name != sender:
-                self.log_print(f"Phishing indicator: Sender name/email mismatch: {display_name} vs {sender}")
-                indicators.append("Phishing indicator: Sender name/email mismatch")
-
-            # Check urgent language
-            urgent_words = ['urgent', 'immediate', 'action required', 'account suspended']
-            found_urgent = [word for word in urgent_words if word in email.Subject.lower()]
-            if found_urgent:
-                self.log_print(f"Phishing indicator: Found urgent language in subject: {found_urgent}")
-                indicators.append("Phishing indicator: Found urgent language in subject")
-
-            # Check URLs
-            if email.HTMLBody:
-                href_pattern = r'href=[\'"]?([^\'" >]+)'
-                urls = re.findall(href_pattern, email.HTMLBody)
-                for url in urls:
-                    if 'http' in url.lower():
-                        if url.lower() not in email.HTMLBody.lower():
-                            self.log_print(f"Phishing indicator: Found mismatched URL display text: {url}")
-                            indicators.append("Phishing indicator: Found Mismatched URL display text")
-                            break
+    def check_phishing_indicators(self, email, features=None):
+        r"""
+        Check for phishing indicators in an email
+
+        Args:
+            email: MailItem or TableMailItem
+            features: PhishingFeatures already extracted for this email (extracted here if None)
 
-            # Check sensitive words
-            sensitive_words = ['password', 'login', 'credential', 'verify account']
-            found_sensitive = [word for word in sensitive_words if word in email.Body.lower()]
-            if found_sensitive:
-                self.log_print(f"Phishing indicator: Found requests for sensitive information: {found_sensitive}")
-                indicators.append("Phishing indicator: Found requests for sensitive information")
+        Returns:
+            list: indicator strings
+        """
+        # 10/18/2026: replaced the per-email Subject/Body/HTMLBody checks with phishing_features.extract_email_features (one pass)
+        indicators = []
 
+        try:
+            if features is None:
+                features = self.feature_store.get(email)
+            for indicator, detail in features.indicators():
+                self.log_print(f"{indicator}: {detail}")
+                indicators.append(indicator)
         except Exception as e:
             self.log_print(f"Error checking indicators: {str(e)}")
 
         return indicators
 
-    def delete_email_with_retry(self, email, max_retries=10, delay=1):
-        r"""
-        Attempt to delete an email with retries.
+    # 10/19/2026: delete/move/mark_read/clear_flag/assign_category *_with_retry (inline time.sleep per retry)
+    # replaced by OutlookActionQueue/RetryScheduler (outlook_actions.py, retry_scheduler.py)
 
-        Args:
-            email: The email object to delete.
-            max_retries: Maximum number of retries.
-            delay: Delay between retries in seconds.
-        """
+    def _fetch_folder_emails(self, folder, restriction):
+        r"""
+        Get the emails in a folder that match a restriction, newest first.
 
-        import time
-
-        # Prepare email for deletion - mark as read and clear flags
-        try: #to mark email as read if unread
-            if email.UnRead:
-                self.mark_email_read_with_retry(email)
-                # email.UnRead = False  # Delete implies marking the item as read
-                self.log_print(f"Email marked as read", "DEBUG")
-        except:
-            self.log_print(f"Error marking email as read", "DEBUG")
-
-        try: #to clear the flag on email
-            if hasattr(email, 'Flag'):
-                self.clear_email_flag_with_retry(email)
-                # email.Flag.Clear()      # Delete implies clearing the flag
-                self.log_print(f"Email flag was cleared", "DEBUG")
-        except:
-            self.log_print(f"Error clearing flag", "DEBUG")
-
-        for attempt in range(max_retries):
-            try:
-                email.Delete()
-                self.log_print(f"Email deleted successfully on attempt {attempt + 1}")
-                return
-            except Exception as e:
-                self.log_print(f"Error deleting email on attempt {attempt + 1}: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(delay)
-                else:
-                    raise
-        return
+        In table fetch mode the columns the first pass reads are pulled in bulk with
+        Folder.GetTable and each email is a TableMailItem that opens the full MailItem
+        only when a body rule, an action or a report needs it.  If the table cannot be
+        read the folder falls back to Items.Restrict.
 
-    def move_email_with_retry(self, email, target_folder, max_retries=10, delay=1):
-        r"""
-        Attempt to move an email to a target folder with retries.
-        First it makes a copy of the email, then it moves it to the inbox
         Args:
-            email: The email object to move.
-            target_folder: The target folder to move the email to.
-            max_retries: Maximum number of retries.
-            delay: Delay between retries in seconds.
-        """
+            folder: Outlook folder
+            restriction: Jet filter string, e.g. "[ReceivedTime] >= '11/01/2025'"
 
-        import time
-        for attempt in range(max_retries):
+        Returns:
+            list: emails (TableMailItem or MailItem objects)
+        """
+        if self.fetch_mode == FETCH_MODE_TABLE:
             try:
-                copied_email = email.Copy()
-                copied_email.Move(target_folder)
-                self.log_print(f"Email moved successfully to {target_folder.Name} on attempt {attempt + 1}")
-                return
+                return fetch_table_rows(folder, restriction, self.namespace, self.fetch_stats)
             except Exception as e:
-                self.log_print(f"Error copying email on attempt {attempt + 1}: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(delay)
-                else:
-                    raise
-        return
+                self.log_print(f"GetTable failed for folder {folder.Name}, falling back to Items.Restrict: {str(e)}")
 
-    def mark_email_read_with_retry(self, email, max_retries=10, delay=1):
+        emails = folder.Items.Restrict(restriction)
+        if emails is None or isinstance(emails, str) or emails.Count == 0:
+            if isinstance(emails, str):
+                self.log_print(f"Error: 'emails' is a string, expected a collection in folder: {folder.Name}")
+            return []
+        emails.Sort("[ReceivedTime]", Descending=True)
+        # Convert to list for processing
+        return [email for email in emails]
+
+    def _log_action_stats(self):
+        stats = self.action_queue.stats
+        self.log_print(f"Action queue: {stats['committed']} emails committed in {stats['flushes']} chunk(s) "
+                       f"({stats['saves']} saves, {stats['moves']} moves, {stats['deletes']} deletes, "
+                       f"{stats['coalesced']} changes coalesced, {stats['failed']} failed)")
+        retries = self.action_queue.retries.stats
+        self.log_print(f"Action retries: {retries['retries']} retried, {retries['waited_seconds']:.1f}s waited, "
+                       f"{retries['breaker_trips']} circuit breaker trip(s), "
+                       f"{retries['breaker_rejections']} commit(s) held back by an open breaker")
+
+    def _log_feature_store_stats(self):
+        stats = self.feature_store.stats
+        self.log_print(f"Feature store: {stats['extracted']} messages extracted, {stats['reused']} lookups reused "
+                       f"(phishing features, URL stubs, link domains)", "DEBUG")
+
+    def _log_folder_cache_stats(self):
+        stats = self.folder_cache.stats
+        self.log_print(f"Folder cache: {stats['memory_hits']} lookups from memory, {stats['id_hits']} opened by stored "
+                       f"EntryID, {stats['resolved']} resolved by search ({stats['stale_ids']} stale IDs)", "DEBUG")
+
+    def _rule_sort_key(self):
         r"""
-        Attempt to mark an email as unread with retries.
+        Sort key for the rules list, per self.rule_order.
 
-        Args:
-            email: The email object to mark as unread.
+        Returns:
+            callable: rule_engine.header_first_sort_key or rule_engine.rule_sort_key
         """
+        if self.rule_order == RULE_ORDER_HEADER_FIRST:
+            return header_first_sort_key
+        return rule_sort_key
 
-        import time
-        for attempt in range(max_retries):
-            try:
-                if email.UnRead:
-                    email.UnRead = False
-                    email.Save()
-                    self.log_print(f"Email marked as read successfully on attempt  {attempt + 1}")
-                return
-            except Exception as e:
-                self.log_print(f"Error marking email as read on attempt {attempt + 1}: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(delay)
-                else:
-                    raise
-        return
-
-    def clear_email_flag_with_retry(self, email, max_retries=10, delay=1):
+    def _open_scan_journal(self, rules_json, safe_senders, days_back):
         r"""
-        Attempt to clear the flag on an email; with with retries.
+        Start the first-pass checkpoint journal, or continue the interrupted scan when self.resume is set.
 
         Args:
-            email: The email object to clear the flag.
-        """
-
-        import time
-        for attempt in range(max_retries):
-            try:
-                email.Flag.Clear()
-                # email.Save()
-                self.log_print(f"Email flag cleared successfully on attempt  {attempt + 1}")
-                return
-            except Exception as e:
-                self.log_print(f"Error clearing flag on email on attempt {attempt + 1}: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(delay)
-                else:
-                    raise
-        return
+            rules_json: rules in effect (their digest is recorded)
+            safe_senders: safe senders in effect
+            days_back: days of email to scan
 
-    def assign_category_to_email_with_retry(self, email, category_name, max_retries=10, delay=1):
+        Returns:
+            ScanJournal; its params["since"] is the ReceivedTime cutoff to use (the interrupted run's on resume)
+        """
+        digest = hashlib.sha256(json.dumps([rules_json, safe_senders], sort_keys=True, default=str).encode('utf-8'))
+        params = {
+            "account": self.email_address,
+            "folders": [folder_ref(folder) for folder in self.target_folders],
+            "since": (datetime.now() - timedelta(days=days_back)).strftime('%m/%d/%Y'),
+            "rules": digest.hexdigest(),
+        }
+        journal = None
+        if self.resume:
+            journal = ScanJournal.resume(self.scan_journal_file, params, self.log_print)
+        if journal is None:
+            journal = ScanJournal.start(self.scan_journal_file, params, self.log_print)
+        return journal
+
+    def _log_scan_journal_stats(self):
+        stats = self.scan_journal.stats
+        self.log_print(f"Scan journal: {stats['processed']} messages checkpointed in {stats['chunks']} chunk(s), "
+                       f"{stats['resumed_skipped']} skipped as already processed ({stats['restored']} restored for the "
+                       f"report and -u), {stats['replayed']} commits replayed "
+                       f"({stats['replay_skipped']} already applied)")
+
+    def scan_accounts(self, stores, rules_json, safe_senders, days_back=DAYS_BACK_DEFAULT):
         r"""
-        Attempt to mark an email as unread with retries.
+        Scan several stores concurrently (account_scan.py) with one compiled ruleset and write one merged report.
+
+        Each store is scanned by its own worker: Outlook accounts in their own COM apartment, IMAP and Gmail
+        accounts with their own session.  Only the scan_backend() actions apply (safe senders back to the Inbox,
+        category, mark read, copy/move to folder, delete); there are no prompts and no second pass.
 
         Args:
-            email: The email object to mark as unread.
+            stores: account_scan.StoreSpec list
+            rules_json: rules document
+            safe_senders: safe_senders document
+            days_back: days of email to scan
+
+        Returns:
+            dict: merged outcome of account_scan.scan_accounts()
         """
+        self.log_print(f"\n\nStarting concurrent scan of {len(stores)} stores: {[store.label for store in stores]}")
+        ruleset = CompiledRuleset(rules_json, safe_senders, sort_key=self._rule_sort_key())
+        outcome = account_scan.scan_accounts(stores, ruleset, days_back, log=self.log_print)
+        for line in account_scan.store_summary_lines(outcome):
+            print_to(line, to_log=True, to_simple=True, to_console=True, log_instance=self)
 
-        import time
-        for attempt in range(max_retries):
-            try:
-                email.Categories = category_name
-                email.Save()
-                self.log_print(f"Email category {category_name} assigned successfully on attempt  {attempt + 1}")
-                return
-            except Exception as e:
-                self.log_print(f"Error assigning {category_name} to email on attempt {attempt + 1}: {str(e)}")
-                if attempt < max_retries - 1:
-                    time.sleep(delay)
-                else:
-                    raise
-        return
+        engine = account_scan.merged_report(outcome)
+        try:
+            lines = engine.write(OUTLOOK_REPORT_PREFIX)
+            self.log_print(f"Report written to {OUTLOOK_REPORT_PREFIX}.csv/.json/.txt")
+        except OSError as e:
+            self.log_print(f"Error writing report files: {str(e)}")
+            lines = engine.text_lines()
+        report = "\n".join(lines)
+        self.log_print(report)
+        simple_print(report)  # one write to the simple log
+        return outcome
 
     def _get_emails_from_folder(self, folder, days_back):
         r"""Helper method to get emails from a specific folder for reprocessing"""
@@ -2194,21 +2135,28 @@ class OutlookSecurityAgent:
             # Create date restriction for recent emails
             restriction = "[ReceivedTime] >= '" + \
                 (datetime.now() - timedelta(days=days_back)).strftime('%m/%d/%Y') + "'"
-            emails = folder.Items.Restrict(restriction)
-            
-            if emails is None or emails.Count == 0:
+            # 10/18/2026: replaced by _fetch_folder_emails (bulk GetTable fetch with Items.Restrict fallback)
+            # emails = folder.Items.Restrict(restriction)
+            #
+            # if emails is None or emails.Count == 0:
+            #     self.log_print(f"No emails found in folder: {folder.Name}")
+            #     return []
+            #
+            # if isinstance(emails, str):
+            #     self.log_print(f"Error: 'emails' is a string, expected a collection in folder: {folder.Name}")
+            #     return []
+            #
+            # emails.Sort("[ReceivedTime]", Descending=True)
+            # self.log_print(f"Found {emails.Count} emails in folder {folder.Name} for reprocessing")
+            #
+            # # Convert to list for processing
+            # return [email for email in emails]
+            emails = self._fetch_folder_emails(folder, restriction)
+            if not emails:
                 self.log_print(f"No emails found in folder: {folder.Name}")
                 return []
-            
-            if isinstance(emails, str):
-                self.log_print(f"Error: 'emails' is a string, expected a collection in folder: {folder.Name}")
-                return []
-            
-            emails.Sort("[ReceivedTime]", Descending=True)
-            self.log_print(f"Found {emails.Count} emails in folder {folder.Name} for reprocessing")
-            
-            # Convert to list for processing
-            return [email for email in emails]
+            self.log_print(f"Found {len(emails)} emails in folder {folder.Name} for reprocessing")
+            return emails
             
         except Exception as e:
             self.log_print(f"Error getting emails from folder {folder.Name}: {str(e)}")
@@ -2272,6 +2220,9 @@ class OutlookSecurityAgent:
                 rules = rules_json if isinstance(rules_json, list) else [rules_json]
                 # Don't reset safe_senders - keep the loaded safe_senders
 
+            # Checkpoint journal; on --resume it keeps the interrupted scan's cutoff date
+            self.scan_journal = self._open_scan_journal(rules_json, safe_senders, days_back)
+
             # Process emails from all target folders
             all_emails_to_process = []
             all_emails_added_info = []
@@ -2280,23 +2231,30 @@ class OutlookSecurityAgent:
                 self.log_print(f"Processing folder: {target_folder.Name}")
                 
                 # Get recent emails from the current target folder
-                restriction = "[ReceivedTime] >= '" + \
-                    (datetime.now() - timedelta(days=days_back)).strftime('%m/%d/%Y') + "'"
-                emails = target_folder.Items.Restrict(restriction)
-
-                if not emails:
+                # restriction = "[ReceivedTime] >= '" + \
+                #     (datetime.now() - timedelta(days=days_back)).strftime('%m/%d/%Y') + "'"
+                restriction = "[ReceivedTime] >= '" + self.scan_journal.params["since"] + "'"
+                # 10/18/2026: replaced by _fetch_folder_emails (bulk GetTable fetch with Items.Restrict fallback)
+                # emails = target_folder.Items.Restrict(restriction)
+                #
+                # if not emails:
+                #     self.log_print(f"No emails found to process in folder: {target_folder.Name}")
+                #     continue
+                #
+                # if isinstance(emails, str):
+                #     self.log_print(f"Error: 'emails' is a string, expected a collection of email objects in folder: {target_folder.Name}")
+                #     continue
+                #
+                # emails.Sort("[ReceivedTime]", Descending=True)
+                # self.log_print(f"Total emails found in {target_folder.Name}: {emails.Count}")
+                #
+                # # Create a list of emails to process from this folder
+                # folder_emails_to_process = [email for email in emails]
+                folder_emails_to_process = self._fetch_folder_emails(target_folder, restriction)
+                if not folder_emails_to_process:
                     self.log_print(f"No emails found to process in folder: {target_folder.Name}")
                     continue
-
-                if isinstance(emails, str):
-                    self.log_print(f"Error: 'emails' is a string, expected a collection of email objects in folder: {target_folder.Name}")
-                    continue
-
-                emails.Sort("[ReceivedTime]", Descending=True)
-                self.log_print(f"Total emails found in {target_folder.Name}: {emails.Count}")
-
-                # Create a list of emails to process from this folder
-                folder_emails_to_process = [email for email in emails]
+                self.log_print(f"Total emails found in {target_folder.Name}: {len(folder_emails_to_process)}")
                 folder_emails_added_info = [{
                     "match": False,
                     "rule": "",
@@ -2311,8 +2269,19 @@ class OutlookSecurityAgent:
                 all_emails_to_process.extend(folder_emails_to_process)
                 all_emails_added_info.extend(folder_emails_added_info)
 
-            if not all_emails_to_process:
+            # Resumed scan: skip what the interrupted run processed (its no-match and phishing emails come back with
+            # their journaled results for the report and -u), re-queue its unconfirmed commits
+            all_emails_to_process, all_emails_added_info, resumed_emails, resumed_added_info = \
+                self.scan_journal.split_processed(all_emails_to_process, all_emails_added_info)
+            if self.scan_journal.pending and self.namespace is not None:
+                self.scan_journal.replay(self.namespace, self.action_queue)
+            self.action_queue.journal = self.scan_journal
+
+            if not all_emails_to_process and not resumed_emails:
                 self.log_print("No emails found to process in any folders.")
+                self.action_queue.flush()
+                self.scan_journal.finish()
+                self.action_queue.journal = None
                 return
 
             processed_count = 0
@@ -2325,7 +2294,9 @@ class OutlookSecurityAgent:
             self.log_print(f"Total emails to process across all folders: {len(all_emails_to_process)}")
 
             # Sort rules once per first-pass (optimization: moved outside email loop)
-            rules.sort(key=lambda rule: rule['actions'].get('delete', False))
+            # 10/18/2026: replaced by _rule_sort_key (header-first two-phase order)
+            # rules.sort(key=lambda rule: rule['actions'].get('delete', False))
+            rules.sort(key=self._rule_sort_key())
 
             # Precompile safe sender patterns for regex mode
             compiled_safe_senders = []
@@ -2334,11 +2305,14 @@ class OutlookSecurityAgent:
 
             for email in all_emails_to_process:
                 try:
+                    self.action_queue.maybe_flush()  # commit queued changes once per chunk of emails
                     processed_count += 1
                     email_index = all_emails_to_process.index(email)
+                    self.action_queue.folder = all_emails_added_info[email_index]['source_folder']  # circuit breaker key
                     email_deleted = False
                     try:
-                        raw_header = email.PropertyAccessor.GetProperty("http://schemas.microsoft.com/mapi/proptag/0x007D001E")
+                        # raw_header = email.PropertyAccessor.GetProperty("http://schemas.microsoft.com/mapi/proptag/0x007D001E")
+                        raw_header = email_transport_headers(email)
                         email_header = self.combine_email_header_lines(raw_header)
                     except Exception as e:
                         self.log_print(f"Error getting email header: {str(e)}")
@@ -2355,9 +2329,10 @@ class OutlookSecurityAgent:
                         matched_safe, matched_pat = self._regex_match_header_any(compiled_safe_senders, email_header, email.SenderEmailAddress)
                         if matched_safe:
                             self.log_print(f"Safe sender (regex) matched in header: {matched_pat}")
-                            self.move_email_with_retry(email, self.inbox_folder)
-                            self.delete_email_with_retry(email)
+                            # 10/18/2026: replaced by action queue (one Move instead of Copy + Move + Delete)
+                            self.action_queue.move(email, self.inbox_folder)
                             email_deleted = True
+                            self.scan_journal.mark_processed(email)
                             if email in all_emails_to_process:
                                 all_emails_to_process.remove(email)
                             self.log_print(f"Email moved to inbox")
@@ -2428,7 +2403,7 @@ class OutlookSecurityAgent:
                         if 'body' in conditions:
                             if use_regex:
                                 compiled = self._compile_pattern_list(conditions['body'])
-                                m, pat = self._any_regex_match(compiled, email.Body)
+                                m, pat = self._any_regex_match(compiled, email.Body) if compiled else (False, None)  # empty list: no body read
                                 if m:
                                     match = True
                                     matched_keyword = pat
@@ -2514,7 +2489,7 @@ class OutlookSecurityAgent:
                         if match and 'body' in exceptions:
                             if use_regex:
                                 compiled = self._compile_pattern_list(exceptions['body'])
-                                m, pat = self._any_regex_match(compiled, email.Body)
+                                m, pat = self._any_regex_match(compiled, email.Body) if compiled else (False, None)  # empty list: no body read
                                 if m:
                                     match = False
                                     matched_keyword = pat
@@ -2564,28 +2539,32 @@ class OutlookSecurityAgent:
                             if 'assign_to_category' in actions and actions['assign_to_category']['category_name']:
                                 try: # to assign category based on rule name
                                     category_name = actions['assign_to_category']['category_name']
-                                    self.assign_category_to_email_with_retry(email, category_name)
+                                    # 10/18/2026: replaced by action queue (category, read and flag share one Save)
+                                    self.action_queue.assign_category(email, category_name)
                                     self.log_print(f"Email assigned to category '{category_name}'", "DEBUG")
                                 except Exception as e:
                                     self.log_print(f"Error assigning category to email: {str(e)}")
                                 if email.UnRead:
-                                    self.mark_email_read_with_retry(email)
+                                    self.action_queue.mark_read(email)
                                     self.log_print("Email marked as read")
                             if 'clear_flag' in actions and actions['clear_flag']:
                                 # this flag is not being passed by outlook, so will never be set.  Keeping in case fixed in the future
-                                self.clear_email_flag_with_retry(email)
+                                self.action_queue.clear_flag(email)
                                 self.log_print("Email flag cleared")
                             if 'set_importance' in actions and actions['set_importance']['importance_level']:
-                                email.Importance = actions['set_importance']['importance_level']
-                                email.Save()
+                                # email.Importance = actions['set_importance']['importance_level']
+                                # email.Save()
+                                self.action_queue.set_property(email, "Importance", actions['set_importance']['importance_level'])
                                 self.log_print(f"Email importance set to {actions['set_importance']['importance_level']}")
                             if 'set_sensitivity' in actions and actions['set_sensitivity']['sensitivity_level']:
-                                email.Sensitivity = actions['set_sensitivity']['sensitivity_level']
-                                email.Save()
+                                # email.Sensitivity = actions['set_sensitivity']['sensitivity_level']
+                                # email.Save()
+                                self.action_queue.set_property(email, "Sensitivity", actions['set_sensitivity']['sensitivity_level'])
                                 self.log_print(f"Email sensitivity set to {actions['set_sensitivity']['sensitivity_level']}")
                             if 'mark_as_task' in actions and actions['mark_as_task']['task_due_date']:
-                                email.TaskDueDate = actions['mark_as_task']['task_due_date']
-                                email.Save()
+                                # email.TaskDueDate = actions['mark_as_task']['task_due_date']
+                                # email.Save()
+                                self.action_queue.set_property(email, "TaskDueDate", actions['mark_as_task']['task_due_date'])
                                 self.log_print(f"Email marked as task with due date: {actions['mark_as_task']['task_due_date']}")
                             if 'play_sound' in actions and actions['play_sound']['sound_file']:
                                 import winsound
@@ -2629,14 +2608,16 @@ class OutlookSecurityAgent:
                             if 'move_to_folder' in actions and actions['move_to_folder']['folder_name']:
                                 folder_name = actions['move_to_folder']['folder_name']
                                 target_folder = self._get_account_folder(self.email_address, folder_name)
-                                email.Move(target_folder)
+                                # email.Move(target_folder)
+                                self.action_queue.move(email, target_folder)
                                 self.log_print(f"Email moved to '{folder_name}' folder")
                             if 'stop_processing_more_rules' in actions and actions['stop_processing_more_rules']:
                                 self.log_print("Stopping processing more rules")
                                 # this flag is not being passed by outlook, so will never be set.  Keeping in case fixed in the future
                             if 'delete' in actions and actions['delete']:
                                 try: # to delete email
-                                    self.delete_email_with_retry(email)
+                                    # 10/18/2026: replaced by action queue (read, flag clear and delete in one commit)
+                                    self.action_queue.delete(email)
                                     email_deleted = True
                                     deleted_total += 1
                                     self.log_print("Email marked as read, flag cleared and deleted")
@@ -2650,7 +2631,9 @@ class OutlookSecurityAgent:
 
                     # After all email rules are processed and it did not match any rules and the email has not been deleted, then check for phishing indicators
                     if not (email_deleted):
-                        indicators = self.check_phishing_indicators(email)
+                        features = self.feature_store.get(email)
+                        all_emails_added_info[email_index]["phishing_features"] = features  # reused by reports and triage
+                        indicators = self.check_phishing_indicators(email, features)
                         if indicators:
                             flagged_count += 1
                             self.log_print(f"Phishing indicators found: {indicators}")
@@ -2679,6 +2662,8 @@ class OutlookSecurityAgent:
                         for header in email_header.splitlines():
                             self.log_print(f"Header: {header}")
 
+                    self.scan_journal.mark_processed(email, all_emails_added_info[email_index])  # checkpointed with the next chunk
+
                     if (DEBUG) and (processed_count >= DEBUG_EMAILS_TO_PROCESS):
                         self.log_print(f"Debug mode: Stopping after {DEBUG_EMAILS_TO_PROCESS} emails")
                         break  # Stop processing more emails in debug mode, then write the report and prompt for rule updates
@@ -2686,18 +2671,34 @@ class OutlookSecurityAgent:
                 except Exception as e:
                     self.log_print(f"Error processing email: {str(e)}")
 
-
-            # Print a list for Phishing OR Match=false, report body unique URL stubs "/<domain>.<>" and ".<domain>.<>" so they can be easily added to the rules
-            #     collect them all first, then determine uniqueness, then print one per line
-            self.log_print(f"\nProcessing Report of URL's from phishing or match = False")
-            self.URL_report(all_emails_to_process, all_emails_added_info)
-
-            # Print a list for Phishing OR Match=false with From: "@<domain>.<>" so they can be easily added to the rules
-            self.log_print(f"\nProcessing Report of From's from phishing or match = False")
-            self.from_report(all_emails_to_process, all_emails_added_info, rules_json)
+            # Commit the last chunk before reports, prompts and the second pass look at the folders again
+            self.action_queue.flush()
+            self.scan_journal.finish()  # the second pass is not journaled
+            self.action_queue.journal = None
+            self._log_scan_journal_stats()
+            self._log_action_stats()
+            self._log_folder_cache_stats()
+            self._log_feature_store_stats()
+
+            # Emails the interrupted run evaluated go to the report and -u too, ahead of this run's
+            all_emails_to_process = resumed_emails + all_emails_to_process
+            all_emails_added_info = resumed_added_info + all_emails_added_info
+
+            if self.fetch_mode == FETCH_MODE_TABLE:
+                self.log_print(f"Table fetch: {self.fetch_stats['rows']} rows in {self.fetch_stats['table_batches']} GetArray calls, "
+                               f"{self.fetch_stats['items_opened']} full items opened, "
+                               f"{self.fetch_stats['header_rereads']} truncated headers re-read")
+                self.log_print(f"Body fetch: {self.fetch_stats['bodies_fetched']} bodies read, "
+                               f"{self.fetch_stats['rows'] - self.fetch_stats['bodies_fetched']} avoided "
+                               f"(decided by safe senders, from, subject or header rules)")
+
+            # 10/18/2026: the per-line URL_report and from_report (removed) replaced by _write_reports (one aggregating pass,
+            # written once as CSV, JSON and text)
+            self.log_print(f"\nProcessing Report of From domains and URL stubs from phishing or match = False")
+            self._write_reports(all_emails_to_process, all_emails_added_info)
 
             # After processing all emails, prompt for rule updates based on unfiltered emails
-            if processed_count > 0:
+            if processed_count > 0 or resumed_emails:
                 self.log_print(f"{CRLF}Checking for rule updates based on unfiltered emails...")
                 # Original call to prompt_update_rules (commented out)
                 # rules_json, safe_senders = self.prompt_update_rules(all_emails_to_process, all_emails_added_info, rules_json, safe_senders)
@@ -2756,15 +2757,20 @@ class OutlookSecurityAgent:
                 second_pass_flagged = 0
                 
                 # Sort rules once per second-pass (optimization: moved outside email loop)
-                rules.sort(key=lambda rule: rule['actions'].get('delete', False))
+                # 10/18/2026: replaced by _rule_sort_key (header-first two-phase order)
+                # rules.sort(key=lambda rule: rule['actions'].get('delete', False))
+                rules.sort(key=self._rule_sort_key())
                 
                 for email_index, email in enumerate(second_pass_emails):
                     try:
+                        self.action_queue.maybe_flush()  # commit queued changes once per chunk of emails
                         if email_index >= len(second_pass_added_info):
                             continue  # Safety check
+                        self.action_queue.folder = second_pass_added_info[email_index].get('source_folder')  # circuit breaker key
                         
                         email_deleted = False
-                        email_header = self.combine_email_header_lines(email.PropertyAccessor.GetProperty("http://schemas.microsoft.com/mapi/proptag/0x007D001E"))
+                        # email_header = self.combine_email_header_lines(email.PropertyAccessor.GetProperty("http://schemas.microsoft.com/mapi/proptag/0x007D001E"))
+                        email_header = self.combine_email_header_lines(email_transport_headers(email))
                         second_pass_added_info[email_index]["email_header"] = email_header
                         
                         self.log_print(f"Second-pass processing email {email_index + 1}/{len(second_pass_emails)}")
@@ -2776,8 +2782,8 @@ class OutlookSecurityAgent:
                             matched_safe, matched_pat = self._regex_match_header_any(second_pass_compiled_safe_senders, email_header, email.SenderEmailAddress)
                             if matched_safe:
                                 self.log_print(f"Second-pass: Safe sender (regex) matched in header: {matched_pat}")
-                                self.move_email_with_retry(email, self.inbox_folder)
-                                self.delete_email_with_retry(email)
+                                # 10/18/2026: replaced by action queue (one Move instead of Copy + Move + Delete)
+                                self.action_queue.move(email, self.inbox_folder)
                                 email_deleted = True
                         
                         if email_deleted:
@@ -2843,7 +2849,7 @@ class OutlookSecurityAgent:
                             if 'body' in conditions and not match:
                                 if use_regex:
                                     compiled = self._compile_pattern_list(conditions['body'])
-                                    m, pat = self._any_regex_match(compiled, email.Body)
+                                    m, pat = self._any_regex_match(compiled, email.Body) if compiled else (False, None)  # empty list: no body read
                                     if m:
                                         match = True
                                         matched_keyword = pat
@@ -2904,7 +2910,7 @@ class OutlookSecurityAgent:
                             if match and 'body' in exceptions:
                                 if use_regex:
                                     compiled = self._compile_pattern_list(exceptions['body'])
-                                    m, pat = self._any_regex_match(compiled, email.Body)
+                                    m, pat = self._any_regex_match(compiled, email.Body) if compiled else (False, None)  # empty list: no body read
                                     if m:
                                         match = False
                                         matched_keyword = pat
@@ -2934,7 +2940,7 @@ class OutlookSecurityAgent:
                                 actions = rule['actions']
                                 if 'delete' in actions and actions['delete']:
                                     try:
-                                        self.delete_email_with_retry(email)
+                                        self.action_queue.delete(email)
                                         email_deleted = True
                                         second_pass_deleted += 1
                                         self.log_print(f"Second-pass: Email deleted by rule: {rule['name']}")
@@ -2944,7 +2950,9 @@ class OutlookSecurityAgent:
                         
                         # Check phishing indicators for unmatched emails
                         if not email_deleted and not second_pass_added_info[email_index]["match"]:
-                            indicators = self.check_phishing_indicators(email)
+                            features = self.feature_store.get(email)  # unchanged messages reuse the first-pass record
+                            second_pass_added_info[email_index]["phishing_features"] = features
+                            indicators = self.check_phishing_indicators(email, features)
                             if indicators:
                                 second_pass_flagged += 1
                                 self.log_print(f"Second-pass: Phishing indicators found: {indicators}")
@@ -2959,6 +2967,11 @@ class OutlookSecurityAgent:
                     except Exception as e:
                         self.log_print(f"Second-pass: Error processing email: {str(e)}")
                 
+                self.action_queue.flush()
+                self._log_action_stats()
+                self._log_folder_cache_stats()
+                self._log_feature_store_stats()
+
                 # Log second-pass summary
 
                 print_to(f"\nSecond-pass Processing Summary:", to_log=True, to_simple=True, to_console=True, log_instance=self)
@@ -2994,6 +3007,17 @@ def main():
     parser = argparse.ArgumentParser(description='Outlook Mail Spam Filter')
     parser.add_argument('-u', '--update_rules', action='store_true', 
                        help='Enable interactive rule updates (default: disabled)')
+    parser.add_argument('--fetch-mode', choices=[FETCH_MODE_TABLE, FETCH_MODE_ITEMS], default=FETCH_MODE_DEFAULT,
+                       help='table: bulk Folder.GetTable columns, items opened on demand; items: Items.Restrict (default: %(default)s)')
+    parser.add_argument('--rule-order', choices=[RULE_ORDER_HEADER_FIRST, RULE_ORDER_FILE], default=RULE_ORDER_DEFAULT,
+                       help='header-first: delete rules needing the body run last, so header-decided emails skip the body; '
+                            'file: rules.yaml order (default: %(default)s)')
+    parser.add_argument('--accounts',
+                       help="YAML file with an 'accounts' list of stores and folders (see account_scan.py); "
+                            "default: EMAIL_ACCOUNTS. More than one store is scanned concurrently")
+    parser.add_argument('--resume', action='store_true',
+                       help='continue an interrupted scan from its checkpoint journal: skip the messages it processed '
+                            'and replay commits it may not have finished (default: start a new scan)')
     
     # Backward-compat shim: ignore removed flags if present on CLI to prevent argparse errors
     removed_cli_flags = ['--use-regex-files', '--convert-safe-senders-to-regex', '--convert-rules-to-regex']
@@ -3007,8 +3031,20 @@ def main():
     
     args = parser.parse_args()
 
+    # One Outlook account: the interactive process_emails() path; several stores: concurrent account_scan workers
+    stores = account_scan.load_stores(args.accounts) if args.accounts else account_scan.stores_from_config(EMAIL_ACCOUNTS)
+    single_store = len(stores) == 1 and stores[0].kind == account_scan.KIND_OUTLOOK
+
     # Initialize agent
-    agent = OutlookSecurityAgent()  # setup for calling functions in class OutlookSecurityAgent
+    # agent = OutlookSecurityAgent()  # setup for calling functions in class OutlookSecurityAgent
+    if single_store:
+        agent = OutlookSecurityAgent(email_address=stores[0].account, folder_names=stores[0].folders or EMAIL_BULK_FOLDER_NAMES)
+    else:
+        outlook_accounts = [store.account for store in stores if store.kind == account_scan.KIND_OUTLOOK]
+        agent = OutlookSecurityAgent(email_address=(outlook_accounts or [EMAIL_ADDRESS])[0], folder_names=[])
+    agent.fetch_mode = args.fetch_mode
+    agent.rule_order = args.rule_order
+    agent.resume = args.resume
 
     try:
 
@@ -3033,7 +3069,13 @@ def main():
         # Process last N days of emails - see DAYS_BACK_DEFAULT
         agent.log_print(f"{CRLF}Begin email analysis{CRLF}")
 
-        agent.process_emails(rules_json, safe_senders, update_rules=args.update_rules, use_regex=effective_use_regex_files)
+        if single_store:
+            agent.process_emails(rules_json, safe_senders, update_rules=args.update_rules, use_regex=effective_use_regex_files)
+        else:
+            if args.update_rules or args.resume:
+                print_to(f"-u/--update_rules and --resume apply to a single Outlook account; ignored for {len(stores)} stores",
+                         to_log=True, to_simple=True, to_console=True, log_instance=agent)
+            agent.scan_accounts(stores, rules_json, safe_senders)
 
         agent.log_print(f"{CRLF}End email analysis{CRLF}")
 
@@ -3,21 +3,64 @@
 Rebuild bundled rules.yaml from monolithic rules to individual per-pattern rules.
 
 This script:
-1. Reads the current monolithic rules.yaml
+1. Reads the current monolithic rules.yaml (or --source; a per-pattern rules.yaml also works)
 2. Extracts patterns from the header rule (SpamAutoDeleteHeader)
 3. Classifies each pattern as entire_domain or exact_domain
 4. Generates individual YAML entries for each pattern
 5. Filters to include only header_from rules
-6. Writes the new YAML to assets/rules/rules.yaml
+6. Writes the new YAML to assets/rules/rules.yaml (only if it changed)
+7. Writes a manifest and a sidecar index next to it (rules.manifest.json, rules.index.json)
+
+Rule names are content-derived: <tld|entire|exact>_<first 10 hex digits of the
+pattern's SHA-256>.  Adding or removing one pattern changes one rule, not the
+name of every later rule.  The manifest maps each pattern's SHA-256 to its name
+and classification; the next rebuild reuses those entries and only classifies
+patterns it has not seen.
+
+The sidecar keeps the classification so loaders do not have to redo it:
+TLD-to-rule, entire-domain-to-rule and exact-domain-to-rule tables (rule
+positions in the YAML), plus the SHA-256 of the YAML bytes it was built from.
+A loader that finds a different hash must ignore the index (see load_index).
+
+Usage:
+    python scripts/rebuild_rules_yaml.py                 # rebuild rules.yaml, the manifest and the index
+    python scripts/rebuild_rules_yaml.py --source ../Archive/rules.yaml
+    python scripts/rebuild_rules_yaml.py --index-only    # index an already rebuilt rules.yaml
+    python scripts/rebuild_rules_yaml.py --source ../Archive/rules.yaml --output /tmp/rules.yaml
 """
 
+import argparse
+import hashlib
+import json
 import re
 import yaml
 from pathlib import Path
 
+INDEX_VERSION = 1
+INDEX_FILE_SUFFIX = '.index.json'   # rules.yaml -> rules.index.json
+MANIFEST_VERSION = 1
+MANIFEST_FILE_SUFFIX = '.manifest.json'   # rules.yaml -> rules.manifest.json
+RULE_ID_HEX = 10                          # hex digits of the pattern's SHA-256 in the rule name
+TYPE_PREFIXES = {
+    'top_level_domain': 'tld',
+    'entire_domain': 'entire',
+    'exact_domain': 'exact',
+}
+EXECUTION_ORDERS = {
+    'top_level_domain': 10,
+    'entire_domain': 20,
+    'exact_domain': 30,
+}
+# patternSubType -> index table
+INDEX_TABLES = {
+    'top_level_domain': 'tlds',
+    'entire_domain': 'entireDomains',
+    'exact_domain': 'exactDomains',
+}
+
 
 def classify_pattern(pattern: str) -> tuple[str | None, str]:
-    """
+    r"""
     Classify a pattern as entire_domain or exact_domain.
     Returns tuple of (classification, sourceDomain)
 
@@ -55,110 +98,241 @@ def classify_pattern(pattern: str) -> tuple[str | None, str]:
     return (None, '')
 
 
-def main():
-    print('[INFO] Rebuilding bundled rules.yaml from monolithic format...\n')
+def index_key(pattern_type: str, source_domain: str) -> str:
+    """
+    Table key for a sourceDomain: the TLD for top_level_domain ('.*.ac' -> 'ac'),
+    the domain label for entire_domain, the domain for exact_domain ('.*.de.com' -> 'de.com').
+    """
+    key = source_domain.lower()
+    if pattern_type in ('top_level_domain', 'exact_domain') and key.startswith('.*.'):
+        key = key[3:]
+    return key
 
-    script_dir = Path(__file__).parent
-    rules_yaml_path = script_dir.parent / 'assets' / 'rules' / 'rules.yaml'
 
-    if not rules_yaml_path.exists():
-        print(f'[ERROR] rules.yaml not found at: {rules_yaml_path}')
-        return 1
+def index_path_for(rules_yaml_path: Path) -> Path:
+    return rules_yaml_path.with_name(rules_yaml_path.stem + INDEX_FILE_SUFFIX)
+
+
+def build_index(rules: list, yaml_bytes: bytes, source_name: str) -> dict:
+    """
+    Build the sidecar index for per-pattern rules (as written by main()).
+
+    Returns a dict with the YAML's SHA-256, the rule names in YAML order and one
+    table per patternSubType mapping index_key() to rule positions.
+    """
+    tables = {table: {} for table in INDEX_TABLES.values()}
+    for position, rule in enumerate(rules):
+        table = INDEX_TABLES.get(rule.get('patternSubType'))
+        if table is None or not rule.get('sourceDomain'):
+            continue
+        key = index_key(rule['patternSubType'], rule['sourceDomain'])
+        tables[table].setdefault(key, []).append(position)
+    return {
+        'version': INDEX_VERSION,
+        'source': source_name,
+        'sha256': hashlib.sha256(yaml_bytes).hexdigest(),
+        'ruleCount': len(rules),
+        'names': [rule.get('name') for rule in rules],
+        **{table: dict(sorted(entries.items())) for table, entries in tables.items()},
+    }
+
+
+def write_index(rules_yaml_path: Path, rules: list, yaml_bytes: bytes) -> Path:
+    index_path = index_path_for(rules_yaml_path)
+    index = build_index(rules, yaml_bytes, rules_yaml_path.name)
+    # Compact: no indentation or spaces, one line
+    index_path.write_text(json.dumps(index, separators=(',', ':')) + '\n', encoding='utf-8')
+    return index_path
+
+
+def load_index(rules_yaml_path: Path) -> dict | None:
+    """
+    Load the sidecar index of rules_yaml_path.
 
+    Returns None when there is no index, it has another version, or it was built
+    from different YAML bytes; the caller then classifies the rules itself.
+    """
+    index_path = index_path_for(rules_yaml_path)
     try:
-        # Load current YAML
-        with open(rules_yaml_path, 'r') as f:
-            data = yaml.safe_load(f)
-
-        # Find SpamAutoDeleteHeader rule
-        rules = data.get('rules', [])
-        header_rule = None
-        for rule in rules:
-            if rule.get('name') == 'SpamAutoDeleteHeader':
-                header_rule = rule
-                break
-
-        if not header_rule:
-            print('[ERROR] SpamAutoDeleteHeader rule not found')
-            return 1
+        index = json.loads(index_path.read_text(encoding='utf-8'))
+        yaml_bytes = rules_yaml_path.read_bytes()
+    except (OSError, ValueError):
+        return None
+    if index.get('version') != INDEX_VERSION or index.get('sha256') != hashlib.sha256(yaml_bytes).hexdigest():
+        return None
+    return index
 
-        # Extract header patterns
-        header_patterns = header_rule.get('conditions', {}).get('header', [])
-        print(f'[INFO] Found {len(header_patterns)} header patterns to classify')
 
-        # Classify patterns
-        classified_patterns = []
-        tld_count = 0
-        entire_domain_count = 0
-        exact_domain_count = 0
-        skipped_count = 0
+def index_only(rules_yaml_path: Path) -> int:
+    yaml_bytes = rules_yaml_path.read_bytes()
+    rules = (yaml.safe_load(yaml_bytes) or {}).get('rules', [])
+    index_path = write_index(rules_yaml_path, rules, yaml_bytes)
+    print(f'[OK] Indexed {len(rules)} rules from {rules_yaml_path.name}')
+    print(f'[OK] Written to: {index_path}')
+    return 0
 
-        for pattern in header_patterns:
-            classification, source_domain = classify_pattern(pattern)
 
-            if classification is None:
-                skipped_count += 1
-                continue
+def pattern_digest(pattern: str) -> str:
+    return hashlib.sha256(pattern.encode('utf-8')).hexdigest()
 
-            if classification == 'top_level_domain':
-                tld_count += 1
-            elif classification == 'entire_domain':
-                entire_domain_count += 1
-            elif classification == 'exact_domain':
-                exact_domain_count += 1
 
-            classified_patterns.append({
-                'pattern': pattern,
-                'type': classification,
-                'sourceDomain': source_domain,
-            })
+def rule_id(pattern_type: str, digest: str) -> str:
+    """Stable rule name from the pattern's content, e.g. entire_3f2a9c01d4"""
+    return f'{TYPE_PREFIXES[pattern_type]}_{digest[:RULE_ID_HEX]}'
 
-        print('\n[INFO] Classification summary:')
-        print(f'  - TLD: {tld_count}')
-        print(f'  - Entire Domain: {entire_domain_count}')
-        print(f'  - Exact Domain: {exact_domain_count}')
-        print(f'  - Skipped: {skipped_count}')
-        print(f'  - Total to include: {len(classified_patterns)}')
 
-        # Generate individual YAML rules
+def manifest_path_for(rules_yaml_path: Path) -> Path:
+    return rules_yaml_path.with_name(rules_yaml_path.stem + MANIFEST_FILE_SUFFIX)
+
+
+def load_manifest(rules_yaml_path: Path) -> dict:
+    """Pattern digest -> manifest entry of the previous rebuild ({} if none or another version)"""
+    try:
+        manifest = json.loads(manifest_path_for(rules_yaml_path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest.get('patterns', {})
+
+
+def write_manifest(rules_yaml_path: Path, entries: dict) -> Path:
+    """One line per pattern, in digest order, so manifest diffs are as small as the change"""
+    path = manifest_path_for(rules_yaml_path)
+    lines = [f'{json.dumps(digest)}:{json.dumps(entries[digest], separators=(",", ":"))}' for digest in sorted(entries)]
+    text = f'{{"version":{MANIFEST_VERSION},"patterns":{{\n' + ',\n'.join(lines) + '\n}}\n'
+    path.write_text(text, encoding='utf-8')
+    return path
+
+
+def source_patterns(data: dict) -> list | None:
+    """
+    Header patterns to rebuild from, as (pattern, known classification or None).
+
+    Monolithic format: the SpamAutoDeleteHeader header list (classified below).
+    Per-pattern format (an earlier rebuild): each header_from rule's pattern, with its
+    own patternSubType/sourceDomain/executionOrder, so curated fixes are kept.
+    """
+    rules = data.get('rules', []) or []
+    for rule in rules:
+        if rule.get('name') == 'SpamAutoDeleteHeader':
+            return [(pattern, None) for pattern in rule.get('conditions', {}).get('header', []) or []]
+    patterns = []
+    for rule in rules:
+        if rule.get('patternCategory') != 'header_from' or rule.get('patternSubType') not in TYPE_PREFIXES:
+            continue
+        for pattern in rule.get('conditions', {}).get('header', []) or []:
+            patterns.append((pattern, {
+                'type': rule['patternSubType'],
+                'sourceDomain': rule.get('sourceDomain', ''),
+                'executionOrder': rule.get('executionOrder', EXECUTION_ORDERS[rule['patternSubType']]),
+            }))
+    return patterns if patterns else None
+
+
+def build_rule(pattern: str, entry: dict) -> dict:
+    return {
+        'name': entry['name'],
+        'enabled': 'True',
+        'isLocal': 'True',
+        'executionOrder': entry['executionOrder'],
+        'conditions': {
+            'type': 'OR',
+            'body': [],
+            'from': [],
+            'header': [pattern],
+            'subject': [],
+        },
+        'actions': {
+            'delete': 'True',
+        },
+        # Present (and empty) so the desktop engine can evaluate the rule and coalesce it with its neighbours
+        'exceptions': {},
+        'patternCategory': 'header_from',
+        'patternSubType': entry['type'],
+        'sourceDomain': entry['sourceDomain'],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rebuild the bundled rules.yaml and its sidecar index')
+    parser.add_argument('--source', type=Path,
+                        help='YAML to rebuild from (monolithic or per-pattern); default: the bundled rules.yaml')
+    parser.add_argument('--output', type=Path,
+                        help='rules.yaml to write (manifest and index go next to it); default: the bundled rules.yaml')
+    parser.add_argument('--index-only', action='store_true',
+                        help='Only write the sidecar index for the current (already rebuilt) rules.yaml')
+    args = parser.parse_args(argv)
+
+    script_dir = Path(__file__).parent
+    rules_yaml_path = args.output or script_dir.parent / 'assets' / 'rules' / 'rules.yaml'
+    source_path = args.source or rules_yaml_path
+
+    if not source_path.exists():
+        print(f'[ERROR] rules.yaml not found at: {source_path}')
+        return 1
+
+    if args.index_only:
+        return index_only(rules_yaml_path)
+
+    print(f'[INFO] Rebuilding bundled rules.yaml from {source_path}...\n')
+
+    try:
+        # Load source YAML
+        with open(source_path, 'r', encoding='utf-8') as f:
+            data = yaml.safe_load(f) or {}
+
+        patterns = source_patterns(data)
+        if patterns is None:
+            print('[ERROR] SpamAutoDeleteHeader rule not found (and no per-pattern header_from rules)')
+            return 1
+        print(f'[INFO] Found {len(patterns)} header patterns')
+
+        # Classify only the patterns the previous rebuild's manifest does not know
+        previous = load_manifest(rules_yaml_path)
+        entries = {}
         new_rules = []
+        counts = {pattern_type: 0 for pattern_type in TYPE_PREFIXES}
+        reused_count = 0
+        classified_count = 0
+        duplicate_count = 0
+        skipped_count = 0
+
+        for pattern, known in patterns:
+            digest = pattern_digest(pattern)
+            if digest in entries:
+                duplicate_count += 1
+                continue
+            entry = previous.get(digest)
+            if entry is not None and entry.get('pattern') == pattern:
+                reused_count += 1
+            else:
+                if known is None:
+                    classification, source_domain = classify_pattern(pattern)
+                    classified_count += 1
+                    if classification is None:
+                        skipped_count += 1
+                        continue
+                    known = {'type': classification, 'sourceDomain': source_domain,
+                             'executionOrder': EXECUTION_ORDERS[classification]}
+                entry = {'name': rule_id(known['type'], digest), **known, 'pattern': pattern}
+            entries[digest] = entry
+            counts[entry['type']] += 1
+            new_rules.append(build_rule(pattern, entry))
+
+        added = sorted(set(entries) - set(previous)) if previous else []
+        removed = sorted(set(previous) - set(entries)) if previous else []
 
-        for i, pat in enumerate(classified_patterns):
-            pattern_type = pat['type']
-            source_domain = pat['sourceDomain']
-
-            # Determine execution order based on type
-            if pattern_type == 'top_level_domain':
-                order = 10
-            elif pattern_type == 'entire_domain':
-                order = 20
-            else:  # exact_domain
-                order = 30
-
-            # Generate unique rule name
-            # Use pattern type prefix + index to guarantee uniqueness
-            type_prefix = 'tld' if pattern_type == 'top_level_domain' else 'entire' if pattern_type == 'entire_domain' else 'exact'
-            rule_name = f'{type_prefix}_{i}'
-
-            new_rules.append({
-                'name': rule_name,
-                'enabled': 'True',
-                'isLocal': 'True',
-                'executionOrder': order,
-                'conditions': {
-                    'type': 'OR',
-                    'body': [],
-                    'from': [],
-                    'header': [pat['pattern']],
-                    'subject': [],
-                },
-                'actions': {
-                    'delete': 'True',
-                },
-                'patternCategory': 'header_from',
-                'patternSubType': pattern_type,
-                'sourceDomain': source_domain,
-            })
+        print('\n[INFO] Classification summary:')
+        print(f'  - TLD: {counts["top_level_domain"]}')
+        print(f'  - Entire Domain: {counts["entire_domain"]}')
+        print(f'  - Exact Domain: {counts["exact_domain"]}')
+        print(f'  - Skipped: {skipped_count}')
+        print(f'  - Duplicates: {duplicate_count}')
+        print(f'  - Total to include: {len(new_rules)}')
+        print(f'  - Reused from manifest: {reused_count}, classified: {classified_count}')
+        if previous:
+            print(f'  - Added: {len(added)}, removed: {len(removed)}')
 
         # Build new RuleSet
         new_data = {
@@ -169,20 +343,25 @@ def main():
             'rules': new_rules,
         }
 
-        # Write new YAML with proper formatting
-        with open(rules_yaml_path, 'w') as f:
-            # Use custom representer for 'True' strings
-            yaml.dump(
-                new_data,
-                f,
-                default_flow_style=False,
-                sort_keys=False,
-                allow_unicode=True,
-                width=100,
-            )
-
-        print(f'\n[OK] Rebuilt rules.yaml with {len(new_rules)} individual rules')
-        print(f'[OK] Written to: {rules_yaml_path}')
+        # Written as UTF-8 bytes with LF line endings, so the index hash is the hash of the file on every platform
+        yaml_text = yaml.dump(
+            new_data,
+            default_flow_style=False,
+            sort_keys=False,
+            allow_unicode=True,
+            width=100,
+        )
+        yaml_bytes = yaml_text.encode('utf-8')
+        if rules_yaml_path.exists() and rules_yaml_path.read_bytes() == yaml_bytes:
+            print(f'\n[OK] rules.yaml unchanged ({len(new_rules)} rules); not rewritten')
+        else:
+            rules_yaml_path.write_bytes(yaml_bytes)
+            print(f'\n[OK] Rebuilt rules.yaml with {len(new_rules)} individual rules')
+            print(f'[OK] Written to: {rules_yaml_path}')
+        manifest_path = write_manifest(rules_yaml_path, entries)
+        index_path = write_index(rules_yaml_path, new_rules, yaml_bytes)
+        print(f'[OK] Manifest written to: {manifest_path}')
+        print(f'[OK] Index written to: {index_path}')
         return 0
 
     except Exception as e: